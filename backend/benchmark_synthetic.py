@@ -0,0 +1,776 @@
+"""
+Synthetic Sheet Benchmark - reproducible throughput va accuracy o'lchovi
+
+Offline sintetik A4 varaqlar yaratadi (javoblari ma'lum) va ularni to'liq
+/api/grade-sheet pipeline'i orqali o'tkazadi:
+    ImageProcessor.process -> QR -> UltraPreciseCoordinateMapper
+    -> AdaptiveOMRDetector -> AnswerGrader -> ImageAnnotator
+
+Geometriya PDF generator / coordinateTemplateGenerator bilan bir xil
+(utils.layout_cache.compile_grid_layout, header offset'lar bilan).
+Har bir worker soni uchun hisobot: sheets/sec, bosqichlar p50/p95
+(services.stage_metrics), peak memory va ground truth bo'yicha aniqlik -
+PERFORMANCE_TARGETS / MEMORY_TARGETS / ACCURACY_TARGETS bilan solishtiriladi.
+
+Usage:
+    python benchmark_synthetic.py --sheets 20 --workers 1,2,4
+    python benchmark_synthetic.py --sheets 10 --blur 1.5 --rotation 2 --perspective 0.02 --jpeg-quality 70
+    python benchmark_synthetic.py --sheets 5 --save-samples test_images/synthetic --output benchmark.json
+    python benchmark_synthetic.py --sheets 10 --qr-mode legacy   # QR decode A/B (default: roi)
+    python benchmark_synthetic.py --sheets 10 --camera           # camera detection: full vs pyramid
+"""
+import os
+import sys
+
+# AI verification tashqi API'ga bog'liq - benchmark deterministik bo'lishi uchun o'chiriladi
+# (config import qilinishidan oldin, spawn qilingan worker'lar ham meros oladi)
+if '--with-ai' not in sys.argv:
+    os.environ['ENABLE_AI_VERIFICATION'] = 'false'
+
+# QR decode A/B: --qr-mode legacy - eski full-page ketma-ketligi (worker'lar ham meros oladi)
+if '--qr-mode' in sys.argv[:-1]:
+    os.environ['QR_DECODE_MODE'] = sys.argv[sys.argv.index('--qr-mode') + 1]
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+from config import settings
+from performance_benchmarks import (
+    ACCURACY_TARGETS,
+    PERFORMANCE_TARGETS,
+    SCALABILITY_TARGETS,
+    check_memory,
+    check_minimum_target,
+    generate_performance_report
+)
+from services import grading_pipeline
+from services.camera_processor import CameraProcessor
+from services.camera_session import order_quad
+from services.stage_metrics import MetricsRegistry
+from services.worker_pool import WorkerPool
+from utils.layout_cache import VARIANTS, compile_grid_layout
+
+logger = logging.getLogger(__name__)
+
+PAPER_WIDTH_MM = 210
+PAPER_HEIGHT_MM = 297
+CORNER_SIZE_MM = 15
+CORNER_MARGIN_MM = 5
+
+# pdfGenerator.ts / coordinateTemplateGenerator.ts layout
+PDF_LAYOUT = {
+    'questionsPerRow': 2,
+    'bubbleSpacing': 8,
+    'bubbleRadius': 2.5,
+    'rowHeight': 5.5,
+    'gridStartX': 25,
+    'gridStartY': 149,
+    'questionSpacing': 90,
+    'firstBubbleOffset': 8
+}
+
+GRID_PARAMS = {
+    'questions_per_row': PDF_LAYOUT['questionsPerRow'],
+    'question_spacing_mm': PDF_LAYOUT['questionSpacing'],
+    'bubble_radius_mm': PDF_LAYOUT['bubbleRadius'],
+    'bubble_spacing_mm': PDF_LAYOUT['bubbleSpacing'],
+    'row_height_mm': PDF_LAYOUT['rowHeight'],
+    'grid_start_x_mm': PDF_LAYOUT['gridStartX'],
+    'grid_start_y_mm': PDF_LAYOUT['gridStartY'],
+    'first_bubble_offset_mm': PDF_LAYOUT['firstBubbleOffset']
+}
+
+# QR code joylashuvi (pdfGenerator.ts: addImage(qr, 160, 10, 25, 25))
+QR_BOX_MM = (160, 10, 25)
+
+
+def build_exam_structure(subjects: int, sections: int, questions: int) -> Dict:
+    """Sintetik imtihon tuzilmasi (frontend Exam formatida)"""
+    return {
+        'id': 'synthetic-benchmark',
+        'name': 'Synthetic Benchmark',
+        'subjects': [
+            {
+                'id': f'subject-{s + 1}',
+                'name': f'Subject {s + 1}',
+                'sections': [
+                    {
+                        'id': f'subject-{s + 1}-section-{k + 1}',
+                        'name': f'Section {k + 1}',
+                        'questionCount': questions,
+                        'correctScore': 1,
+                        'wrongScore': 0
+                    }
+                    for k in range(sections)
+                ]
+            }
+            for s in range(subjects)
+        ]
+    }
+
+
+def build_coordinate_template(exam_structure: Dict) -> Dict:
+    """
+    coordinateTemplateGenerator.ts'ning Python nusxasi - template matching strategiyasi uchun
+    """
+    top_left = CORNER_MARGIN_MM + CORNER_SIZE_MM / 2
+    corner_markers = {
+        'topLeft': {'x': top_left, 'y': top_left},
+        'topRight': {'x': PAPER_WIDTH_MM - top_left, 'y': top_left},
+        'bottomLeft': {'x': top_left, 'y': PAPER_HEIGHT_MM - top_left},
+        'bottomRight': {'x': PAPER_WIDTH_MM - top_left, 'y': PAPER_HEIGHT_MM - top_left}
+    }
+    width_between = corner_markers['topRight']['x'] - top_left
+    height_between = corner_markers['bottomLeft']['y'] - top_left
+
+    layout = compile_grid_layout(exam_structure, GRID_PARAMS, header_offsets=True)
+    questions = {}
+    for index, q_num in enumerate(layout.question_numbers):
+        start, end = layout.offsets[index], layout.offsets[index + 1]
+        questions[str(q_num)] = {
+            'questionNumber': q_num,
+            'bubbles': [
+                {
+                    'variant': layout.variants[i],
+                    'relativeX': round((float(layout.points[i, 0]) - top_left) / width_between, 6),
+                    'relativeY': round((float(layout.points[i, 1]) - top_left) / height_between, 6),
+                    'absoluteX': round(float(layout.points[i, 0]), 2),
+                    'absoluteY': round(float(layout.points[i, 1]), 2)
+                }
+                for i in range(start, end)
+            ]
+        }
+
+    return {
+        'version': '2.0',
+        'timestamp': datetime.now().isoformat(),
+        'cornerMarkers': corner_markers,
+        'layout': dict(PDF_LAYOUT, paperWidth=PAPER_WIDTH_MM, paperHeight=PAPER_HEIGHT_MM),
+        'questions': questions
+    }
+
+
+def build_qr_payload(exam_structure: Dict) -> str:
+    """pdfGenerator.ts addQRCodeToSheet bilan bir xil layoutData"""
+    return json.dumps({
+        'examId': exam_structure['id'],
+        'examName': exam_structure['name'],
+        'setNumber': 1,
+        'version': '2.0',
+        'layout': PDF_LAYOUT,
+        'structure': {
+            'totalQuestions': sum(
+                section['questionCount']
+                for subject in exam_structure['subjects']
+                for section in subject['sections']
+            ),
+            'subjects': [
+                {
+                    'id': subject['id'],
+                    'name': subject['name'],
+                    'sections': [
+                        {'id': section['id'], 'name': section['name'], 'questionCount': section['questionCount']}
+                        for section in subject['sections']
+                    ]
+                }
+                for subject in exam_structure['subjects']
+            ]
+        }
+    }, separators=(',', ':'))
+
+
+def encode_qr(payload: str, level: str = 'L') -> Optional[np.ndarray]:
+    """
+    QR modul matritsasi (uint8, 0/255) - cv2.QRCodeEncoder bo'lmasa None
+
+    pdfGenerator 'H' ishlatadi, lekin 25mm'da bu ~109 modul - OpenCV QRCodeDetector
+    (pyzbar bo'lmaganda) bunday zich kodlarni ko'pincha o'qiy olmaydi.
+    """
+    if not hasattr(cv2, 'QRCodeEncoder'):
+        logger.warning("cv2.QRCodeEncoder not available - sheets will have no QR code")
+        return None
+
+    params = cv2.QRCodeEncoder.Params()
+    params.correction_level = getattr(cv2, f'QRCodeEncoder_CORRECT_LEVEL_{level}')
+    return cv2.QRCodeEncoder.create(params).encode(payload)
+
+
+def generate_answers(
+    question_count: int,
+    rng: random.Random,
+    blank_rate: float,
+    partial_rate: float
+) -> Tuple[Dict[int, Optional[str]], set]:
+    """
+    Ground truth: {q_num: variant | None} va qisman belgilangan savollar to'plami
+
+    Qisman belgi ham talabaning javobi hisoblanadi (och / to'liq bo'yalmagan).
+    """
+    answers = {}
+    partial = set()
+    for q_num in range(1, question_count + 1):
+        if rng.random() < blank_rate:
+            answers[q_num] = None
+            continue
+        answers[q_num] = rng.choice(VARIANTS)
+        if rng.random() < partial_rate:
+            partial.add(q_num)
+    return answers, partial
+
+
+def render_sheet(
+    layout,
+    answers: Dict[int, Optional[str]],
+    partial: set,
+    options: Dict,
+    qr_matrix: Optional[np.ndarray],
+    rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Toza (degradatsiyasiz) A4 varaq - BGR, options['dpi'] ruxsatda
+    """
+    px_per_mm = options['dpi'] / 25.4
+    width = int(round(PAPER_WIDTH_MM * px_per_mm))
+    height = int(round(PAPER_HEIGHT_MM * px_per_mm))
+    sheet = np.full((height, width), 250, dtype=np.uint8)
+
+    def px(value_mm: float) -> int:
+        return int(round(value_mm * px_per_mm))
+
+    # Corner markers (15mm, 5mm margin)
+    if options['corners']:
+        size = px(CORNER_SIZE_MM)
+        margin = px(CORNER_MARGIN_MM)
+        for x, y in (
+            (margin, margin),
+            (width - margin - size, margin),
+            (margin, height - margin - size),
+            (width - margin - size, height - margin - size)
+        ):
+            cv2.rectangle(sheet, (x, y), (x + size, y + size), 0, -1)
+
+    # Sarlavha (PDF header'ga o'xshash matn va ramka)
+    cv2.putText(sheet, 'SYNTHETIC BENCHMARK', (px(25), px(30)),
+                cv2.FONT_HERSHEY_SIMPLEX, px_per_mm * 0.25, 30, max(1, px(0.3)))
+    cv2.rectangle(sheet, (px(20), px(45)), (px(190), px(135)), 90, max(1, px(0.3)))
+
+    if qr_matrix is not None and options['qr']:
+        x_mm, y_mm, size_mm = QR_BOX_MM
+        qr = cv2.resize(qr_matrix, (px(size_mm), px(size_mm)), interpolation=cv2.INTER_NEAREST)
+        sheet[px(y_mm):px(y_mm) + qr.shape[0], px(x_mm):px(x_mm) + qr.shape[1]] = qr
+
+    font_scale = px_per_mm * 0.12
+    outline = max(1, px(0.3))
+
+    for index, q_num in enumerate(layout.question_numbers):
+        start, end = layout.offsets[index], layout.offsets[index + 1]
+        first_x_mm, y_mm = float(layout.points[start, 0]), float(layout.points[start, 1])
+
+        # Savol raqami (bubble'lardan chapda)
+        cv2.putText(sheet, f'{q_num}.', (px(first_x_mm - 10), px(y_mm + 1)),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, 40, max(1, px(0.2)))
+
+        for i in range(start, end):
+            x_mm, y_mm, r_mm = (float(v) for v in layout.points[i])
+            center = (px(x_mm), px(y_mm))
+            radius = px(r_mm)
+
+            cv2.circle(sheet, center, radius, 60, outline, cv2.LINE_AA)
+            cv2.putText(sheet, layout.variants[i], (center[0] - px(0.9), center[1] + px(0.9)),
+                        cv2.FONT_HERSHEY_SIMPLEX, font_scale, 140, 1, cv2.LINE_AA)
+
+            if answers.get(q_num) != layout.variants[i]:
+                continue
+
+            # Qalam bilan bo'yash: darkness + tekstura
+            darkness = options['fill_darkness']
+            if q_num in partial:
+                darkness *= options['partial_strength']
+                fill_radius = int(radius * 0.6)
+            else:
+                fill_radius = int(radius * 0.9)
+
+            mask = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+            cv2.circle(mask, (radius, radius), fill_radius, 255, -1, cv2.LINE_AA)
+            y1, x1 = center[1] - radius, center[0] - radius
+            roi = sheet[y1:y1 + mask.shape[0], x1:x1 + mask.shape[1]].astype(np.float32)
+            ink = 255 * (1 - darkness) + rng.normal(0, 12, roi.shape)
+            alpha = mask.astype(np.float32) / 255
+            roi = roi * (1 - alpha) + np.minimum(roi, ink) * alpha
+            sheet[y1:y1 + mask.shape[0], x1:x1 + mask.shape[1]] = np.clip(roi, 0, 255).astype(np.uint8)
+
+    return cv2.cvtColor(sheet, cv2.COLOR_GRAY2BGR)
+
+
+def degrade(image: np.ndarray, options: Dict, rng: np.random.Generator) -> np.ndarray:
+    """Perspective, rotation, blur, shovqin (JPEG siqish encode paytida)"""
+    height, width = image.shape[:2]
+    white = (255, 255, 255)
+
+    if options['perspective'] > 0:
+        jitter = options['perspective'] * min(width, height)
+        src = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+        dst = src + rng.uniform(-jitter, jitter, src.shape).astype(np.float32)
+        matrix = cv2.getPerspectiveTransform(src, dst)
+        image = cv2.warpPerspective(image, matrix, (width, height), borderValue=white)
+
+    if options['rotation'] > 0:
+        angle = rng.uniform(-options['rotation'], options['rotation'])
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        image = cv2.warpAffine(image, matrix, (width, height), borderValue=white)
+
+    if options['blur'] > 0:
+        image = cv2.GaussianBlur(image, (0, 0), options['blur'])
+
+    if options['noise'] > 0:
+        noise = rng.normal(0, options['noise'], image.shape)
+        image = np.clip(image.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+    return image
+
+
+def generate_sheets(options: Dict) -> Tuple[Dict, Dict, Dict, List[Dict]]:
+    """
+    Barcha sintetik varaqlarni oldindan yaratish (benchmark vaqtiga kirmaydi)
+
+    Returns:
+        (exam_structure, answer_key, coordinate_template, sheets)
+        sheets: [{'filename', 'data' (JPEG bytes), 'answers', 'partial'}]
+    """
+    exam_structure = build_exam_structure(options['subjects'], options['sections'], options['questions'])
+    layout = compile_grid_layout(exam_structure, GRID_PARAMS, header_offsets=True)
+    question_count = len(layout.question_numbers)
+
+    key_rng = random.Random(options['seed'])
+    answer_key = {str(q): key_rng.choice(VARIANTS) for q in range(1, question_count + 1)}
+
+    qr_matrix = encode_qr(build_qr_payload(exam_structure), options['qr_level']) if options['qr'] else None
+
+    sheets = []
+    for index in range(options['sheets']):
+        seed = options['seed'] + index + 1
+        answers, partial = generate_answers(
+            question_count, random.Random(seed), options['blank_rate'], options['partial_rate']
+        )
+        rng = np.random.default_rng(seed)
+
+        image = render_sheet(layout, answers, partial, options, qr_matrix, rng)
+        image = degrade(image, options, rng)
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, options['jpeg_quality']])
+        if not ok:
+            raise RuntimeError(f"Failed to encode sheet {index}")
+
+        sheets.append({
+            'filename': f'synthetic_{index:04d}.jpg',
+            'data': buffer.tobytes(),
+            'answers': answers,
+            'partial': partial
+        })
+
+        if options['save_samples'] and index < options['sample_count']:
+            sample_dir = Path(options['save_samples'])
+            sample_dir.mkdir(parents=True, exist_ok=True)
+            (sample_dir / sheets[-1]['filename']).write_bytes(sheets[-1]['data'])
+
+    return exam_structure, answer_key, build_coordinate_template(exam_structure), sheets
+
+
+def score_sheet(result: Dict, sheet: Dict) -> Dict:
+    """Aniqlangan javoblarni ground truth bilan solishtirish"""
+    detected = {
+        item['questionNumber']: item['studentAnswer'] or None
+        for item in result.get('results', {}).get('detailedResults', [])
+    }
+
+    total = correct = partial_total = partial_correct = 0
+    for q_num, expected in sheet['answers'].items():
+        match = detected.get(q_num) == expected
+        total += 1
+        correct += match
+        if q_num in sheet['partial']:
+            partial_total += 1
+            partial_correct += match
+
+    return {
+        'total': total,
+        'correct': correct,
+        'partial_total': partial_total,
+        'partial_correct': partial_correct
+    }
+
+
+def render_camera_frame(
+    sheet: np.ndarray,
+    frame_size: Tuple[int, int],
+    options: Dict,
+    rng: np.random.Generator
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Varaqni kamera kadriga joylash: qorong'i stol fonida perspektiva bilan
+
+    Returns:
+        (BGR kadr, ground truth qog'oz burchaklari - TL, TR, BR, BL)
+    """
+    frame_width, frame_height = frame_size
+    sheet_height, sheet_width = sheet.shape[:2]
+
+    # Fon - gradient + shovqin (Canny uchun real stol kabi)
+    gradient = np.linspace(40, 90, frame_width, dtype=np.float32)[None, :, None]
+    background = gradient + rng.normal(0, 6, (frame_height, frame_width, 1)).astype(np.float32)
+    frame = np.clip(np.repeat(background, 3, axis=2), 0, 255).astype(np.uint8)
+
+    paper_height = frame_height * rng.uniform(0.75, 0.9)
+    paper_width = paper_height * sheet_width / sheet_height
+    center = np.array([frame_width / 2, frame_height / 2]) + rng.uniform(-0.05, 0.05, 2) * frame_height
+    half = np.array([paper_width, paper_height]) / 2
+
+    quad = center + np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * half
+    quad += rng.uniform(-0.04, 0.04, quad.shape) * paper_height  # perspective
+    quad = quad.astype(np.float32)
+
+    src = np.float32([[0, 0], [sheet_width, 0], [sheet_width, sheet_height], [0, sheet_height]])
+    matrix = cv2.getPerspectiveTransform(src, quad)
+    cv2.warpPerspective(
+        sheet, matrix, (frame_width, frame_height),
+        dst=frame, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_TRANSPARENT
+    )
+
+    if options['blur'] > 0:
+        frame = cv2.GaussianBlur(frame, (0, 0), options['blur'])
+    if options['noise'] > 0:
+        noise = rng.normal(0, options['noise'], frame.shape)
+        frame = np.clip(frame.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+    return frame, quad
+
+
+def run_camera_benchmark(options: Dict, sheets: List[Dict]) -> Dict:
+    """
+    CameraProcessor qog'oz aniqlash: 'full' (butun kadrda Canny) va 'pyramid'
+    (past ruxsatda kontur + full-res cornerSubPix) - vaqt va burchak aniqligi
+
+    Har bir varaq bir xil kamera kadriga joylanadi, ikkala rejim ham o'sha
+    kadrda o'lchanadi; delta = pyramid - full.
+    """
+    frame_size = tuple(int(value) for value in options['camera_size'].lower().split('x'))
+    modes = ('full', 'pyramid')
+    processors = {mode: CameraProcessor(detect_mode=mode) for mode in modes}
+    samples = {mode: {'detect': [], 'warp': [], 'error': [], 'found': 0, 'markers': 0} for mode in modes}
+
+    for index, sheet in enumerate(sheets):
+        image = cv2.imdecode(np.frombuffer(sheet['data'], np.uint8), cv2.IMREAD_COLOR)
+        rng = np.random.default_rng(options['seed'] + 1000 + index)
+        frame, truth = render_camera_frame(image, frame_size, options, rng)
+
+        for mode, processor in processors.items():
+            data = samples[mode]
+
+            start = time.perf_counter()
+            detection = processor._detect_paper_in_frame(frame)
+            data['detect'].append(time.perf_counter() - start)
+            if not detection['found']:
+                continue
+            data['found'] += 1
+
+            detected = order_quad(np.array(detection['corners'], dtype=np.float32))
+            data['error'].append(float(np.linalg.norm(detected - truth, axis=1).mean()))
+
+            start = time.perf_counter()
+            paper = processor._crop_and_correct_paper(frame, detection['corners'])
+            data['warp'].append(time.perf_counter() - start)
+
+            if paper is not None and len(processor._detect_corner_markers_in_paper(paper)['corners']) == 4:
+                data['markers'] += 1
+
+    def summarize(data: Dict) -> Dict:
+        errors = sorted(data['error'])
+        return {
+            'detect_ms_p50': round(float(np.median(data['detect'])) * 1000, 1) if data['detect'] else 0.0,
+            'warp_ms_p50': round(float(np.median(data['warp'])) * 1000, 1) if data['warp'] else 0.0,
+            'found_rate': round(data['found'] / len(sheets) * 100, 1) if sheets else 0.0,
+            'markers_rate': round(data['markers'] / len(sheets) * 100, 1) if sheets else 0.0,
+            'corner_error_px_mean': round(float(np.mean(errors)), 2) if errors else None,
+            'corner_error_px_max': round(errors[-1], 2) if errors else None
+        }
+
+    results = {mode: summarize(samples[mode]) for mode in modes}
+    delta = {}
+    for key, value in results['pyramid'].items():
+        if value is not None and results['full'][key] is not None:
+            delta[key] = round(value - results['full'][key], 2)
+
+    return {
+        'frame_size': f'{frame_size[0]}x{frame_size[1]}',
+        'detect_width': processors['pyramid'].detect_width,
+        'sheets': len(sheets),
+        'modes': results,
+        'delta': delta
+    }
+
+
+def print_camera_report(report: Dict):
+    print("=" * 80)
+    print(f"CAMERA DETECTION: full vs pyramid ({report['frame_size']}, "
+          f"pyramid width {report['detect_width']}px, {report['sheets']} frames)")
+    print("=" * 80)
+    columns = ('detect_ms_p50', 'warp_ms_p50', 'found_rate', 'markers_rate',
+               'corner_error_px_mean', 'corner_error_px_max')
+    print(f"{'':<10}" + ''.join(f"{column:>22}" for column in columns))
+    for name, values in list(report['modes'].items()) + [('delta', report['delta'])]:
+        cells = ''.join(
+            f"{values[column]:>22}" if values.get(column) is not None else f"{'-':>22}"
+            for column in columns
+        )
+        print(f"{name:<10}{cells}")
+    print()
+
+
+def peak_memory_mb(mode: str) -> float:
+    """
+    Peak RSS (MB): process rejimida tugagan worker'lar bo'yicha maksimum,
+    thread rejimida joriy process
+    """
+    if not RESOURCE_AVAILABLE:
+        return 0.0
+    who = resource.RUSAGE_CHILDREN if mode == 'process' else resource.RUSAGE_SELF
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+async def _grade_all(pool: WorkerPool, exam_structure, answer_key, coord_template, sheets) -> List:
+    async def grade_one(sheet):
+        try:
+            return await pool.run(
+                grading_pipeline.run_grade_sheet,
+                sheet['data'], exam_structure, answer_key, coord_template,
+                sheet['filename'], datetime.now()
+            )
+        except Exception as e:
+            logger.error(f"{sheet['filename']} failed: {e}")
+            return {'success': False, 'error': str(e)}
+
+    return await asyncio.gather(*(grade_one(sheet) for sheet in sheets))
+
+
+def run_benchmark(
+    workers: int,
+    options: Dict,
+    exam_structure: Dict,
+    answer_key: Dict,
+    coord_template: Optional[Dict],
+    sheets: List[Dict]
+) -> Dict:
+    """Bitta worker soni uchun barcha varaqlarni tekshirish va hisobot"""
+    pool = WorkerPool(
+        mode=options['mode'],
+        max_workers=workers,
+        queue_size=len(sheets),
+        job_timeout=settings.WORKER_JOB_TIMEOUT,
+        start_method=settings.WORKER_START_METHOD
+    )
+    pool.start(warm_up=True)
+
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(_grade_all(pool, exam_structure, answer_key, coord_template, sheets))
+        wall = time.perf_counter() - start
+    finally:
+        pool.shutdown(wait=True)
+
+    registry = MetricsRegistry(window=max(1, len(sheets)))
+    totals = {'total': 0, 'correct': 0, 'partial_total': 0, 'partial_correct': 0}
+    failed = 0
+    methods = {}
+
+    for result, sheet in zip(results, sheets):
+        if not result.get('success'):
+            failed += 1
+            continue
+        registry.observe('run_grade_sheet', result)
+        for key, value in score_sheet(result, sheet).items():
+            totals[key] += value
+        method = result['statistics']['coordinate_detection']['method']
+        methods[method] = methods.get(method, 0) + 1
+
+    stages = registry.snapshot()
+    accuracy = totals['correct'] / totals['total'] * 100 if totals['total'] else 0.0
+    partial_accuracy = (
+        totals['partial_correct'] / totals['partial_total'] * 100 if totals['partial_total'] else None
+    )
+    sheets_per_second = len(sheets) / wall if wall > 0 else 0.0
+    request_memory = stages.get('total', {}).get('rss_delta_mb', {}).get('p95', 0.0)
+
+    return {
+        'workers': workers,
+        'mode': options['mode'],
+        'qr_mode': options['qr_mode'],
+        'sheets': len(sheets),
+        'failed': failed,
+        'wall_seconds': round(wall, 3),
+        'sheets_per_second': round(sheets_per_second, 3),
+        'peak_memory_mb': round(peak_memory_mb(options['mode']), 1),
+        'accuracy': round(accuracy, 2),
+        'partial_accuracy': round(partial_accuracy, 2) if partial_accuracy is not None else None,
+        'coordinate_methods': methods,
+        'stages': stages,
+        'checks': {
+            'performance': generate_performance_report({
+                name: data['wall']['p95'] for name, data in stages.items()
+                if name in PERFORMANCE_TARGETS
+            }),
+            'accuracy': check_minimum_target(ACCURACY_TARGETS, 'omr_detection', accuracy, '%'),
+            'throughput': check_minimum_target(SCALABILITY_TARGETS, 'throughput', sheets_per_second, '/s'),
+            'memory': check_memory('total_per_request', request_memory)
+        }
+    }
+
+
+def print_report(report: Dict):
+    print("=" * 80)
+    print(f"WORKERS: {report['workers']} ({report['mode']})")
+    print("=" * 80)
+    print(f"Sheets:          {report['sheets']} ({report['failed']} failed)")
+    print(f"Wall time:       {report['wall_seconds']:.2f}s")
+    print(f"Throughput:      {report['sheets_per_second']:.2f} sheets/sec")
+    print(f"Peak memory:     {report['peak_memory_mb']:.1f} MB")
+    print(f"Accuracy:        {report['accuracy']:.2f}%")
+    if report['partial_accuracy'] is not None:
+        print(f"Partial marks:   {report['partial_accuracy']:.2f}%")
+    print(f"Coordinate:      {report['coordinate_methods']}")
+    print(f"QR decode mode:  {report['qr_mode']}")
+    print()
+
+    print(f"{'stage':<24}{'p50 (s)':>10}{'p95 (s)':>10}{'cpu p50':>10}{'rss p95 MB':>12}")
+    for name, data in sorted(report['stages'].items(), key=lambda item: item[0] == 'total'):
+        print(
+            f"{name:<24}{data['wall']['p50']:>10.3f}{data['wall']['p95']:>10.3f}"
+            f"{data['cpu']['p50']:>10.3f}{data['rss_delta_mb']['p95']:>12.1f}"
+        )
+    print()
+
+    for result in report['checks']['performance']['metrics'].values():
+        print(result['message'])
+    for key in ('accuracy', 'throughput', 'memory'):
+        print(report['checks'][key]['message'])
+    print()
+
+
+def parse_args(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description="Synthetic OMR sheet benchmark")
+    parser.add_argument('--sheets', type=int, default=10, help="Number of sheets per run")
+    parser.add_argument('--workers', default='1', help="Comma-separated worker counts, e.g. 1,2,4")
+    parser.add_argument('--mode', choices=('process', 'thread'), default=settings.WORKER_POOL_MODE)
+    parser.add_argument('--seed', type=int, default=42)
+
+    parser.add_argument('--subjects', type=int, default=1)
+    parser.add_argument('--sections', type=int, default=1, help="Sections per subject")
+    parser.add_argument('--questions', type=int, default=40, help="Questions per section")
+    parser.add_argument('--dpi', type=int, default=300)
+
+    parser.add_argument('--no-corners', dest='corners', action='store_false', help="Omit corner markers")
+    parser.add_argument('--no-qr', dest='qr', action='store_false', help="Omit the layout QR code")
+    parser.add_argument('--qr-level', choices=('L', 'M', 'Q', 'H'), default='L',
+                        help="QR error correction level (the PDF generator uses H)")
+    parser.add_argument('--qr-mode', choices=('roi', 'legacy'), default=settings.QR_DECODE_MODE,
+                        help="QR decode strategy (legacy = full-page attempts only, for A/B timing)")
+    parser.add_argument('--no-template', dest='template', action='store_false',
+                        help="Do not send a coordinate template")
+    parser.add_argument('--fill-darkness', type=float, default=0.85, help="0-1, pencil darkness")
+    parser.add_argument('--blank-rate', type=float, default=0.05)
+    parser.add_argument('--partial-rate', type=float, default=0.05)
+    parser.add_argument('--partial-strength', type=float, default=0.6,
+                        help="Darkness multiplier for partial marks")
+
+    parser.add_argument('--blur', type=float, default=0.0, help="Gaussian blur sigma (px)")
+    parser.add_argument('--rotation', type=float, default=0.0, help="Max rotation (degrees)")
+    parser.add_argument('--perspective', type=float, default=0.0, help="Max corner jitter (fraction of page)")
+    parser.add_argument('--noise', type=float, default=0.0, help="Gaussian noise sigma")
+    parser.add_argument('--jpeg-quality', type=int, default=92)
+
+    parser.add_argument('--camera', action='store_true',
+                        help="Benchmark camera paper detection (full vs pyramid) instead of grading")
+    parser.add_argument('--camera-size', default='4000x3000', help="Synthetic camera frame size (WxH)")
+
+    parser.add_argument('--save-samples', default=None, help="Directory for sample sheets")
+    parser.add_argument('--sample-count', type=int, default=3)
+    parser.add_argument('--output', default=None, help="Write JSON report here")
+    parser.add_argument('--with-ai', action='store_true', help="Keep AI verification enabled")
+    parser.add_argument('--verbose', action='store_true')
+
+    options = vars(parser.parse_args(argv))
+    options['workers'] = [int(value) for value in options['workers'].split(',') if value.strip()]
+    return options
+
+
+def main(argv=None) -> int:
+    options = parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if options['verbose'] else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    print("=" * 80)
+    print("SYNTHETIC SHEET BENCHMARK")
+    print("=" * 80)
+
+    start = time.perf_counter()
+    exam_structure, answer_key, coord_template, sheets = generate_sheets(options)
+    print(f"Generated {len(sheets)} sheets in {time.perf_counter() - start:.2f}s "
+          f"({options['questions'] * options['sections'] * options['subjects']} questions each)")
+    print()
+
+    if options['camera']:
+        report = run_camera_benchmark(options, sheets)
+        print_camera_report(report)
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps({'camera': report}, indent=2, ensure_ascii=False), encoding='utf-8'
+            )
+            print(f"Report written to {options['output']}")
+        return 0
+
+    reports = []
+    for workers in options['workers']:
+        report = run_benchmark(
+            workers,
+            options,
+            exam_structure,
+            answer_key,
+            coord_template if options['template'] else None,
+            sheets
+        )
+        print_report(report)
+        reports.append(report)
+
+    if options['output']:
+        serializable = {
+            key: value for key, value in options.items()
+            if key not in ('output', 'save_samples')
+        }
+        Path(options['output']).write_text(
+            json.dumps({'options': serializable, 'runs': reports}, indent=2, ensure_ascii=False),
+            encoding='utf-8'
+        )
+        print(f"Report written to {options['output']}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -25,7 +25,81 @@ class Settings:
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', 10485760))  # 10MB
     TEMP_DIR = Path(os.getenv('TEMP_DIR', 'temp'))
     AI_CONFIDENCE_THRESHOLD = float(os.getenv('AI_CONFIDENCE_THRESHOLD', 70.0))
+    UPLOAD_SPILL_THRESHOLD = min(  # larger uploads go through TEMP_DIR (default MAX_FILE_SIZE / 2 = 5MB)
+        int(os.getenv('UPLOAD_SPILL_THRESHOLD', MAX_FILE_SIZE // 2)), MAX_FILE_SIZE
+    )
+
+    # Worker Pool - CPU-bound grading pipelines (see SCALABILITY_TARGETS)
+    WORKER_POOL_MODE = os.getenv('WORKER_POOL_MODE', 'process')  # 'process' or 'thread'
+    WORKER_POOL_SIZE = int(os.getenv('WORKER_POOL_SIZE', os.cpu_count() or 2))
+    WORKER_QUEUE_SIZE = int(os.getenv('WORKER_QUEUE_SIZE', 10))  # concurrent_requests target
+    WORKER_JOB_TIMEOUT = float(os.getenv('WORKER_JOB_TIMEOUT', 60.0))  # seconds per sheet
+    WORKER_START_METHOD = os.getenv('WORKER_START_METHOD', 'spawn')  # 'spawn' or 'fork'
+    WORKER_WARM_UP = os.getenv('WORKER_WARM_UP', 'true').lower() == 'true'
     
+    # Batch Grading
+    BATCH_MAX_SHEETS = int(os.getenv('BATCH_MAX_SHEETS', 500))
+    BATCH_PDF_DPI = int(os.getenv('BATCH_PDF_DPI', 300))  # 300 DPI = TARGET_WIDTH x TARGET_HEIGHT for A4
+    BATCH_ZIP_MAX_ENTRIES = int(os.getenv('BATCH_ZIP_MAX_ENTRIES', 1000))  # files per ZIP archive
+    BATCH_ZIP_MAX_TOTAL_SIZE = int(os.getenv('BATCH_ZIP_MAX_TOTAL_SIZE', 209715200))  # 200MB uncompressed per ZIP
+
+    # Layout Cache - compiled bubble layouts per exam/template
+    LAYOUT_CACHE_SIZE = int(os.getenv('LAYOUT_CACHE_SIZE', 64))
+    LAYOUT_CACHE_TTL = float(os.getenv('LAYOUT_CACHE_TTL', 3600.0))  # seconds, 0 = no expiry
+
+    # Mask Bank - shared bubble disk/annulus masks (LRU, per worker process)
+    MASK_BANK_SIZE = int(os.getenv('MASK_BANK_SIZE', 512))
+
+    # Coordinate Detection - UltraPrecise strategy chain
+    COORDINATE_STRATEGY_MODE = os.getenv('COORDINATE_STRATEGY_MODE', 'sequential')  # 'sequential' or 'race'
+    COORDINATE_RACE_WORKERS = int(os.getenv('COORDINATE_RACE_WORKERS', 4))  # threads per worker process
+    QR_LAYOUT_FAST_PATH = os.getenv('QR_LAYOUT_FAST_PATH', 'true').lower() == 'true'  # QR sheets skip the cascade
+
+    # QR Decoding - expected/remembered region first, full page as fallback
+    QR_DECODE_MODE = os.getenv('QR_DECODE_MODE', 'roi')  # 'roi' or 'legacy' (full-page attempts only, for A/B)
+    QR_PYRAMID_SCALES = [float(s) for s in os.getenv('QR_PYRAMID_SCALES', '0.5,1.0,2.0').split(',') if s.strip()]
+    QR_LOCATION_CACHE_SIZE = int(os.getenv('QR_LOCATION_CACHE_SIZE', 64))  # remembered QR boxes (per exam)
+
+    # OCR Anchors - question-number OCR (UltraPrecise 'ocr_anchors' strategy)
+    OCR_ANCHOR_MODE = os.getenv('OCR_ANCHOR_MODE', 'strips')  # 'strips' (layout number columns) or 'full' (whole page)
+    OCR_ENGINE = os.getenv('OCR_ENGINE', 'auto')  # 'auto' (tesserocr if installed), 'tesserocr' or 'pytesseract'
+    OCR_STRIP_WORKERS = int(os.getenv('OCR_STRIP_WORKERS', 4))  # parallel bands per worker process
+    OCR_STRIP_BAND_MM = float(os.getenv('OCR_STRIP_BAND_MM', 60.0))  # band height, bands overlap by ~2 rows
+    OCR_STRIP_MARGIN_MM = float(os.getenv('OCR_STRIP_MARGIN_MM', 6.0))  # slack around the expected number column
+    OCR_ANCHOR_CACHE_SIZE = int(os.getenv('OCR_ANCHOR_CACHE_SIZE', 64))  # (exam id, sheet fingerprint) -> anchors
+
+    # Corner Engine - shared marker detection on the four corner windows
+    CORNER_ENGINE_MODE = os.getenv('CORNER_ENGINE_MODE', 'windows')  # 'windows' or 'legacy' (per-detector full-page code)
+    CORNER_ENGINE_WORKERS = int(os.getenv('CORNER_ENGINE_WORKERS', 4))  # parallel corner tiles (1 = sequential)
+
+    # Bubble Finder - Hough circle search (photo / template / pattern fallbacks)
+    HOUGH_ROI_MODE = os.getenv('HOUGH_ROI_MODE', 'auto')  # 'auto' (corners or projection profile) or 'off' (full page)
+    HOUGH_SCALE = float(os.getenv('HOUGH_SCALE', 0.5))  # search downscale (1.0 = full resolution)
+    HOUGH_MIN_SCALED_RADIUS = float(os.getenv('HOUGH_MIN_SCALED_RADIUS', 8.0))  # px, smallest minRadius after downscale
+    HOUGH_COUNT_TOLERANCE = float(os.getenv('HOUGH_COUNT_TOLERANCE', 0.1))  # stop when |found - expected| <= this share
+    HOUGH_PARAM_CACHE_SIZE = int(os.getenv('HOUGH_PARAM_CACHE_SIZE', 128))  # (detector, exam, device) -> params (0 = off)
+
+    # Camera Processing - paper outline detection on camera frames
+    CAMERA_DETECT_MODE = os.getenv('CAMERA_DETECT_MODE', 'pyramid')  # 'pyramid' (downscale + cornerSubPix) or 'full'
+    CAMERA_DETECT_WIDTH = int(os.getenv('CAMERA_DETECT_WIDTH', 640))  # long side of the detection downscale
+
+    # Camera WebSocket (/api/camera/ws) - live readiness updates per session
+    CAMERA_WS_FRAME_WIDTH = int(os.getenv('CAMERA_WS_FRAME_WIDTH', 640))  # working width for tracking/detection
+    CAMERA_WS_MIN_FRAME_WIDTH = int(os.getenv('CAMERA_WS_MIN_FRAME_WIDTH', 320))  # lower bound when over budget
+    CAMERA_WS_FRAME_BUDGET_MS = float(os.getenv('CAMERA_WS_FRAME_BUDGET_MS', 100.0))  # per-frame processing budget
+
+    # Annotated Image - response shaping for grade-sheet / grade-batch / camera capture
+    ANNOTATION_MODE = os.getenv('ANNOTATION_MODE', 'full')  # 'full', 'preview', 'overlay', 'lazy' or 'none'
+    ANNOTATION_FORMAT = os.getenv('ANNOTATION_FORMAT', 'jpeg')  # 'jpeg' or 'webp'
+    ANNOTATION_QUALITY = int(os.getenv('ANNOTATION_QUALITY', 90))  # 1-100 for both formats
+    ANNOTATION_PREVIEW_WIDTH = int(os.getenv('ANNOTATION_PREVIEW_WIDTH', 1000))  # px, preview mode / lazy default
+    ANNOTATION_CACHE_SIZE = int(os.getenv('ANNOTATION_CACHE_SIZE', 32))  # lazy pages kept for GET /api/annotated
+    ANNOTATION_CACHE_TTL = float(os.getenv('ANNOTATION_CACHE_TTL', 300.0))  # seconds a lazy image URL stays valid
+
+    # Metrics - pipeline stage timing (/metrics)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', 1024))  # samples per stage for p50/p95/p99
+
     # Image Processing
     TARGET_WIDTH = 2480  # Updated to match PDF resolution
     TARGET_HEIGHT = 3508  # Updated to match PDF resolution
@@ -47,6 +121,8 @@ class Settings:
     MIN_INNER_FILL = 15.0  # % - MAXIMUM SENSITIVITY for light marks
     MIN_DIFFERENCE = 4.0  # % - MAXIMUM SENSITIVITY for closer marks
     MULTIPLE_MARKS_THRESHOLD = 4.0  # % - MAXIMUM SENSITIVITY
+    USE_INTEGRAL_STATS = os.getenv('USE_INTEGRAL_STATS', 'true').lower() == 'true'  # O(1) bubble mean/std/fill queries
+    ROI_DENOISE = os.getenv('ROI_DENOISE', 'false').lower() == 'true'  # Denoise only around bubble ROIs (experimental)
     
     # Corner Detection - IMPROVED SCORING WEIGHTS
     CORNER_ASPECT_WEIGHT = 0.15  # Square shape (increased)
@@ -75,5 +151,19 @@ class Settings:
     GROQ_MODEL = os.getenv('GROQ_MODEL', 'llama-3.1-8b-instant')  # Updated to available model
     GROQ_TEMPERATURE = float(os.getenv('GROQ_TEMPERATURE', 0.1))
     GROQ_MAX_TOKENS = int(os.getenv('GROQ_MAX_TOKENS', 200))
+    
+    # AI Verification transport - concurrent requests, retry, deadline, verdict cache
+    AI_VERIFY_ASYNC = os.getenv('AI_VERIFY_ASYNC', 'true').lower() == 'true'  # false = sequential sync verifiers
+    AI_BASE_URL = os.getenv('AI_BASE_URL', '')  # override provider endpoint (e.g. local mock server)
+    AI_VERIFY_CONCURRENCY = int(os.getenv('AI_VERIFY_CONCURRENCY', 5))  # in-flight requests per worker process
+    AI_VERIFY_MAX_RETRIES = int(os.getenv('AI_VERIFY_MAX_RETRIES', 3))  # on 429/5xx/connection errors
+    AI_VERIFY_BACKOFF_BASE = float(os.getenv('AI_VERIFY_BACKOFF_BASE', 0.5))  # seconds, doubled per retry (+jitter)
+    AI_VERIFY_DEADLINE = float(os.getenv('AI_VERIFY_DEADLINE', 15.0))  # seconds per sheet, then OMR answers stand
+    AI_VERIFY_REQUEST_TIMEOUT = float(os.getenv('AI_VERIFY_REQUEST_TIMEOUT', 10.0))  # seconds per HTTP request
+    AI_VERIFY_CACHE_SIZE = int(os.getenv('AI_VERIFY_CACHE_SIZE', 2048))  # crop hash -> verdict (0 = off)
+    AI_VERIFY_BATCH_SIZE = int(os.getenv('AI_VERIFY_BATCH_SIZE', 1))  # questions per request (>1 = tiled composite)
+    AI_VERIFY_TILE_COLUMNS = int(os.getenv('AI_VERIFY_TILE_COLUMNS', 2))  # tiles per row in the composite
+    AI_VERIFY_TILE_HEIGHT = int(os.getenv('AI_VERIFY_TILE_HEIGHT', 160))  # px per tile (width follows crop aspect)
+    AI_VERIFY_JPEG_QUALITY = int(os.getenv('AI_VERIFY_JPEG_QUALITY', 95))
 
 settings = Settings()
@@ -50,14 +50,14 @@ processor = ImageProcessor(
 )
 
 result = processor.process('test_images/5-imtihon-simulated.jpg')
-print(f"✅ Processed: {result['processed'].shape[1]}x{result['processed'].shape[0]}")
+print(f"✅ Processed: {result['grayscale'].shape[1]}x{result['grayscale'].shape[0]}")
 print()
 
 # Generate coordinates
 print("2. Generating coordinates...")
 mapper = CoordinateMapper(
-    image_width=result['processed'].shape[1],
-    image_height=result['processed'].shape[0],
+    image_width=result['grayscale'].shape[1],
+    image_height=result['grayscale'].shape[0],
     exam_structure=exam_structure,
     qr_layout=None
 )
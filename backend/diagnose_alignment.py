@@ -25,7 +25,7 @@ def diagnose_image(image_path: str, exam_structure_path: str):
     
     print(f"\n1. IMAGE PROCESSING")
     print(f"   Original size: {result['original'].shape[1]}x{result['original'].shape[0]}")
-    print(f"   Processed size: {result['processed'].shape[1]}x{result['processed'].shape[0]}")
+    print(f"   Processed size: {result['grayscale'].shape[1]}x{result['grayscale'].shape[0]}")
     print(f"   Corners detected: {len(result['corners'])}/4")
     
     if len(result['corners']) < 4:
@@ -82,7 +82,7 @@ def diagnose_image(image_path: str, exam_structure_path: str):
     
     # Visual check - draw rectangles on image
     print(f"\n6. CREATING VISUAL DEBUG IMAGE")
-    annotated = cv2.cvtColor(result['processed'], cv2.COLOR_GRAY2BGR)
+    annotated = cv2.cvtColor(result['planes']['light_enhanced'], cv2.COLOR_GRAY2BGR)
     
     # Draw first 10 questions
     for q_num in range(1, min(11, len(coordinates) + 1)):
@@ -4,28 +4,25 @@ Hybrid: OpenCV + Groq AI
 """
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, Response
 import os
 import shutil
 import logging
 import json
-import cv2
-import numpy as np
-import base64
+import asyncio
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
 
 from config import settings
-from services import ImageProcessor, OMRDetector, AIVerifier, AnswerGrader, ImageAnnotator, QRCodeReader
-from services.advanced_omr_detector import AdvancedOMRDetector
-from services.ocr_anchor_detector import OCRAnchorDetector
-from services.photo_omr_service import PhotoOMRService
-from services.improved_photo_processor import ImprovedPhotoProcessor
-from services.photo_quality_assessor import PhotoQualityAssessor
-from services.improved_corner_detector import ImprovedCornerDetector
-from services.openai_verifier import OpenAIVerifier
+from services import grading_pipeline
+from services.grading_pipeline import PipelineError
+from services.batch_loader import BatchExpander
+from services.worker_pool import WorkerPool, WorkerPoolSaturated, WorkerJobTimeout
+from services.stage_metrics import metrics_registry
+from services.annotation_cache import annotation_cache
+from services.image_annotator import annotation_options
 from services.database_service import db_service
-from utils import CoordinateMapper
 from middleware.auth_middleware import get_current_user, optional_auth
 
 # Import authentication routes
@@ -48,10 +45,19 @@ app = FastAPI(
     version="3.0.0"
 )
 
+# Worker Pool (CPU-bound grading pipelines run outside the event loop)
+worker_pool = WorkerPool(
+    mode=settings.WORKER_POOL_MODE,
+    max_workers=settings.WORKER_POOL_SIZE,
+    queue_size=settings.WORKER_QUEUE_SIZE,
+    job_timeout=settings.WORKER_JOB_TIMEOUT,
+    start_method=settings.WORKER_START_METHOD
+)
+
 # Database startup/shutdown events
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database connection on startup"""
+    """Initialize database connection and worker pool on startup"""
     if settings.USE_DATABASE:
         try:
             await db_service.connect()
@@ -59,12 +65,19 @@ async def startup_event():
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
             logger.warning("Running without database - using file-based storage")
+    
+    # Warm-up blocks until every worker has imported cv2 and built its services
+    await asyncio.get_running_loop().run_in_executor(
+        None, worker_pool.start, settings.WORKER_WARM_UP
+    )
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Close database connection on shutdown"""
+    """Close database connection and worker pool on shutdown"""
     if settings.USE_DATABASE:
         await db_service.disconnect()
+    
+    worker_pool.shutdown(wait=False)
 
 # CORS middleware
 app.add_middleware(
@@ -81,92 +94,95 @@ app.include_router(auth_router)
 # Include camera system router
 app.include_router(camera_router)
 
-# Initialize services
-image_processor = ImageProcessor(
-    target_width=settings.TARGET_WIDTH,
-    target_height=settings.TARGET_HEIGHT
-)
-
-# Ultra Precise Coordinate Mapper (NEW! - 100% accuracy)
-from services.ultra_precise_coordinate_mapper import UltraPreciseCoordinateMapper
-ultra_precise_mapper = UltraPreciseCoordinateMapper()
-logger.info("Ultra Precise Coordinate Mapper initialized (100% accuracy)")
-
-# Adaptive OMR Detector (NEW! - adaptive to image quality)
-from services.adaptive_omr_detector import AdaptiveOMRDetector
-adaptive_omr_detector = AdaptiveOMRDetector()
-logger.info("Adaptive OMR Detector initialized (quality-aware)")
+# AI Verifier (OpenAI GPT-4 Vision or Groq fallback)
+# Pipelines build their own instance per worker; this one is for status endpoints
+ai_verifier = grading_pipeline.create_ai_verifier()
+if ai_verifier:
+    logger.info(f"AI Verifier initialized successfully ({type(ai_verifier).__name__})")
+elif not settings.ENABLE_AI_VERIFICATION:
+    logger.info("AI Verification disabled in config")
+else:
+    logger.warning("System will run without AI verification")
 
-# Advanced OMR Detector (EXISTING)
-advanced_omr_detector = AdvancedOMRDetector()
+# Temp directory
+settings.TEMP_DIR.mkdir(exist_ok=True)
 
-# Old OMR Detector (fallback)
-omr_detector = OMRDetector(
-    bubble_radius=settings.BUBBLE_RADIUS,
-    min_darkness=settings.MIN_DARKNESS,
-    min_difference=settings.MIN_DIFFERENCE,
-    multiple_marks_threshold=settings.MULTIPLE_MARKS_THRESHOLD
-)
 
-# QR Code Reader
-qr_reader = QRCodeReader()
+async def run_in_worker(func, *args):
+    """
+    Pipeline'ni worker pool'da bajarish va xatolarni HTTP javoblarga aylantirish
+    """
+    try:
+        result = await worker_pool.run(func, *args)
+        metrics_registry.observe(func.__name__, result)
+        return result
+    except WorkerPoolSaturated as e:
+        logger.warning(f"Request rejected: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail="Server is busy grading other sheets. Please retry shortly.",
+            headers={'Retry-After': '1'}
+        )
+    except WorkerJobTimeout as e:
+        logger.error(f"Grading timed out: {e}")
+        raise HTTPException(
+            status_code=504,
+            detail=f"Grading timed out after {settings.WORKER_JOB_TIMEOUT:.0f}s"
+        )
+    except PipelineError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-# OCR Anchor Detector (NEW!)
-ocr_anchor_detector = OCRAnchorDetector()
 
-# Photo OMR Service (NEW! - for photos, not PDF-generated sheets)
-photo_omr_service = PhotoOMRService()
-logger.info("Photo OMR Service initialized (for photo support)")
+async def read_upload(file: UploadFile, prefix: str = '') -> Tuple[Union[bytes, str], Optional[Path]]:
+    """
+    Yuklangan faylni o'qish
+    
+    Kichik fayllar xotirada qoladi (worker cv2.imdecode bilan decode qiladi),
+    faqat UPLOAD_SPILL_THRESHOLD'dan katta fayllar TEMP_DIR'ga yoziladi.
+    
+    Returns:
+        (image_source, temp_path) - temp_path faqat diskka yozilganda
+    """
+    size = file.size
+    if size is None:
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+        file.file.seek(0)
+    
+    if size <= settings.UPLOAD_SPILL_THRESHOLD:
+        data = await file.read()
+        logger.info(f"Upload kept in memory: {len(data)} bytes")
+        return data, None
+    
+    temp_path = settings.TEMP_DIR / f"{prefix}{datetime.now().timestamp()}_{file.filename}"
+    with open(temp_path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    
+    logger.info(f"Large upload spilled to disk: {temp_path} ({size} bytes)")
+    return str(temp_path), temp_path
 
-# Improved Photo Processor (ENHANCED!)
-improved_photo_processor = ImprovedPhotoProcessor()
-logger.info("Improved Photo Processor initialized (enhanced photo processing)")
 
-# Photo Quality Assessor (NEW!)
-photo_quality_assessor = PhotoQualityAssessor()
-logger.info("Photo Quality Assessor initialized (quality assessment)")
+def remove_temp_file(temp_path: Path):
+    """Vaqtinchalik faylni o'chirish"""
+    if temp_path and temp_path.exists():
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
 
-# Template Matching OMR (NEW! - for unknown layouts)
-from services.template_matching_omr import TemplateMatchingOMR
-template_matching_omr = TemplateMatchingOMR()
-logger.info("Template Matching OMR initialized (for unknown layouts)")
 
-# AI Verifier (OpenAI GPT-4 Vision or Groq fallback)
-ai_verifier = None
-if settings.ENABLE_AI_VERIFICATION:
-    if settings.AI_PROVIDER == 'openai' and settings.OPENAI_API_KEY:
-        try:
-            ai_verifier = OpenAIVerifier(
-                api_key=settings.OPENAI_API_KEY,
-                model=settings.OPENAI_MODEL,
-                temperature=settings.OPENAI_TEMPERATURE,
-                max_tokens=settings.OPENAI_MAX_TOKENS
-            )
-            logger.info("OpenAI GPT-4 Vision Verifier initialized successfully")
-        except Exception as e:
-            logger.warning(f"OpenAI Verifier initialization failed: {e}")
-    elif settings.GROQ_API_KEY:
-        try:
-            ai_verifier = AIVerifier(
-                api_key=settings.GROQ_API_KEY,
-                model=settings.GROQ_MODEL,
-                temperature=settings.GROQ_TEMPERATURE,
-                max_tokens=settings.GROQ_MAX_TOKENS
-            )
-            logger.info("Groq AI Verifier initialized successfully (fallback)")
-        except Exception as e:
-            logger.warning(f"Groq AI Verifier initialization failed: {e}")
-    else:
-        logger.warning("AI Verification enabled but no API keys provided")
-        logger.warning("System will run without AI verification")
-else:
-    if not settings.ENABLE_AI_VERIFICATION:
-        logger.info("AI Verification disabled in config")
-    else:
-        logger.warning("GROQ_API_KEY not found. AI verification disabled.")
+def parse_annotation_options(
+    mode: Optional[str],
+    image_format: Optional[str],
+    quality: Optional[int],
+    max_width: Optional[int] = None
+) -> Dict:
+    """Annotation form/query parametrlarini tekshirish (xato bo'lsa 400)"""
+    try:
+        return annotation_options(mode, image_format, quality, max_width)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-# Temp directory
-settings.TEMP_DIR.mkdir(exist_ok=True)
 
 @app.get("/")
 async def root():
@@ -188,7 +204,44 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "ai_enabled": ai_verifier is not None
+        "ai_enabled": ai_verifier is not None,
+        "worker_pool": worker_pool.get_stats(),
+        "annotation_cache": annotation_cache.get_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus metrics - pipeline bosqichlari (p50/p95/p99) va worker pool holati
+    """
+    pool_stats = worker_pool.get_stats()
+    pool_gauges = {
+        f"omr_worker_pool_{key}": pool_stats[key]
+        for key in ('in_flight', 'capacity')
+    }
+    pool_counters = {
+        f"omr_worker_pool_jobs_{key}_total": pool_stats[key]
+        for key in ('submitted', 'completed', 'failed', 'rejected', 'timed_out')
+    }
+    return PlainTextResponse(
+        metrics_registry.render_prometheus(pool_gauges, pool_counters),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/metrics/report")
+async def metrics_report(quantile: str = 'p95'):
+    """
+    Jonli o'lchovlar bo'yicha PERFORMANCE_TARGETS hisoboti
+    """
+    if quantile not in ('p50', 'p95', 'p99'):
+        raise HTTPException(status_code=400, detail="quantile must be one of p50, p95, p99")
+    
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "report": metrics_registry.performance_report(quantile),
+        "stages": metrics_registry.snapshot(),
+        "coordinate_strategies": metrics_registry.strategy_snapshot(),
+        "ai_verification": metrics_registry.ai_snapshot()
     }
 
 @app.post("/api/template-match-grade")
@@ -221,12 +274,8 @@ async def template_match_grade(
                 detail="Invalid file type. Only images are allowed."
             )
         
-        # 2. Save temporary file
-        temp_path = settings.TEMP_DIR / f"template_{datetime.now().timestamp()}_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"File saved: {temp_path}")
+        # 2. Read upload (in memory unless above spill threshold)
+        image_source, temp_path = await read_upload(file, prefix='template_')
         
         # 3. Parse answer key
         try:
@@ -237,118 +286,12 @@ async def template_match_grade(
                 detail=f"Invalid answer key JSON: {str(e)}"
             )
         
-        # 4. Load and preprocess image
-        logger.info("STEP 1/4: Loading and preprocessing image...")
-        image = cv2.imread(str(temp_path))
-        if image is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Failed to load image"
-            )
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply preprocessing
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        
-        # 5. Template matching OMR processing
-        logger.info("STEP 2/4: Template matching OMR processing...")
-        results = template_matching_omr.process_image(enhanced)
-        
-        if 'error' in results:
-            raise HTTPException(
-                status_code=400,
-                detail=results['error']
-            )
-        
-        # 6. Compare with answer key and calculate score
-        logger.info("STEP 3/4: Comparing with answer key...")
-        
-        correct_count = 0
-        wrong_count = 0
-        unanswered_count = 0
-        total_questions = len(answer_key_data)
-        
-        detailed_results = []
-        
-        for q_num in range(1, total_questions + 1):
-            correct_answer = answer_key_data.get(str(q_num), '?')
-            detected_answer = None
-            confidence = 0
-            
-            if q_num in results['answers']:
-                answer_data = results['answers'][q_num]
-                detected_answer = answer_data['answer']
-                confidence = answer_data['confidence']
-            
-            # Determine status
-            if detected_answer is None:
-                status = 'unanswered'
-                unanswered_count += 1
-            elif detected_answer == correct_answer:
-                status = 'correct'
-                correct_count += 1
-            else:
-                status = 'wrong'
-                wrong_count += 1
-            
-            detailed_results.append({
-                'questionNumber': q_num,
-                'correctAnswer': correct_answer,
-                'detectedAnswer': detected_answer,
-                'confidence': confidence,
-                'status': status
-            })
-        
-        # Calculate final score
-        accuracy = (correct_count / total_questions * 100) if total_questions > 0 else 0
-        
-        # 7. Create annotated image
-        logger.info("STEP 4/4: Creating annotated image...")
-        annotated = template_matching_omr.create_annotated_image(image, results)
-        
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', annotated)
-        annotated_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # Prepare response
-        response = {
-            "success": True,
-            "method": "template_matching",
-            "results": {
-                "answers": detailed_results,
-                "score": {
-                    "correct": correct_count,
-                    "wrong": wrong_count,
-                    "unanswered": unanswered_count,
-                    "total": total_questions,
-                    "accuracy": round(accuracy, 1),
-                    "percentage": f"{accuracy:.1f}%"
-                }
-            },
-            "statistics": {
-                "total": results['statistics']['total'],
-                "detected": results['statistics']['detected'],
-                "bubbles_found": results['statistics']['bubbles_found'],
-                "processing_time": round(processing_time, 2),
-                "method": "Template Matching OMR"
-            },
-            "annotatedImage": f"data:image/jpeg;base64,{annotated_base64}",
-            "metadata": {
-                "filename": file.filename,
-                "timestamp": start_time.isoformat(),
-                "image_size": f"{image.shape[1]}x{image.shape[0]}",
-                "bubbles_detected": len(results.get('bubbles', [])),
-                "questions_detected": len(results.get('questions', {}))
-            }
-        }
+        # 4. Template matching pipeline (worker pool)
+        response = await run_in_worker(
+            grading_pipeline.run_template_match_grade,
+            image_source, answer_key_data, file.filename, start_time
+        )
         
-        logger.info(f"✅ Template matching complete: {accuracy:.1f}% accuracy ({processing_time:.2f}s)")
         return JSONResponse(content=response)
         
     except HTTPException:
@@ -361,8 +304,7 @@ async def template_match_grade(
         )
     finally:
         # Cleanup
-        if temp_path and temp_path.exists():
-            temp_path.unlink()
+        remove_temp_file(temp_path)
 
 
 @app.post("/api/ultra-precise-grade")
@@ -402,12 +344,8 @@ async def ultra_precise_grade(
                 detail="Invalid file type. Only images are allowed."
             )
         
-        # 2. Save temporary file
-        temp_path = settings.TEMP_DIR / f"ultra_{datetime.now().timestamp()}_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"File saved: {temp_path}")
+        # 2. Read upload (in memory unless above spill threshold)
+        image_source, temp_path = await read_upload(file, prefix='ultra_')
         
         # 3. Parse JSON data
         try:
@@ -430,178 +368,25 @@ async def ultra_precise_grade(
                 detail=f"Invalid JSON data: {str(e)}"
             )
         
-        # 4. Load and assess image
-        logger.info("STEP 1/5: Image Loading and Quality Assessment...")
-        import cv2
-        image = cv2.imread(str(temp_path))
-        if image is None:
-            raise HTTPException(status_code=400, detail="Failed to load image")
-        
-        # Quality assessment
-        image_quality = adaptive_omr_detector._assess_image_quality(image)
-        logger.info(f"Image quality: {image_quality['overall_score']:.1f}/100 ({image_quality['category']})")
-        
-        # 5. ULTRA PRECISE Coordinate Detection
-        logger.info("STEP 2/5: ULTRA PRECISE Coordinate Detection...")
-        
-        if calibration_points:
-            # Manual calibration (100% accuracy)
-            coordinate_result = ultra_precise_mapper.calibrate_manually(
-                image, calibration_points, exam_data
-            )
-        else:
-            # Automatic detection
-            coordinate_result = ultra_precise_mapper.detect_layout_with_precision(
-                image, exam_data, coord_template
-            )
-        
-        coordinates = coordinate_result.get('coordinates', {})
-        accuracy_estimate = coordinate_result.get('accuracy_estimate', 0)
-        
-        logger.info(f"✅ Coordinate method: {coordinate_result['method']} ({accuracy_estimate}% accuracy)")
-        
-        if not coordinates:
-            # Return calibration instructions
-            return JSONResponse({
-                'success': False,
-                'calibration_needed': True,
-                'coordinate_result': coordinate_result,
-                'image_quality': image_quality,
-                'instructions': {
-                    'message': 'Manual calibration needed for 100% accuracy',
-                    'steps': [
-                        'Identify at least 4 bubble positions in the image',
-                        'Note their question numbers and variants (e.g., Q1-A, Q5-C)',
-                        'Measure their pixel coordinates',
-                        'Provide coordinates via manual_calibration parameter'
-                    ],
-                    'format': '[{"question": 1, "variant": "A", "x": 123, "y": 456}, ...]'
-                }
-            })
-        
-        # 6. ADAPTIVE OMR Detection
-        logger.info("STEP 3/5: ADAPTIVE OMR Detection...")
-        
-        # Prepare image for OMR
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        omr_results = adaptive_omr_detector.detect_all_answers(
-            gray, coordinates, exam_data, image_quality
+        # 4. Ultra precise pipeline (worker pool)
+        response = await run_in_worker(
+            grading_pipeline.run_ultra_precise_grade,
+            image_source, exam_data, answer_key_data,
+            coord_template, calibration_points, file.filename, start_time
         )
         
-        logger.info(f"✅ OMR method: {omr_results.get('detection_strategy', {}).get('name', 'unknown')}")
-        logger.info(f"   Detection: {omr_results['statistics']['detected']}/{omr_results['statistics']['total']}")
-        
-        # 7. AI Verification (if needed and enabled)
-        verified_results = omr_results
-        ai_stats = None
-        
-        if ai_verifier and omr_results['statistics']['uncertain'] > 0:
-            logger.info("STEP 4/5: AI Verification...")
-            try:
-                verified_results = ai_verifier.verify_uncertain_answers(
-                    gray, omr_results, coordinates,
-                    confidence_threshold=settings.AI_CONFIDENCE_THRESHOLD,
-                    max_verifications=20
-                )
-                
-                ai_verified = sum(
-                    1 for topic in verified_results['answers'].values()
-                    for section in topic.values()
-                    for answer in section
-                    if answer.get('ai_verified')
-                )
-                
-                ai_corrected = sum(
-                    1 for topic in verified_results['answers'].values()
-                    for section in topic.values()
-                    for answer in section
-                    if answer.get('warning') == 'AI_CORRECTED'
-                )
-                
-                ai_stats = {
-                    'verified': ai_verified,
-                    'corrected': ai_corrected,
-                    'enabled': True
-                }
-                
-            except Exception as e:
-                logger.error(f"AI verification failed: {e}")
-                ai_stats = {'enabled': False, 'error': str(e)}
-        else:
-            ai_stats = {
-                'enabled': ai_verifier is not None,
-                'verified': 0,
-                'corrected': 0,
-                'reason': 'No uncertain answers' if ai_verifier else 'AI disabled'
-            }
-        
-        # 8. Grading
-        logger.info("STEP 5/5: Grading...")
-        grader = AnswerGrader(answer_key_data, exam_data)
-        final_results = grader.grade(verified_results['answers'])
-        
-        # 9. Image Annotation
-        annotator = ImageAnnotator()
-        annotated_image = annotator.annotate_sheet(
-            gray, final_results, coordinates, answer_key_data
-        )
-        
-        # 10. Cleanup
-        if temp_path and temp_path.exists():
-            os.remove(temp_path)
-        
-        # Calculate processing time
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        logger.info(f"=== ULTRA PRECISE GRADING COMPLETE ===")
-        logger.info(f"Duration: {duration:.2f}s")
-        logger.info(f"Score: {final_results['totalScore']}/{final_results['maxScore']} ({final_results['percentage']}%)")
-        logger.info(f"Coordinate accuracy: {accuracy_estimate}%")
-        
-        return JSONResponse({
-            'success': True,
-            'results': final_results,
-            'annotatedImage': annotated_image,
-            'statistics': {
-                'omr': omr_results['statistics'],
-                'ai': ai_stats,
-                'coordinate_detection': {
-                    'method': coordinate_result['method'],
-                    'accuracy_estimate': accuracy_estimate,
-                    'validation': coordinate_result.get('validation', {})
-                },
-                'detection_strategy': omr_results.get('detection_strategy', {}),
-                'image_quality': image_quality,
-                'duration': round(duration, 2)
-            },
-            'metadata': {
-                'timestamp': end_time.isoformat(),
-                'filename': file.filename,
-                'system_version': '3.1.0',
-                'precision_level': 'ULTRA_HIGH',
-                'coordinate_method': coordinate_result['method'],
-                'omr_method': omr_results.get('detection_strategy', {}).get('name', 'adaptive')
-            }
-        })
+        return JSONResponse(response)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Ultra precise grading error: {e}", exc_info=True)
-        
-        # Cleanup on error
-        if temp_path and temp_path.exists():
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        
         raise HTTPException(
             status_code=500,
             detail=f"Ultra precise grading failed: {str(e)}"
         )
+    finally:
+        remove_temp_file(temp_path)
 
 
 @app.post("/api/grade-sheet")
@@ -610,6 +395,10 @@ async def grade_sheet(
     exam_structure: str = Form(...),
     answer_key: str = Form(...),
     coordinate_template: str = Form(None),  # YANGI: Optional coordinate template
+    force_full_cascade: bool = Form(False),  # Debug: QR fast path'ni o'chirish
+    annotation: str = Form(None),  # full | preview | overlay | lazy | none (default: ANNOTATION_MODE)
+    annotation_format: str = Form(None),  # jpeg | webp
+    annotation_quality: int = Form(None),
     current_user: dict = Depends(get_current_user)  # AUTHENTICATION REQUIRED
 ):
     """
@@ -620,6 +409,11 @@ async def grade_sheet(
         exam_structure: JSON string of exam structure
         answer_key: JSON string of answer key
         coordinate_template: JSON string of coordinate template (optional)
+        force_full_cascade: Run the full coordinate cascade even for QR-identified sheets
+        annotation: Annotated image shape - full, preview (downscaled), overlay
+            (rectangle list only), lazy (annotatedImageUrl, rendered on GET) or none
+        annotation_format: jpeg or webp (full/preview)
+        annotation_quality: 1-100 (full/preview)
         
     Returns:
         JSON with grading results
@@ -629,6 +423,7 @@ async def grade_sheet(
     logger.info(f"File: {file.filename}")
     logger.info(f"User: {current_user['username']} ({current_user['role']})")
     
+    annotation_opts = parse_annotation_options(annotation, annotation_format, annotation_quality)
     temp_path = None
     
     try:
@@ -639,12 +434,8 @@ async def grade_sheet(
                 detail="Invalid file type. Only images are allowed."
             )
         
-        # 2. Save temporary file
-        temp_path = settings.TEMP_DIR / f"{datetime.now().timestamp()}_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"File saved: {temp_path}")
+        # 2. Read upload (in memory unless above spill threshold)
+        image_source, temp_path = await read_upload(file)
         
         # 3. Parse JSON data
         try:
@@ -662,248 +453,20 @@ async def grade_sheet(
                 detail=f"Invalid JSON data: {str(e)}"
             )
         
-        # 4. Image Processing (OpenCV)
-        logger.info("STEP 1/6: Image Processing...")
-        try:
-            processed = image_processor.process(str(temp_path))
-        except Exception as e:
-            logger.error(f"Image processing failed: {e}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Image processing failed: {str(e)}"
-            )
-        
-        # 4.5. QR Code Detection (NEW!)
-        logger.info("STEP 2/6: QR Code Detection...")
-        qr_data = qr_reader.read_qr_code(processed['grayscale'])
-        
-        if qr_data:
-            logger.info("✅ QR Code detected! Using QR layout data")
-            # Use layout from QR code
-            qr_layout = qr_reader.get_layout_from_qr(qr_data)
-            logger.info(f"   QR Layout: {qr_layout}")
-        else:
-            logger.warning("⚠️  No QR code found, using default layout")
-            qr_layout = None
-        
-        # 5. ULTRA PRECISE Coordinate Calculation
-        logger.info("STEP 3/6: ULTRA PRECISE Coordinate Calculation...")
-        
-        # Use Ultra Precise Coordinate Mapper
-        coordinate_result = ultra_precise_mapper.detect_layout_with_precision(
-            processed['grayscale'],
-            exam_data,
-            coord_template
-        )
-        
-        coordinates = coordinate_result.get('coordinates', {})
-        accuracy_estimate = coordinate_result.get('accuracy_estimate', 0)
-        
-        logger.info(f"✅ Coordinate detection: {coordinate_result['method']} ({accuracy_estimate}% accuracy)")
-        
-        if not coordinates:
-            logger.error("❌ Ultra precise coordinate detection failed!")
-            logger.info("Attempting fallback coordinate detection methods...")
-            
-            # Fallback 1: Try template matching with relaxed parameters
-            try:
-                from services.template_matching_omr import TemplateMatchingOMR
-                template_omr = TemplateMatchingOMR()
-                template_result = template_omr.detect_layout_fallback(processed['grayscale'], exam_data)
-                
-                if template_result.get('coordinates'):
-                    coordinates = template_result['coordinates']
-                    coordinate_result['method'] = 'template_matching_fallback'
-                    coordinate_result['accuracy_estimate'] = 75
-                    logger.info("✅ Template matching fallback successful")
-                else:
-                    raise Exception("Template matching fallback failed")
-                    
-            except Exception as e:
-                logger.warning(f"Template matching fallback failed: {e}")
-                
-                # Fallback 2: Use default coordinate template
-                try:
-                    from utils.coordinate_mapper import CoordinateMapper
-                    
-                    # Create default corners based on image dimensions
-                    height, width = processed['grayscale'].shape
-                    default_corners = [
-                        {'name': 'top-left', 'x': int(width * 0.05), 'y': int(height * 0.05)},
-                        {'name': 'top-right', 'x': int(width * 0.95), 'y': int(height * 0.05)},
-                        {'name': 'bottom-left', 'x': int(width * 0.05), 'y': int(height * 0.95)},
-                        {'name': 'bottom-right', 'x': int(width * 0.95), 'y': int(height * 0.95)}
-                    ]
-                    
-                    mapper = CoordinateMapper(default_corners, exam_data)
-                    coordinates = mapper.calculate_all()
-                    coordinate_result['method'] = 'default_estimation'
-                    coordinate_result['accuracy_estimate'] = 60
-                    logger.info("✅ Default coordinate estimation applied")
-                    
-                except Exception as e2:
-                    logger.error(f"Default coordinate estimation failed: {e2}")
-                    
-                    # Final fallback: Return calibration needed response
-                    return JSONResponse({
-                        'success': False,
-                        'error': 'Coordinate detection failed. Image quality may be insufficient or corner markers are not visible.',
-                        'calibration_needed': True,
-                        'suggestions': [
-                            'Ensure the image has clear corner markers (black squares in all 4 corners)',
-                            'Check that the image is well-lit and not blurry',
-                            'Make sure the entire answer sheet is visible in the image',
-                            'Try using a higher resolution image (minimum 800x1100px)',
-                            'Ensure the answer sheet is flat and not skewed',
-                            'Consider manual calibration if automatic detection continues to fail'
-                        ],
-                        'fallback_options': {
-                            'template_matching': 'Use template matching for unknown layouts',
-                            'manual_calibration': 'Provide manual bubble coordinates',
-                            'simple_grid': 'Use estimated grid layout'
-                        },
-                        'debug_info': {
-                            'image_dimensions': f"{processed['grayscale'].shape[1]}x{processed['grayscale'].shape[0]}",
-                            'image_quality': processed.get('quality', {}),
-                            'detection_attempts': ['ultra_precise', 'template_fallback', 'default_estimation'],
-                            'last_error': str(e2),
-                            'manual_calibration': 'Provide manual bubble coordinates',
-                            'photo_processing': 'Use photo-specific processing methods'
-                        }
-                    })
-        
-        # 6. ADAPTIVE OMR Detection
-        logger.info("STEP 4/6: ADAPTIVE OMR Detection...")
-        
-        # Use Adaptive OMR Detector with image quality assessment
-        omr_results = adaptive_omr_detector.detect_all_answers(
-            processed['gray_for_omr'],  # Use pure grayscale
-            coordinates,
-            exam_data,
-            processed['quality']  # Pass quality assessment
+        # 4. Grading pipeline (worker pool)
+        response = await run_in_worker(
+            grading_pipeline.run_grade_sheet,
+            image_source, exam_data, answer_key_data,
+            coord_template, file.filename, start_time, force_full_cascade, annotation_opts
         )
         
-        logger.info(f"✅ OMR Detection method: {omr_results.get('detection_strategy', {}).get('name', 'unknown')}")
-        logger.info(f"   Image quality: {omr_results.get('image_quality', {}).get('category', 'unknown')}")
-        logger.info(f"   Detection: {omr_results['statistics']['detected']}/{omr_results['statistics']['total']}")
-        logger.info(f"   High confidence: {omr_results['statistics']['high_confidence']}")
-        logger.info(f"   Medium confidence: {omr_results['statistics']['medium_confidence']}")
-        logger.info(f"   Low confidence: {omr_results['statistics']['low_confidence']}")
-        
-        # 7. AI Verification (if enabled and needed)
-        verified_results = omr_results
-        ai_stats = None
-        
-        if ai_verifier and omr_results['statistics']['uncertain'] > 0:
-            logger.info("STEP 5/6: AI Verification...")
-            try:
-                verified_results = ai_verifier.verify_uncertain_answers(
-                    processed['grayscale'],
-                    omr_results,
-                    coordinates,
-                    confidence_threshold=settings.AI_CONFIDENCE_THRESHOLD,
-                    max_verifications=20
-                )
-                
-                # Calculate AI stats
-                ai_verified = sum(
-                    1 for topic in verified_results['answers'].values()
-                    for section in topic.values()
-                    for answer in section
-                    if answer.get('ai_verified')
-                )
-                
-                ai_corrected = sum(
-                    1 for topic in verified_results['answers'].values()
-                    for section in topic.values()
-                    for answer in section
-                    if answer.get('warning') == 'AI_CORRECTED'
-                )
-                
-                ai_stats = {
-                    'verified': ai_verified,
-                    'corrected': ai_corrected,
-                    'enabled': True
-                }
-                
-            except Exception as e:
-                logger.error(f"AI verification failed: {e}")
-                logger.warning("Continuing without AI verification")
-                ai_stats = {'enabled': False, 'error': str(e)}
-        else:
-            logger.info("STEP 5/6: AI Verification skipped")
-            ai_stats = {
-                'enabled': ai_verifier is not None,
-                'verified': 0,
-                'corrected': 0,
-                'reason': 'No uncertain answers' if ai_verifier else 'AI disabled'
-            }
-        
-        # 8. Grading
-        logger.info("STEP 6/6: Grading...")
-        grader = AnswerGrader(answer_key_data, exam_data)
-        final_results = grader.grade(verified_results['answers'])
-        
-        # 9. Image Annotation (Vizual ko'rsatish)
-        logger.info("STEP 6/6: Image Annotation...")
-        annotator = ImageAnnotator()
-        # Use grayscale image for better visual quality
-        # Coordinates are the same for both processed and grayscale (same dimensions)
-        annotated_image = annotator.annotate_sheet(
-            processed['grayscale'],  # Use grayscale for better quality
-            final_results,
-            coordinates,
-            answer_key_data
-        )
-        
-        # 10. Cleanup
-        if temp_path and temp_path.exists():
-            os.remove(temp_path)
-        
-        # Calculate processing time
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        logger.info(f"=== GRADING COMPLETE ===")
-        logger.info(f"Duration: {duration:.2f}s")
-        logger.info(f"Score: {final_results['totalScore']}/{final_results['maxScore']} ({final_results['percentage']}%)")
-        
-        return JSONResponse({
-            'success': True,
-            'results': final_results,
-            'annotatedImage': annotated_image,
-            'statistics': {
-                'omr': omr_results['statistics'],
-                'ai': ai_stats,
-                'quality': processed['quality'],
-                'coordinate_detection': {
-                    'method': coordinate_result['method'],
-                    'accuracy_estimate': coordinate_result['accuracy_estimate']
-                },
-                'detection_strategy': omr_results.get('detection_strategy', {}),
-                'duration': round(duration, 2)
-            },
-            'metadata': {
-                'timestamp': end_time.isoformat(),
-                'filename': file.filename,
-                'system_version': '3.1.0',  # Updated version
-                'coordinate_precision': 'ULTRA_HIGH',
-                'omr_method': 'ADAPTIVE'
-            }
-        })
+        return JSONResponse(annotation_cache.publish(response))
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
         
-        # Cleanup on error
-        if temp_path and temp_path.exists():
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        
         # Provide more helpful error messages
         error_message = str(e)
         
@@ -922,6 +485,255 @@ async def grade_sheet(
             status_code=500,
             detail=error_detail
         )
+    finally:
+        remove_temp_file(temp_path)
+
+def format_stream_event(payload: Dict, stream_format: str) -> str:
+    """Bitta natijani NDJSON qatori yoki SSE event sifatida formatlash"""
+    data = json.dumps(payload, ensure_ascii=False)
+    if stream_format == 'sse':
+        return f"event: {payload['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def stream_batch_results(
+    expander: BatchExpander,
+    exam_key: str,
+    exam_data: Dict,
+    answer_key_data: Dict,
+    coord_template: Optional[Dict],
+    annotation: Optional[Dict],
+    stream_format: str,
+    start_time: datetime
+):
+    """
+    Batch varaqlarini worker pool'da parallel tekshirish va natijalarni
+    tayyor bo'lishi bilan oqim sifatida qaytarish
+    """
+    sheets = expander.sheets
+    
+    # Batch bir vaqtda ko'pi bilan max_workers slot egallaydi -
+    # navbatning qolgan qismi yakka so'rovlar uchun bo'sh qoladi
+    semaphore = asyncio.Semaphore(worker_pool.max_workers)
+    
+    async def grade_one(index: int, sheet: Dict) -> Dict:
+        result = {
+            'type': 'sheet',
+            'index': index,
+            'filename': sheet['filename'],
+            'page': sheet['page']
+        }
+        
+        async with semaphore:
+            sheet_start = datetime.now()
+            try:
+                while True:
+                    try:
+                        body = await worker_pool.run(
+                            grading_pipeline.run_grade_batch_sheet,
+                            sheet['source'], exam_key, exam_data, answer_key_data,
+                            coord_template, sheet['filename'], sheet_start,
+                            annotation
+                        )
+                        metrics_registry.observe('run_grade_batch_sheet', body)
+                        break
+                    except WorkerPoolSaturated:
+                        # Boshqa so'rovlar pool'ni to'ldirgan - kutib qayta urinish
+                        await asyncio.sleep(0.5)
+                
+                result.update(annotation_cache.publish(body))
+                
+            except PipelineError as e:
+                result.update({'success': False, 'error': e.detail})
+            except WorkerJobTimeout:
+                result.update({
+                    'success': False,
+                    'error': f"Grading timed out after {settings.WORKER_JOB_TIMEOUT:.0f}s"
+                })
+            except Exception as e:
+                logger.error(f"Batch sheet {index} ({sheet['filename']}) failed: {e}")
+                result.update({'success': False, 'error': f"Processing failed: {str(e)}"})
+        
+        return result
+    
+    tasks = [
+        asyncio.ensure_future(grade_one(index, sheet))
+        for index, sheet in enumerate(sheets)
+    ]
+    
+    succeeded = 0
+    failed = 0
+    
+    try:
+        yield format_stream_event({
+            'type': 'batch_started',
+            'total': len(sheets),
+            'skipped': expander.skipped
+        }, stream_format)
+        
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            if result.get('success'):
+                succeeded += 1
+            else:
+                failed += 1
+            
+            yield format_stream_event(result, stream_format)
+        
+        duration = (datetime.now() - start_time).total_seconds()
+        logger.info(f"=== BATCH GRADING COMPLETE: {succeeded}/{len(sheets)} sheets in {duration:.2f}s ===")
+        
+        yield format_stream_event({
+            'type': 'summary',
+            'total': len(sheets),
+            'succeeded': succeeded,
+            'failed': failed,
+            'skipped': len(expander.skipped),
+            'duration': round(duration, 2),
+            'sheets_per_second': round(len(sheets) / duration, 2) if duration > 0 else None
+        }, stream_format)
+        
+    finally:
+        # Client uzilsa qolgan ishlarni bekor qilish
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        expander.cleanup()
+
+
+@app.post("/api/grade-batch")
+async def grade_batch(
+    files: List[UploadFile] = File(...),
+    exam_structure: str = Form(...),
+    answer_key: str = Form(...),
+    coordinate_template: str = Form(None),
+    stream_format: str = Form('ndjson'),  # 'ndjson' or 'sse'
+    include_annotated_image: bool = Form(False),
+    annotation: str = Form(None),  # overrides include_annotated_image (full | preview | overlay | lazy | none)
+    annotation_format: str = Form(None),
+    annotation_quality: int = Form(None),
+    current_user: dict = Depends(get_current_user)  # AUTHENTICATION REQUIRED
+):
+    """
+    Ko'p varaqni bitta so'rovda tekshirish
+    
+    Args:
+        files: Rasmlar ro'yxati yoki ZIP / multi-page TIFF / PDF
+        exam_structure: JSON string of exam structure (barcha varaqlar uchun bitta)
+        answer_key: JSON string of answer key
+        coordinate_template: JSON string of coordinate template (optional)
+        stream_format: 'ndjson' (application/x-ndjson) yoki 'sse' (text/event-stream)
+        include_annotated_image: Har bir varaq uchun annotated rasm qaytarish (annotation='full')
+        annotation: Annotated image shape per sheet (see /api/grade-sheet); default none
+        annotation_format: jpeg or webp
+        annotation_quality: 1-100
+        
+    Returns:
+        Streaming response - har bir varaq tayyor bo'lishi bilan bitta event
+    """
+    start_time = datetime.now()
+    logger.info(f"=== NEW BATCH GRADING REQUEST ===")
+    logger.info(f"Files: {len(files)}")
+    logger.info(f"User: {current_user['username']} ({current_user['role']})")
+    
+    if stream_format not in ('ndjson', 'sse'):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid stream_format. Use 'ndjson' or 'sse'."
+        )
+    
+    if annotation is None:
+        annotation = 'full' if include_annotated_image else 'none'
+    annotation_opts = parse_annotation_options(annotation, annotation_format, annotation_quality)
+    
+    # 1. Parse JSON data (bir marta - barcha varaqlar uchun)
+    try:
+        exam_data = json.loads(exam_structure)
+        answer_key_data = json.loads(answer_key)
+        coord_template = json.loads(coordinate_template) if coordinate_template else None
+    except json.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid JSON data: {str(e)}"
+        )
+    
+    exam_key = grading_pipeline.make_exam_key(exam_data, answer_key_data, coord_template)
+    
+    # 2. Expand uploads into individual sheets
+    expander = BatchExpander(
+        settings.TEMP_DIR,
+        max_sheets=settings.BATCH_MAX_SHEETS,
+        pdf_dpi=settings.BATCH_PDF_DPI,
+        max_entry_size=settings.MAX_FILE_SIZE,
+        max_zip_entries=settings.BATCH_ZIP_MAX_ENTRIES,
+        max_zip_total_size=settings.BATCH_ZIP_MAX_TOTAL_SIZE
+    )
+    loop = asyncio.get_running_loop()
+    
+    try:
+        for file in files:
+            data = await file.read()
+            await loop.run_in_executor(
+                None, expander.add_upload, file.filename, file.content_type, data
+            )
+    except ValueError as e:
+        expander.cleanup()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        expander.cleanup()
+        logger.error(f"Batch upload expansion failed: {e}", exc_info=True)
+        raise HTTPException(status_code=400, detail=f"Failed to read batch upload: {str(e)}")
+    
+    if not expander.sheets:
+        expander.cleanup()
+        raise HTTPException(
+            status_code=400,
+            detail={'message': 'No gradable sheets found in upload', 'skipped': expander.skipped}
+        )
+    
+    logger.info(f"Batch expanded: {len(expander.sheets)} sheets, {len(expander.skipped)} skipped")
+    
+    # 3. Stream results as each sheet finishes
+    return StreamingResponse(
+        stream_batch_results(
+            expander, exam_key, exam_data, answer_key_data, coord_template,
+            annotation_opts, stream_format, start_time
+        ),
+        media_type='text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+    )
+
+@app.get("/api/annotated/{token}")
+async def get_annotated_image(
+    token: str,
+    format: str = None,
+    quality: int = None,
+    max_width: int = None
+):
+    """
+    Lazy annotated rasm (annotation='lazy' javobidagi annotatedImageUrl)
+    
+    Token o'zi capability - auth header talab qilinmaydi (<img src> uchun).
+    Rasm birinchi so'rovda chiziladi va encode qilinadi, keyingilari cache'dan.
+    
+    Args:
+        format: jpeg or webp (default: ANNOTATION_FORMAT)
+        quality: 1-100 (default: ANNOTATION_QUALITY)
+        max_width: downscale to this width (default: full size)
+    """
+    options = parse_annotation_options('full', format, quality, max_width)
+    rendered = await asyncio.get_running_loop().run_in_executor(
+        None, annotation_cache.render, token, options['format'], options['quality'], max_width
+    )
+    
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Annotated image not found or expired")
+    
+    data, mime = rendered
+    return Response(
+        content=data,
+        media_type=mime,
+        headers={'Cache-Control': f"private, max-age={int(settings.ANNOTATION_CACHE_TTL)}"}
+    )
 
 @app.post("/api/grade-photo")
 async def grade_photo(
@@ -957,12 +769,8 @@ async def grade_photo(
                 detail="Invalid file type. Only images are allowed."
             )
         
-        # 2. Save temporary file
-        temp_path = settings.TEMP_DIR / f"photo_{datetime.now().timestamp()}_{file.filename}"
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Photo saved: {temp_path}")
+        # 2. Read upload (in memory unless above spill threshold)
+        image_source, temp_path = await read_upload(file, prefix='photo_')
         
         # 3. Parse JSON data
         try:
@@ -974,99 +782,25 @@ async def grade_photo(
                 detail=f"Invalid JSON data: {str(e)}"
             )
         
-        # 4. Quality Assessment
-        logger.info("Step 1/3: Photo Quality Assessment...")
-        import cv2
-        image = cv2.imread(str(temp_path))
-        quality_assessment = photo_quality_assessor.assess_photo_quality(image)
-        
-        logger.info(f"Photo quality: {quality_assessment['overall_quality']:.1f}/100 ({quality_assessment['omr_suitability']['level']})")
-        
-        # 5. Process photo
-        logger.info("Step 2/3: Photo Processing...")
-        
-        if use_enhanced_processing:
-            logger.info("Using enhanced photo processor...")
-            try:
-                results = improved_photo_processor.process_photo_complete(
-                    str(temp_path),
-                    exam_data,
-                    answer_key_data
-                )
-                processing_method = "enhanced_processor"
-            except Exception as e:
-                logger.error(f"Enhanced processing failed: {e}")
-                logger.info("Falling back to standard photo processor...")
-                results = photo_omr_service.process_photo(
-                    str(temp_path),
-                    exam_data,
-                    answer_key_data
-                )
-                processing_method = "standard_processor_fallback"
-        else:
-            logger.info("Using standard photo processor...")
-            results = photo_omr_service.process_photo(
-                str(temp_path),
-                exam_data,
-                answer_key_data
-            )
-            processing_method = "standard_processor"
-        
-        # 6. Cleanup
-        if temp_path and temp_path.exists():
-            os.remove(temp_path)
-        
-        # Calculate processing time
-        end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        grading_results = results['grading_results']
-        
-        logger.info(f"=== PHOTO GRADING COMPLETE ===")
-        logger.info(f"Duration: {duration:.2f}s")
-        logger.info(f"Score: {grading_results['totalScore']}/{grading_results['maxScore']} ({grading_results['percentage']}%)")
-        logger.info(f"Detection: {results['omr_results']['statistics']['detected']}/{results.get('questions_mapped', 'unknown')}")
+        # 4. Photo pipeline (worker pool)
+        response = await run_in_worker(
+            grading_pipeline.run_grade_photo,
+            image_source, exam_data, answer_key_data,
+            use_enhanced_processing, file.filename, start_time
+        )
         
-        return JSONResponse({
-            'success': True,
-            'results': grading_results,
-            'quality_assessment': quality_assessment,
-            'statistics': {
-                'omr': results['omr_results']['statistics'],
-                'photo': {
-                    'bubbles_found': results.get('bubbles_found', 0),
-                    'questions_mapped': results.get('questions_mapped', 0),
-                    'detection_method': results.get('detection_method', processing_method),
-                    'processing_method': processing_method
-                },
-                'duration': round(duration, 2)
-            },
-            'metadata': {
-                'timestamp': end_time.isoformat(),
-                'filename': file.filename,
-                'system_version': '3.0.0',
-                'processing_type': 'photo',
-                'enhanced_processing': use_enhanced_processing,
-                'warning': 'Photo processing is experimental and may have lower accuracy than PDF-generated sheets'
-            }
-        })
+        return JSONResponse(response)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Unexpected error in photo processing: {e}", exc_info=True)
-        
-        # Cleanup on error
-        if temp_path and temp_path.exists():
-            try:
-                os.remove(temp_path)
-            except:
-                pass
-        
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
+    finally:
+        remove_temp_file(temp_path)
 
 @app.post("/api/test-ai")
 async def test_ai():
@@ -0,0 +1,176 @@
+"""
+Mock AI Server - OpenAI/Groq chat.completions mock (AI verification testlari uchun)
+
+Crop'ni haqiqatan "ko'radi": rasm eni variantlar soniga bo'linadi va eng
+qorong'i ustun javob sifatida qaytariladi. Tiled so'rovlarda (prompt'dagi
+"Layout:" qatori) kompozit tile'larga bo'linib, har biri shunday tahlil
+qilinadi va JSON qaytariladi. Kechikish, 429 (Retry-After bilan)
+va 500 xatolarini simulyatsiya qiladi - parallellik, retry/backoff va
+deadline'ni real provider'siz tekshirish uchun. --malformed-tiled bilan
+tiled so'rovlarga yaroqsiz JSON qaytaradi (alohida so'rovlarga fallback).
+
+Usage:
+    python mock_ai_server.py --port 8765 --latency 0.8 --rate-limit-every 5
+    AI_BASE_URL=http://127.0.0.1:8765/v1 python main.py          # OpenAI
+    AI_BASE_URL=http://127.0.0.1:8765 AI_PROVIDER=groq python main.py   # Groq (/openai/v1/...)
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Mock AI verification server")
+
+options = {
+    'latency': 0.5, 'jitter': 0.2, 'rate_limit_every': 0, 'retry_after': 0.2, 'error_rate': 0.0,
+    'malformed_tiled': False
+}
+state = {'requests': 0, 'tiled_requests': 0, 'in_flight': 0, 'max_in_flight': 0, 'rate_limited': 0, 'errors': 0}
+state_lock = threading.Lock()
+
+
+LAYOUT_PATTERN = re.compile(
+    r'Layout: (\d+)x(\d+) tiles, tile (\d+)x(\d+) px, label bar (\d+) px, gap (\d+) px'
+)
+TILE_QUESTION_PATTERN = re.compile(r'^- Q(\d+): variants ([^|]*)\|', re.MULTILINE)
+
+
+def decode_image(data_url: str):
+    return cv2.imdecode(
+        np.frombuffer(base64.b64decode(data_url.split(',', 1)[1]), np.uint8), cv2.IMREAD_GRAYSCALE
+    )
+
+
+def analyze_crop(image, variants: list) -> tuple:
+    """(javob yoki None, ishonch) - eng qorong'i ustun"""
+    if image is None or not variants:
+        return None, 0
+
+    columns = np.array_split(image.astype(np.float32), len(variants), axis=1)
+    darkness = np.array([255 - column.mean() for column in columns])
+    order = np.argsort(darkness)[::-1]
+    gap = darkness[order[0]] - (darkness[order[1]] if len(order) > 1 else 0)
+
+    if gap < 3:
+        return None, 60
+    return variants[order[0]], int(min(99, 70 + gap * 2))
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+
+    with state_lock:
+        state['requests'] += 1
+        number = state['requests']
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+
+    try:
+        if options['rate_limit_every'] and number % options['rate_limit_every'] == 0:
+            with state_lock:
+                state['rate_limited'] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={'retry-after': str(options['retry_after'])},
+                content={'error': {'message': 'Rate limit reached', 'type': 'rate_limit_error'}}
+            )
+
+        if random.random() < options['error_rate']:
+            with state_lock:
+                state['errors'] += 1
+            return JSONResponse(status_code=500, content={'error': {'message': 'Mock server error'}})
+
+        await asyncio.sleep(max(0.0, options['latency'] + random.uniform(-1, 1) * options['jitter']))
+
+        content = body['messages'][0]['content']
+        prompt = next(part['text'] for part in content if part['type'] == 'text')
+        image = decode_image(next(part['image_url']['url'] for part in content if part['type'] == 'image_url'))
+
+        layout = LAYOUT_PATTERN.search(prompt)
+        if layout:
+            with state_lock:
+                state['tiled_requests'] += 1
+        if layout and options['malformed_tiled']:
+            text = '{"answers": [{"question": 1, "answer": "A"'  # kesilgan JSON
+        elif layout:
+            columns, _, tile_width, tile_height, label_height, gap = (int(v) for v in layout.groups())
+            answers = []
+            for index, (question_number, variant_text) in enumerate(TILE_QUESTION_PATTERN.findall(prompt)):
+                row, column = divmod(index, columns)
+                x = column * (tile_width + gap)
+                y = row * (label_height + tile_height + gap) + label_height
+                tile = image[y:y + tile_height, x:x + tile_width] if image is not None else None
+                answer, confidence = analyze_crop(tile, [v.strip() for v in variant_text.split(',')])
+                answers.append({
+                    'question': int(question_number),
+                    'answer': answer or 'NONE',
+                    'confidence': confidence,
+                    'reason': 'Mock analysis of column darkness.'
+                })
+            text = json.dumps({'answers': answers})
+        else:
+            match = re.search(r'Available variants: ([^\n]*)', prompt)
+            variants = [v.strip() for v in match.group(1).split(',')] if match else []
+            answer, confidence = analyze_crop(image, variants)
+            text = (
+                f"ANSWER: {answer or 'NONE'}\n"
+                f"CONFIDENCE: {confidence}\n"
+                f"REASON: Mock analysis of column darkness."
+            )
+
+        return {
+            'id': f'mock-{number}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': text},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }
+    finally:
+        with state_lock:
+            state['in_flight'] -= 1
+
+
+@app.get("/stats")
+async def get_stats():
+    with state_lock:
+        return dict(state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Groq chat.completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=options['latency'], help="Seconds per request")
+    parser.add_argument('--jitter', type=float, default=options['jitter'])
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="Every Nth request gets 429")
+    parser.add_argument('--retry-after', type=float, default=options['retry_after'])
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument('--malformed-tiled', action='store_true', help="Reply to tiled requests with broken JSON")
+    args = parser.parse_args()
+
+    options.update(
+        latency=args.latency, jitter=args.jitter, rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after, error_rate=args.error_rate, malformed_tiled=args.malformed_tiled
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -169,6 +169,86 @@ def check_performance(metric_name: str, value: float) -> dict:
         'message': message
     }
 
+def check_memory(metric_name: str, value: float) -> dict:
+    """
+    Check if memory metric (MB) meets MEMORY_TARGETS
+    
+    Args:
+        metric_name: Name of metric (e.g., 'total_per_request')
+        value: Measured value in MB
+        
+    Returns:
+        dict: Same shape as check_performance
+    """
+    if metric_name not in MEMORY_TARGETS:
+        return {
+            'status': 'unknown',
+            'value': value,
+            'message': f'Unknown metric: {metric_name}'
+        }
+    
+    targets = MEMORY_TARGETS[metric_name]
+    
+    if value <= targets['target']:
+        status = 'good'
+        message = f'✅ {metric_name}: {value:.1f}MB (target: {targets["target"]}MB)'
+    elif value <= targets['warning']:
+        status = 'warning'
+        message = f'⚠️  {metric_name}: {value:.1f}MB (warning threshold: {targets["warning"]}MB)'
+    else:
+        status = 'critical'
+        message = f'❌ {metric_name}: {value:.1f}MB (critical threshold: {targets["critical"]}MB)'
+    
+    return {
+        'status': status,
+        'value': value,
+        'target': targets['target'],
+        'warning': targets['warning'],
+        'critical': targets['critical'],
+        'message': message
+    }
+
+def check_minimum_target(targets: dict, metric_name: str, value: float, unit: str = '') -> dict:
+    """
+    Check a higher-is-better metric (ACCURACY_TARGETS, SCALABILITY_TARGETS)
+    
+    Args:
+        targets: Target table (e.g., ACCURACY_TARGETS)
+        metric_name: Name of metric (e.g., 'omr_detection', 'throughput')
+        value: Measured value
+        unit: Unit suffix for the message (e.g., '%')
+        
+    Returns:
+        dict: Same shape as check_performance
+    """
+    if metric_name not in targets or 'target' not in targets[metric_name]:
+        return {
+            'status': 'unknown',
+            'value': value,
+            'message': f'Unknown metric: {metric_name}'
+        }
+    
+    metric_targets = targets[metric_name]
+    
+    if value >= metric_targets['target']:
+        status = 'good'
+        message = f'✅ {metric_name}: {value:.2f}{unit} (target: {metric_targets["target"]}{unit})'
+    elif value >= metric_targets['warning']:
+        status = 'warning'
+        message = f'⚠️  {metric_name}: {value:.2f}{unit} (warning threshold: {metric_targets["warning"]}{unit})'
+    else:
+        status = 'critical'
+        message = f'❌ {metric_name}: {value:.2f}{unit} (critical threshold: {metric_targets["critical"]}{unit})'
+    
+    return {
+        'status': status,
+        'value': value,
+        'target': metric_targets['target'],
+        'warning': metric_targets['warning'],
+        'critical': metric_targets['critical'],
+        'message': message
+    }
+
 def generate_performance_report(metrics: dict) -> dict:
     """
     Generate performance report from metrics
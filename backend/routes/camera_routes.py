@@ -2,18 +2,23 @@
 Camera System API Routes
 Professional camera-based OMR processing endpoints
 """
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import cv2
 import numpy as np
 import json
 import logging
+import time
 from typing import Dict, Any
 
 from services.camera_processor import CameraProcessor
+from services.camera_session import CameraSession
 from services.adaptive_omr_detector import AdaptiveOMRDetector
 from services.grader import AnswerGrader
-from services.image_annotator import ImageAnnotator
+from services.image_annotator import ImageAnnotator, annotation_options
+from services.annotation_cache import annotation_cache
 
 logger = logging.getLogger(__name__)
 
@@ -74,7 +79,10 @@ async def process_camera_frame(
 async def capture_and_grade_sheet(
     image: UploadFile = File(...),
     exam_structure: str = Form(...),
-    answer_key: str = Form(...)
+    answer_key: str = Form(...),
+    annotation: str = Form(None),  # full | preview | overlay | lazy | none
+    annotation_format: str = Form(None),  # jpeg | webp
+    annotation_quality: int = Form(None)
 ):
     """
     Complete camera capture and grading pipeline
@@ -83,10 +91,18 @@ async def capture_and_grade_sheet(
         image: Captured camera image
         exam_structure: JSON string of exam structure  
         answer_key: JSON string of answer key
+        annotation: Annotated image shape (same options as /api/grade-sheet)
+        annotation_format: jpeg or webp
+        annotation_quality: 1-100
         
     Returns:
         dict: Complete grading results with annotations
     """
+    try:
+        annotation_opts = annotation_options(annotation, annotation_format, annotation_quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Parse inputs
         exam_data = json.loads(exam_structure)
@@ -139,25 +155,20 @@ async def capture_and_grade_sheet(
         grader = AnswerGrader(answers, exam_data)
         grading_results = grader.grade(omr_results['answers'])
         
-        logger.info(f"✅ Grading complete: {grading_results['score']}/{grading_results['total']}")
+        logger.info(f"✅ Grading complete: {grading_results['totalScore']}/{grading_results['maxScore']}")
         
         # Step 4: Generate annotated image
-        logger.info("🎨 Step 4: Generating annotated image...")
+        logger.info(f"🎨 Step 4: Generating annotated image ({annotation_opts['mode']})...")
         annotator = ImageAnnotator()
         
         # Use the cropped paper for annotation
-        annotated_image = annotator.annotate_results(
+        annotation_fields = annotator.shape_response(
             cropped_paper,
+            grading_results,
             paper_coordinates,
-            omr_results['answers'],
-            answers,
-            grading_results
+            annotation_opts
         )
-        
-        # Convert annotated image to base64
-        import base64
-        _, buffer = cv2.imencode('.jpg', annotated_image)
-        annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+        annotated_image = annotation_fields.pop('annotatedImage')
         
         logger.info("✅ Camera capture and grading pipeline completed successfully")
         
@@ -169,10 +180,11 @@ async def capture_and_grade_sheet(
             },
             'omr_results': omr_results,
             'grading_results': grading_results,
-            'annotated_image': f"data:image/jpeg;base64,{annotated_base64}",
+            'annotated_image': annotated_image,
+            **annotation_cache.publish(annotation_fields),
             'statistics': {
-                'total_questions': grading_results['total'],
-                'correct_answers': grading_results['correct'],
+                'total_questions': grading_results['totalQuestions'],
+                'correct_answers': grading_results['correctAnswers'],
                 'accuracy_percentage': grading_results['percentage'],
                 'processing_method': 'camera_system'
             }
@@ -262,6 +274,139 @@ async def validate_paper_quality(
         logger.error(f"Paper validation error: {e}")
         raise HTTPException(status_code=500, detail=f"Validation error: {str(e)}")
 
+def _parse_exam_message(text: str) -> Dict:
+    """{"exam_structure": {...}} yoki {"exam_structure": "<json>"} xabari"""
+    message = json.loads(text)
+    if not isinstance(message, dict) or 'exam_structure' not in message:
+        raise ValueError("exam_structure is required")
+
+    exam_data = message['exam_structure']
+    if isinstance(exam_data, str):
+        exam_data = json.loads(exam_data)
+    if not isinstance(exam_data, dict):
+        raise ValueError("exam_structure must be an object")
+    return exam_data
+
+
+def _analyze_frame_bytes(session: CameraSession, data: bytes) -> Dict:
+    """Threadpool'da: decode (past ruxsat) + session.analyze_frame"""
+    frame = session.decode_frame(data)
+    if frame is None:
+        session.stats['undecodable'] += 1
+        return {
+            'paper_detected': False,
+            'corners_found': 0,
+            'quality_score': 0,
+            'ready_to_capture': False,
+            'tracking': 'lost',
+            'error': 'Invalid image format'
+        }
+    return session.analyze_frame(frame)
+
+
+@router.websocket("/ws")
+async def camera_stream(websocket: WebSocket):
+    """
+    Live camera stream - per-session paper tracking and readiness updates
+
+    Protocol:
+        1. client -> {"exam_structure": {...}} (text, once)
+        2. server -> {"type": "ready", "frame_width": 640}
+        3. client -> JPEG frames (binary), any rate
+           server -> {"type": "frame", "paper_detected", "corners_found",
+                      "quality_score", "ready_to_capture", "tracking", "quad",
+                      "frame", "dropped", "latency_ms", ...} per processed frame
+        Text messages later: {"exam_structure": ...} replaces the exam,
+        {"type": "reset"} restarts tracking.
+
+    Only the newest frame is kept: if the client sends faster than frames
+    are processed, stale frames are dropped (counted in "dropped"), so the
+    latency of each update stays within one frame's processing time.
+    """
+    await websocket.accept()
+
+    try:
+        exam_data = _parse_exam_message(await websocket.receive_text())
+    except WebSocketDisconnect:
+        return
+    except (json.JSONDecodeError, ValueError) as e:
+        await websocket.send_json({'type': 'error', 'message': f"Invalid exam structure: {e}"})
+        await websocket.close(code=1003)
+        return
+
+    session = CameraSession(exam_data, camera_processor)
+    await websocket.send_json({'type': 'ready', 'frame_width': session.frame_width})
+
+    # Eng oxirgi kadr uchun bitta slot + boshqaruv xabarlari (asosiy sikl qo'llaydi)
+    pending = {'frame': None, 'received_at': 0.0, 'controls': [], 'closed': False}
+    counters = {'received': 0, 'dropped': 0}
+    wake = asyncio.Event()
+
+    async def receive_messages():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+
+                if message.get('bytes') is not None:
+                    counters['received'] += 1
+                    if pending['frame'] is not None:
+                        counters['dropped'] += 1
+                    pending['frame'] = message['bytes']
+                    pending['received_at'] = time.perf_counter()
+                elif message.get('text'):
+                    pending['controls'].append(message['text'])
+                wake.set()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            pending['closed'] = True
+            wake.set()
+
+    receiver = asyncio.create_task(receive_messages())
+
+    try:
+        while True:
+            await wake.wait()
+            wake.clear()
+            if pending['closed']:
+                break
+
+            controls, pending['controls'] = pending['controls'], []
+            for text in controls:
+                try:
+                    control = json.loads(text)
+                    if isinstance(control, dict) and control.get('type') == 'reset':
+                        session.reset_tracking()
+                    else:
+                        session.set_exam(_parse_exam_message(text))
+                except (json.JSONDecodeError, ValueError) as e:
+                    await websocket.send_json({'type': 'error', 'message': str(e)})
+
+            data, received_at = pending['frame'], pending['received_at']
+            pending['frame'] = None
+            if data is None:
+                continue
+
+            update = await run_in_threadpool(_analyze_frame_bytes, session, data)
+            update.update({
+                'type': 'frame',
+                'frame': counters['received'],
+                'dropped': counters['dropped'],
+                'latency_ms': round((time.perf_counter() - received_at) * 1000, 1)
+            })
+            await websocket.send_json(update)
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Camera stream error: {e}")
+        await websocket.close(code=1011)
+    finally:
+        receiver.cancel()
+        logger.info(f"Camera stream closed: {session.get_stats()}, dropped={counters['dropped']}")
+
 @router.get("/system-status")
 async def get_camera_system_status():
     """
@@ -275,6 +420,7 @@ async def get_camera_system_status():
         'version': '1.0.0',
         'capabilities': [
             'Real-time paper detection',
+            'Live paper tracking over WebSocket (/api/camera/ws)',
             'Automatic perspective correction', 
             'Corner marker detection',
             'Template-based coordinate mapping',
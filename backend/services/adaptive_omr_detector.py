@@ -7,6 +7,12 @@ import numpy as np
 from typing import Dict, List, Tuple, Optional
 import logging
 
+from config import settings
+from services.bubble_scorer import BatchBubbleScorer
+from services.integral_stats import IntegralImageEngine
+from services.lazy_planes import LazyPlanes, get_image_planes
+from services.quality_metrics import get_quality_metrics
+
 logger = logging.getLogger(__name__)
 
 class AdaptiveOMRDetector:
@@ -21,6 +27,18 @@ class AdaptiveOMRDetector:
     - False positive filtering
     """
     
+    # Har bir detection metodi qaysi tayyorlangan plane'larni ishlatadi
+    METHOD_PLANES = {
+        'darkness_analysis': ('enhanced', 'darkness_stats', 'integral'),
+        'contour_analysis': ('binary',),
+        'template_matching': ('enhanced',),
+        'edge_detection': ('enhanced',),
+        'comparative_analysis': ('enhanced', 'integral')
+    }
+    
+    # fastNlMeansDenoising: templateWindowSize=7, searchWindowSize=21 -> 3 + 10
+    NLM_WINDOW_RADIUS = 13
+    
     def __init__(self):
         self.detection_methods = [
             'darkness_analysis',
@@ -29,6 +47,7 @@ class AdaptiveOMRDetector:
             'edge_detection',
             'comparative_analysis'
         ]
+        self.batch_scorer = BatchBubbleScorer()
         
     def detect_all_answers(
         self,
@@ -54,8 +73,10 @@ class AdaptiveOMRDetector:
         detection_strategy = self._select_detection_strategy(image_quality)
         logger.info(f"Selected strategy: {detection_strategy['name']}")
         
-        # 3. Prepare image for detection
-        prepared_images = self._prepare_images_adaptive(image, image_quality)
+        # 3. Prepare images lazily - only planes the strategy's methods use
+        prepared_images = self._prepare_images_adaptive(
+            image, image_quality, detection_strategy['methods'], coordinates
+        )
         
         # 4. Detect all answers
         results = {}
@@ -116,6 +137,7 @@ class AdaptiveOMRDetector:
                 
                 results[topic['id']][section['id']] = section_results
         
+        logger.info(f"Prepared planes: {', '.join(prepared_images.computed())}")
         logger.info(f"✅ Adaptive detection complete:")
         logger.info(f"   Detected: {stats['detected']}/{stats['total']}")
         logger.info(f"   High confidence: {stats['high_confidence']}")
@@ -131,24 +153,22 @@ class AdaptiveOMRDetector:
     
     def _assess_image_quality(self, image: np.ndarray) -> Dict:
         """
-        Image quality'ni baholash
+        Image quality'ni baholash (umumiy quality_metrics - tile'lar va MAD noise)
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        metrics = get_quality_metrics(image)
         
         # 1. Sharpness (Laplacian variance)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        sharpness_score = min(100, laplacian_var / 10)  # Normalize to 0-100
+        sharpness_score = min(100, metrics['laplacian_var'] / 10)  # Normalize to 0-100
         
         # 2. Contrast (standard deviation)
-        contrast_score = min(100, gray.std() / 2.55)  # Normalize to 0-100
+        contrast_score = min(100, metrics['std'] / 2.55)  # Normalize to 0-100
         
         # 3. Brightness
-        brightness = gray.mean()
+        brightness = metrics['mean']
         brightness_score = 100 - abs(brightness - 127) / 1.27  # Optimal around 127
         
-        # 4. Noise level
-        noise = cv2.fastNlMeansDenoising(gray)
-        noise_diff = np.abs(gray.astype(float) - noise.astype(float)).mean()
+        # 4. Noise level - mean |noise| = sigma * sqrt(2/pi) (oldingi |gray - NLM| o'rniga)
+        noise_diff = metrics['noise_sigma'] * np.sqrt(2 / np.pi)
         noise_score = max(0, 100 - noise_diff * 2)
         
         # 5. Overall score
@@ -172,7 +192,7 @@ class AdaptiveOMRDetector:
             'brightness': brightness_score,
             'noise': noise_score,
             'brightness_value': brightness,
-            'contrast_value': gray.std()
+            'contrast_value': metrics['std']
         }
     
     def _select_detection_strategy(self, image_quality: Dict) -> Dict:
@@ -234,71 +254,162 @@ class AdaptiveOMRDetector:
                 'preprocessing': 'heavy_enhancement'
             }
     
-    def _prepare_images_adaptive(self, image: np.ndarray, image_quality: Dict) -> Dict:
+    def _prepare_images_adaptive(
+        self,
+        image: np.ndarray,
+        image_quality: Dict,
+        methods: Optional[List[str]] = None,
+        coordinates: Optional[Dict] = None
+    ) -> LazyPlanes:
         """
         Image quality'ga qarab adaptive preprocessing
+        
+        Plane'lar lazy - faqat tanlangan metodlar ishlatadiganlari (METHOD_PLANES)
+        ro'yxatga olinadi va birinchi murojaatda bir marta hisoblanadi.
+        coordinates berilsa va ROI_DENOISE yoqilgan bo'lsa, denoising faqat bubble ROI'lari
+        atrofida bajariladi - denoised plane faqat shu to'rtburchaklar ichida bir xil;
+        CLAHE va Otsu butun sahifa bo'yicha ishlagani uchun enhanced/binary plane'lar
+        to'liq denoise natijasidan farq qiladi (shuning uchun default o'chiq).
+        EXCELLENT/GOOD plane'lari (gray, clahe_2, otsu_inv) so'rovning umumiy
+        plane grafidan olinadi - ImageProcessor allaqachon qurgan bo'lsa qayta hisoblanmaydi.
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        shared = get_image_planes(image)
+        gray = shared['gray']
         
-        prepared = {
-            'original': gray.copy(),
-            'enhanced': None,
-            'binary': None,
-            'denoised': None
-        }
+        if methods is None:
+            methods = self.detection_methods
+        needed = {plane for method in methods for plane in self.METHOD_PLANES.get(method, ())}
         
         category = image_quality.get('category', 'FAIR')
+        roi_boxes = None
+        if coordinates and settings.ROI_DENOISE and category not in ('EXCELLENT', 'GOOD'):
+            roi_boxes = self._bubble_roi_boxes(coordinates, gray.shape[:2])
         
-        if category == 'EXCELLENT':
-            # Minimal processing for high quality
-            prepared['enhanced'] = gray.copy()
-            
-        elif category == 'GOOD':
-            # Light enhancement
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            prepared['enhanced'] = clahe.apply(gray)
-            
-        elif category == 'FAIR':
-            # Moderate enhancement
-            # Denoising
-            denoised = cv2.fastNlMeansDenoising(gray)
-            
-            # CLAHE
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(denoised)
-            
-            # Light sharpening
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-            sharpened = cv2.filter2D(enhanced, -1, kernel)
-            
-            prepared['enhanced'] = sharpened
-            prepared['denoised'] = denoised
+        planes = LazyPlanes()
+        planes['original'] = gray
+        
+        # Denoising (FAIR: default h, POOR: strong h=10)
+        def build_denoised(p):
+            if category in ('EXCELLENT', 'GOOD'):
+                return None
+            h = 3 if category == 'FAIR' else 10
+            return self._denoise(gray, h, roi_boxes)
+        
+        def build_enhanced(p):
+            if category == 'EXCELLENT':
+                # Minimal processing for high quality (detection metodlari faqat o'qiydi)
+                return gray
             
-        else:  # POOR
-            # Heavy enhancement
-            # Strong denoising
-            denoised = cv2.fastNlMeansDenoising(gray, h=10)
+            if category == 'GOOD':
+                # Light enhancement (CLAHE 2.0)
+                return shared['clahe_2']
             
-            # Strong CLAHE
-            clahe = cv2.createCLAHE(clipLimit=4.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(denoised)
+            # FAIR: moderate, POOR: heavy enhancement
+            clahe = cv2.createCLAHE(clipLimit=3.0 if category == 'FAIR' else 4.0, tileGridSize=(8, 8))
+            enhanced = clahe.apply(p['denoised'])
             
             # Sharpening
             kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
             sharpened = cv2.filter2D(enhanced, -1, kernel)
             
-            # Bilateral filter for smoothing
-            bilateral = cv2.bilateralFilter(sharpened, 9, 75, 75)
+            if category == 'FAIR':
+                return sharpened
             
-            prepared['enhanced'] = bilateral
-            prepared['denoised'] = denoised
+            # Bilateral filter for smoothing
+            return cv2.bilateralFilter(sharpened, 9, 75, 75)
+        
+        def build_binary(p):
+            if category == 'EXCELLENT':
+                return shared['otsu_inv']
+            if category == 'GOOD':
+                return shared['otsu_inv@clahe_2']
+            _, binary = cv2.threshold(
+                p['enhanced'], 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+            )
+            return binary
+        
+        planes.register('denoised', build_denoised)
+        planes.register('enhanced', build_enhanced)
+        if 'binary' in needed:
+            planes.register('binary', build_binary)
+        
+        # Vectorized darkness/fill for every bubble on the sheet
+        if 'darkness_stats' in needed and coordinates:
+            planes.register(
+                'darkness_stats',
+                lambda p: self._precompute_darkness_stats(p['enhanced'], coordinates)
+            )
+        
+        # Integral image - O(1) mean/std per bubble ROI
+        if 'integral' in needed and settings.USE_INTEGRAL_STATS:
+            planes.register('integral', lambda p: IntegralImageEngine(p['enhanced']))
+        
+        return planes
+    
+    def _bubble_roi_boxes(
+        self,
+        coordinates: Dict,
+        shape: Tuple[int, int],
+        margin: int = 8
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Bubble ROI'lari birlashmasi - qo'shni ROI'lar bitta to'rtburchakka qo'shiladi
         
-        # Create binary image
-        _, prepared['binary'] = cv2.threshold(
-            prepared['enhanced'], 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
-        )
+        margin: sharpening (3x3) va bilateral (d=9) filtrlari uchun qo'shimcha piksellar
         
-        return prepared
+        Returns:
+            [(x1, y1, x2, y2), ...]
+        """
+        height, width = shape
+        mask = np.zeros((height, width), dtype=np.uint8)
+        
+        for coords in coordinates.values():
+            for bubble in coords.get('bubbles', []):
+                x, y = int(bubble['x']), int(bubble['y'])
+                half = int(bubble.get('radius', 8)) + margin
+                x1, y1 = max(0, x - half), max(0, y - half)
+                x2, y2 = min(width, x + half), min(height, y + half)
+                if x2 > x1 and y2 > y1:
+                    mask[y1:y2, x1:x2] = 255
+        
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        
+        boxes = []
+        for label in range(1, count):
+            x, y, w, h = stats[label, :4]
+            boxes.append((int(x), int(y), int(x + w), int(y + h)))
+        
+        return boxes
+    
+    def _denoise(
+        self,
+        gray: np.ndarray,
+        h: float,
+        roi_boxes: Optional[List[Tuple[int, int, int, int]]] = None
+    ) -> np.ndarray:
+        """
+        fastNlMeansDenoising - butun sahifa yoki faqat ROI to'rtburchaklari
+        
+        Har bir to'rtburchak NLM oynasi (template 7 + search 21 -> 13px) bilan
+        kengaytirib kesiladi, shuning uchun to'rtburchak ichidagi natija butun
+        sahifani denoise qilish bilan bir xil. Tashqarisi o'zgarmaydi (denoise qilinmaydi),
+        shuning uchun undan keyingi butun sahifa CLAHE/Otsu natijasi boshqacha bo'ladi.
+        """
+        if roi_boxes is None:
+            return cv2.fastNlMeansDenoising(gray, h=h)
+        
+        height, width = gray.shape[:2]
+        pad = self.NLM_WINDOW_RADIUS
+        denoised = gray.copy()
+        
+        for x1, y1, x2, y2 in roi_boxes:
+            cx1, cy1 = max(0, x1 - pad), max(0, y1 - pad)
+            cx2, cy2 = min(width, x2 + pad), min(height, y2 + pad)
+            
+            crop = cv2.fastNlMeansDenoising(gray[cy1:cy2, cx1:cx2], h=h)
+            denoised[y1:y2, x1:x2] = crop[y1 - cy1:y2 - cy1, x1 - cx1:x2 - cx1]
+        
+        return denoised
     
     def _detect_single_question_adaptive(
         self,
@@ -359,6 +470,50 @@ class AdaptiveOMRDetector:
         
         return final_result
     
+    def _precompute_darkness_stats(self, image: np.ndarray, coordinates: Dict) -> Dict:
+        """
+        Barcha bubble'lar uchun darkness va Otsu fill (batch)
+        
+        Returns:
+            {(x, y, radius): (darkness, fill_percentage)} - faqat rasm ichidagi ROI'lar
+        """
+        bubbles = [
+            bubble
+            for coords in coordinates.values()
+            for bubble in coords.get('bubbles', [])
+        ]
+        
+        stats = self.batch_scorer.square_stats(image, bubbles, default_radius=8)
+        
+        darkness_stats = {}
+        for i, bubble in enumerate(bubbles):
+            if stats['valid'][i]:
+                key = (int(bubble['x']), int(bubble['y']), int(bubble.get('radius', 8)))
+                darkness_stats[key] = (255 - stats['mean'][i], stats['otsu_fill'][i])
+        
+        return darkness_stats
+    
+    def _integral_roi_stats(self, images: Dict, bubbles: List[Dict]) -> Optional[Dict]:
+        """
+        Savol bubble'lari uchun kvadrat ROI mean/std (integral image, bitta so'rov)
+        
+        Faqat mean/std integral'dan olinadi. Otsu fill darkness_stats'da (batch, radius
+        guruhlari bo'yicha) hisoblanadi; Canny edge density esa ROI bo'yicha qoladi -
+        bubble to'rtburchaklarida edge plane + integral qurish (~100ms) 200 ta kichik
+        Canny'dan (~18ms) sekinroq.
+        
+        Returns:
+            IntegralImageEngine.rect_stats natijasi yoki None (engine yo'q)
+        """
+        engine = images.get('integral')
+        if engine is None:
+            return None
+        
+        xs = [int(b['x']) for b in bubbles]
+        ys = [int(b['y']) for b in bubbles]
+        radii = [int(b.get('radius', 8)) for b in bubbles]
+        return engine.rect_stats(xs, ys, radii)
+    
     def _detect_by_darkness_analysis(
         self, 
         images: Dict, 
@@ -369,24 +524,34 @@ class AdaptiveOMRDetector:
         Darkness analysis method
         """
         image = images['enhanced']
+        darkness_stats = images.get('darkness_stats', {})
+        roi_stats = self._integral_roi_stats(images, bubbles)
         
         bubble_scores = []
         
-        for bubble in bubbles:
+        for i, bubble in enumerate(bubbles):
             x, y = int(bubble['x']), int(bubble['y'])
             radius = int(bubble.get('radius', 8))
             
-            # Extract ROI
-            roi = self._extract_bubble_roi(image, x, y, radius)
-            if roi is None:
-                continue
-            
-            # Calculate darkness
-            darkness = 255 - roi.mean()
-            
-            # Calculate fill percentage
-            _, binary_roi = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-            fill_percentage = (binary_roi > 0).sum() / binary_roi.size * 100
+            precomputed = darkness_stats.get((x, y, radius))
+            if precomputed is not None:
+                darkness, fill_percentage = precomputed
+            else:
+                # Extract ROI
+                roi = self._extract_bubble_roi(image, x, y, radius)
+                if roi is None:
+                    continue
+                
+                # Calculate darkness
+                if roi_stats is not None:
+                    darkness = 255 - roi_stats['mean'][i]
+                else:
+                    darkness = 255 - roi.mean()
+                
+                # Calculate fill percentage (Otsu - histogram kerak, integral bilan emas;
+                # faqat darkness_stats'da yo'q, rasm chetida kesilgan ROI'lar uchun)
+                _, binary_roi = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+                fill_percentage = (binary_roi > 0).sum() / binary_roi.size * 100
             
             bubble_scores.append({
                 'variant': bubble['variant'],
@@ -437,10 +602,11 @@ class AdaptiveOMRDetector:
         Comparative analysis method - nisbiy taqqoslash
         """
         image = images['enhanced']
+        roi_stats = self._integral_roi_stats(images, bubbles)
         
         bubble_scores = []
         
-        for bubble in bubbles:
+        for i, bubble in enumerate(bubbles):
             x, y = int(bubble['x']), int(bubble['y'])
             radius = int(bubble.get('radius', 8))
             
@@ -450,10 +616,14 @@ class AdaptiveOMRDetector:
                 continue
             
             # Multiple metrics
-            darkness = 255 - roi.mean()
-            std_dev = roi.std()
+            if roi_stats is not None:
+                darkness = 255 - roi_stats['mean'][i]
+                std_dev = roi_stats['std'][i]
+            else:
+                darkness = 255 - roi.mean()
+                std_dev = roi.std()
             
-            # Edge density
+            # Edge density (ROI bo'yicha - _integral_roi_stats izohiga qarang)
             edges = cv2.Canny(roi, 50, 150)
             edge_density = (edges > 0).sum() / edges.size * 100
             
@@ -7,6 +7,8 @@ import numpy as np
 from typing import Dict, List, Tuple
 import logging
 
+from utils.spatial_index import as_points, match_nearest
+
 logger = logging.getLogger(__name__)
 
 class AdvancedOMRDetector:
@@ -187,49 +189,36 @@ class AdvancedOMRDetector:
         """
         matched = {}
         
-        for q_num, coords in coordinates.items():
-            question_bubbles = []
-            
-            for variant_coord in coords['bubbles']:
-                expected_x = variant_coord['x']
-                expected_y = variant_coord['y']
-                expected_radius = variant_coord['radius']
-                
-                # Eng yaqin bubbleni topish
-                closest_bubble = None
-                min_distance = float('inf')
-                
-                for bubble in bubbles:
-                    bx, by = bubble['center']
-                    
-                    # Distance
-                    distance = np.sqrt(
-                        (bx - expected_x)**2 + 
-                        (by - expected_y)**2
-                    )
-                    
-                    # Radius ham tekshirish
-                    radius_diff = abs(bubble['radius'] - expected_radius)
-                    
-                    # Combined metric
-                    metric = distance + radius_diff * 2
-                    
-                    # Threshold: 20 pixels ichida bo'lishi kerak
-                    if metric < min_distance and distance < 20:
-                        min_distance = metric
-                        closest_bubble = bubble
-                
-                if closest_bubble:
-                    question_bubbles.append({
-                        'variant': variant_coord['variant'],
-                        'expected': (expected_x, expected_y),
-                        'actual': closest_bubble['center'],
-                        'radius': closest_bubble['radius'],
-                        'bubble_data': closest_bubble
-                    })
-            
-            if question_bubbles:
-                matched[q_num] = question_bubbles
+        # Barcha kutilgan variantlar bitta massivda - KD-tree bilan bir so'rovda moslashtiriladi
+        expected = [
+            (q_num, variant_coord)
+            for q_num, coords in coordinates.items()
+            for variant_coord in coords['bubbles']
+        ]
+        if not expected:
+            return matched
+        
+        # Combined metric: distance + radius farqi * 2, threshold: 20 pixels ichida
+        matches = match_nearest(
+            np.array([(c['x'], c['y']) for _, c in expected], dtype=np.float64),
+            as_points(bubbles, 'center', None),
+            max_distance=20,
+            query_sizes=np.array([c['radius'] for _, c in expected], dtype=np.float64),
+            point_sizes=np.array([b['radius'] for b in bubbles], dtype=np.float64),
+            size_weight=2
+        )
+        
+        for (q_num, variant_coord), bubble_idx in zip(expected, matches):
+            if bubble_idx < 0:
+                continue
+            closest_bubble = bubbles[bubble_idx]
+            matched.setdefault(q_num, []).append({
+                'variant': variant_coord['variant'],
+                'expected': (variant_coord['x'], variant_coord['y']),
+                'actual': closest_bubble['center'],
+                'radius': closest_bubble['radius'],
+                'bubble_data': closest_bubble
+            })
         
         return matched
     
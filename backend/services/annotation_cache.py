@@ -0,0 +1,132 @@
+"""
+Annotation Cache - lazy annotated rasmlar (GET /api/annotated/{token})
+
+'lazy' rejimida grading javobi rasmni inline qilmaydi: worker grayscale varaq va
+to'rtburchaklar ro'yxatini qaytaradi, API process ularni shu yerda qisqa muddat
+saqlaydi va javobga URL qo'yadi. Rasm faqat client so'raganda chiziladi va
+encode qilinadi; har bir (format, quality, max_width) varianti bir marta render
+qilinib saqlanadi. Token - taxmin qilib bo'lmaydigan capability (secrets), shuning
+uchun <img src> ham auth header'siz ishlaydi.
+"""
+import logging
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+URL_PREFIX = '/api/annotated/'
+
+
+class _Entry:
+    __slots__ = ('image', 'boxes', 'created', 'rendered')
+
+    def __init__(self, image: np.ndarray, boxes: list):
+        self.image = image
+        self.boxes = boxes
+        self.created = time.monotonic()
+        self.rendered: Dict[Tuple, Tuple[bytes, str]] = {}
+
+
+class AnnotationCache:
+    """
+    Token -> (grayscale varaq, boxes, render'lar) - thread-safe LRU + TTL
+    """
+
+    def __init__(self, max_size: int = 32, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.evictions = 0
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl > 0 and time.monotonic() - entry.created > self.ttl
+
+    def put(self, image: np.ndarray, boxes: list) -> str:
+        """Varaqni saqlash va token qaytarish"""
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._entries[token] = _Entry(image, boxes)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return token
+
+    def publish(self, response: Dict) -> Dict:
+        """
+        Javobdagi 'annotationSource'ni cache'ga olib, o'rniga 'annotatedImageUrl' qo'yish
+        (lazy bo'lmagan javoblar o'zgarishsiz qaytadi)
+        """
+        source = response.pop('annotationSource', None)
+        if source is not None:
+            token = self.put(source['image'], source['boxes'])
+            response['annotatedImageUrl'] = f"{URL_PREFIX}{token}"
+            response['annotatedImageExpiresIn'] = self.ttl if self.ttl > 0 else None
+        return response
+
+    def render(
+        self,
+        token: str,
+        image_format: str,
+        quality: int,
+        max_width: Optional[int]
+    ) -> Optional[Tuple[bytes, str]]:
+        """
+        Encode qilingan rasm (bytes, MIME) yoki None (token yo'q/muddati o'tgan)
+        """
+        from services.image_annotator import ImageAnnotator
+
+        key = (image_format, quality, max_width)
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and self._expired(entry):
+                del self._entries[token]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(token)
+            rendered = entry.rendered.get(key)
+            if rendered is not None:
+                self.hits += 1
+                return rendered
+
+        # Render lock'dan tashqarida - parallel so'rovda ikki marta chizilishi zararsiz
+        rendered = ImageAnnotator().render(entry.image, entry.boxes, image_format, quality, max_width)
+
+        with self._lock:
+            self.renders += 1
+            entry.rendered[key] = rendered
+
+        return rendered
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'renders': self.renders,
+                'evictions': self.evictions
+            }
+
+
+annotation_cache = AnnotationCache(settings.ANNOTATION_CACHE_SIZE, settings.ANNOTATION_CACHE_TTL)
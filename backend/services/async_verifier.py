@@ -0,0 +1,574 @@
+"""
+Async AI Verifier - shubhali javoblarni parallel tekshirish
+OpenAIVerifier / AIVerifier (Groq) ustidan: bir xil crop, prompt va parse
+
+Sync verifier'lar har bir savol uchun ketma-ket chat.completions.create
+chaqiradi (20 ta savol = 20 ta ketma-ket round-trip). Bu yerda:
+- process bo'yicha bitta fon event loop (thread) va unda bitta async client
+  (AsyncOpenAI / AsyncGroq) - ulanishlar pool'i so'rovlar orasida umumiy
+- semaphore bilan cheklangan parallellik (AI_VERIFY_CONCURRENCY, process bo'yicha)
+- 429 / 5xx / ulanish xatolarida retry: eksponensial backoff + jitter,
+  Retry-After sarlavhasi hisobga olinadi
+- varaq bo'yicha deadline (AI_VERIFY_DEADLINE) - ulgurmagan savollarda OMR javobi qoladi
+- crop piksellari hash'i bo'yicha verdict cache - bir xil varaqni qayta
+  tekshirish API'ga qayta murojaat qilmaydi
+- chaqiruv counter'lari (so'rovlar, retry, deadline, ...) javobdagi
+  'ai_verification' orqali MetricsRegistry'ga (/metrics) boradi
+- AI_VERIFY_BATCH_SIZE > 1: K ta savol crop'i yorliqli tile'lar bilan bitta
+  kompozit rasmga joylanadi, javob JSON sxemada; har bir savol verdict'i
+  baribir sync verifier'ning _parse_ai_response'idan o'tadi (bir xil qaror
+  semantikasi). JSON yaroqsiz yoki savol tushib qolsa - o'sha savollar alohida.
+
+AI_BASE_URL orqali lokal mock server'ga yo'naltirish mumkin (mock_ai_server.py).
+"""
+import asyncio
+import base64
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+UNCERTAIN_WARNINGS = ('MULTIPLE_MARKS', 'LOW_CONFIDENCE', 'NO_MARK')
+
+CALL_COUNTERS = ('requests', 'tiled_requests', 'single_fallbacks', 'retries', 'failed', 'deadline_expired')
+
+TILE_LABEL_HEIGHT = 28  # px - tile ustidagi qora yorliq ("Q12")
+TILE_GAP = 6  # px - tile'lar orasidagi oq chiziq
+
+TILED_PROMPT = """You are an expert OMR (Optical Mark Recognition) system analyzing answer sheets.
+
+The image contains {count} answer rows arranged as tiles, read left-to-right, top-to-bottom.
+Each tile has a black label bar on top with its question number (e.g. "Q12"); the bubbles are below it.
+Layout: {columns}x{rows} tiles, tile {tile_width}x{tile_height} px, label bar {label_height} px, gap {gap} px
+
+Questions:
+{questions}
+
+**Your Task:**
+For EACH tile, determine which ONE bubble (circle) is filled/marked with pen or pencil.
+
+**Rules:**
+1. Look for the DARKEST bubble with the most ink/pencil marks
+2. Ignore light marks, scratches, smudges, or stray marks outside bubbles
+3. If multiple bubbles are marked, choose the DARKEST and most completely filled one
+4. If no bubble is clearly marked, answer "NONE"
+5. Be decisive - choose the most likely answer based on visual evidence
+
+**Response Format (JSON only):**
+{{"answers": [{{"question": 12, "answer": "B", "confidence": 95, "reason": "one sentence"}}]}}
+Include every question listed above exactly once. "answer" is one of the listed variants or "NONE", "confidence" is 0-100."""
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+# Joriy verify_uncertain_answers chaqiruvining counter'lari (_verify_batch task'i va uning bolalari)
+_call_counts: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    'ai_verify_call_counts', default=None
+)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Process bo'yicha fon event loop (daemon thread, birinchi chaqiruvda)"""
+    global _loop
+
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name='ai-verifier-loop', daemon=True
+                )
+                thread.start()
+                _loop = loop
+
+    return _loop
+
+
+def compose_tiles(
+    crops: List[np.ndarray],
+    labels: List[str],
+    columns: int,
+    tile_height: int
+) -> Tuple[np.ndarray, Dict]:
+    """
+    Crop'larni yorliqli tile'lar to'riga joylash (grayscale)
+
+    Tile eni - crop'lar nisbatining medianasi bo'yicha (bitta varaqda savol
+    qatorlari deyarli bir xil nisbatda), har bir crop aynan tile o'lchamiga
+    keltiriladi.
+
+    Returns:
+        (composite, layout) - layout: columns, rows, tile_width, tile_height,
+        label_height, gap (promptga yoziladi)
+    """
+    columns = max(1, min(columns, len(crops)))
+    rows = math.ceil(len(crops) / columns)
+    aspect = float(np.median([crop.shape[1] / max(crop.shape[0], 1) for crop in crops]))
+    tile_width = max(tile_height, int(round(tile_height * aspect)))
+    cell_height = TILE_LABEL_HEIGHT + tile_height
+
+    composite = np.full(
+        (rows * cell_height + (rows - 1) * TILE_GAP, columns * tile_width + (columns - 1) * TILE_GAP),
+        255, dtype=np.uint8
+    )
+
+    for index, (crop, label) in enumerate(zip(crops, labels)):
+        row, column = divmod(index, columns)
+        x = column * (tile_width + TILE_GAP)
+        y = row * (cell_height + TILE_GAP)
+
+        composite[y:y + TILE_LABEL_HEIGHT, x:x + tile_width] = 0
+        cv2.putText(
+            composite, label, (x + 6, y + TILE_LABEL_HEIGHT - 8),
+            cv2.FONT_HERSHEY_SIMPLEX, 0.7, 255, 2, cv2.LINE_AA
+        )
+        interpolation = cv2.INTER_AREA if crop.shape[0] > tile_height else cv2.INTER_CUBIC
+        composite[y + TILE_LABEL_HEIGHT:y + cell_height, x:x + tile_width] = cv2.resize(
+            crop, (tile_width, tile_height), interpolation=interpolation
+        )
+
+    return composite, {
+        'columns': columns,
+        'rows': rows,
+        'tile_width': tile_width,
+        'tile_height': tile_height,
+        'label_height': TILE_LABEL_HEIGHT,
+        'gap': TILE_GAP
+    }
+
+
+class VerdictCache:
+    """
+    Crop hash -> AI javob matni (thread-safe LRU)
+
+    Matn saqlanadi, verdict emas: 'changed' OMR javobiga bog'liq, shuning uchun
+    har safar joriy savol bilan qayta parse qilinadi.
+    """
+
+    def __init__(self, max_size: int = 2048):
+        self.max_size = max_size
+
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, text: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class AsyncAIVerifier:
+    """
+    Parallel AI tekshiruv - verify_uncertain_answers sync verifier'lar bilan bir xil
+    interfeysda (pipeline worker'lari uchun), ichida esa fon loop'dagi async so'rovlar
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        api_key: str,
+        model: str,
+        temperature: float = 0.1,
+        max_tokens: int = 200,
+        base_url: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        deadline: Optional[float] = None,
+        request_timeout: Optional[float] = None,
+        cache_size: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ):
+        # Crop / prompt / parse / update - provider'ning sync verifier'idan
+        if provider == 'openai':
+            import openai as sdk
+            from services.openai_verifier import OpenAIVerifier
+            self._base = OpenAIVerifier(api_key=api_key, model=model, temperature=temperature, max_tokens=max_tokens)
+            self._client_class = sdk.AsyncOpenAI
+        elif provider == 'groq':
+            import groq as sdk
+            from services.ai_verifier import AIVerifier
+            self._base = AIVerifier(api_key=api_key, model=model, temperature=temperature, max_tokens=max_tokens)
+            self._client_class = sdk.AsyncGroq
+        else:
+            raise ValueError(f"Unknown AI provider: {provider}")
+
+        self._sdk = sdk
+        self.provider = provider
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.base_url = base_url or None
+
+        self.concurrency = concurrency or settings.AI_VERIFY_CONCURRENCY
+        self.max_retries = settings.AI_VERIFY_MAX_RETRIES if max_retries is None else max_retries
+        self.deadline = deadline or settings.AI_VERIFY_DEADLINE
+        self.request_timeout = request_timeout or settings.AI_VERIFY_REQUEST_TIMEOUT
+        self.cache = VerdictCache(settings.AI_VERIFY_CACHE_SIZE if cache_size is None else cache_size)
+
+        # Tiled mode (1 = har bir savol alohida so'rov)
+        self.batch_size = max(1, batch_size or settings.AI_VERIFY_BATCH_SIZE)
+        self.tile_columns = settings.AI_VERIFY_TILE_COLUMNS
+        self.tile_height = settings.AI_VERIFY_TILE_HEIGHT
+        self.jpeg_quality = settings.AI_VERIFY_JPEG_QUALITY
+
+        # Fon loop'da yaratiladi (client va semaphore shu loop'ga tegishli)
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        logger.info(
+            f"Async AI Verifier initialized ({provider}, {model}, "
+            f"concurrency={self.concurrency}, deadline={self.deadline}s, batch={self.batch_size})"
+        )
+
+    @staticmethod
+    def _count(key: str, amount: int = 1):
+        counts = _call_counts.get()
+        if counts is not None:
+            counts[key] += amount
+
+    def verify_uncertain_answers(
+        self,
+        image: np.ndarray,
+        omr_results: Dict,
+        coordinates: Dict,
+        confidence_threshold: float = 70.0,
+        max_verifications: int = 20
+    ) -> Dict:
+        """
+        Past ishonchli javoblarni AI bilan parallel tekshirish
+
+        Args:
+            image: Grayscale image
+            omr_results: OMR detection results
+            coordinates: Question coordinates
+            confidence_threshold: Minimum confidence for AI verification
+            max_verifications: Maximum number of questions to verify
+
+        Returns:
+            dict: Updated results with AI verifications
+            ('ai_verification' - shu chaqiruv statistikasi)
+        """
+        verified_results = omr_results.copy()
+
+        uncertain_questions = [
+            answer
+            for topic_data in omr_results['answers'].values()
+            for section_data in topic_data.values()
+            for answer in section_data
+            if answer['confidence'] < confidence_threshold or answer['warning'] in UNCERTAIN_WARNINGS
+        ]
+        logger.info(f"Found {len(uncertain_questions)} uncertain answers")
+
+        questions_to_verify = [
+            question for question in uncertain_questions[:max_verifications]
+            if question['questionNumber'] in coordinates
+        ]
+        if not questions_to_verify:
+            return verified_results
+
+        start = time.perf_counter()
+
+        # CPU qismi (crop, JPEG, hash) shu worker thread'da; cache'dagilar so'rovsiz
+        jobs = []
+        verdicts: List[Tuple[Dict, str, Optional[str]]] = []  # (question, text, yangi cache kaliti)
+        for question in questions_to_verify:
+            coords = coordinates[question['questionNumber']]
+            crop = self._base._extract_question_region(image, coords)
+            key = self._cache_key(crop, coords)
+            cached = self.cache.get(key)
+            if cached is not None:
+                verdicts.append((question, cached, None))
+            else:
+                jobs.append((question, coords, crop, key))
+
+        cache_hits = len(verdicts)
+        timed_out = 0
+        counts = dict.fromkeys(CALL_COUNTERS, 0)
+
+        if jobs:
+            groups = [
+                self._prepare_group(jobs[i:i + self.batch_size])
+                for i in range(0, len(jobs), self.batch_size)
+            ]
+            future = asyncio.run_coroutine_threadsafe(self._verify_batch(groups, counts), _get_loop())
+            try:
+                texts = future.result(timeout=self.deadline + 1.0)
+            except Exception as e:
+                future.cancel()
+                logger.error(f"AI verification batch failed: {e}")
+                texts = [None] * len(jobs)
+
+            for (question, coords, crop, key), text in zip(jobs, texts):
+                if text is None:
+                    timed_out += 1
+                    continue
+                verdicts.append((question, text, key))
+
+        verified_count = 0
+        corrected_count = 0
+        for question, text, key in verdicts:
+            ai_result = self._base._parse_ai_response(text, question)
+            if not ai_result['success']:
+                continue
+            if key is not None:
+                self.cache.put(key, text)
+
+            self._base._update_answer(verified_results, question['questionNumber'], ai_result)
+            verified_count += 1
+            if ai_result.get('changed'):
+                corrected_count += 1
+                logger.info(
+                    f"Q{question['questionNumber']}: "
+                    f"OMR={ai_result.get('original_answer')} → AI={ai_result['answer']} "
+                    f"(confidence: {ai_result['confidence']}%)"
+                )
+
+        verified_results['ai_verification'] = {
+            'requested': len(questions_to_verify),
+            'api_calls': math.ceil(len(jobs) / self.batch_size) if jobs else 0,
+            'cache_hits': cache_hits,
+            'unanswered': timed_out,
+            'seconds': round(time.perf_counter() - start, 3),
+            **counts
+        }
+        logger.info(
+            f"AI verification complete: {verified_count} verified, {corrected_count} corrected "
+            f"({cache_hits} cached, {timed_out} unanswered, "
+            f"{verified_results['ai_verification']['seconds']}s)"
+        )
+
+        return verified_results
+
+    def _cache_key(self, crop: np.ndarray, coords: Dict) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{self.provider}|{self.model}|{crop.shape}|".encode())
+        digest.update(','.join(str(b['variant']) for b in coords['bubbles']).encode())
+        digest.update(np.ascontiguousarray(crop).tobytes())
+        return digest.hexdigest()
+
+    def _encode_crop(self, crop: np.ndarray) -> str:
+        _, buffer = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return base64.b64encode(buffer).decode('utf-8')
+
+    def _single_request(self, job: Tuple) -> Tuple[str, str]:
+        question, coords, crop, key = job
+        return self._encode_crop(crop), self._base._create_verification_prompt(question, coords)
+
+    def _prepare_group(self, jobs: List[Tuple]) -> Dict:
+        """
+        So'rov guruhi: bitta savol - oddiy prompt, bir nechta - kompozit rasm + JSON prompt
+        """
+        if len(jobs) == 1:
+            img_base64, prompt = self._single_request(jobs[0])
+            return {'jobs': jobs, 'image': img_base64, 'prompt': prompt, 'tiled': False}
+
+        labels = [f"Q{question['questionNumber']}" for question, coords, crop, key in jobs]
+        composite, layout = compose_tiles(
+            [crop for question, coords, crop, key in jobs], labels, self.tile_columns, self.tile_height
+        )
+        questions = '\n'.join(
+            f"- {label}: variants {', '.join(str(b['variant']) for b in coords['bubbles'])} | "
+            f"OMR: {question['answer'] or 'none'} ({question['confidence']}%), "
+            f"warning: {question['warning'] or 'none'}"
+            for label, (question, coords, crop, key) in zip(labels, jobs)
+        )
+        prompt = TILED_PROMPT.format(count=len(jobs), questions=questions, **layout)
+        return {'jobs': jobs, 'image': self._encode_crop(composite), 'prompt': prompt, 'tiled': True}
+
+    def _split_tiled_response(self, text: str, jobs: List[Tuple]) -> List[Optional[str]]:
+        """
+        JSON javob -> har bir savol uchun sync formatdagi matn
+        (ANSWER / CONFIDENCE / REASON) yoki None
+        """
+        body = text.strip()
+        if body.startswith('```'):
+            body = body.strip('`')
+            body = body[body.find('{'):]
+        try:
+            items = json.loads(body).get('answers', [])
+        except (ValueError, AttributeError):
+            logger.warning("Tiled AI response is not valid JSON")
+            return [None] * len(jobs)
+
+        by_question = {}
+        for item in items:
+            try:
+                by_question[int(str(item['question']).lstrip('Qq'))] = item
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        texts = []
+        for question, coords, crop, key in jobs:
+            item = by_question.get(question['questionNumber'])
+            if item is None or 'answer' not in item or 'confidence' not in item:
+                texts.append(None)
+                continue
+            answer = str(item['answer'] or 'NONE').strip().upper()
+            texts.append(
+                f"ANSWER: {answer}\n"
+                f"CONFIDENCE: {item['confidence']}\n"
+                f"REASON: {item.get('reason', '')}"
+            )
+        return texts
+
+    async def _verify_group(self, group: Dict, deadline: float) -> List[Optional[str]]:
+        if not group['tiled']:
+            return [await self._request_with_retry(group['image'], group['prompt'], deadline)]
+
+        self._count('tiled_requests')
+        text = await self._request_with_retry(group['image'], group['prompt'], deadline, json_mode=True)
+        texts = self._split_tiled_response(text, group['jobs']) if text else [None] * len(group['jobs'])
+
+        # Javobsiz qolganlar - alohida so'rovlar (deadline ichida)
+        missing = [index for index, value in enumerate(texts) if value is None]
+        if missing and time.monotonic() < deadline:
+            self._count('single_fallbacks', len(missing))
+            singles = await asyncio.gather(*(
+                self._request_with_retry(*self._single_request(group['jobs'][index]), deadline)
+                for index in missing
+            ))
+            for index, value in zip(missing, singles):
+                texts[index] = value
+        return texts
+
+    async def _verify_batch(self, groups: List[Dict], counts: Dict[str, int]) -> List[Optional[str]]:
+        """
+        Barcha guruhlar parallel (semaphore bilan); deadline'gacha
+        tugamaganlari bekor qilinadi -> None (savollar tartibida tekis ro'yxat)
+
+        counts - shu chaqiruv counter'lari (ichki task'lar context orqali oladi)
+        """
+        _call_counts.set(counts)
+        if self._client is None:
+            self._client = self._client_class(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.request_timeout,
+                max_retries=0  # retry/backoff o'zimizda (Retry-After + deadline)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        deadline = time.monotonic() + self.deadline
+        tasks = [asyncio.ensure_future(self._verify_group(group, deadline)) for group in groups]
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            dropped = sum(len(group['jobs']) for group, task in zip(groups, tasks) if task in pending)
+            self._count('deadline_expired', dropped)
+            logger.warning(f"AI verification deadline ({self.deadline}s): {dropped} questions dropped")
+
+        results = []
+        for group, task in zip(groups, tasks):
+            if task in done and not task.cancelled() and task.exception() is None:
+                results.extend(task.result())
+            else:
+                results.extend([None] * len(group['jobs']))
+        return results
+
+    async def _request_with_retry(
+        self,
+        img_base64: str,
+        prompt: str,
+        deadline: float,
+        json_mode: bool = False
+    ) -> Optional[str]:
+        extra = {'response_format': {'type': 'json_object'}} if json_mode else {}
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self._count('requests')
+                    response = await self._client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {
+                                "role": "user",
+                                "content": [
+                                    {"type": "text", "text": prompt},
+                                    {
+                                        "type": "image_url",
+                                        "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"}
+                                    }
+                                ]
+                            }
+                        ],
+                        temperature=self.temperature,
+                        max_tokens=self.max_tokens * (self.batch_size if json_mode else 1),
+                        **extra
+                    )
+                return response.choices[0].message.content.strip()
+
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                    self._count('failed')
+                    logger.error(f"{self.provider} API error: {e}")
+                    return None
+
+                self._count('retries')
+                logger.warning(f"{self.provider} API error ({e}), retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+        return None
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Qayta urinish kechikishi (s) yoki None - xato qayta urinishga yaramaydi"""
+        if isinstance(error, self._sdk.APIStatusError):
+            if error.status_code not in RETRY_STATUS_CODES:
+                return None
+            retry_after = error.response.headers.get('retry-after') if error.response is not None else None
+            if retry_after:
+                try:
+                    return max(0.0, float(retry_after))
+                except ValueError:
+                    pass
+        elif not isinstance(error, self._sdk.APIConnectionError):  # APITimeoutError ham shu yerda
+            return None
+
+        backoff = settings.AI_VERIFY_BACKOFF_BASE * (2 ** attempt)
+        return backoff * (0.5 + random.random() / 2)
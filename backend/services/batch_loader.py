@@ -0,0 +1,248 @@
+"""
+Batch Loader - ko'p varaqli upload'larni alohida varaqlarga ajratish
+Oddiy rasmlar, ZIP arxivlar, multi-page TIFF va PDF qo'llab-quvvatlanadi
+"""
+import io
+import logging
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from services.image_loader import load_image
+
+logger = logging.getLogger(__name__)
+
+# PDF support (poppler kerak)
+PDF2IMAGE_AVAILABLE = False
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    PDF2IMAGE_AVAILABLE = True
+except Exception as e:
+    logger.warning(f"pdf2image not available - PDF batches disabled: {e}")
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+TIFF_EXTENSIONS = {'.tif', '.tiff'}
+
+
+def detect_upload_kind(filename: str, content_type: Optional[str] = None) -> Optional[str]:
+    """
+    Upload turini aniqlash
+
+    Returns:
+        'image', 'tiff', 'pdf', 'zip' yoki None (qo'llab-quvvatlanmaydi)
+    """
+    suffix = Path(filename or '').suffix.lower()
+    content_type = (content_type or '').lower()
+
+    if suffix == '.zip' or content_type in ('application/zip', 'application/x-zip-compressed'):
+        return 'zip'
+    if suffix == '.pdf' or content_type == 'application/pdf':
+        return 'pdf'
+    if suffix in TIFF_EXTENSIONS or content_type == 'image/tiff':
+        return 'tiff'
+    if suffix in IMAGE_EXTENSIONS or content_type.startswith('image/'):
+        return 'image'
+
+    return None
+
+
+class BatchExpander:
+    """
+    Upload'larni varaq ro'yxatiga aylantirish
+
+    Har bir varaq: {'filename', 'page', 'source'}
+    - source = bytes: bitta rasm (worker cv2.imdecode qiladi)
+    - source = {'kind', 'path', 'page'}: ko'p sahifali fayl TEMP_DIR'ga
+      bir marta yoziladi, worker faqat o'z sahifasini o'qiydi
+    """
+
+    def __init__(
+        self,
+        temp_dir: Path,
+        max_sheets: int = 500,
+        pdf_dpi: int = 300,
+        max_entry_size: int = 10485760,
+        max_zip_entries: int = 1000,
+        max_zip_total_size: int = 209715200
+    ):
+        self.temp_dir = Path(temp_dir)
+        self.max_sheets = max_sheets
+        self.pdf_dpi = pdf_dpi
+        # ZIP bomb himoyasi - header'dagi uncompressed o'lcham o'qishdan oldin tekshiriladi
+        # (zipfile file_size'dan ortiq bayt qaytarmaydi)
+        self.max_entry_size = max_entry_size
+        self.max_zip_entries = max_zip_entries
+        self.max_zip_total_size = max_zip_total_size
+
+        self.sheets: List[Dict] = []
+        self.temp_files: List[Path] = []
+        self.skipped: List[Dict] = []
+
+    def add_upload(self, filename: str, content_type: Optional[str], data: bytes):
+        """Bitta upload'ni qo'shish (turiga qarab ajratiladi)"""
+        kind = detect_upload_kind(filename, content_type)
+
+        if kind == 'zip':
+            self._add_zip(filename, data)
+        elif kind == 'tiff':
+            self._add_tiff(filename, data)
+        elif kind == 'pdf':
+            self._add_pdf(filename, data)
+        elif kind == 'image':
+            self._add_sheet(filename, None, data)
+        else:
+            self.skipped.append({'filename': filename, 'reason': 'Unsupported file type'})
+
+    def _add_sheet(self, filename: str, page: Optional[int], source):
+        if len(self.sheets) >= self.max_sheets:
+            raise ValueError(f"Batch exceeds maximum of {self.max_sheets} sheets")
+
+        self.sheets.append({
+            'filename': filename,
+            'page': page,
+            'source': source
+        })
+
+    def _add_zip(self, filename: str, data: bytes):
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(data))
+        except zipfile.BadZipFile as e:
+            self.skipped.append({'filename': filename, 'reason': f'Invalid ZIP: {e}'})
+            return
+
+        with archive:
+            entries = [
+                info for info in archive.infolist()
+                if not info.is_dir() and not Path(info.filename).name.startswith('.')
+            ]
+            if len(entries) > self.max_zip_entries:
+                self.skipped.append({
+                    'filename': filename,
+                    'reason': f'ZIP has {len(entries)} entries (limit {self.max_zip_entries})'
+                })
+                return
+
+            total_size = 0
+
+            # Fayl nomi bo'yicha barqaror tartib
+            for info in sorted(entries, key=lambda i: i.filename):
+                kind = detect_upload_kind(info.filename)
+                if kind in (None, 'zip'):
+                    self.skipped.append({'filename': info.filename, 'reason': 'Unsupported file type'})
+                    continue
+
+                if info.file_size > self.max_entry_size:
+                    self.skipped.append({
+                        'filename': info.filename,
+                        'reason': f'Entry too large: {info.file_size} bytes (limit {self.max_entry_size})'
+                    })
+                    continue
+
+                if total_size + info.file_size > self.max_zip_total_size:
+                    self.skipped.append({
+                        'filename': info.filename,
+                        'reason': f'ZIP uncompressed size limit reached ({self.max_zip_total_size} bytes)'
+                    })
+                    continue
+
+                total_size += info.file_size
+                self.add_upload(info.filename, None, archive.read(info))
+
+    def _spill(self, filename: str, data: bytes) -> Path:
+        temp_path = self.temp_dir / f"batch_{datetime.now().timestamp()}_{Path(filename).name}"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        self.temp_files.append(temp_path)
+        return temp_path
+
+    def _add_tiff(self, filename: str, data: bytes):
+        try:
+            with Image.open(io.BytesIO(data)) as tiff:
+                page_count = getattr(tiff, 'n_frames', 1)
+        except Exception as e:
+            self.skipped.append({'filename': filename, 'reason': f'Invalid TIFF: {e}'})
+            return
+
+        if page_count == 1:
+            self._add_sheet(filename, None, data)
+            return
+
+        temp_path = self._spill(filename, data)
+        for page in range(page_count):
+            self._add_sheet(filename, page + 1, {'kind': 'tiff', 'path': str(temp_path), 'page': page})
+
+    def _add_pdf(self, filename: str, data: bytes):
+        if not PDF2IMAGE_AVAILABLE:
+            self.skipped.append({'filename': filename, 'reason': 'PDF support not available (pdf2image)'})
+            return
+
+        temp_path = self._spill(filename, data)
+        try:
+            page_count = int(pdfinfo_from_path(str(temp_path))['Pages'])
+        except Exception as e:
+            self.skipped.append({'filename': filename, 'reason': f'Invalid PDF: {e}'})
+            return
+
+        for page in range(page_count):
+            self._add_sheet(filename, page + 1, {
+                'kind': 'pdf',
+                'path': str(temp_path),
+                'page': page,
+                'dpi': self.pdf_dpi
+            })
+
+    def cleanup(self):
+        """Spill qilingan vaqtinchalik fayllarni o'chirish"""
+        for temp_path in self.temp_files:
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+        self.temp_files = []
+
+
+def _pil_to_bgr(page: Image.Image) -> np.ndarray:
+    return cv2.cvtColor(np.array(page.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+def load_sheet_image(source) -> np.ndarray:
+    """
+    Batch varag'ini worker ichida yuklash
+
+    Args:
+        source: bytes / fayl yo'li / {'kind', 'path', 'page'} sahifa tavsifi
+
+    Returns:
+        np.ndarray: BGR rasm
+    """
+    if not isinstance(source, dict):
+        return load_image(source)
+
+    kind = source['kind']
+    page = source['page']
+
+    if kind == 'tiff':
+        with Image.open(source['path']) as tiff:
+            try:
+                tiff.seek(page)
+            except EOFError:
+                raise ValueError(f"TIFF page {page + 1} not found")
+            return _pil_to_bgr(tiff)
+
+    if kind == 'pdf':
+        pages = convert_from_path(
+            source['path'],
+            dpi=source.get('dpi', 300),
+            first_page=page + 1,
+            last_page=page + 1
+        )
+        if not pages:
+            raise ValueError(f"PDF page {page + 1} not found")
+        return _pil_to_bgr(pages[0])
+
+    raise ValueError(f"Unknown sheet source kind: {kind}")
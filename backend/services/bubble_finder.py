@@ -0,0 +1,257 @@
+"""
+Bubble Finder - Hough circle nomzodlari uchun umumiy qidiruv
+
+Avval har bir detector to'liq varaqda HoughCircles'ni bir necha parametr to'plami
+bilan ishlatar edi (foto uchun bitta o'tish ~1-15 s). Bu yerda:
+1. Javoblar gridi joylashgan hudud (ROI) topiladi - corner'lar berilsa ular
+   orasidagi to'rtburchak, aks holda projection profile (siyoh bor qator/ustunlar)
+2. ROI kichraytirilgan masshtabda qidiriladi (HOUGH_SCALE, radius HOUGH_MIN_SCALED_RADIUS
+   pikseldan kichik bo'lmaydigan darajada); radius/minDist masshtablanadi, param2
+   (accumulator threshold) esa o'zgarmaydi - kichik rasmda shovqin ovozlari kamayadi
+3. Topilgan soni kutilganga tolerance ichida yaqin bo'lsa - qolgan to'plamlar sinalmaydi
+4. G'olib to'plam (exam, qurilma sinfi) bo'yicha hough_param_cache'da saqlanadi va
+   keyingi varaqda birinchi sinaladi
+
+Natija koordinatalari doim asl rasm piksellarida.
+"""
+import cv2
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ROI = Tuple[int, int, int, int]  # (x0, y0, x1, y1), x1/y1 - chegaradan tashqari
+
+PROFILE_WIDTH = 400  # projection profile shu enga kichraytirilgan rasmda hisoblanadi
+PROFILE_MIN_INK = 0.01  # qator/ustundagi siyoh ulushi shundan katta bo'lsa - kontent
+MIN_ROI_FRACTION = 0.2  # bundan kichik ROI ishonchsiz - to'liq rasm ishlatiladi
+
+
+def exam_cache_key(exam_structure: Optional[Dict]) -> Optional[str]:
+    """Exam id yoki subjects hash (id bo'lmasa)"""
+    if not exam_structure:
+        return None
+    return str(exam_structure.get('id') or hashlib.sha1(
+        repr(exam_structure.get('subjects')).encode('utf-8')
+    ).hexdigest())
+
+
+def device_class(image: np.ndarray) -> str:
+    """
+    Qurilma sinfi - o'lcham va orientatsiya bo'yicha (bir telefon/skaner bir xil
+    ruxsatda suratga oladi, shuning uchun bir xil bubble radiusi)
+    """
+    height, width = image.shape[:2]
+    return f"{int(round(width / 256))}x{int(round(height / 256))}"
+
+
+class HoughParamCache:
+    """
+    (detector, exam, qurilma sinfi) -> g'olib parametr to'plami - thread-safe LRU
+    """
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+
+        self._entries: 'OrderedDict[Tuple, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[Dict]:
+        with self._lock:
+            params = self._entries.get(key)
+            if params is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return params
+
+    def put(self, key: Tuple, params: Dict):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = dict(params)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+hough_param_cache = HoughParamCache(settings.HOUGH_PARAM_CACHE_SIZE)
+
+
+def locate_answer_grid(
+    gray: np.ndarray,
+    corners: Optional[Sequence] = None,
+    margin: int = 0
+) -> ROI:
+    """
+    Javoblar gridi qidiriladigan hudud
+
+    Args:
+        gray: Grayscale rasm
+        corners: Corner marker'lar ([(x, y), ...] yoki [{'x', 'y'}, ...]) - bo'lsa ular orasi
+        margin: Har tomondan qo'shiladigan piksel (bubble chetda kesilmasligi uchun)
+    """
+    height, width = gray.shape[:2]
+    full = (0, 0, width, height)
+
+    if corners and len(corners) >= 4:
+        points = np.array([
+            (c['x'], c['y']) if isinstance(c, dict) else (c[0], c[1])
+            for c in corners
+        ], dtype=np.float64)
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0)
+    else:
+        # Projection profile: siyoh (Otsu) bor qator va ustunlar - bo'sh chetlar va fon kesiladi
+        scale = min(1.0, PROFILE_WIDTH / width)
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        _, ink = cv2.threshold(small, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+        rows = np.flatnonzero(ink.mean(axis=1) > PROFILE_MIN_INK)
+        cols = np.flatnonzero(ink.mean(axis=0) > PROFILE_MIN_INK)
+        if len(rows) == 0 or len(cols) == 0:
+            return full
+        x0, x1 = cols[0] / scale, (cols[-1] + 1) / scale
+        y0, y1 = rows[0] / scale, (rows[-1] + 1) / scale
+
+    roi = (
+        max(0, int(np.floor(x0)) - margin),
+        max(0, int(np.floor(y0)) - margin),
+        min(width, int(np.ceil(x1)) + margin),
+        min(height, int(np.ceil(y1)) + margin)
+    )
+    area = (roi[2] - roi[0]) * (roi[3] - roi[1])
+    if roi[2] <= roi[0] or roi[3] <= roi[1] or area < MIN_ROI_FRACTION * width * height:
+        return full
+    return roi
+
+
+def _search_scale(min_radius: float) -> float:
+    """Kichraytirish koeffitsienti - eng kichik radius HOUGH_MIN_SCALED_RADIUS'dan kam bo'lmasin"""
+    scale = min(1.0, max(0.05, settings.HOUGH_SCALE))
+    if min_radius > 0:
+        scale = max(scale, min(1.0, settings.HOUGH_MIN_SCALED_RADIUS / min_radius))
+    return scale
+
+
+def find_bubble_candidates(
+    gray: np.ndarray,
+    param_sets: Sequence[Dict],
+    expected_count: Optional[int] = None,
+    preprocess: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    corners: Optional[Sequence] = None,
+    cache_key: Optional[Tuple] = None,
+    dp: float = 1,
+    param1: float = 50
+) -> Tuple[Optional[np.ndarray], Optional[Dict]]:
+    """
+    ROI + kichraytirilgan masshtabdagi HoughCircles, early exit va parametr cache bilan
+
+    Args:
+        gray: Grayscale rasm (asl o'lcham)
+        param_sets: [{'minRadius', 'maxRadius', 'param2', 'minDist'}, ...] - asl piksellarda
+        expected_count: Kutilgan bubble soni (None - birinchi to'plam natijasi qaytadi)
+        preprocess: ROI'ga (kichraytirishdan oldin) qo'llanadigan funksiya (CLAHE, blur, ...)
+        corners: Corner marker'lar (ROI uchun), bo'lmasa projection profile
+        cache_key: (detector, exam, ...) - berilsa g'olib to'plam device_class bilan saqlanadi
+        dp, param1: HoughCircles parametrlari (barcha to'plamlar uchun)
+
+    Returns:
+        (circles int (N, 3) [x, y, r] asl piksellarda yoki None, tanlangan to'plam)
+    """
+    param_sets = list(param_sets)
+    if not param_sets:
+        return None, None
+
+    if cache_key is not None:
+        cache_key = tuple(cache_key) + (device_class(gray),)
+        cached = hough_param_cache.get(cache_key)
+        if cached in param_sets:
+            param_sets.remove(cached)
+            param_sets.insert(0, cached)
+
+    roi = (0, 0, gray.shape[1], gray.shape[0])
+    if settings.HOUGH_ROI_MODE == 'auto':
+        margin = int(max(p['maxRadius'] for p in param_sets)) * 2
+        roi = locate_answer_grid(gray, corners, margin)
+    x0, y0, x1, y1 = roi
+
+    region = gray[y0:y1, x0:x1]
+    if preprocess is not None:
+        region = preprocess(region)
+
+    tolerance = settings.HOUGH_COUNT_TOLERANCE * expected_count if expected_count is not None else None
+    scaled_regions: Dict[float, np.ndarray] = {}
+    best_circles, best_params = None, None
+    best_count_diff = float('inf')
+
+    for params in param_sets:
+        scale = _search_scale(params['minRadius'])
+        if scale not in scaled_regions:
+            scaled_regions[scale] = region if scale == 1.0 else cv2.resize(
+                region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+
+        circles = cv2.HoughCircles(
+            scaled_regions[scale],
+            cv2.HOUGH_GRADIENT,
+            dp=dp,
+            minDist=max(1.0, params['minDist'] * scale),
+            param1=param1,
+            param2=params['param2'],
+            minRadius=max(1, int(np.floor(params['minRadius'] * scale))),
+            maxRadius=max(2, int(np.ceil(params['maxRadius'] * scale)))
+        )
+        if circles is None:
+            continue
+
+        circles = circles[0].astype(np.float64)
+        circles /= scale
+        circles[:, 0] += x0
+        circles[:, 1] += y0
+
+        if expected_count is None:
+            best_circles, best_params = circles, params
+            break
+
+        count = len(circles)
+        count_diff = abs(count - expected_count)
+        logger.info(f"  Params {params} (scale {scale:.2f}): Found {count} circles (diff: {count_diff})")
+
+        if count_diff < best_count_diff:
+            best_count_diff = count_diff
+            best_circles, best_params = circles, params
+
+        if count_diff <= tolerance:
+            break
+
+    if best_circles is None:
+        return None, None
+
+    if cache_key is not None and tolerance is not None and best_count_diff <= tolerance:
+        hough_param_cache.put(cache_key, best_params)
+
+    return np.round(best_circles).astype("int"), best_params
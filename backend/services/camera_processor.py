@@ -15,18 +15,32 @@ import numpy as np
 from typing import Dict, List, Tuple, Optional
 import logging
 
+from config import settings
+from services.corner_engine import get_corner_engine, use_corner_engine
+
 logger = logging.getLogger(__name__)
 
+MIN_PAPER_AREA = 10000  # px^2 at full camera resolution
+
+# Pyramid mode: corner refinement at full resolution (cornerSubPix)
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 40, 0.01)
+SUBPIX_MIN_WINDOW = 5  # half-window (px); grows with the downscale factor
+
 class CameraProcessor:
     """
     Professional camera-based OMR processor
     Implements the complete pipeline from camera_system.md
     """
     
-    def __init__(self):
+    def __init__(self, detect_mode: Optional[str] = None, detect_width: Optional[int] = None):
         self.target_width = 2480  # Standard A4 width at 300 DPI
         self.target_height = 3508  # Standard A4 height at 300 DPI
         
+        # 'pyramid': paper outline on a downscale + cornerSubPix at full resolution
+        # 'full': Canny/contours on the full camera frame (previous behaviour)
+        self.detect_mode = detect_mode or settings.CAMERA_DETECT_MODE
+        self.detect_width = detect_width or settings.CAMERA_DETECT_WIDTH
+        
     def process_camera_image(
         self,
         image: np.ndarray,
@@ -110,15 +124,65 @@ class CameraProcessor:
         """
         Detect paper document in camera frame
         
+        In 'pyramid' mode the outline is found on a detect_width downscale
+        and the four corners are refined with cornerSubPix on small
+        full-resolution windows - only the later warp touches the whole frame.
+        
         Returns:
             dict: {
                 'found': bool,
-                'corners': List[Tuple[int, int]],
+                'corners': List[Tuple[float, float]],
                 'aspect_ratio': float,
                 'confidence': float
             }
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = image.shape[:2]
+        scale = 1.0
+        
+        if self.detect_mode == 'pyramid' and max(height, width) > self.detect_width * 1.25:
+            scale = self.detect_width / max(height, width)
+            small = cv2.resize(
+                image,
+                (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                interpolation=cv2.INTER_AREA
+            )
+            paper_contour = self._find_paper_contour(small, MIN_PAPER_AREA * scale * scale)
+        else:
+            paper_contour = self._find_paper_contour(image, MIN_PAPER_AREA)
+        
+        if paper_contour is None:
+            return {
+                'found': False,
+                'corners': [],
+                'aspect_ratio': 0,
+                'confidence': 0
+            }
+        
+        # Extract corner points
+        if scale < 1.0:
+            corners = self._refine_corners(image, paper_contour.reshape(4, 2) / scale, 1.0 / scale)
+        else:
+            corners = [tuple(point[0]) for point in paper_contour]
+        
+        # Calculate aspect ratio
+        width = np.linalg.norm(np.array(corners[1]) - np.array(corners[0]))
+        height = np.linalg.norm(np.array(corners[3]) - np.array(corners[0]))
+        aspect_ratio = min(width, height) / max(width, height)
+        
+        # A4 aspect ratio is approximately 0.707 (210/297)
+        a4_similarity = 1 - abs(aspect_ratio - 0.707)
+        confidence = min(a4_similarity * 100, 100)
+        
+        return {
+            'found': True,
+            'corners': corners,
+            'aspect_ratio': aspect_ratio,
+            'confidence': confidence
+        }
+    
+    def _find_paper_contour(self, image: np.ndarray, min_area: float) -> Optional[np.ndarray]:
+        """Largest 4-point contour (Canny + close + approxPolyDP), or None"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
         
         # Apply Gaussian blur to reduce noise
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -139,7 +203,7 @@ class CameraProcessor:
         
         for contour in contours:
             area = cv2.contourArea(contour)
-            if area < 10000:  # Minimum area threshold
+            if area < min_area:  # Minimum area threshold
                 continue
             
             # Approximate contour to polygon
@@ -151,32 +215,48 @@ class CameraProcessor:
                 max_area = area
                 paper_contour = approx
         
-        if paper_contour is None:
-            return {
-                'found': False,
-                'corners': [],
-                'aspect_ratio': 0,
-                'confidence': 0
-            }
-        
-        # Extract corner points
-        corners = [tuple(point[0]) for point in paper_contour]
-        
-        # Calculate aspect ratio
-        width = np.linalg.norm(np.array(corners[1]) - np.array(corners[0]))
-        height = np.linalg.norm(np.array(corners[3]) - np.array(corners[0]))
-        aspect_ratio = min(width, height) / max(width, height)
+        return paper_contour
+    
+    def _refine_corners(
+        self,
+        image: np.ndarray,
+        corners: np.ndarray,
+        upscale: float
+    ) -> List[Tuple[float, float]]:
+        """
+        Upscaled low-res corners -> sub-pixel corners at full resolution
         
-        # A4 aspect ratio is approximately 0.707 (210/297)
-        a4_similarity = 1 - abs(aspect_ratio - 0.707)
-        confidence = min(a4_similarity * 100, 100)
+        cornerSubPix runs on a small grayscale window around each corner
+        (half-window ~2 low-res pixels), never on the whole frame. A corner
+        that drifts outside its window keeps the upscaled position.
+        """
+        height, width = image.shape[:2]
+        half = max(SUBPIX_MIN_WINDOW, int(np.ceil(upscale * 2)))
+        pad = half + 2
+        refined = []
+        
+        for x, y in corners:
+            x1, y1 = max(0, int(x) - pad), max(0, int(y) - pad)
+            x2, y2 = min(width, int(x) + pad + 1), min(height, int(y) + pad + 1)
+            window = image[y1:y2, x1:x2]
+            if window.ndim == 3:
+                window = cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+            
+            local_half = min(half, (window.shape[0] - 1) // 2 - 1, (window.shape[1] - 1) // 2 - 1)
+            if local_half < 2:
+                refined.append((float(x), float(y)))
+                continue
+            
+            point = np.array([[[x - x1, y - y1]]], dtype=np.float32)
+            cv2.cornerSubPix(window, point, (local_half, local_half), (-1, -1), SUBPIX_CRITERIA)
+            px, py = float(point[0, 0, 0]) + x1, float(point[0, 0, 1]) + y1
+            
+            if abs(px - x) > half or abs(py - y) > half:
+                refined.append((float(x), float(y)))
+            else:
+                refined.append((px, py))
         
-        return {
-            'found': True,
-            'corners': corners,
-            'aspect_ratio': aspect_ratio,
-            'confidence': confidence
-        }
+        return refined
     
     def _crop_and_correct_paper(
         self, 
@@ -257,6 +337,14 @@ class CameraProcessor:
                 'marker_distance': float
             }
         """
+        if use_corner_engine():
+            # Eski qidiruv hududi: margin + 2 * marker = 35mm
+            detected_corners = get_corner_engine('photo', window_mm=35.0).detect(paper_image)
+            return {
+                'corners': detected_corners,
+                'marker_distance': self._marker_distance(detected_corners)
+            }
+        
         gray = cv2.cvtColor(paper_image, cv2.COLOR_BGR2GRAY)
         height, width = gray.shape
         
@@ -351,6 +439,13 @@ class CameraProcessor:
             if best_marker:
                 detected_corners.append(best_marker)
         
+        return {
+            'corners': detected_corners,
+            'marker_distance': self._marker_distance(detected_corners)
+        }
+    
+    def _marker_distance(self, detected_corners: List[Dict]) -> float:
+        """Yuqori ikki marker orasidagi masofa (px), topilmasa 0"""
         # Calculate marker distance if we have at least 2 corners
         marker_distance = 0
         if len(detected_corners) >= 2:
@@ -360,10 +455,7 @@ class CameraProcessor:
                 c1, c2 = top_corners[0], top_corners[1]
                 marker_distance = np.sqrt((c1['x'] - c2['x'])**2 + (c1['y'] - c2['y'])**2)
         
-        return {
-            'corners': detected_corners,
-            'marker_distance': marker_distance
-        }
+        return marker_distance
     
     def _calculate_template_coordinates(
         self,
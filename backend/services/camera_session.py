@@ -0,0 +1,298 @@
+"""
+Camera Session - WebSocket kamera oqimi uchun kadrlar orasidagi holat
+/api/camera/ws har bir ulanish uchun bitta CameraSession
+
+HTTP /process-frame har kadrda exam JSON'ni parse qiladi, to'liq JPEG'ni
+decode qiladi va butun process_camera_image'ni (shu jumladan ready_to_capture
+uchun kerak bo'lmagan _calculate_template_coordinates'ni) ishga tushiradi.
+Session esa:
+- exam_structure'ni bir marta saqlaydi
+- kadrni past ruxsatda decode qiladi (JPEG DCT scaling - IMREAD_REDUCED_*)
+- qog'oz to'rtburchagini oldingi kadrdan optik oqim (LK) bilan kuzatadi,
+  chetlar bo'ylab kontrast bilan tekshiradi; kuzatuv yo'qolgandagina to'liq
+  Canny/contour qidiruvi (_detect_paper_in_frame)
+- corner marker va sifatni kichik (PREVIEW_PAPER_SIZE) warp'da hisoblaydi,
+  qog'oz qimirlamasa oldingi natijani qayta ishlatadi
+- kadr vaqti byudjetdan oshsa ishchi kenglikni kamaytiradi
+
+Session thread-safe emas - bitta ulanishda kadrlar ketma-ket qayta ishlanadi.
+"""
+import cv2
+import numpy as np
+import logging
+import time
+from typing import Dict, List, Optional
+
+from config import settings
+from services.camera_processor import CameraProcessor
+
+logger = logging.getLogger(__name__)
+
+# Marker/sifat uchun qog'oz warp'i - A4, ~2 px/mm (15mm marker ~30 px)
+PREVIEW_PAPER_SIZE = (420, 594)
+
+# Kuzatuv (Lucas-Kanade) parametrlari
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+)
+TRACK_MAX_AREA_CHANGE = 0.25  # kadrlar orasida maydon o'zgarishi (nisbiy)
+TRACK_EDGE_SAMPLES = 16  # har bir tomonda tekshiriladigan nuqtalar
+TRACK_EDGE_OFFSET = 3  # px - chetning ikki tomonidagi namuna masofasi
+TRACK_EDGE_CONTRAST = 20  # gray darajasi - chet "bor" deb hisoblash uchun
+TRACK_MIN_EDGE_SUPPORT = 0.6  # chetlar bo'ylab kontrastli nuqtalar ulushi
+STILL_THRESHOLD_PX = 1.0  # o'rtacha burchak siljishi - qog'oz qimirlamagan
+
+ADAPT_SHRINK = 0.8  # byudjetdan oshganda kenglik koeffitsienti
+
+
+def order_quad(points: np.ndarray) -> np.ndarray:
+    """To'rt nuqta: top-left, top-right, bottom-right, bottom-left (float32, 4x2)"""
+    points = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    sums = points.sum(axis=1)
+    diffs = points[:, 1] - points[:, 0]
+    return np.array([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+
+class CameraSession:
+    """
+    Bitta kamera ulanishi: exam, oxirgi qog'oz to'rtburchagi, marker'lar
+
+    analyze_frame() kadr uchun readiness/sifat yangilanishini qaytaradi
+    (paper_detected, corners_found, quality_score, ready_to_capture, ...).
+    """
+
+    def __init__(self, exam_structure: Dict, processor: Optional[CameraProcessor] = None):
+        self.exam_structure = exam_structure
+        self.processor = processor or CameraProcessor()
+
+        self.frame_width = settings.CAMERA_WS_FRAME_WIDTH
+        self.frame_budget = settings.CAMERA_WS_FRAME_BUDGET_MS / 1000.0
+
+        # Kadrlar orasidagi holat (ishchi ruxsat koordinatalarida)
+        self.quad: Optional[np.ndarray] = None
+        self.corners: List[Dict] = []
+        self.quality_score = 0.0
+        self.stable_frames = 0
+        self._prev_gray: Optional[np.ndarray] = None
+        self._decode_flag = cv2.IMREAD_COLOR
+
+        self.stats = {
+            'frames': 0,
+            'tracked': 0,
+            'redetected': 0,
+            'lost': 0,
+            'undecodable': 0
+        }
+
+    def set_exam(self, exam_structure: Dict):
+        self.exam_structure = exam_structure
+
+    def reset_tracking(self):
+        self.quad = None
+        self.corners = []
+        self.quality_score = 0.0
+        self.stable_frames = 0
+        self._prev_gray = None
+
+    def decode_frame(self, data: bytes) -> Optional[np.ndarray]:
+        """
+        JPEG/PNG baytlaridan ishchi kenglikdagi BGR kadr
+
+        Birinchi kadrdan keyin IMREAD_REDUCED_COLOR_{2,4,8} tanlanadi -
+        JPEG decoder to'liq ruxsatni umuman tiklamaydi.
+        """
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), self._decode_flag)
+        if frame is None:
+            return None
+
+        height, width = frame.shape[:2]
+        if self._decode_flag == cv2.IMREAD_COLOR:
+            self._decode_flag = self._reduced_flag(width)
+
+        if width > self.frame_width:
+            scale = self.frame_width / width
+            frame = cv2.resize(
+                frame, (self.frame_width, max(1, int(round(height * scale)))),
+                interpolation=cv2.INTER_AREA
+            )
+        return frame
+
+    def _reduced_flag(self, full_width: int) -> int:
+        """Kenglik frame_width'dan kam bo'lmaydigan eng katta DCT kichraytirish"""
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                             (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if full_width // factor >= self.frame_width:
+                return flag
+        return cv2.IMREAD_COLOR
+
+    def analyze_frame(self, frame: np.ndarray) -> Dict:
+        """
+        Bitta (past ruxsatli) kadr uchun readiness yangilanishi
+
+        Returns:
+            dict: {
+                'paper_detected', 'corners_found', 'quality_score',
+                'ready_to_capture', 'tracking' ('tracked' | 'detected' | 'lost'),
+                'stable_frames', 'quad' (0..1 normalizatsiyalangan yoki None),
+                'process_ms'
+            }
+        """
+        start = time.perf_counter()
+        self.stats['frames'] += 1
+
+        if frame.ndim == 2:
+            gray = frame
+            frame = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        previous_quad = self.quad
+        quad = self._track_quad(gray)
+        tracking = 'tracked'
+
+        if quad is None:
+            detection = self.processor._detect_paper_in_frame(frame)
+            if detection['found']:
+                quad = order_quad(detection['corners'])
+                tracking = 'detected'
+                previous_quad = None
+            else:
+                tracking = 'lost'
+        self.stats[tracking if tracking != 'detected' else 'redetected'] += 1
+
+        self._prev_gray = gray
+        self.quad = quad
+
+        if quad is None:
+            self.corners = []
+            self.quality_score = 0.0
+            self.stable_frames = 0
+        else:
+            still = (
+                previous_quad is not None
+                and float(np.linalg.norm(quad - previous_quad, axis=1).mean()) < STILL_THRESHOLD_PX
+            )
+            if still and self.stable_frames > 0:
+                # Qog'oz joyida - marker va sifat oldingi kadrdagidek
+                self.stable_frames += 1
+            else:
+                self._assess_paper(frame, quad)
+                self.stable_frames = 1 if still else 0
+
+        elapsed = time.perf_counter() - start
+        height, width = gray.shape[:2]
+        corners_found = len(self.corners)
+        update = {
+            'paper_detected': quad is not None,
+            'corners_found': corners_found,
+            'quality_score': round(float(self.quality_score), 1),
+            'ready_to_capture': quad is not None and corners_found == 4,
+            'tracking': tracking,
+            'stable_frames': self.stable_frames,
+            'quad': (quad / np.array([width, height], dtype=np.float32)).round(4).tolist()
+                    if quad is not None else None,
+            'process_ms': round(elapsed * 1000, 1)
+        }
+
+        self._adapt_width(elapsed)
+        return update
+
+    def _track_quad(self, gray: np.ndarray) -> Optional[np.ndarray]:
+        """Oldingi to'rtburchakni LK optik oqim bilan ko'chirish; ishonchsiz bo'lsa None"""
+        if self.quad is None or self._prev_gray is None or self._prev_gray.shape != gray.shape:
+            return None
+
+        points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._prev_gray, gray, self.quad.reshape(-1, 1, 2), None, **LK_PARAMS
+        )
+        if points is None or status is None or not status.all():
+            return None
+
+        quad = points.reshape(4, 2)
+        height, width = gray.shape[:2]
+        if (quad[:, 0] < -1).any() or (quad[:, 0] > width).any() or \
+                (quad[:, 1] < -1).any() or (quad[:, 1] > height).any():
+            return None
+        if not cv2.isContourConvex(quad):
+            return None
+
+        previous_area = cv2.contourArea(self.quad)
+        area = cv2.contourArea(quad)
+        if previous_area <= 0 or abs(area / previous_area - 1) > TRACK_MAX_AREA_CHANGE:
+            return None
+
+        if self._edge_support(gray, quad) < TRACK_MIN_EDGE_SUPPORT:
+            return None
+
+        return quad
+
+    def _edge_support(self, gray: np.ndarray, quad: np.ndarray) -> float:
+        """
+        To'rtburchak tomonlari bo'ylab kontrastli nuqtalar ulushi
+
+        Har bir namunada chetga perpendikulyar ikki tomondagi yorqinlik
+        farqi - qog'oz foni/stol chegarasi haqiqatan shu yerda ekanini tekshiradi.
+        """
+        height, width = gray.shape[:2]
+        t = (np.arange(TRACK_EDGE_SAMPLES, dtype=np.float32) + 0.5) / TRACK_EDGE_SAMPLES
+
+        start = quad
+        end = np.roll(quad, -1, axis=0)
+        direction = end - start
+        length = np.linalg.norm(direction, axis=1, keepdims=True)
+        normal = np.stack([-direction[:, 1], direction[:, 0]], axis=1) / np.maximum(length, 1e-6)
+
+        samples = start[:, None, :] + t[None, :, None] * direction[:, None, :]
+        inner = samples + TRACK_EDGE_OFFSET * normal[:, None, :]
+        outer = samples - TRACK_EDGE_OFFSET * normal[:, None, :]
+
+        def _sample(points):
+            xs = np.clip(np.rint(points[..., 0]), 0, width - 1).astype(np.intp)
+            ys = np.clip(np.rint(points[..., 1]), 0, height - 1).astype(np.intp)
+            return gray[ys, xs].astype(np.int16)
+
+        contrast = np.abs(_sample(inner) - _sample(outer))
+        return float((contrast > TRACK_EDGE_CONTRAST).mean())
+
+    def _assess_paper(self, frame: np.ndarray, quad: np.ndarray):
+        """Kichik warp'da corner marker'lar va sifat (template koordinatalarsiz)"""
+        paper_width, paper_height = PREVIEW_PAPER_SIZE
+        destination = np.array([
+            [0, 0], [paper_width, 0], [paper_width, paper_height], [0, paper_height]
+        ], dtype=np.float32)
+
+        matrix = cv2.getPerspectiveTransform(quad, destination)
+        paper = cv2.warpPerspective(
+            frame, matrix, PREVIEW_PAPER_SIZE,
+            flags=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=(255, 255, 255)
+        )
+
+        self.corners = self.processor._detect_corner_markers_in_paper(paper)['corners']
+        self.quality_score = self.processor._assess_paper_quality(paper)
+
+    def _adapt_width(self, elapsed: float):
+        """Kadr byudjetdan oshsa ishchi kenglikni kamaytirish (kuzatuv qaytadan)"""
+        minimum = settings.CAMERA_WS_MIN_FRAME_WIDTH
+        if elapsed <= self.frame_budget or self.frame_width <= minimum:
+            return
+
+        self.frame_width = max(minimum, int(self.frame_width * ADAPT_SHRINK))
+        self._decode_flag = cv2.IMREAD_COLOR
+        self.reset_tracking()
+        logger.info(
+            f"Camera frame took {elapsed * 1000:.0f} ms (budget "
+            f"{self.frame_budget * 1000:.0f} ms) - working width {self.frame_width}px"
+        )
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, frame_width=self.frame_width)
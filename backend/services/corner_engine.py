@@ -0,0 +1,465 @@
+"""
+Corner Engine - burchak markerlarini topish uchun yagona dvigatel
+ImageProcessor, ImprovedCornerDetector, PhotoCornerDetector, CameraProcessor va
+ImageStandardizer shu yerga delegatsiya qiladi (CORNER_ENGINE_MODE='windows')
+
+Butun sahifani threshold + findContours qilish o'rniga:
+1. Avval to'rtta burchak qidiruv oynasi kesiladi (A4 mm -> px, window_mm)
+2. Strategiyalar kaskadi (otsu / fixed / adaptive / canny / template) faqat shu
+   kichik tile'larda ishlaydi - tile'lar parallel (OpenCV GIL'ni bo'shatadi)
+   'template' - coarse-to-fine (match_marker_template, ImprovedCornerDetector
+   bilan umumiy): 1/4 masshtabda bitta cho'qqi, so'ng to'liq ruxsatda kichik oyna
+3. Eng yaxshi nomzod CORNER_*_WEIGHT bo'yicha baholanadi (confidence 0-1)
+4. Marker markazi subpixel aniqlikda: minAreaRect uchlari cornerSubPix bilan
+   aniqlashtirilib, o'rtachasi olinadi
+
+Profillar: 'scan' (PDF/skaner - qat'iy) va 'photo' (kamera/foto - yumshoq).
+"""
+import cv2
+import numpy as np
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from services.lazy_planes import get_image_planes
+
+logger = logging.getLogger(__name__)
+
+PAPER_SIZE_MM = (210.0, 297.0)  # A4
+MARKER_SIZE_MM = 15.0
+MARKER_MARGIN_MM = 5.0
+
+CORNER_NAMES = ('top-left', 'top-right', 'bottom-left', 'bottom-right')
+
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+# Profil -> nomzod filtrlari va strategiyalar tartibi
+PROFILES = {
+    'scan': {
+        'strategies': ('otsu', 'fixed', 'adaptive', 'template'),
+        'window_mm': 30.0,
+        'min_darkness': 0.5,
+        'min_uniformity': 0.4,
+        'size_range': (0.4, 2.5),
+        'aspect_range': (0.6, 1.67),
+        'min_score': 0.4,
+        'template_threshold': 0.6,
+        'template_coarse_threshold': 0.5,
+    },
+    'photo': {
+        'strategies': ('adaptive', 'otsu', 'canny', 'template'),
+        'window_mm': 45.0,
+        'min_darkness': 0.3,
+        'min_uniformity': 0.2,
+        'size_range': (0.2, 3.0),
+        'aspect_range': (0.4, 2.5),
+        'min_score': 0.3,
+        'template_threshold': 0.3,
+        'template_coarse_threshold': 0.25,
+    },
+}
+
+TEMPLATE_COARSE_SCALE = 0.25  # template strategiyasi: coarse bosqich masshtabi
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Process bo'yicha umumiy tile pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.CORNER_ENGINE_WORKERS),
+                thread_name_prefix='corner-tile'
+            )
+        return _executor
+
+
+def expected_marker_centers(width: int, height: int) -> Dict[str, Tuple[float, float]]:
+    """PDF spetsifikatsiyasi bo'yicha marker markazlari (px) - 5mm margin, 15mm marker"""
+    px_per_mm_x = width / PAPER_SIZE_MM[0]
+    px_per_mm_y = height / PAPER_SIZE_MM[1]
+    near = MARKER_MARGIN_MM + MARKER_SIZE_MM / 2
+    far_x = PAPER_SIZE_MM[0] - near
+    far_y = PAPER_SIZE_MM[1] - near
+
+    return {
+        'top-left': (near * px_per_mm_x, near * px_per_mm_y),
+        'top-right': (far_x * px_per_mm_x, near * px_per_mm_y),
+        'bottom-left': (near * px_per_mm_x, far_y * px_per_mm_y),
+        'bottom-right': (far_x * px_per_mm_x, far_y * px_per_mm_y),
+    }
+
+
+def marker_template(size: int, pad: int) -> np.ndarray:
+    """
+    Ideal marker: oq hoshiyali qora kvadrat
+
+    Bir xil rangli template TM_CCOEFF_NORMED'da har joyda 1.0 beradi, shuning uchun hoshiya shart.
+    """
+    template = np.full((size + 2 * pad, size + 2 * pad), 255, dtype=np.uint8)
+    template[pad:pad + size, pad:pad + size] = 0
+    return template
+
+
+def match_marker_template(
+    gray: np.ndarray,
+    size: int,
+    pad: int,
+    threshold: float,
+    coarse_threshold: float,
+    scale: float = TEMPLATE_COARSE_SCALE
+) -> Optional[Tuple[float, Tuple[int, int]]]:
+    """
+    Coarse-to-fine marker qidiruvi
+
+    Kichraytirilgan rasmda matchTemplate, bitta eng yuqori cho'qqi (minMaxLoc), so'ng
+    to'liq ruxsatda cho'qqi atrofidagi kichik oynada aniqlashtirish. Coarse template
+    juda kichik bo'lsa - to'g'ridan-to'g'ri to'liq ruxsatda.
+
+    Returns:
+        (peak, (x, y) - template'ning yuqori chap burchagi gray'da) yoki None
+    """
+    template = marker_template(size, pad)
+    height, width = gray.shape[:2]
+    if height < template.shape[0] or width < template.shape[1]:
+        return None
+
+    coarse_size = int(round(size * scale))
+    x1, y1 = 0, 0
+    window = gray
+    if scale < 1.0 and coarse_size >= 4:
+        coarse_template = marker_template(coarse_size, max(1, int(round(pad * scale))))
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        if small.shape[0] >= coarse_template.shape[0] and small.shape[1] >= coarse_template.shape[1]:
+            result = cv2.matchTemplate(small, coarse_template, cv2.TM_CCOEFF_NORMED)
+            _, coarse_peak, _, (cx, cy) = cv2.minMaxLoc(result)
+            if coarse_peak < coarse_threshold:
+                return None
+
+            # Refine oynasi: coarse joylashuv xatosi ~1/scale px + coarse template yaxlitlash;
+            # foto'da korrelyatsiya cho'qqisi yassi bo'lishi mumkin - marker o'lchamiga nisbatan kengaytiriladi
+            margin = max(int(np.ceil(2 / scale)) + 2, size // 8)
+            guess_x = int(round(cx / scale))
+            guess_y = int(round(cy / scale))
+            x1 = max(0, guess_x - margin)
+            y1 = max(0, guess_y - margin)
+            x2 = min(width, guess_x + template.shape[1] + margin)
+            y2 = min(height, guess_y + template.shape[0] + margin)
+            window = gray[y1:y2, x1:x2]
+            if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+                return None
+
+    result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+    _, peak, _, (fx, fy) = cv2.minMaxLoc(result)
+    if peak < threshold:
+        return None
+    return float(peak), (x1 + fx, y1 + fy)
+
+
+class CornerEngine:
+    """
+    To'rt burchak oynasida marker qidirish (tile'lar parallel)
+    """
+
+    def __init__(self, profile: str = 'scan', window_mm: Optional[float] = None):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown corner profile: {profile}")
+
+        self.profile = profile
+        self.params = PROFILES[profile]
+        self.window_mm = window_mm or self.params['window_mm']
+
+        self.weights = {
+            'aspect': settings.CORNER_ASPECT_WEIGHT,
+            'size': settings.CORNER_SIZE_WEIGHT,
+            'dist': settings.CORNER_DIST_WEIGHT,
+            'darkness': settings.CORNER_DARKNESS_WEIGHT,
+            'uniformity': settings.CORNER_UNIFORMITY_WEIGHT,
+        }
+
+    def search_windows(self, width: int, height: int) -> List[Dict]:
+        """
+        Burchak qidiruv oynalari (px) - CORNER_NAMES tartibida
+        """
+        window_w = min(width, int(round(self.window_mm * width / PAPER_SIZE_MM[0])))
+        window_h = min(height, int(round(self.window_mm * height / PAPER_SIZE_MM[1])))
+        centers = expected_marker_centers(width, height)
+
+        windows = []
+        for name in CORNER_NAMES:
+            x1 = 0 if 'left' in name else width - window_w
+            y1 = 0 if 'top' in name else height - window_h
+            windows.append({
+                'name': name,
+                'x1': x1,
+                'y1': y1,
+                'x2': x1 + window_w,
+                'y2': y1 + window_h,
+                'expected_x': centers[name][0],
+                'expected_y': centers[name][1],
+            })
+        return windows
+
+    def detect(self, image: np.ndarray) -> List[Dict]:
+        """
+        Markerlarni topish
+
+        Args:
+            image: BGR yoki grayscale
+
+        Returns:
+            list: topilgan markerlar CORNER_NAMES tartibida (4 tadan kam bo'lishi mumkin)
+                [{'name', 'x', 'y' (subpixel float), 'confidence' (0-1), 'score',
+                  'method', 'darkness', 'uniformity', 'size', 'aspect'}, ...]
+        """
+        gray = get_image_planes(image)['gray']
+        height, width = gray.shape[:2]
+
+        px_per_mm = min(width / PAPER_SIZE_MM[0], height / PAPER_SIZE_MM[1])
+        expected_size = MARKER_SIZE_MM * px_per_mm
+        windows = self.search_windows(width, height)
+
+        def run(window):
+            try:
+                return self._detect_in_window(gray, window, expected_size)
+            except Exception as e:
+                logger.warning(f"Corner window {window['name']} failed: {e}")
+                return None
+
+        if settings.CORNER_ENGINE_WORKERS > 1:
+            results = list(_get_executor().map(run, windows))
+        else:
+            results = [run(window) for window in windows]
+
+        markers = [marker for marker in results if marker is not None]
+        logger.info(
+            f"Corner engine ({self.profile}): {len(markers)}/4 markers - "
+            + ", ".join(f"{m['name']}={m['method']}@{m['confidence']:.2f}" for m in markers)
+        )
+        return markers
+
+    def _detect_in_window(self, gray: np.ndarray, window: Dict, expected_size: float) -> Optional[Dict]:
+        """Bitta oynada strategiyalar kaskadi - birinchi yetarli nomzod qaytadi"""
+        x1, y1, x2, y2 = window['x1'], window['y1'], window['x2'], window['y2']
+        tile = gray[y1:y2, x1:x2]
+        if tile.size == 0:
+            return None
+
+        expected = (window['expected_x'] - x1, window['expected_y'] - y1)
+        best = None
+
+        for strategy in self.params['strategies']:
+            if strategy == 'template':
+                candidate = self._template_candidate(tile, expected, expected_size)
+            else:
+                candidate = self._contour_candidate(tile, self._binarize(tile, strategy), expected, expected_size)
+
+            if candidate is None:
+                continue
+            candidate['method'] = strategy
+
+            if best is None or candidate['score'] > best['score']:
+                best = candidate
+            if candidate['score'] >= self.params['min_score']:
+                break
+
+        if best is None or best['score'] < self.params['min_score']:
+            return None
+
+        center = self._refine_center(tile, best.pop('rect'))
+        return {
+            'name': window['name'],
+            'x': round(float(center[0] + x1), 2),
+            'y': round(float(center[1] + y1), 2),
+            'confidence': round(float(best['score']), 4),
+            **best
+        }
+
+    def _binarize(self, tile: np.ndarray, strategy: str) -> np.ndarray:
+        if strategy == 'otsu':
+            _, binary = cv2.threshold(tile, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        elif strategy == 'fixed':
+            _, binary = cv2.threshold(tile, 100, 255, cv2.THRESH_BINARY_INV)
+        elif strategy == 'adaptive':
+            binary = cv2.adaptiveThreshold(
+                tile, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 21, 10
+            )
+        elif strategy == 'canny':
+            edges = cv2.Canny(cv2.GaussianBlur(tile, (5, 5), 0), 50, 150)
+            binary = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=1)
+        else:
+            raise ValueError(f"Unknown corner strategy: {strategy}")
+
+        kernel = np.ones((3, 3), np.uint8)
+        binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        return cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
+
+    def _score(
+        self,
+        tile: np.ndarray,
+        box: Tuple[int, int, int, int],
+        center: Tuple[float, float],
+        expected: Tuple[float, float],
+        expected_size: float
+    ) -> Optional[Dict]:
+        """Nomzodni filtrlash va baholash (None = filtrdan o'tmadi)"""
+        x, y, w, h = box
+        if w == 0 or h == 0:
+            return None
+
+        aspect_ratio = w / float(h)
+        marker_size = min(w, h)
+        min_ratio, max_ratio = self.params['size_range']
+        min_aspect, max_aspect = self.params['aspect_range']
+
+        if not (expected_size * min_ratio < marker_size < expected_size * max_ratio):
+            return None
+        if not (min_aspect < aspect_ratio < max_aspect):
+            return None
+
+        roi = tile[y:y + h, x:x + w]
+        if roi.size == 0:
+            return None
+
+        darkness = (255 - float(np.mean(roi))) / 255.0
+        if darkness < self.params['min_darkness']:
+            return None
+
+        uniformity = 1.0 - min(float(np.std(roi)) / 128.0, 1.0)
+        if uniformity < self.params['min_uniformity']:
+            return None
+
+        dist = float(np.hypot(center[0] - expected[0], center[1] - expected[1]))
+
+        aspect_score = 1.0 - min(abs(1.0 - aspect_ratio), 1.0)
+        size_score = 1.0 - min(abs(marker_size - expected_size) / expected_size, 1.0)
+        dist_score = 1.0 - min(dist / (expected_size * 2), 1.0)
+
+        score = (
+            aspect_score * self.weights['aspect'] +
+            size_score * self.weights['size'] +
+            dist_score * self.weights['dist'] +
+            darkness * self.weights['darkness'] +
+            uniformity * self.weights['uniformity']
+        )
+
+        return {
+            'score': score,
+            'darkness': round(darkness, 4),
+            'uniformity': round(uniformity, 4),
+            'size': int(marker_size),
+            'aspect': round(aspect_ratio, 4),
+        }
+
+    def _contour_candidate(
+        self,
+        tile: np.ndarray,
+        binary: np.ndarray,
+        expected: Tuple[float, float],
+        expected_size: float
+    ) -> Optional[Dict]:
+        height, width = tile.shape[:2]
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        best = None
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+
+            # Tile'ning ichki chegarasiga tegsa - marker kesilgan (oyna tashqarisida davom etadi)
+            touches_inner = (
+                (expected[0] < width / 2 and x + w >= width) or
+                (expected[0] >= width / 2 and x <= 0) or
+                (expected[1] < height / 2 and y + h >= height) or
+                (expected[1] >= height / 2 and y <= 0)
+            )
+            if touches_inner:
+                continue
+
+            candidate = self._score(tile, (x, y, w, h), (x + w / 2, y + h / 2), expected, expected_size)
+            if candidate is None:
+                continue
+
+            if best is None or candidate['score'] > best['score']:
+                candidate['rect'] = cv2.minAreaRect(contour)
+                best = candidate
+
+        return best
+
+    def _template_candidate(
+        self,
+        tile: np.ndarray,
+        expected: Tuple[float, float],
+        expected_size: float
+    ) -> Optional[Dict]:
+        """Ideal marker bilan coarse-to-fine matchTemplate - tile ichida"""
+        size = max(4, int(round(expected_size)))
+        pad = max(2, size // 4)
+
+        match = match_marker_template(
+            tile, size, pad, self.params['template_threshold'], self.params['template_coarse_threshold']
+        )
+        if match is None:
+            return None
+        peak, location = match
+
+        box = (location[0] + pad, location[1] + pad, size, size)
+        center = (box[0] + size / 2, box[1] + size / 2)
+        candidate = self._score(tile, box, center, expected, expected_size)
+        if candidate is None:
+            return None
+
+        # Template mosligi ham ishonchga kiradi
+        candidate['score'] = (candidate['score'] + float(peak)) / 2
+        candidate['rect'] = (center, (float(size), float(size)), 0.0)
+        return candidate
+
+    def _refine_center(self, tile: np.ndarray, rect: Tuple) -> Tuple[float, float]:
+        """
+        Marker markazi: minAreaRect uchlari cornerSubPix bilan, so'ng o'rtacha
+        (aniqlashtirish buzilsa - rect markazi)
+        """
+        (cx, cy), (w, h), _ = rect
+        side = min(w, h)
+        if side < 8:
+            return cx, cy
+
+        window = max(2, int(side / 6))
+        points = cv2.boxPoints(rect).reshape(-1, 1, 2).astype(np.float32)
+
+        height, width = tile.shape[:2]
+        inside = (
+            (points[:, 0, 0] >= window + 1).all() and (points[:, 0, 0] < width - window - 1).all() and
+            (points[:, 0, 1] >= window + 1).all() and (points[:, 0, 1] < height - window - 1).all()
+        )
+        if not inside:
+            return cx, cy
+
+        refined = cv2.cornerSubPix(tile, points.copy(), (window, window), (-1, -1), SUBPIX_CRITERIA)
+        center = refined.reshape(-1, 2).mean(axis=0)
+
+        if np.hypot(center[0] - cx, center[1] - cy) > side / 4:
+            return cx, cy
+        return float(center[0]), float(center[1])
+
+
+_engines: Dict[Tuple[str, Optional[float]], CornerEngine] = {}
+
+
+def get_corner_engine(profile: str = 'scan', window_mm: Optional[float] = None) -> CornerEngine:
+    """Profil bo'yicha umumiy engine (holatsiz, shuning uchun thread'lar o'rtasida umumiy)"""
+    key = (profile, window_mm)
+    engine = _engines.get(key)
+    if engine is None:
+        engine = _engines[key] = CornerEngine(profile, window_mm)
+    return engine
+
+
+def use_corner_engine() -> bool:
+    """CORNER_ENGINE_MODE='windows' - chaqiruvchilar engine'ga delegatsiya qiladi"""
+    return settings.CORNER_ENGINE_MODE == 'windows'
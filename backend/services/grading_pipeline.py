@@ -0,0 +1,916 @@
+"""
+Grading Pipelines - CPU-bound tekshirish bosqichlari
+main.py endpoint'laridan ajratilgan, WorkerPool ichida bajariladi
+
+Har bir run_* funksiyasi module darajasida (pickle qilinadigan) va faqat
+oddiy Python/JSON qiymatlarini qabul qiladi va qaytaradi, shuning uchun
+process pool'da ham, thread pool'da ham ishlaydi. image_source - encoded
+upload baytlari yoki (katta fayllar uchun) TEMP_DIR'dagi fayl yo'li.
+"""
+import cv2
+import json
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from services.image_loader import ImageSource, load_image
+from services.lazy_planes import plane_scope
+from services.stage_metrics import stage, timed_stage, track_request
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(Exception):
+    """
+    Pipeline xatosi - endpoint HTTPException'ga aylantiradi
+
+    Process chegarasidan pickle orqali o'tishi uchun barcha maydonlar args'da.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+    def __str__(self):
+        return self.detail
+
+
+class PipelineServices:
+    """
+    Bitta worker (process) ichidagi servis instance'lari
+    """
+
+    def __init__(self):
+        from services.image_processor import ImageProcessor
+        from services.qr_reader import QRCodeReader
+        from services.ultra_precise_coordinate_mapper import UltraPreciseCoordinateMapper
+        from services.adaptive_omr_detector import AdaptiveOMRDetector
+        from services.photo_omr_service import PhotoOMRService
+        from services.improved_photo_processor import ImprovedPhotoProcessor
+        from services.photo_quality_assessor import PhotoQualityAssessor
+        from services.template_matching_omr import TemplateMatchingOMR
+
+        self.image_processor = ImageProcessor(
+            target_width=settings.TARGET_WIDTH,
+            target_height=settings.TARGET_HEIGHT
+        )
+        self.qr_reader = QRCodeReader()
+        self.ultra_precise_mapper = UltraPreciseCoordinateMapper()
+        self.adaptive_omr_detector = AdaptiveOMRDetector()
+        self.photo_omr_service = PhotoOMRService()
+        self.improved_photo_processor = ImprovedPhotoProcessor()
+        self.photo_quality_assessor = PhotoQualityAssessor()
+        self.template_matching_omr = TemplateMatchingOMR()
+        self.ai_verifier = create_ai_verifier()
+
+
+_services: Optional[PipelineServices] = None
+_services_lock = threading.Lock()
+
+
+def get_services() -> PipelineServices:
+    """
+    Joriy process uchun servislarni olish (birinchi chaqiruvda yaratiladi)
+    """
+    global _services
+
+    if _services is None:
+        with _services_lock:
+            if _services is None:
+                _services = PipelineServices()
+                logger.info("Grading pipeline services initialized")
+
+    return _services
+
+
+def create_ai_verifier():
+    """
+    AI Verifier (OpenAI GPT-4 Vision yoki Groq fallback)
+
+    AI_VERIFY_ASYNC: savollar parallel (AsyncAIVerifier), aks holda yoki u
+    ishga tushmasa (masalan SDK'da async client yo'q) - ketma-ket sync verifier.
+    """
+    if not settings.ENABLE_AI_VERIFICATION:
+        return None
+
+    if settings.AI_VERIFY_ASYNC:
+        if settings.AI_PROVIDER == 'openai' and settings.OPENAI_API_KEY:
+            provider, api_key = 'openai', settings.OPENAI_API_KEY
+            model, temperature, max_tokens = settings.OPENAI_MODEL, settings.OPENAI_TEMPERATURE, settings.OPENAI_MAX_TOKENS
+        elif settings.GROQ_API_KEY:
+            provider, api_key = 'groq', settings.GROQ_API_KEY
+            model, temperature, max_tokens = settings.GROQ_MODEL, settings.GROQ_TEMPERATURE, settings.GROQ_MAX_TOKENS
+        else:
+            logger.warning("AI Verification enabled but no API keys provided")
+            return None
+
+        try:
+            from services.async_verifier import AsyncAIVerifier
+            return AsyncAIVerifier(
+                provider=provider,
+                api_key=api_key,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                base_url=settings.AI_BASE_URL
+            )
+        except Exception as e:
+            logger.warning(f"Async AI Verifier initialization failed, using sync verifier: {e}")
+
+    if settings.AI_PROVIDER == 'openai' and settings.OPENAI_API_KEY:
+        try:
+            from services.openai_verifier import OpenAIVerifier
+            return OpenAIVerifier(
+                api_key=settings.OPENAI_API_KEY,
+                model=settings.OPENAI_MODEL,
+                temperature=settings.OPENAI_TEMPERATURE,
+                max_tokens=settings.OPENAI_MAX_TOKENS
+            )
+        except Exception as e:
+            logger.warning(f"OpenAI Verifier initialization failed: {e}")
+    elif settings.GROQ_API_KEY:
+        try:
+            from services.ai_verifier import AIVerifier
+            return AIVerifier(
+                api_key=settings.GROQ_API_KEY,
+                model=settings.GROQ_MODEL,
+                temperature=settings.GROQ_TEMPERATURE,
+                max_tokens=settings.GROQ_MAX_TOKENS
+            )
+        except Exception as e:
+            logger.warning(f"Groq AI Verifier initialization failed: {e}")
+    else:
+        logger.warning("AI Verification enabled but no API keys provided")
+
+    return None
+
+
+class ExamContext:
+    """
+    Imtihon bo'yicha bir marta tayyorlanadigan obyektlar
+
+    Batch'dagi barcha varaqlar bir xil exam_structure/answer_key'ga ega,
+    shuning uchun grader va annotator har bir varaq uchun qayta yaratilmaydi.
+    """
+
+    def __init__(self, exam_data: Dict, answer_key_data: Dict, coord_template: Optional[Dict]):
+        from services.grader import AnswerGrader
+        from services.image_annotator import ImageAnnotator
+
+        self.exam_data = exam_data
+        self.answer_key = answer_key_data
+        self.coord_template = coord_template
+        self.grader = AnswerGrader(answer_key_data, exam_data)
+        self.annotator = ImageAnnotator()
+
+
+_exam_contexts: 'OrderedDict[str, ExamContext]' = OrderedDict()
+_exam_contexts_lock = threading.Lock()
+_EXAM_CONTEXT_LIMIT = 16
+
+
+def get_exam_context(
+    exam_key: Optional[str],
+    exam_data: Dict,
+    answer_key_data: Dict,
+    coord_template: Optional[Dict]
+) -> ExamContext:
+    """
+    Imtihon kontekstini olish (exam_key bo'lsa worker ichida LRU cache'lanadi)
+    """
+    if exam_key is None:
+        return ExamContext(exam_data, answer_key_data, coord_template)
+
+    with _exam_contexts_lock:
+        context = _exam_contexts.get(exam_key)
+        if context is not None:
+            _exam_contexts.move_to_end(exam_key)
+            return context
+
+        context = ExamContext(exam_data, answer_key_data, coord_template)
+        _exam_contexts[exam_key] = context
+        while len(_exam_contexts) > _EXAM_CONTEXT_LIMIT:
+            _exam_contexts.popitem(last=False)
+
+    return context
+
+
+def make_exam_key(exam_data: Dict, answer_key_data: Dict, coord_template: Optional[Dict]) -> str:
+    """Imtihon ta'rifining barqaror hash'i (ExamContext cache kaliti)"""
+    payload = json.dumps(
+        [exam_data, answer_key_data, coord_template],
+        sort_keys=True,
+        separators=(',', ':')
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _decode(image_source: ImageSource):
+    """Upload'ni decode qilish (xato bo'lsa 400)"""
+    try:
+        return load_image(image_source)
+    except ValueError as e:
+        raise PipelineError(400, f"Failed to load image: {e}")
+
+
+@timed_stage('ai_verification')
+def _verify_with_ai(
+    ai_verifier,
+    image,
+    omr_results: Dict,
+    coordinates: Dict
+) -> Tuple[Dict, Dict]:
+    """
+    Noaniq javoblarni AI bilan tekshirish (agar yoqilgan bo'lsa)
+
+    Returns:
+        (verified_results, ai_stats)
+    """
+    if not (ai_verifier and omr_results['statistics']['uncertain'] > 0):
+        logger.info("AI Verification skipped")
+        return omr_results, {
+            'enabled': ai_verifier is not None,
+            'verified': 0,
+            'corrected': 0,
+            'reason': 'No uncertain answers' if ai_verifier else 'AI disabled'
+        }
+
+    try:
+        verified_results = ai_verifier.verify_uncertain_answers(
+            image,
+            omr_results,
+            coordinates,
+            confidence_threshold=settings.AI_CONFIDENCE_THRESHOLD,
+            max_verifications=20
+        )
+
+        ai_verified = sum(
+            1 for topic in verified_results['answers'].values()
+            for section in topic.values()
+            for answer in section
+            if answer.get('ai_verified')
+        )
+
+        ai_corrected = sum(
+            1 for topic in verified_results['answers'].values()
+            for section in topic.values()
+            for answer in section
+            if answer.get('warning') == 'AI_CORRECTED'
+        )
+
+        ai_stats = {
+            'verified': ai_verified,
+            'corrected': ai_corrected,
+            'enabled': True
+        }
+        ai_stats.update(verified_results.pop('ai_verification', {}))
+        return verified_results, ai_stats
+
+    except Exception as e:
+        logger.error(f"AI verification failed: {e}")
+        logger.warning("Continuing without AI verification")
+        return omr_results, {'enabled': False, 'error': str(e)}
+
+
+@track_request
+@plane_scope()
+def run_template_match_grade(
+    image_source: ImageSource,
+    answer_key_data: Dict,
+    filename: str,
+    start_time: datetime
+) -> Dict:
+    """
+    Template Matching OMR pipeline - noma'lum layout'lar uchun
+    """
+    services = get_services()
+
+    # 1. Load and preprocess image
+    logger.info("STEP 1/4: Loading and preprocessing image...")
+    with stage('image_processing'):
+        image = _decode(image_source)
+
+        # Convert to grayscale
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        # Apply preprocessing
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        enhanced = clahe.apply(gray)
+
+    # 2. Template matching OMR processing
+    logger.info("STEP 2/4: Template matching OMR processing...")
+    with stage('omr_detection'):
+        results = services.template_matching_omr.process_image(enhanced)
+
+    if 'error' in results:
+        raise PipelineError(400, results['error'])
+
+    # 3. Compare with answer key and calculate score
+    logger.info("STEP 3/4: Comparing with answer key...")
+
+    correct_count = 0
+    wrong_count = 0
+    unanswered_count = 0
+    total_questions = len(answer_key_data)
+
+    detailed_results = []
+
+    for q_num in range(1, total_questions + 1):
+        correct_answer = answer_key_data.get(str(q_num), '?')
+        detected_answer = None
+        confidence = 0
+
+        if q_num in results['answers']:
+            answer_data = results['answers'][q_num]
+            detected_answer = answer_data['answer']
+            confidence = answer_data['confidence']
+
+        # Determine status
+        if detected_answer is None:
+            status = 'unanswered'
+            unanswered_count += 1
+        elif detected_answer == correct_answer:
+            status = 'correct'
+            correct_count += 1
+        else:
+            status = 'wrong'
+            wrong_count += 1
+
+        detailed_results.append({
+            'questionNumber': q_num,
+            'correctAnswer': correct_answer,
+            'detectedAnswer': detected_answer,
+            'confidence': confidence,
+            'status': status
+        })
+
+    # Calculate final score
+    accuracy = (correct_count / total_questions * 100) if total_questions > 0 else 0
+
+    # 4. Create annotated image
+    logger.info("STEP 4/4: Creating annotated image...")
+    with stage('annotation'):
+        annotated = services.template_matching_omr.create_annotated_image(image, results)
+
+        # Convert to base64
+        _, buffer = cv2.imencode('.jpg', annotated)
+        annotated_base64 = base64.b64encode(buffer).decode('utf-8')
+
+    # Calculate processing time
+    processing_time = (datetime.now() - start_time).total_seconds()
+
+    logger.info(f"✅ Template matching complete: {accuracy:.1f}% accuracy ({processing_time:.2f}s)")
+
+    return {
+        "success": True,
+        "method": "template_matching",
+        "results": {
+            "answers": detailed_results,
+            "score": {
+                "correct": correct_count,
+                "wrong": wrong_count,
+                "unanswered": unanswered_count,
+                "total": total_questions,
+                "accuracy": round(accuracy, 1),
+                "percentage": f"{accuracy:.1f}%"
+            }
+        },
+        "statistics": {
+            "total": results['statistics']['total'],
+            "detected": results['statistics']['detected'],
+            "bubbles_found": results['statistics']['bubbles_found'],
+            "processing_time": round(processing_time, 2),
+            "method": "Template Matching OMR"
+        },
+        "annotatedImage": f"data:image/jpeg;base64,{annotated_base64}",
+        "metadata": {
+            "filename": filename,
+            "timestamp": start_time.isoformat(),
+            "image_size": f"{image.shape[1]}x{image.shape[0]}",
+            "bubbles_detected": len(results.get('bubbles', [])),
+            "questions_detected": len(results.get('questions', {}))
+        }
+    }
+
+
+@track_request
+@plane_scope()
+def run_ultra_precise_grade(
+    image_source: ImageSource,
+    exam_data: Dict,
+    answer_key_data: Dict,
+    coord_template: Optional[Dict],
+    calibration_points: Optional[List[Dict]],
+    filename: str,
+    start_time: datetime
+) -> Dict:
+    """
+    ULTRA PRECISE pipeline - 100% aniqlik uchun
+    """
+    from services.grader import AnswerGrader
+    from services.image_annotator import ImageAnnotator
+
+    services = get_services()
+
+    # 1. Load and assess image
+    logger.info("STEP 1/5: Image Loading and Quality Assessment...")
+    with stage('image_processing'):
+        image = _decode(image_source)
+
+        # Quality assessment
+        image_quality = services.adaptive_omr_detector._assess_image_quality(image)
+    logger.info(f"Image quality: {image_quality['overall_score']:.1f}/100 ({image_quality['category']})")
+
+    # 2. ULTRA PRECISE Coordinate Detection
+    logger.info("STEP 2/5: ULTRA PRECISE Coordinate Detection...")
+
+    with stage('coordinate_calculation'):
+        if calibration_points:
+            # Manual calibration (100% accuracy)
+            coordinate_result = services.ultra_precise_mapper.calibrate_manually(
+                image, calibration_points, exam_data
+            )
+        else:
+            # Automatic detection
+            coordinate_result = services.ultra_precise_mapper.detect_layout_with_precision(
+                image, exam_data, coord_template
+            )
+
+    coordinates = coordinate_result.get('coordinates', {})
+    accuracy_estimate = coordinate_result.get('accuracy_estimate', 0)
+
+    logger.info(f"✅ Coordinate method: {coordinate_result['method']} ({accuracy_estimate}% accuracy)")
+
+    if not coordinates:
+        # Return calibration instructions
+        return {
+            'success': False,
+            'calibration_needed': True,
+            'coordinate_result': coordinate_result,
+            'image_quality': image_quality,
+            'instructions': {
+                'message': 'Manual calibration needed for 100% accuracy',
+                'steps': [
+                    'Identify at least 4 bubble positions in the image',
+                    'Note their question numbers and variants (e.g., Q1-A, Q5-C)',
+                    'Measure their pixel coordinates',
+                    'Provide coordinates via manual_calibration parameter'
+                ],
+                'format': '[{"question": 1, "variant": "A", "x": 123, "y": 456}, ...]'
+            }
+        }
+
+    # 3. ADAPTIVE OMR Detection
+    logger.info("STEP 3/5: ADAPTIVE OMR Detection...")
+
+    with stage('omr_detection'):
+        # Prepare image for OMR
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        omr_results = services.adaptive_omr_detector.detect_all_answers(
+            gray, coordinates, exam_data, image_quality
+        )
+
+    logger.info(f"✅ OMR method: {omr_results.get('detection_strategy', {}).get('name', 'unknown')}")
+    logger.info(f"   Detection: {omr_results['statistics']['detected']}/{omr_results['statistics']['total']}")
+
+    # 4. AI Verification (if needed and enabled)
+    logger.info("STEP 4/5: AI Verification...")
+    verified_results, ai_stats = _verify_with_ai(
+        services.ai_verifier, gray, omr_results, coordinates
+    )
+
+    # 5. Grading
+    logger.info("STEP 5/5: Grading...")
+    with stage('grading'):
+        grader = AnswerGrader(answer_key_data, exam_data)
+        final_results = grader.grade(verified_results['answers'])
+
+    # 6. Image Annotation
+    with stage('annotation'):
+        annotator = ImageAnnotator()
+        annotated_image = annotator.annotate_sheet(
+            gray, final_results, coordinates, answer_key_data
+        )
+
+    # Calculate processing time
+    end_time = datetime.now()
+    duration = (end_time - start_time).total_seconds()
+
+    logger.info(f"=== ULTRA PRECISE GRADING COMPLETE ===")
+    logger.info(f"Duration: {duration:.2f}s")
+    logger.info(f"Score: {final_results['totalScore']}/{final_results['maxScore']} ({final_results['percentage']}%)")
+    logger.info(f"Coordinate accuracy: {accuracy_estimate}%")
+
+    return {
+        'success': True,
+        'results': final_results,
+        'annotatedImage': annotated_image,
+        'statistics': {
+            'omr': omr_results['statistics'],
+            'ai': ai_stats,
+            'coordinate_detection': {
+                'method': coordinate_result['method'],
+                'accuracy_estimate': accuracy_estimate,
+                'validation': coordinate_result.get('validation', {}),
+                'strategy_timings': coordinate_result.get('strategy_timings', {})
+            },
+            'detection_strategy': omr_results.get('detection_strategy', {}),
+            'image_quality': image_quality,
+            'duration': round(duration, 2)
+        },
+        'metadata': {
+            'timestamp': end_time.isoformat(),
+            'filename': filename,
+            'system_version': '3.1.0',
+            'precision_level': 'ULTRA_HIGH',
+            'coordinate_method': coordinate_result['method'],
+            'omr_method': omr_results.get('detection_strategy', {}).get('name', 'adaptive')
+        }
+    }
+
+
+@track_request
+@plane_scope()
+def run_grade_sheet(
+    image_source: ImageSource,
+    exam_data: Dict,
+    answer_key_data: Dict,
+    coord_template: Optional[Dict],
+    filename: str,
+    start_time: datetime,
+    force_full_cascade: bool = False,
+    annotation: Optional[Dict] = None
+) -> Dict:
+    """
+    Asosiy pipeline - Professional OMR + AI
+
+    force_full_cascade: QR topilsa ham to'liq coordinate cascade (debug uchun)
+    annotation: image_annotator.annotation_options() natijasi (None = settings bo'yicha)
+    """
+    with stage('image_processing'):
+        image = _decode(image_source)
+
+    return _grade_sheet_image(
+        image,
+        get_exam_context(None, exam_data, answer_key_data, coord_template),
+        filename,
+        start_time,
+        annotation=annotation,
+        force_full_cascade=force_full_cascade
+    )
+
+
+@track_request
+@plane_scope()
+def run_grade_batch_sheet(
+    sheet_source,
+    exam_key: str,
+    exam_data: Dict,
+    answer_key_data: Dict,
+    coord_template: Optional[Dict],
+    filename: str,
+    start_time: datetime,
+    annotation: Optional[Dict] = None
+) -> Dict:
+    """
+    Batch'dagi bitta varaq - /api/grade-sheet bilan bir xil pipeline,
+    lekin imtihon konteksti (grader, annotator) worker ichida qayta ishlatiladi
+
+    annotation: None = rasm qaytarilmaydi (batch default)
+    """
+    from services.batch_loader import load_sheet_image
+
+    try:
+        with stage('image_processing'):
+            image = load_sheet_image(sheet_source)
+    except Exception as e:
+        raise PipelineError(400, f"Failed to load image: {e}")
+
+    return _grade_sheet_image(
+        image,
+        get_exam_context(exam_key, exam_data, answer_key_data, coord_template),
+        filename,
+        start_time,
+        annotation=annotation or {'mode': 'none'}
+    )
+
+
+def _grade_sheet_image(
+    image,
+    context: 'ExamContext',
+    filename: str,
+    start_time: datetime,
+    annotation: Optional[Dict] = None,
+    force_full_cascade: bool = False
+) -> Dict:
+    """
+    Decode qilingan varaqni tekshirish (grade-sheet va grade-batch uchun umumiy)
+
+    annotation: javob shakli (full/preview/overlay/lazy/none), None = settings bo'yicha
+    """
+    from services.image_annotator import annotation_options
+
+    annotation = annotation or annotation_options()
+    services = get_services()
+    exam_data = context.exam_data
+    coord_template = context.coord_template
+
+    # 1. Image Processing (OpenCV)
+    logger.info("STEP 1/6: Image Processing...")
+    try:
+        with stage('image_processing'):
+            processed = services.image_processor.process(image)
+    except Exception as e:
+        logger.error(f"Image processing failed: {e}")
+        raise PipelineError(400, f"Image processing failed: {str(e)}")
+
+    # 2. QR Code Detection
+    logger.info("STEP 2/6: QR Code Detection...")
+    with stage('qr_detection'):
+        qr_data = services.qr_reader.read_qr_code(processed['grayscale'], exam_id=exam_data.get('id'))
+
+        if qr_data:
+            logger.info("✅ QR Code detected! Using QR layout data")
+            # Use layout from QR code
+            qr_layout = services.qr_reader.get_layout_from_qr(qr_data)
+            logger.info(f"   QR Layout: {qr_layout}")
+        else:
+            logger.warning("⚠️  No QR code found, using default layout")
+            qr_layout = None
+
+    # 3. ULTRA PRECISE Coordinate Calculation
+    logger.info("STEP 3/6: ULTRA PRECISE Coordinate Calculation...")
+
+    with stage('coordinate_calculation'):
+        coordinate_result = None
+
+        # QR fast path: chop etilgan varaq layout'i ma'lum - OCR/corner/pattern cascade kerak emas
+        if qr_layout and settings.QR_LAYOUT_FAST_PATH and not force_full_cascade:
+            coordinate_result = services.ultra_precise_mapper.detect_layout_from_qr(
+                processed['grayscale'],
+                qr_data,
+                qr_layout,
+                exam_data,
+                frame=processed.get('frame', 'page')
+            )
+            if not coordinate_result.get('success'):
+                coordinate_result = None
+        elif qr_layout and force_full_cascade:
+            logger.info("QR fast path disabled for this request (force_full_cascade)")
+
+        if coordinate_result is None:
+            coordinate_result = services.ultra_precise_mapper.detect_layout_with_precision(
+                processed['grayscale'],
+                exam_data,
+                coord_template
+            )
+
+    coordinates = coordinate_result.get('coordinates', {})
+    accuracy_estimate = coordinate_result.get('accuracy_estimate', 0)
+
+    logger.info(f"✅ Coordinate detection: {coordinate_result['method']} ({accuracy_estimate}% accuracy)")
+
+    if not coordinates:
+        logger.error("❌ Ultra precise coordinate detection failed!")
+        logger.info("Attempting fallback coordinate detection methods...")
+
+        # Fallback 1: Try template matching with relaxed parameters
+        try:
+            template_result = services.template_matching_omr.detect_layout_fallback(
+                processed['grayscale'], exam_data
+            )
+
+            if template_result.get('coordinates'):
+                coordinates = template_result['coordinates']
+                coordinate_result['method'] = 'template_matching_fallback'
+                coordinate_result['accuracy_estimate'] = 75
+                logger.info("✅ Template matching fallback successful")
+            else:
+                raise Exception("Template matching fallback failed")
+
+        except Exception as e:
+            logger.warning(f"Template matching fallback failed: {e}")
+
+            # Fallback 2: Use default coordinate template
+            try:
+                from utils.coordinate_mapper import CoordinateMapper
+
+                # Create default corners based on image dimensions
+                height, width = processed['grayscale'].shape
+                default_corners = [
+                    {'name': 'top-left', 'x': int(width * 0.05), 'y': int(height * 0.05)},
+                    {'name': 'top-right', 'x': int(width * 0.95), 'y': int(height * 0.05)},
+                    {'name': 'bottom-left', 'x': int(width * 0.05), 'y': int(height * 0.95)},
+                    {'name': 'bottom-right', 'x': int(width * 0.95), 'y': int(height * 0.95)}
+                ]
+
+                mapper = CoordinateMapper(default_corners, exam_data)
+                coordinates = mapper.calculate_all()
+                coordinate_result['method'] = 'default_estimation'
+                coordinate_result['accuracy_estimate'] = 60
+                logger.info("✅ Default coordinate estimation applied")
+
+            except Exception as e2:
+                logger.error(f"Default coordinate estimation failed: {e2}")
+
+                # Final fallback: Return calibration needed response
+                return {
+                    'success': False,
+                    'error': 'Coordinate detection failed. Image quality may be insufficient or corner markers are not visible.',
+                    'calibration_needed': True,
+                    'suggestions': [
+                        'Ensure the image has clear corner markers (black squares in all 4 corners)',
+                        'Check that the image is well-lit and not blurry',
+                        'Make sure the entire answer sheet is visible in the image',
+                        'Try using a higher resolution image (minimum 800x1100px)',
+                        'Ensure the answer sheet is flat and not skewed',
+                        'Consider manual calibration if automatic detection continues to fail'
+                    ],
+                    'fallback_options': {
+                        'template_matching': 'Use template matching for unknown layouts',
+                        'manual_calibration': 'Provide manual bubble coordinates',
+                        'simple_grid': 'Use estimated grid layout'
+                    },
+                    'debug_info': {
+                        'image_dimensions': f"{processed['grayscale'].shape[1]}x{processed['grayscale'].shape[0]}",
+                        'image_quality': processed.get('quality', {}),
+                        'detection_attempts': ['ultra_precise', 'template_fallback', 'default_estimation'],
+                        'last_error': str(e2),
+                        'manual_calibration': 'Provide manual bubble coordinates',
+                        'photo_processing': 'Use photo-specific processing methods'
+                    }
+                }
+
+    # 4. ADAPTIVE OMR Detection
+    logger.info("STEP 4/6: ADAPTIVE OMR Detection...")
+
+    # Use Adaptive OMR Detector with image quality assessment
+    with stage('omr_detection'):
+        omr_results = services.adaptive_omr_detector.detect_all_answers(
+            processed['gray_for_omr'],  # Use pure grayscale
+            coordinates,
+            exam_data,
+            processed['quality']  # Pass quality assessment
+        )
+
+    logger.info(f"✅ OMR Detection method: {omr_results.get('detection_strategy', {}).get('name', 'unknown')}")
+    logger.info(f"   Image quality: {omr_results.get('image_quality', {}).get('category', 'unknown')}")
+    logger.info(f"   Detection: {omr_results['statistics']['detected']}/{omr_results['statistics']['total']}")
+    logger.info(f"   High confidence: {omr_results['statistics']['high_confidence']}")
+    logger.info(f"   Medium confidence: {omr_results['statistics']['medium_confidence']}")
+    logger.info(f"   Low confidence: {omr_results['statistics']['low_confidence']}")
+
+    # 5. AI Verification (if enabled and needed)
+    logger.info("STEP 5/6: AI Verification...")
+    verified_results, ai_stats = _verify_with_ai(
+        services.ai_verifier, processed['grayscale'], omr_results, coordinates
+    )
+
+    # 6. Grading
+    logger.info("STEP 6/6: Grading...")
+    with stage('grading'):
+        final_results = context.grader.grade(verified_results['answers'])
+
+    # 7. Image Annotation (Vizual ko'rsatish)
+    annotation_fields = {'annotatedImage': None}
+    if annotation['mode'] != 'none':
+        logger.info(f"STEP 6/6: Image Annotation ({annotation['mode']})...")
+        # Use grayscale image for better visual quality
+        # Coordinates are the same for both processed and grayscale (same dimensions)
+        with stage('annotation'):
+            annotation_fields = context.annotator.shape_response(
+                processed['grayscale'],  # Use grayscale for better quality
+                final_results,
+                coordinates,
+                annotation
+            )
+
+    # Calculate processing time
+    end_time = datetime.now()
+    duration = (end_time - start_time).total_seconds()
+
+    logger.info(f"=== GRADING COMPLETE ===")
+    logger.info(f"Duration: {duration:.2f}s")
+    logger.info(f"Score: {final_results['totalScore']}/{final_results['maxScore']} ({final_results['percentage']}%)")
+
+    return {
+        'success': True,
+        'results': final_results,
+        **annotation_fields,
+        'statistics': {
+            'omr': omr_results['statistics'],
+            'ai': ai_stats,
+            'quality': processed['quality'],
+            'coordinate_detection': {
+                'method': coordinate_result['method'],
+                'accuracy_estimate': coordinate_result['accuracy_estimate'],
+                'strategy_timings': coordinate_result.get('strategy_timings', {})
+            },
+            'detection_strategy': omr_results.get('detection_strategy', {}),
+            'duration': round(duration, 2)
+        },
+        'metadata': {
+            'timestamp': end_time.isoformat(),
+            'filename': filename,
+            'system_version': '3.1.0',  # Updated version
+            'coordinate_precision': 'ULTRA_HIGH',
+            'omr_method': 'ADAPTIVE'
+        }
+    }
+
+
+@track_request
+@plane_scope()
+def run_grade_photo(
+    image_source: ImageSource,
+    exam_data: Dict,
+    answer_key_data: Dict,
+    use_enhanced_processing: bool,
+    filename: str,
+    start_time: datetime
+) -> Dict:
+    """
+    Photo pipeline - Enhanced Photo OMR (experimental)
+    """
+    services = get_services()
+
+    # 1. Quality Assessment
+    logger.info("Step 1/3: Photo Quality Assessment...")
+    with stage('image_processing'):
+        image = _decode(image_source)
+
+        quality_assessment = services.photo_quality_assessor.assess_photo_quality(image)
+
+    logger.info(f"Photo quality: {quality_assessment['overall_quality']:.1f}/100 ({quality_assessment['omr_suitability']['level']})")
+
+    # 2. Process photo
+    logger.info("Step 2/3: Photo Processing...")
+
+    if use_enhanced_processing:
+        logger.info("Using enhanced photo processor...")
+        try:
+            results = services.improved_photo_processor.process_photo_complete(
+                image,
+                exam_data,
+                answer_key_data
+            )
+            processing_method = "enhanced_processor"
+        except Exception as e:
+            logger.error(f"Enhanced processing failed: {e}")
+            logger.info("Falling back to standard photo processor...")
+            results = services.photo_omr_service.process_photo(
+                image,
+                exam_data,
+                answer_key_data
+            )
+            processing_method = "standard_processor_fallback"
+    else:
+        logger.info("Using standard photo processor...")
+        results = services.photo_omr_service.process_photo(
+            image,
+            exam_data,
+            answer_key_data
+        )
+        processing_method = "standard_processor"
+
+    # Calculate processing time
+    end_time = datetime.now()
+    duration = (end_time - start_time).total_seconds()
+
+    grading_results = results['grading_results']
+
+    logger.info(f"=== PHOTO GRADING COMPLETE ===")
+    logger.info(f"Duration: {duration:.2f}s")
+    logger.info(f"Score: {grading_results['totalScore']}/{grading_results['maxScore']} ({grading_results['percentage']}%)")
+    logger.info(f"Detection: {results['omr_results']['statistics']['detected']}/{results.get('questions_mapped', 'unknown')}")
+
+    return {
+        'success': True,
+        'results': grading_results,
+        'quality_assessment': quality_assessment,
+        'statistics': {
+            'omr': results['omr_results']['statistics'],
+            'photo': {
+                'bubbles_found': results.get('bubbles_found', 0),
+                'questions_mapped': results.get('questions_mapped', 0),
+                'detection_method': results.get('detection_method', processing_method),
+                'processing_method': processing_method
+            },
+            'duration': round(duration, 2)
+        },
+        'metadata': {
+            'timestamp': end_time.isoformat(),
+            'filename': filename,
+            'system_version': '3.0.0',
+            'processing_type': 'photo',
+            'enhanced_processing': use_enhanced_processing,
+            'warning': 'Photo processing is experimental and may have lower accuracy than PDF-generated sheets'
+        }
+    }
@@ -1,76 +1,180 @@
 """
 Image Annotator - Javoblarni vizual ko'rsatish
 To'g'ri javoblar, xato javoblar va o'quvchi javoblarini belgilash
+
+Javob shakli (annotation options):
+- full:    to'liq o'lchamdagi rasm (data URL) - eski xatti-harakat
+- preview: max_width'gacha kichraytirilgan rasm
+- overlay: rasm yo'q, faqat to'rtburchaklar ro'yxati (rang bilan) - client o'zi chizadi
+- lazy:    rasm keyinroq GET /api/annotated/{token} orqali (annotation_cache)
+- none:    rasm ham, overlay ham yo'q
 """
 import cv2
 import numpy as np
 import base64
 import logging
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
 
 logger = logging.getLogger(__name__)
 
+ANNOTATION_MODES = ('full', 'preview', 'overlay', 'lazy', 'none')
+
+# format -> (imencode extension, quality flag, MIME type)
+IMAGE_FORMATS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY, 'image/jpeg'),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY, 'image/webp'),
+}
+
+Box = Tuple[int, str, str, int, int, int, int]  # (questionNumber, variant, kind, x1, y1, x2, y2)
+
+
+def annotation_options(
+    mode: Optional[str] = None,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    max_width: Optional[int] = None
+) -> Dict:
+    """
+    So'rov parametrlarini tekshirish, berilmaganlari settings'dan olinadi
+
+    Raises:
+        ValueError: noma'lum mode/format yoki diapazondan tashqari qiymat
+    """
+    mode = (mode or settings.ANNOTATION_MODE).lower()
+    image_format = (image_format or settings.ANNOTATION_FORMAT).lower()
+    if image_format == 'jpg':
+        image_format = 'jpeg'
+    quality = settings.ANNOTATION_QUALITY if quality is None else int(quality)
+    max_width = settings.ANNOTATION_PREVIEW_WIDTH if max_width is None else int(max_width)
+
+    if mode not in ANNOTATION_MODES:
+        raise ValueError(f"annotation must be one of {', '.join(ANNOTATION_MODES)}")
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"annotation_format must be one of {', '.join(IMAGE_FORMATS)}")
+    if not 1 <= quality <= 100:
+        raise ValueError("annotation_quality must be between 1 and 100")
+    if max_width < 16:
+        raise ValueError("max_width must be at least 16")
+
+    return {'mode': mode, 'format': image_format, 'quality': quality, 'max_width': max_width}
+
+
 class ImageAnnotator:
     """
     Tekshirilgan varaqni vizual ko'rsatish uchun annotate qilish
     """
-    
+
     # Colors (BGR format for OpenCV)
     COLOR_CORRECT_ANSWER = (0, 255, 0)      # Yashil - to'g'ri javob
     COLOR_STUDENT_CORRECT = (255, 128, 0)   # Ko'k - o'quvchi to'g'ri belgilagan
     COLOR_STUDENT_WRONG = (0, 0, 255)       # Qizil - o'quvchi xato belgilagan
-    
+
+    KIND_COLORS = {
+        'correct_answer': COLOR_CORRECT_ANSWER,
+        'student_correct': COLOR_STUDENT_CORRECT,
+        'student_wrong': COLOR_STUDENT_WRONG,
+    }
+
     THICKNESS = 2  # Rectangle thickness (reduced for precision)
     PADDING = 0    # No padding - exact bubble size
-    
+
     # NO OFFSET - Coordinates should be accurate
     X_OFFSET = 0
     Y_OFFSET = 0
-    
+
     def __init__(self):
         pass
-    
+
     def annotate_sheet(
         self,
         image: np.ndarray,
         grading_results: Dict,
         coordinates: Dict,
-        answer_key: Dict
-    ) -> str:
+        answer_key: Dict,
+        options: Optional[Dict] = None
+    ) -> Optional[str]:
+        """
+        Varaqni annotate qilish va base64 data URL qaytarish
+
+        options berilmasa - to'liq o'lchamli JPEG (quality 90), eski natija bilan bir xil.
+        'overlay'/'lazy'/'none' uchun rasm qaytmaydi - shape_response ishlating.
+        """
+        options = options or {'mode': 'full', 'format': 'jpeg', 'quality': 90}
+        if options['mode'] not in ('full', 'preview'):
+            return None
+
+        boxes = self.build_boxes(grading_results, coordinates)
+        max_width = options.get('max_width') if options['mode'] == 'preview' else None
+        data, mime = self.render(image, boxes, options['format'], options['quality'], max_width)
+
+        return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    def shape_response(
+        self,
+        image: np.ndarray,
+        grading_results: Dict,
+        coordinates: Dict,
+        options: Dict
+    ) -> Dict:
         """
-        Varaqni annotate qilish va base64 string qaytarish
+        Javobga qo'shiladigan annotation maydonlari (options['mode'] bo'yicha)
+
+        Returns:
+            {'annotatedImage': data URL yoki None, ...}
+            overlay: + 'annotationOverlay'
+            lazy:    + 'annotationSource' (API process uni annotation_cache'ga oladi)
         """
-        logger.info("Starting image annotation...")
-        
-        # Convert to BGR for colored annotations
-        if len(image.shape) == 2:
-            annotated = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-        else:
-            annotated = image.copy()
-        
-        logger.info(f"Annotation image shape: {annotated.shape}")
-        
+        mode = options['mode']
+        if mode == 'none':
+            return {'annotatedImage': None}
+
+        boxes = self.build_boxes(grading_results, coordinates)
+
+        if mode == 'overlay':
+            return {
+                'annotatedImage': None,
+                'annotationOverlay': self.build_overlay(image.shape, boxes)
+            }
+
+        if mode == 'lazy':
+            return {
+                'annotatedImage': None,
+                'annotationSource': {'image': image, 'boxes': boxes}
+            }
+
+        max_width = options['max_width'] if mode == 'preview' else None
+        data, mime = self.render(image, boxes, options['format'], options['quality'], max_width)
+        return {'annotatedImage': f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"}
+
+    def build_boxes(self, grading_results: Dict, coordinates: Dict) -> List[Box]:
+        """
+        Chiziladigan to'rtburchaklar ro'yxati (chizish tartibida)
+        """
+        boxes = []
+
         # Annotate each question
         total_annotated = 0
         no_answer_count = 0
         correct_count = 0
         wrong_count = 0
-        
+
         # Use topicResults from grading_results
         for topic_data in grading_results.get('topicResults', []):
             for section_data in topic_data.get('sections', []):
                 for question in section_data.get('questions', []):
                     q_num = question['questionNumber']
-                    
+
                     if q_num not in coordinates:
                         logger.warning(f"Coordinates not found for Q{q_num}")
                         continue
-                    
+
                     # Get answers
                     correct_answer = question.get('correctAnswer')
                     student_answer = question.get('studentAnswer')
                     is_correct = question.get('isCorrect', False)
-                    
+
                     # Count
                     if student_answer is None or student_answer == '':
                         no_answer_count += 1
@@ -78,37 +182,109 @@ class ImageAnnotator:
                         correct_count += 1
                     else:
                         wrong_count += 1
-                    
-                    # Annotate
-                    self._annotate_question(
-                        annotated,
+
+                    boxes.extend(self._question_boxes(
                         coordinates[q_num],
                         correct_answer,
                         student_answer,
                         is_correct
-                    )
-                    
+                    ))
+
                     total_annotated += 1
-        
+
         logger.info(f"Annotated {total_annotated} questions: {correct_count} correct, {wrong_count} wrong, {no_answer_count} no answer")
-        
-        # Convert to base64
-        _, buffer = cv2.imencode('.jpg', annotated, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        return f"data:image/jpeg;base64,{img_base64}"
-    
-    def _annotate_question(
+
+        return boxes
+
+    def render(
         self,
         image: np.ndarray,
+        boxes: List[Box],
+        image_format: str = 'jpeg',
+        quality: int = 90,
+        max_width: Optional[int] = None
+    ) -> Tuple[bytes, str]:
+        """
+        To'rtburchaklarni chizish va encode qilish
+
+        max_width berilsa, rasm (grayscale holida, BGR'dan oldin) kichraytiriladi va
+        koordinatalar shu masshtabga o'tkaziladi.
+
+        Returns:
+            (encoded bytes, MIME type)
+        """
+        height, width = image.shape[:2]
+        scale = 1.0
+        if max_width and width > max_width:
+            scale = max_width / width
+            image = cv2.resize(
+                image, (max_width, max(1, int(round(height * scale)))), interpolation=cv2.INTER_AREA
+            )
+
+        # Convert to BGR for colored annotations
+        if len(image.shape) == 2:
+            annotated = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        else:
+            annotated = image.copy()
+
+        thickness = self.THICKNESS if scale >= 0.75 else 1
+        for _, _, kind, x1, y1, x2, y2 in boxes:
+            if scale != 1.0:
+                x1, y1, x2, y2 = (int(round(v * scale)) for v in (x1, y1, x2, y2))
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), self.KIND_COLORS[kind], thickness)
+
+        extension, quality_flag, mime = IMAGE_FORMATS[image_format]
+        ok, buffer = cv2.imencode(extension, annotated, [quality_flag, int(quality)])
+        if not ok:
+            raise ValueError(f"Failed to encode annotated image as {image_format}")
+
+        return buffer.tobytes(), mime
+
+    def build_overlay(self, image_shape: Tuple, boxes: List[Box]) -> Dict:
+        """
+        Rasm o'rniga client chizishi uchun overlay (koordinatalar varaq piksellarida)
+        """
+        return {
+            'width': int(image_shape[1]),
+            'height': int(image_shape[0]),
+            'thickness': self.THICKNESS,
+            'colors': {
+                kind: '#{:02x}{:02x}{:02x}'.format(color[2], color[1], color[0])
+                for kind, color in self.KIND_COLORS.items()
+            },
+            'boxes': [
+                {
+                    'questionNumber': q_num,
+                    'variant': variant,
+                    'kind': kind,
+                    'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2
+                }
+                for q_num, variant, kind, x1, y1, x2, y2 in boxes
+            ]
+        }
+
+    def _bubble_box(self, bubble: Dict) -> Tuple[int, int, int, int]:
+        x = int(round(bubble['x'])) + self.X_OFFSET
+        y = int(round(bubble['y'])) + self.Y_OFFSET
+        radius = int(round(bubble['radius']))
+
+        return (
+            x - radius - self.PADDING,
+            y - radius - self.PADDING,
+            x + radius + self.PADDING,
+            y + radius + self.PADDING
+        )
+
+    def _question_boxes(
+        self,
         coords: Dict,
         correct_answer: str,
         student_answer: str,
         is_correct: bool
-    ):
+    ) -> List[Box]:
         """
-        Bitta savolni annotate qilish
-        
+        Bitta savolning to'rtburchaklari
+
         YANGI MANTIQ (MINIMAL ANNOTATION):
         - Faqat KERAKLI bubble'larni annotation qilish
         - To'g'ri javob: YASHIL
@@ -117,64 +293,33 @@ class ImageAnnotator:
         - Boshqa bubble'lar: annotation qilinmaydi
         """
         bubbles = coords['bubbles']
-        
-        # DEBUG: Log first bubble coordinates
-        if coords['questionNumber'] == 1:
-            logger.info(f"Q1 Bubble A coordinates: x={bubbles[0]['x']:.1f}, y={bubbles[0]['y']:.1f}, radius={bubbles[0]['radius']:.1f}")
-            logger.info(f"Q1 Correct answer: {correct_answer}, Student answer: {student_answer}, Is correct: {is_correct}")
-        
+        q_num = coords['questionNumber']
+        boxes = []
+
         for bubble in bubbles:
             variant = bubble['variant']
-            x = int(round(bubble['x'])) + self.X_OFFSET
-            y = int(round(bubble['y'])) + self.Y_OFFSET
-            radius = int(round(bubble['radius']))
-            
-            # Calculate rectangle coordinates
-            x1 = x - radius - self.PADDING
-            y1 = y - radius - self.PADDING
-            x2 = x + radius + self.PADDING
-            y2 = y + radius + self.PADDING
-            
+
             # FAQAT KERAKLI BUBBLE'LARNI ANNOTATION QILISH
-            
+
             # Case 1: Student to'g'ri javob bergan (to'g'ri javob == student javobi)
             if variant == correct_answer and variant == student_answer:
                 # KO'K - student to'g'ri belgilagan
-                cv2.rectangle(
-                    image, (x1, y1), (x2, y2),
-                    self.COLOR_STUDENT_CORRECT,
-                    self.THICKNESS
-                )
-            
+                boxes.append((q_num, variant, 'student_correct') + self._bubble_box(bubble))
+
             # Case 2: Student xato javob bergan
             elif variant == student_answer and not is_correct:
                 # QIZIL - student xato belgilagan
-                cv2.rectangle(
-                    image, (x1, y1), (x2, y2),
-                    self.COLOR_STUDENT_WRONG,
-                    self.THICKNESS
-                )
+                boxes.append((q_num, variant, 'student_wrong') + self._bubble_box(bubble))
                 # YASHIL - to'g'ri javobni ham ko'rsatish
                 # (agar student xato bergan bo'lsa, to'g'ri javobni ko'rsatish kerak)
                 for b in bubbles:
                     if b['variant'] == correct_answer:
-                        bx = int(round(b['x'])) + self.X_OFFSET
-                        by = int(round(b['y'])) + self.Y_OFFSET
-                        br = int(round(b['radius']))
-                        cv2.rectangle(
-                            image, 
-                            (bx - br - self.PADDING, by - br - self.PADDING),
-                            (bx + br + self.PADDING, by + br + self.PADDING),
-                            self.COLOR_CORRECT_ANSWER,
-                            self.THICKNESS
-                        )
+                        boxes.append((q_num, b['variant'], 'correct_answer') + self._bubble_box(b))
                         break
-            
+
             # Case 3: Student javob bermagan (student_answer is None)
             elif student_answer is None and variant == correct_answer:
                 # YASHIL - faqat to'g'ri javobni ko'rsatish
-                cv2.rectangle(
-                    image, (x1, y1), (x2, y2),
-                    self.COLOR_CORRECT_ANSWER,
-                    self.THICKNESS
-                )
+                boxes.append((q_num, variant, 'correct_answer') + self._bubble_box(bubble))
+
+        return boxes
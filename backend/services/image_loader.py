@@ -0,0 +1,70 @@
+"""
+Image Loader - rasmni xotiradan yoki fayldan yuklash
+Upload'larni TEMP_DIR orqali aylantirmasdan to'g'ridan-to'g'ri decode qilish
+"""
+import cv2
+import numpy as np
+import logging
+from pathlib import Path
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+ImageSource = Union[str, Path, bytes, bytearray, memoryview, np.ndarray]
+
+
+def decode_image_bytes(data: Union[bytes, bytearray, memoryview], flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """
+    Encoded rasm baytlarini decode qilish
+
+    np.frombuffer nusxa olmaydi - cv2.imdecode to'g'ridan-to'g'ri
+    upload buferidan o'qiydi.
+
+    Raises:
+        ValueError: Baytlar rasm sifatida decode bo'lmasa
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, flags)
+
+    if image is None:
+        raise ValueError(f"Failed to decode image ({len(buffer)} bytes)")
+
+    return image
+
+
+def load_image(source: ImageSource, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """
+    Rasmni istalgan manbadan yuklash
+
+    Args:
+        source: Fayl yo'li, encoded baytlar yoki allaqachon decode qilingan ndarray
+        flags: cv2.IMREAD_COLOR yoki cv2.IMREAD_GRAYSCALE
+
+    Returns:
+        np.ndarray: BGR (IMREAD_COLOR) yoki grayscale (IMREAD_GRAYSCALE) rasm
+    """
+    if isinstance(source, np.ndarray):
+        # Decoded array - faqat kanal sonini moslashtirish
+        if flags == cv2.IMREAD_GRAYSCALE and source.ndim == 3:
+            return cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+        if flags == cv2.IMREAD_COLOR and source.ndim == 2:
+            return cv2.cvtColor(source, cv2.COLOR_GRAY2BGR)
+        return source
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return decode_image_bytes(source, flags)
+
+    image = cv2.imread(str(source), flags)
+    if image is None:
+        raise ValueError(f"Failed to load image: {source}")
+
+    return image
+
+
+def describe_source(source: ImageSource) -> str:
+    """Log uchun manba tavsifi"""
+    if isinstance(source, np.ndarray):
+        return f"<ndarray {source.shape[1]}x{source.shape[0]}>"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes in memory>"
+    return str(source)
@@ -4,9 +4,14 @@ Implements advanced preprocessing pipeline for OMR sheets
 """
 import cv2
 import numpy as np
-from typing import Tuple, Optional, Dict
+from typing import Tuple, Optional, Dict, Union
 import logging
 
+from services.corner_engine import get_corner_engine, use_corner_engine
+from services.image_loader import load_image, describe_source
+from services.lazy_planes import get_image_planes
+from services.quality_metrics import get_quality_metrics
+
 logger = logging.getLogger(__name__)
 
 class ImageProcessor:
@@ -19,27 +24,29 @@ class ImageProcessor:
         self.target_height = target_height
         self.corner_marker_size = 60  # Increased from 40 to 60 for better detection
         
-    def process(self, image_path: str) -> Dict:
+    def process(self, image_path: Union[str, np.ndarray]) -> Dict:
         """
         Rasmni to'liq qayta ishlash pipeline
         
+        Args:
+            image_path: Fayl yo'li yoki allaqachon decode qilingan BGR ndarray
+        
         Returns:
             dict: {
                 'original': np.ndarray,
-                'processed': np.ndarray,
-                'grayscale': np.ndarray,
-                'gray_for_omr': np.ndarray,  # PURE grayscale for OMR
+                'grayscale': np.ndarray,  # planes['clahe_2'] (tayyor o'lchamda - planes['gray'])
+                'gray_for_omr': np.ndarray,  # PURE grayscale for OMR (planes['gray'])
+                'planes': ImagePlanes,  # so'rov plane grafi; 'light_enhanced' - lazy, faqat so'ralganda
                 'corners': list,
+                'frame': 'page' | 'markers',  # rasm chegaralari sahifa yoki marker markazlari
                 'quality': dict,
                 'dimensions': dict
             }
         """
-        logger.info(f"Processing image: {image_path}")
+        logger.info(f"Processing image: {describe_source(image_path)}")
         
         # 1. Yuklash
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Failed to load image: {image_path}")
+        image = load_image(image_path)
         
         original = image.copy()
         logger.info(f"Image loaded: {image.shape[1]}x{image.shape[0]}")
@@ -50,8 +57,9 @@ class ImageProcessor:
             logger.info("Image already correct size - skipping perspective correction")
             
             # Just convert to grayscale
-            gray_for_omr = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            gray_enhanced = gray_for_omr.copy()
+            planes = get_image_planes(image)
+            planes.register('light_enhanced', lambda p: p['gray'])  # No processing needed
+            gray_for_omr = planes['gray']
             
             # Default corners
             corners = self._get_default_corners(image)
@@ -61,10 +69,11 @@ class ImageProcessor:
             
             return {
                 'original': original,
-                'processed': gray_for_omr,  # No processing needed
-                'grayscale': gray_enhanced,
+                'grayscale': gray_for_omr,
                 'gray_for_omr': gray_for_omr,  # PURE grayscale
+                'planes': planes,
                 'corners': corners,
+                'frame': 'page',
                 'quality': quality,
                 'dimensions': {
                     'width': self.target_width,
@@ -78,8 +87,11 @@ class ImageProcessor:
         if corners_original is None:
             logger.warning("Corner markers not found, using full image")
             corners_original = self._get_default_corners(image)
+            frame = 'page'
         else:
             logger.info(f"Found {len(corners_original)} corner markers")
+            # Perspective correction marker markazlarini rasm burchaklariga olib boradi
+            frame = 'markers'
         
         # 3. Perspective correction
         logger.info("Correcting perspective...")
@@ -103,83 +115,32 @@ class ImageProcessor:
             (self.target_width, self.target_height)
         )
         
-        # 5. Grayscale conversion
-        logger.info("Converting to grayscale...")
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
+        # 5. Grayscale conversion - plane grafi orqali (keyingi servislar ham shu plane'larni oladi)
+        planes = get_image_planes(resized)
         
         # CRITICAL: Keep PURE grayscale for OMR detection (no enhancement!)
         # OMR detection works best on pure grayscale
-        gray_for_omr = gray.copy()
+        gray_for_omr = planes['gray']
         
         # 5.5. Enhance grayscale for better annotation quality ONLY
-        logger.info("Enhancing grayscale for annotation...")
         # Apply CLAHE for better contrast (for annotation, not OMR!)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        gray_enhanced = clahe.apply(gray)
-        
-        # 6. Adaptive thresholding (CRITICAL!)
-        logger.info("Applying adaptive thresholding...")
-        # CRITICAL FIX: Use GRAYSCALE for OMR detection, not thresholded!
-        # Thresholded image is only for visualization/annotation
-        processed = cv2.adaptiveThreshold(
-            gray,
-            255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY,
-            15,  # Increased block size from 11 to 15
-            3    # Increased C constant from 2 to 3
-        )
-        
-        # CRITICAL: Keep original grayscale for OMR detection
-        # OMR detector works MUCH better on grayscale than binary!
+        gray_enhanced = planes['clahe_2']
         
-        # 7. Noise reduction with bilateral filter (preserves edges better)
-        logger.info("Reducing noise...")
-        # First pass: bilateral filter to preserve edges
-        denoised = cv2.bilateralFilter(gray, 9, 75, 75)
-        
-        # Second pass: morphological operations to clean up
-        kernel = np.ones((2, 2), np.uint8)
-        denoised = cv2.morphologyEx(denoised, cv2.MORPH_CLOSE, kernel)
-        
-        # 8. Contrast enhancement with CLAHE
-        logger.info("Enhancing contrast...")
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))  # Increased clipLimit
-        enhanced = clahe.apply(denoised)
-        
-        # 9. Gamma correction for light marks detection (NEW!)
-        logger.info("Applying gamma correction for light marks...")
-        gamma = 0.8  # Brighten the image to detect light marks better
-        gamma_corrected = np.power(enhanced / 255.0, gamma) * 255.0
-        gamma_corrected = gamma_corrected.astype(np.uint8)
-        
-        # 10. Final sharpening to improve bubble detection
-        logger.info("Sharpening image...")
-        kernel_sharpen = np.array([[-1,-1,-1],
-                                   [-1, 9,-1],
-                                   [-1,-1,-1]])
-        sharpened = cv2.filter2D(gamma_corrected, -1, kernel_sharpen)
-        
-        # 11. Additional light mark enhancement
-        logger.info("Enhancing light marks...")
-        # Create a mask for potential light marks
-        light_mask = cv2.inRange(sharpened, 180, 220)  # Light gray areas
-        
-        # Darken light marks slightly
-        light_enhanced = sharpened.copy()
-        light_enhanced[light_mask > 0] = light_enhanced[light_mask > 0] * 0.85
-        light_enhanced = light_enhanced.astype(np.uint8)
+        # 6. Light-mark enhanced plane (bilateral + close + CLAHE 3 + gamma + sharpen)
+        # Lazy - grade_sheet uni ishlatmaydi, faqat so'ralganda quriladi (~350 ms A4)
+        planes.register('light_enhanced', self._build_light_enhanced)
         
-        # 12. Quality assessment
-        quality = self.assess_quality(light_enhanced)
+        # 7. Quality assessment - pure gray bo'yicha (umumiy quality_metrics cache'i)
+        quality = self.assess_quality(gray_for_omr)
         logger.info(f"Image quality: {quality['overall']:.1f}%")
         
         return {
             'original': original,
-            'processed': light_enhanced,  # Use light-enhanced image for OMR detection
             'grayscale': gray_enhanced,  # Use enhanced grayscale for annotation
             'gray_for_omr': gray_for_omr,  # CRITICAL: Original grayscale for OMR detection
+            'planes': planes,
             'corners': corners,
+            'frame': frame,
             'quality': quality,
             'dimensions': {
                 'width': self.target_width,
@@ -187,13 +148,47 @@ class ImageProcessor:
             }
         }
     
+    def _build_light_enhanced(self, planes) -> np.ndarray:
+        """
+        Yengil belgilar uchun kuchaytirilgan plane (avvalgi 'processed' chiqishi)
+        """
+        # Noise reduction: bilateral filter (preserves edges) + morphological close
+        # -> CLAHE (clipLimit 3.0)
+        enhanced = planes['clahe_3@close_2@bilateral_9']
+        
+        # Gamma correction for light marks detection
+        gamma = 0.8  # Brighten the image to detect light marks better
+        gamma_table = (np.power(np.arange(256) / 255.0, gamma) * 255.0).astype(np.uint8)
+        gamma_corrected = cv2.LUT(enhanced, gamma_table)
+        
+        # Final sharpening to improve bubble detection
+        kernel_sharpen = np.array([[-1,-1,-1],
+                                   [-1, 9,-1],
+                                   [-1,-1,-1]])
+        sharpened = cv2.filter2D(gamma_corrected, -1, kernel_sharpen)
+        
+        # Darken light marks slightly (light gray areas)
+        light_mask = cv2.inRange(sharpened, 180, 220)
+        light_enhanced = sharpened.copy()
+        light_enhanced[light_mask > 0] = light_enhanced[light_mask > 0] * 0.85
+        return light_enhanced.astype(np.uint8)
+    
     def detect_corner_markers(self, image: np.ndarray) -> Optional[list]:
         """
         To'rtta burchak markerlarini topish - PDF spetsifikatsiyalariga asoslangan
         Corner markers: 15mm x 15mm, 5mm margin from edges
         
         YANGI YONDASHUV: Faqat 4 ta burchakda qidirish, boshqa joyda emas!
+        CORNER_ENGINE_MODE='windows': faqat burchak oynalari (corner_engine, subpixel)
         """
+        if use_corner_engine():
+            markers = get_corner_engine('scan').detect(image)
+            if len(markers) == 4:
+                logger.info("✅ All 4 corner markers detected successfully!")
+                return markers
+            logger.warning(f"⚠️  Only {len(markers)}/4 corner markers found")
+            return None
+        
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         height, width = image.shape[:2]
         
@@ -527,15 +522,17 @@ class ImageProcessor:
         """
         Rasm sifatini baholash
         """
-        # Laplacian variance (sharpness)
-        laplacian_var = cv2.Laplacian(image, cv2.CV_64F).var()
-        sharpness = min(100, laplacian_var / 100)
+        metrics = get_quality_metrics(image)
+        
+        # Laplacian variance (sharpness) - pure gray shkalasida, AdaptiveOMRDetector
+        # va PhotoQualityAssessor bilan bir xil (light_enhanced'da /100 edi)
+        sharpness = min(100, metrics['laplacian_var'] / 10)
         
         # Contrast
-        contrast = image.std() / 128 * 100
+        contrast = metrics['std'] / 128 * 100
         
         # Brightness
-        brightness = image.mean() / 255 * 100
+        brightness = metrics['mean'] / 255 * 100
         
         # Overall quality score
         overall = (sharpness * 0.4 + contrast * 0.4 + brightness * 0.2)
@@ -26,6 +26,8 @@ import base64
 from typing import Dict, Tuple, Optional
 import logging
 
+from services.corner_engine import get_corner_engine, use_corner_engine
+
 logger = logging.getLogger(__name__)
 
 class ImageStandardizer:
@@ -167,6 +169,10 @@ class ImageStandardizer:
         """
         Corner marker'larni topish
         """
+        if use_corner_engine():
+            markers = get_corner_engine('scan').detect(image)
+            return markers if len(markers) == 4 else None
+        
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         height, width = image.shape[:2]
         
@@ -7,6 +7,9 @@ import numpy as np
 from typing import List, Dict, Optional, Tuple
 import logging
 
+from services.corner_engine import get_corner_engine, match_marker_template, use_corner_engine
+from services.lazy_planes import get_image_planes
+
 logger = logging.getLogger(__name__)
 
 class ImprovedCornerDetector:
@@ -20,6 +23,11 @@ class ImprovedCornerDetector:
         self.max_area = 3000  # Maximum area for corner marker
         self.aspect_ratio_tolerance = 0.4  # Square shape tolerance
         
+        # Template matching (coarse-to-fine)
+        self.template_coarse_scale = 0.25
+        self.template_coarse_threshold = 0.5
+        self.template_threshold = 0.6
+        
     def detect_corners(self, image: np.ndarray) -> Optional[List[Dict]]:
         """
         Improved corner detection with multiple strategies
@@ -27,9 +35,19 @@ class ImprovedCornerDetector:
         Strategy 1: Template matching
         Strategy 2: Contour-based detection with improved filtering
         Strategy 3: Edge-based detection
+        
+        CORNER_ENGINE_MODE='windows': kaskad faqat burchak oynalarida (corner_engine)
         """
         logger.info("Starting improved corner detection...")
         
+        if use_corner_engine():
+            corners = get_corner_engine('scan').detect(image)
+            if len(corners) == 4:
+                logger.info("✅ Corner engine detection successful")
+                return corners
+            logger.warning("❌ All corner detection strategies failed")
+            return None
+        
         # Try multiple strategies
         corners = None
         
@@ -57,42 +75,51 @@ class ImprovedCornerDetector:
     def _detect_by_template_matching(self, image: np.ndarray) -> Optional[List[Dict]]:
         """
         Template matching approach - create ideal corner template
+        
+        Coarse-to-fine: har bir chorakda 1/4 masshtabda matchTemplate, bitta
+        eng yuqori cho'qqi (minMaxLoc - chorak bo'yicha NMS), so'ng to'liq
+        ruxsatda kichik oynada aniqlashtirish (corner_engine.match_marker_template -
+        CORNER_ENGINE_MODE='windows' dagi template strategiyasi ham shuni ishlatadi).
         """
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            gray = get_image_planes(image)['gray']
             height, width = gray.shape
             
             # Calculate expected corner size
             px_per_mm_x = width / 210
             px_per_mm_y = height / 297
             corner_size = int(15 * min(px_per_mm_x, px_per_mm_y))
+            pad = corner_size // 4
             
-            # Create ideal corner template (black square)
-            template = np.zeros((corner_size, corner_size), dtype=np.uint8)
-            
-            # Match template
-            result = cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED)
-            
-            # Find peaks
-            threshold = 0.6
-            locations = np.where(result >= threshold)
+            mid_x, mid_y = width // 2, height // 2
+            quadrants = [
+                ('top-left', 0, 0, mid_x, mid_y),
+                ('top-right', mid_x, 0, width, mid_y),
+                ('bottom-left', 0, mid_y, mid_x, height),
+                ('bottom-right', mid_x, mid_y, width, height)
+            ]
             
-            if len(locations[0]) < 4:
-                return None
-            
-            # Convert to corner positions
             corners = []
-            for y, x in zip(locations[0], locations[1]):
-                center_x = x + corner_size // 2
-                center_y = y + corner_size // 2
+            for name, qx1, qy1, qx2, qy2 in quadrants:
+                # Chorakdagi bitta eng yaxshi cho'qqi (corner engine'ning template strategiyasi bilan umumiy)
+                match = match_marker_template(
+                    gray[qy1:qy2, qx1:qx2], corner_size, pad,
+                    self.template_threshold, self.template_coarse_threshold, self.template_coarse_scale
+                )
+                if match is None:
+                    logger.warning(f"No corners found in {name} quadrant")
+                    return None
+                
+                peak, (fx, fy) = match
                 corners.append({
-                    'x': center_x,
-                    'y': center_y,
-                    'confidence': float(result[y, x])
+                    'x': int(qx1 + fx + pad + corner_size // 2),
+                    'y': int(qy1 + fy + pad + corner_size // 2),
+                    'confidence': peak,
+                    'name': name
                 })
             
-            # Select best 4 corners (one in each quadrant)
-            return self._select_best_corners(corners, width, height)
+            logger.info(f"Selected 4 corners: {[c['name'] for c in corners]}")
+            return corners
             
         except Exception as e:
             logger.error(f"Template matching failed: {e}")
@@ -103,27 +130,26 @@ class ImprovedCornerDetector:
         Improved contour-based detection with better filtering
         """
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            height, width = gray.shape
+            planes = get_image_planes(image)
+            height, width = planes['gray'].shape
             
-            # Multiple thresholding approaches
+            # Multiple thresholding approaches (so'rov plane grafidan - boshqa strategiyalar bilan umumiy)
             corners_all = []
             
             # Approach 1: Otsu thresholding
-            _, binary1 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+            binary1 = planes['otsu_inv']
             corners1 = self._find_corners_in_binary(binary1, width, height)
             if corners1:
                 corners_all.extend(corners1)
             
             # Approach 2: Adaptive thresholding
-            binary2 = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                          cv2.THRESH_BINARY_INV, 15, 10)
+            binary2 = planes['adaptive_inv_15_10']
             corners2 = self._find_corners_in_binary(binary2, width, height)
             if corners2:
                 corners_all.extend(corners2)
             
             # Approach 3: Fixed threshold
-            _, binary3 = cv2.threshold(gray, 100, 255, cv2.THRESH_BINARY_INV)
+            binary3 = planes['fixed_inv_100']
             corners3 = self._find_corners_in_binary(binary3, width, height)
             if corners3:
                 corners_all.extend(corners3)
@@ -208,7 +234,7 @@ class ImprovedCornerDetector:
         Edge-based corner detection using Harris corner detector
         """
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            gray = get_image_planes(image)['gray']
             height, width = gray.shape
             
             # Harris corner detection
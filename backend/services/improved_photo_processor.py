@@ -4,10 +4,15 @@ Advanced photo processing with multiple fallback strategies
 """
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import logging
 from pathlib import Path
 
+from services.image_loader import load_image, describe_source
+from services.bubble_finder import exam_cache_key, find_bubble_candidates
+from services.mask_bank import mask_bank
+from utils.spatial_index import as_points, suppress_radius
+
 logger = logging.getLogger(__name__)
 
 class ImprovedPhotoProcessor:
@@ -66,7 +71,8 @@ class ImprovedPhotoProcessor:
     def detect_bubbles_advanced(
         self,
         image: np.ndarray,
-        expected_count: int = 200
+        expected_count: int = 200,
+        cache_key: Optional[str] = None
     ) -> List[Dict]:
         """
         Advanced bubble detection with multiple strategies
@@ -74,6 +80,7 @@ class ImprovedPhotoProcessor:
         Args:
             image: Preprocessed grayscale image
             expected_count: Expected number of bubbles
+            cache_key: Exam key for the Hough parameter cache
             
         Returns:
             list: Detected bubbles with metadata
@@ -81,7 +88,7 @@ class ImprovedPhotoProcessor:
         logger.info("Starting advanced bubble detection...")
         
         # Strategy 1: Hough Circle Transform (multiple parameter sets)
-        bubbles = self._detect_with_hough_circles(image, expected_count)
+        bubbles = self._detect_with_hough_circles(image, expected_count, cache_key)
         
         if len(bubbles) >= expected_count * 0.7:  # 70% success
             logger.info(f"✅ Hough circles successful: {len(bubbles)} bubbles")
@@ -105,14 +112,13 @@ class ImprovedPhotoProcessor:
     def _detect_with_hough_circles(
         self,
         image: np.ndarray,
-        expected_count: int
+        expected_count: int,
+        cache_key: Optional[str] = None
     ) -> List[Dict]:
         """
         Hough Circle Transform with multiple parameter sets
+        (answer grid ROI, reduced scale, early exit - services.bubble_finder)
         """
-        # Enhanced preprocessing for circle detection
-        blurred = cv2.GaussianBlur(image, (3, 3), 0)
-        
         # Multiple parameter sets (more comprehensive)
         param_sets = [
             {'minRadius': 8, 'maxRadius': 25, 'param2': 25, 'minDist': 20},
@@ -123,36 +129,18 @@ class ImprovedPhotoProcessor:
             {'minRadius': 15, 'maxRadius': 40, 'param2': 12, 'minDist': 35},
         ]
         
-        best_circles = None
-        best_count_diff = float('inf')
-        
-        for params in param_sets:
-            circles = cv2.HoughCircles(
-                blurred,
-                cv2.HOUGH_GRADIENT,
-                dp=1,
-                minDist=params['minDist'],
-                param1=50,
-                param2=params['param2'],
-                minRadius=params['minRadius'],
-                maxRadius=params['maxRadius']
-            )
-            
-            if circles is not None:
-                count = len(circles[0])
-                count_diff = abs(count - expected_count)
-                
-                logger.info(f"  Params {params}: Found {count} circles (diff: {count_diff})")
-                
-                if count_diff < best_count_diff:
-                    best_count_diff = count_diff
-                    best_circles = circles
+        # Enhanced preprocessing for circle detection
+        circles, _ = find_bubble_candidates(
+            image,
+            param_sets,
+            expected_count=expected_count,
+            preprocess=lambda region: cv2.GaussianBlur(region, (3, 3), 0),
+            cache_key=('improved_photo', cache_key) if cache_key else None
+        )
         
-        if best_circles is None:
+        if circles is None:
             return []
         
-        circles = np.round(best_circles[0, :]).astype("int")
-        
         # Convert to dict format with quality assessment
         bubbles = []
         for x, y, r in circles:
@@ -346,23 +334,9 @@ class ImprovedPhotoProcessor:
         # Sort by quality (best first)
         bubbles.sort(key=lambda b: b['quality'], reverse=True)
         
-        filtered = []
-        
-        for bubble in bubbles:
-            is_duplicate = False
-            
-            for existing in filtered:
-                distance = np.sqrt(
-                    (bubble['x'] - existing['x']) ** 2 +
-                    (bubble['y'] - existing['y']) ** 2
-                )
-                
-                if distance < min_distance:
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                filtered.append(bubble)
+        # Radius ichidagi qo'shnilar KD-tree'dan bir marta olinadi (O(n^2) juftlik o'rniga)
+        kept = suppress_radius(as_points(bubbles), min_distance)
+        filtered = [bubbles[i] for i in kept]
         
         return filtered
     
@@ -393,18 +367,15 @@ class ImprovedPhotoProcessor:
         center_x = x - x1
         center_y = y - y1
         
-        # Inner circle (bubble area)
-        inner_mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(inner_mask, (center_x, center_y), radius, 255, -1)
-        
-        # Outer ring (background area)
-        outer_mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(outer_mask, (center_x, center_y), int(radius * 1.4), 255, -1)
-        cv2.circle(outer_mask, (center_x, center_y), int(radius * 1.1), 0, -1)
+        # Inner circle (bubble area) va outer ring (background area) - umumiy mask_bank'dan
+        inner_mask, _ = mask_bank.disk(roi.shape[:2], (center_x, center_y), radius)
+        outer_mask, _ = mask_bank.annulus(
+            roi.shape[:2], (center_x, center_y), int(radius * 1.4), int(radius * 1.1)
+        )
         
         # Extract pixels
-        inner_pixels = roi[inner_mask > 0]
-        outer_pixels = roi[outer_mask > 0]
+        inner_pixels = roi[inner_mask]
+        outer_pixels = roi[outer_mask]
         
         if len(inner_pixels) == 0 or len(outer_pixels) == 0:
             return {'darkness': 0, 'score': 0, 'filled': False}
@@ -504,19 +475,17 @@ class ImprovedPhotoProcessor:
     
     def process_photo_complete(
         self,
-        image_path: str,
+        image_path: Union[str, np.ndarray],
         exam_structure: Dict,
         answer_key: Dict
     ) -> Dict:
         """
         Complete photo processing pipeline
         """
-        logger.info(f"Processing photo with improved processor: {image_path}")
+        logger.info(f"Processing photo with improved processor: {describe_source(image_path)}")
         
-        # Load image
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Cannot load image: {image_path}")
+        # Load image (path or decoded BGR ndarray)
+        image = load_image(image_path)
         
         # Preprocess
         processed = self.preprocess_photo(image)
@@ -529,7 +498,9 @@ class ImprovedPhotoProcessor:
         )
         
         # Detect bubbles
-        bubbles = self.detect_bubbles_advanced(processed, total_questions * 5)
+        bubbles = self.detect_bubbles_advanced(
+            processed, total_questions * 5, cache_key=exam_cache_key(exam_structure)
+        )
         
         # Map to questions (reuse existing logic)
         from services.photo_omr_service import PhotoOMRService
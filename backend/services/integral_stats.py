@@ -0,0 +1,177 @@
+"""
+Integral Image Engine - bubble statistikalari O(1) so'rovlar bilan
+Har bir bubble uchun ROI kesish, mask chizish va mean/std hisoblash o'rniga
+
+Rasm uchun bir marta quriladi:
+1. cv2.integral2 - yig'indi va kvadratlar yig'indisi (float64, butun sonlar aniq)
+2. Threshold bo'yicha qora piksellar soni uchun integral (kerak bo'lganda)
+
+Kvadrat ROI - 4 ta qiymat. Doira (cv2.circle mask) bir xil kenglikdagi qatorlar
+bo'yicha bir nechta to'rtburchakka ajratiladi (radius bo'yicha cache), shuning uchun
+doira yig'indisi ham mask bilan aynan bir xil - taxminiy emas.
+"""
+import cv2
+import numpy as np
+import logging
+from functools import lru_cache
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=128)
+def disk_rectangles(radius: int) -> np.ndarray:
+    """
+    cv2.circle(center, radius, -1) maskasini to'rtburchaklarga ajratish
+
+    Returns:
+        (K, 4) int64 [dx1, dy1, dx2, dy2] - markazga nisbatan, yarim ochiq
+        (x1 <= x < x2), read-only
+    """
+    size = 2 * radius + 3
+    center = radius + 1
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(mask, (center, center), radius, 255, -1)
+
+    rects = []
+    previous = None
+    for row in range(size):
+        cols = np.flatnonzero(mask[row])
+        span = (int(cols[0]), int(cols[-1]) + 1) if len(cols) else None
+
+        if span is not None and span == previous:
+            rects[-1][3] = row + 1 - center  # Oldingi to'rtburchakni cho'zish
+        elif span is not None:
+            rects.append([span[0] - center, row - center, span[1] - center, row + 1 - center])
+        previous = span
+
+    rects = np.array(rects, dtype=np.int64).reshape(-1, 4)
+    rects.setflags(write=False)
+    return rects
+
+
+class IntegralImageEngine:
+    """
+    Bitta (tayyorlangan) grayscale rasm uchun integral jadvallar
+
+    Barcha so'rovlar vektorlashtirilgan: xs, ys, radii massivlari bo'yicha
+    (N,) natijalar qaytariladi. ROI rasm chetidan chiqsa kesiladi -
+    _extract_bubble_roi va cv2.circle xatti-harakati bilan bir xil.
+    """
+
+    def __init__(self, image: np.ndarray):
+        if len(image.shape) == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        self.image = image
+        self.height, self.width = image.shape[:2]
+        self.sum, self.sqsum = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        self._dark_counts: Dict[int, np.ndarray] = {}
+
+    def dark_count_table(self, threshold: int) -> np.ndarray:
+        """pixel < threshold piksellar soni uchun integral (threshold bo'yicha cache)"""
+        table = self._dark_counts.get(threshold)
+        if table is None:
+            dark = (self.image < threshold).astype(np.uint8)
+            table = cv2.integral(dark, sdepth=cv2.CV_32S)
+            self._dark_counts[threshold] = table
+        return table
+
+    @staticmethod
+    def _query(table: np.ndarray, x1, y1, x2, y2) -> np.ndarray:
+        return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+    @staticmethod
+    def _finish(count, total, sq_total, dark) -> Dict:
+        safe = np.maximum(count, 1)
+        mean = total / safe
+        # Var = E[x^2] - E[x]^2 (yaxlitlash sababli manfiy bo'lishi mumkin)
+        variance = np.maximum(sq_total / safe - mean * mean, 0.0)
+
+        stats = {
+            'valid': count > 0,
+            'count': count,
+            'mean': np.where(count > 0, mean, 0.0),
+            'std': np.where(count > 0, np.sqrt(variance), 0.0)
+        }
+        if dark is not None:
+            stats['dark_count'] = dark
+        return stats
+
+    def rect_stats(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        half_sizes: np.ndarray,
+        dark_threshold: Optional[int] = None
+    ) -> Dict:
+        """
+        Kvadrat ROI [y-h:y+h, x-h:x+h] (rasm chegarasida kesilgan) statistikasi
+
+        Returns:
+            {'valid', 'count', 'mean', 'std'[, 'dark_count']} - (N,) massivlar
+        """
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        half_sizes = np.asarray(half_sizes, dtype=np.int64)
+
+        x1 = np.clip(xs - half_sizes, 0, self.width)
+        y1 = np.clip(ys - half_sizes, 0, self.height)
+        x2 = np.clip(xs + half_sizes, 0, self.width)
+        y2 = np.clip(ys + half_sizes, 0, self.height)
+        x2 = np.maximum(x2, x1)
+        y2 = np.maximum(y2, y1)
+
+        count = (x2 - x1) * (y2 - y1)
+        total = self._query(self.sum, x1, y1, x2, y2)
+        sq_total = self._query(self.sqsum, x1, y1, x2, y2)
+        dark = None
+        if dark_threshold is not None:
+            dark = self._query(self.dark_count_table(dark_threshold), x1, y1, x2, y2)
+
+        return self._finish(count, total, sq_total, dark)
+
+    def disk_stats(
+        self,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        radii: np.ndarray,
+        dark_threshold: Optional[int] = None
+    ) -> Dict:
+        """
+        cv2.circle(mask, (x, y), r, 255, -1) ichidagi piksellar statistikasi
+
+        Returns:
+            {'valid', 'count', 'mean', 'std'[, 'dark_count']} - (N,) massivlar
+        """
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        radii = np.asarray(radii, dtype=np.int64)
+        n = len(xs)
+
+        count = np.zeros(n, dtype=np.int64)
+        total = np.zeros(n)
+        sq_total = np.zeros(n)
+        dark = np.zeros(n, dtype=np.int64) if dark_threshold is not None else None
+        dark_table = self.dark_count_table(dark_threshold) if dark_threshold is not None else None
+
+        for radius in np.unique(radii):
+            if radius < 0:
+                continue
+
+            group = np.flatnonzero(radii == radius)
+            rects = disk_rectangles(int(radius))
+
+            # (n_group, K) to'rtburchak chegaralari, rasm ichida kesilgan
+            x1 = np.clip(xs[group, None] + rects[:, 0], 0, self.width)
+            y1 = np.clip(ys[group, None] + rects[:, 1], 0, self.height)
+            x2 = np.maximum(np.clip(xs[group, None] + rects[:, 2], 0, self.width), x1)
+            y2 = np.maximum(np.clip(ys[group, None] + rects[:, 3], 0, self.height), y1)
+
+            count[group] = ((x2 - x1) * (y2 - y1)).sum(axis=1)
+            total[group] = self._query(self.sum, x1, y1, x2, y2).sum(axis=1)
+            sq_total[group] = self._query(self.sqsum, x1, y1, x2, y2).sum(axis=1)
+            if dark is not None:
+                dark[group] = self._query(dark_table, x1, y1, x2, y2).sum(axis=1)
+
+        return self._finish(count, total, sq_total, dark)
@@ -0,0 +1,264 @@
+"""
+Lazy Planes - talab bo'yicha hisoblanadigan tayyorlangan rasmlar
+Har bir plane (enhanced, binary, denoised, ...) birinchi murojaatda bir marta quriladi
+
+ImagePlanes - so'rov davomida barcha servislar uchun umumiy hosila rasmlar grafi
+(gray -> clahe_2 -> otsu_inv@clahe_2, adaptive_15_3, ...). ImageProcessor,
+UltraPreciseCoordinateMapper, ImprovedCornerDetector, OCRAnchorDetector va
+AdaptiveOMRDetector get_image_planes() orqali bir xil plane'larni ishlatadi.
+"""
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LazyPlanes:
+    """
+    Dict'ga o'xshash konteyner: planes['enhanced'] birinchi chaqiruvda builder'ni
+    ishga tushiradi va natijani saqlaydi.
+
+    Builder planes obyektini qabul qiladi, shuning uchun boshqa plane'larga
+    bog'liq bo'lishi mumkin (masalan binary -> enhanced -> denoised).
+    """
+
+    def __init__(self):
+        self._builders: Dict[str, Callable[['LazyPlanes'], Any]] = {}
+        self._values: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}  # plane -> build time (ms)
+
+    def register(self, name: str, builder: Callable[['LazyPlanes'], Any]):
+        """Plane builder'ini ro'yxatga olish (hali hisoblanmaydi)"""
+        self._builders[name] = builder
+        self._values.pop(name, None)
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+
+        builder = self._builders.get(name)
+        if builder is None:
+            raise KeyError(name)
+
+        start = time.perf_counter()
+        value = builder(self)
+        self.timings[name] = (time.perf_counter() - start) * 1000
+        logger.debug(f"Plane '{name}' built in {self.timings[name]:.1f}ms")
+
+        self._values[name] = value
+        return value
+
+    def __setitem__(self, name: str, value: Any):
+        self._values[name] = value
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._values or name in self._builders
+
+    def get(self, name: str, default: Any = None) -> Any:
+        if name not in self:
+            return default
+        return self[name]
+
+    def computed(self) -> List[str]:
+        """Hozirgacha hisoblangan plane'lar"""
+        return list(self._values)
+
+
+# Parametrik plane'lar: nom -> operatsiya. 'op@base' - op base plane'ga qo'llanadi,
+# base ko'rsatilmasa 'gray' (masalan 'otsu_inv@clahe_2', 'clahe_3@close_2@bilateral_9')
+PLANE_OPS = [
+    (re.compile(r'clahe_(\d+(?:\.\d+)?)'),
+     lambda base, clip: cv2.createCLAHE(clipLimit=float(clip), tileGridSize=(8, 8)).apply(base)),
+    (re.compile(r'otsu(_inv)?'),
+     lambda base, inv: cv2.threshold(
+         base, 0, 255, (cv2.THRESH_BINARY_INV if inv else cv2.THRESH_BINARY) + cv2.THRESH_OTSU
+     )[1]),
+    (re.compile(r'adaptive(_inv)?_(\d+)_(\d+)'),
+     lambda base, inv, block, c: cv2.adaptiveThreshold(
+         base, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+         cv2.THRESH_BINARY_INV if inv else cv2.THRESH_BINARY, int(block), int(c)
+     )),
+    (re.compile(r'fixed(_inv)?_(\d+)'),
+     lambda base, inv, level: cv2.threshold(
+         base, int(level), 255, cv2.THRESH_BINARY_INV if inv else cv2.THRESH_BINARY
+     )[1]),
+    (re.compile(r'bilateral_(\d+)'),
+     lambda base, d: cv2.bilateralFilter(base, int(d), 75, 75)),
+    (re.compile(r'close_(\d+)'),
+     lambda base, k: cv2.morphologyEx(base, cv2.MORPH_CLOSE, np.ones((int(k), int(k)), np.uint8))),
+    (re.compile(r'open_(\d+)'),
+     lambda base, k: cv2.morphologyEx(base, cv2.MORPH_OPEN, np.ones((int(k), int(k)), np.uint8))),
+]
+
+
+class ImagePlanes(LazyPlanes):
+    """
+    Bitta sahifa uchun hosila rasmlar DAG'i (gray, clahe_2, otsu_inv, adaptive_15_3, ...)
+
+    Parametrik nomlar PLANE_OPS orqali talab bo'yicha quriladi, maxsus plane'lar
+    register() bilan qo'shiladi. Har bir plane ko'pi bilan bir marta hisoblanadi -
+    parallel thread'lar (racing mode) bir xil plane'ni kutib turadi.
+    Qurilgan massivlar joriy plane_scope'ga yoziladi, shuning uchun ularni olgan
+    servis get_image_planes(massiv) orqali shu grafning view'iga qaytadi.
+    """
+
+    def __init__(self, source: np.ndarray, scope: Optional['PlaneScope'] = None):
+        super().__init__()
+        self.source = source
+        self.scope = scope
+        self._lock = threading.Lock()
+        self._plane_locks: Dict[str, threading.Lock] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+
+        with self._lock:
+            plane_lock = self._plane_locks.setdefault(name, threading.Lock())
+
+        # DAG bo'lgani uchun qulflar doim bog'liqlik tartibida olinadi (deadlock yo'q)
+        with plane_lock:
+            if name in self._values:
+                return self._values[name]
+
+            if name not in self._builders:
+                self._builders[name] = self._resolve(name)
+            value = super().__getitem__(name)
+
+        if self.scope is not None and isinstance(value, np.ndarray):
+            self.scope.bind(value, self, name)
+        return value
+
+    def __contains__(self, name: str) -> bool:
+        if super().__contains__(name):
+            return True
+        try:
+            self._resolve(name)
+        except KeyError:
+            return False
+        return True
+
+    def _resolve(self, name: str) -> Callable[['ImagePlanes'], Any]:
+        """Parametrik nomni builder'ga aylantirish"""
+        if name == 'gray':
+            return lambda p: (
+                cv2.cvtColor(p.source, cv2.COLOR_BGR2GRAY) if len(p.source.shape) == 3 else p.source
+            )
+
+        op, _, base = name.partition('@')
+        base = base or 'gray'
+        for pattern, builder in PLANE_OPS:
+            match = pattern.fullmatch(op)
+            if match:
+                return lambda p, builder=builder, args=match.groups(): builder(p[base], *args)
+
+        raise KeyError(name)
+
+    def view(self, base: str) -> 'PlaneView':
+        """base plane'ni 'gray' deb ko'radigan view (nomlar '@base' bilan to'ldiriladi)"""
+        return PlaneView(self, base)
+
+
+class PlaneView:
+    """
+    ImagePlanes ichidagi plane'ga nisbatan ko'rinish:
+    view('clahe_2')['otsu_inv'] == planes['otsu_inv@clahe_2']
+    """
+
+    def __init__(self, planes: ImagePlanes, base: str):
+        self.planes = planes
+        self.base = base
+
+    def qualify(self, name: str) -> str:
+        return self.base if name == 'gray' else f'{name}@{self.base}'
+
+    def __getitem__(self, name: str) -> Any:
+        return self.planes[self.qualify(name)]
+
+    def __contains__(self, name: str) -> bool:
+        return self.qualify(name) in self.planes
+
+    def get(self, name: str, default: Any = None) -> Any:
+        if name not in self:
+            return default
+        return self[name]
+
+    def computed(self) -> List[str]:
+        return self.planes.computed()
+
+
+class PlaneScope:
+    """
+    So'rov davomidagi massiv -> (graf, plane nomi) bog'lanishlari
+
+    Massivlar scope yopilguncha kuchli havola bilan saqlanadi, shuning uchun
+    id() qayta ishlatilishi mumkin emas.
+    """
+
+    def __init__(self):
+        self._planes: Dict[int, Tuple[np.ndarray, ImagePlanes, str]] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, image: np.ndarray, planes: ImagePlanes, name: str):
+        with self._lock:
+            # Birinchi bog'lanish qoladi ('gray' manba massivning o'zi bo'lishi mumkin)
+            self._planes.setdefault(id(image), (image, planes, name))
+
+    def lookup(self, image: np.ndarray) -> Optional[Union[ImagePlanes, PlaneView]]:
+        with self._lock:
+            entry = self._planes.get(id(image))
+        if entry is None or entry[0] is not image:
+            return None
+        _, planes, name = entry
+        if name in ('source', 'gray'):
+            return planes
+        return planes.view(name)
+
+
+_current_scope: ContextVar[Optional[PlaneScope]] = ContextVar('plane_scope', default=None)
+
+
+@contextmanager
+def plane_scope():
+    """
+    So'rov uchun plane cache (decorator sifatida ham: @plane_scope())
+
+    Ichma-ich chaqirilsa tashqi scope ishlatiladi. Worker thread'larga
+    contextvars.copy_context() orqali uzatiladi.
+    """
+    if _current_scope.get() is not None:
+        yield _current_scope.get()
+        return
+
+    token = _current_scope.set(PlaneScope())
+    try:
+        yield _current_scope.get()
+    finally:
+        _current_scope.reset(token)
+
+
+def get_image_planes(image: np.ndarray) -> Union[ImagePlanes, PlaneView]:
+    """
+    Rasm uchun plane grafi: avval joriy scope'da qurilgan plane bo'lsa uning
+    view'i, aks holda yangi graf (scope bo'lsa unga yoziladi)
+
+    planes['gray'] doim shu rasmning grayscale'i.
+    """
+    scope = _current_scope.get()
+    if scope is not None:
+        planes = scope.lookup(image)
+        if planes is not None:
+            return planes
+
+    planes = ImagePlanes(image, scope)
+    if scope is not None:
+        scope.bind(image, planes, 'source')
+    return planes
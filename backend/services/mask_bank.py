@@ -0,0 +1,119 @@
+"""
+Mask Bank - bubble tahlili uchun oldindan chizilgan disk/annulus mask'lar
+Har bir bubble uchun np.zeros + cv2.circle o'rniga process bo'yicha umumiy LRU
+
+Kalit - (ROI o'lchami, ROI ichidagi markaz, piksel radius(lar)i). Varaqdagi
+bubble'lar bir xil radiusga ega va ROI'lar markaz atrofida kesiladi, shuning
+uchun barqaror holatda (rasm chetidan tashqari) bir nechta mask butun varaqqa
+yetadi. Mask'lar aynan per-bubble yo'ldagi kabi cv2.circle bilan chiziladi
+(natijalar bir xil) va read-only bool massiv + piksellar soni sifatida qaytadi.
+Chaqiruvchilar ratio'larni piksel radiusga o'zlari o'giradi (int(radius * ratio)),
+shuning uchun turli ratio'lar bir xil radiusga tushsa, bitta mask ishlatiladi.
+"""
+import cv2
+import numpy as np
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Shape = Tuple[int, int]
+Center = Tuple[int, int]
+MaskEntry = Tuple[np.ndarray, int]  # (bool mask, True piksellar soni)
+
+
+def _draw(shape: Shape, center: Center, outer_radius: int, inner_radius: int = -1) -> MaskEntry:
+    """cv2.circle rasterizatsiyasi: outer doira, inner_radius >= 0 bo'lsa ichi o'chiriladi"""
+    canvas = np.zeros(shape, dtype=np.uint8)
+    if outer_radius >= 0:
+        # radius=0 ham bitta piksel chizadi (cv2.circle xatti-harakati)
+        cv2.circle(canvas, center, outer_radius, 255, -1)
+    if inner_radius >= 0:
+        cv2.circle(canvas, center, inner_radius, 0, -1)
+
+    mask = canvas > 0
+    mask.setflags(write=False)
+    return mask, int(np.count_nonzero(mask))
+
+
+class MaskBank:
+    """
+    Disk va annulus mask'lari uchun thread-safe LRU (hajm bo'yicha eviction)
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+
+        self._entries: 'OrderedDict[Tuple, MaskEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get(self, key: Tuple, shape: Shape, center: Center, outer_radius: int, inner_radius: int) -> MaskEntry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        # Chizish lock'dan tashqarida - parallel miss'da ikki marta chizilishi zararsiz
+        entry = _draw(shape, center, outer_radius, inner_radius)
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+        return entry
+
+    def disk(self, shape: Shape, center: Center, radius: int) -> MaskEntry:
+        """
+        To'ldirilgan doira: np.zeros(shape) + cv2.circle(center, radius, -1)
+
+        Args:
+            shape: ROI (height, width)
+            center: ROI ichidagi markaz (x, y)
+            radius: piksel radius (manfiy bo'lsa bo'sh mask)
+        """
+        shape = (int(shape[0]), int(shape[1]))
+        center = (int(center[0]), int(center[1]))
+        radius = int(radius)
+        return self._get(('disk', shape, center, radius), shape, center, radius, -1)
+
+    def annulus(self, shape: Shape, center: Center, outer_radius: int, inner_radius: int) -> MaskEntry:
+        """
+        Halqa: outer_radius doirasi, inner_radius doirasi o'chirilgan
+        (per-bubble yo'ldagi ikki marta cv2.circle bilan bir xil)
+        """
+        shape = (int(shape[0]), int(shape[1]))
+        center = (int(center[0]), int(center[1]))
+        outer_radius, inner_radius = int(outer_radius), int(inner_radius)
+        return self._get(
+            ('annulus', shape, center, outer_radius, inner_radius),
+            shape, center, outer_radius, inner_radius
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+mask_bank = MaskBank(settings.MASK_BANK_SIZE)
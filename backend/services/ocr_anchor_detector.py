@@ -1,13 +1,28 @@
 """
 OCR-Based Anchor Detection System
 Savol raqamlarini OCR bilan topib, bubble'larni nisbiy pozitsiyada aniqlash
+
+OCR_ANCHOR_MODE='strips' (default): butun sahifa o'rniga faqat savol raqamlari
+bo'lishi mumkin bo'lgan tor ustun chiziqlari (layout'dan - birinchi bubble'dan
+chapda) OCR qilinadi. Har bir chiziq overlap'li bandlarga bo'linib thread'larda
+parallel o'qiladi; tesserocr o'rnatilgan bo'lsa har thread'da bitta doimiy
+PyTessBaseAPI (subprocess yo'q), aks holda pytesseract. Natija
+(exam id, varaq fingerprint) bo'yicha cache'lanadi - retry va qayta tekshirishda
+OCR qayta ishlamaydi.
 """
 import cv2
 import numpy as np
+import hashlib
 import logging
 import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 
+from config import settings
+from services.lazy_planes import get_image_planes
+
 logger = logging.getLogger(__name__)
 
 # Try to import pytesseract
@@ -19,6 +34,113 @@ except ImportError:
     TESSERACT_AVAILABLE = False
     logger.warning("Tesseract OCR not available - OCR anchor detection disabled")
 
+# Optional: in-process Tesseract API (har chaqiruvda subprocess o'rniga)
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+    logger.info("tesserocr available - in-process OCR for anchor strips")
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+OCR_WHITELIST = '0123456789.'
+STRIP_PADDING_PX = 10  # oq chegara - Tesseract qirrada turgan raqamlarni yaxshiroq o'qiydi
+MIN_WORD_CONFIDENCE = 50
+
+Word = Tuple[str, float, int, int, int, int]  # (text, conf, left, top, width, height)
+
+_tesserocr_local = threading.local()
+
+_strip_executor = None
+_strip_executor_lock = threading.Lock()
+
+
+def _get_strip_executor() -> ThreadPoolExecutor:
+    """Process bo'yicha umumiy pool - thread'lar (va ularning tesserocr handle'lari) qayta ishlatiladi"""
+    global _strip_executor
+    with _strip_executor_lock:
+        if _strip_executor is None:
+            _strip_executor = ThreadPoolExecutor(
+                max_workers=max(1, settings.OCR_STRIP_WORKERS),
+                thread_name_prefix='ocr-strip'
+            )
+        return _strip_executor
+
+
+def _get_tesserocr_api():
+    """Thread bo'yicha bitta PyTessBaseAPI (instance thread-safe emas)"""
+    api = getattr(_tesserocr_local, 'api', None)
+    if api is None:
+        api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.DEFAULT)
+        api.SetVariable('tessedit_char_whitelist', OCR_WHITELIST)
+        _tesserocr_local.api = api
+    return api
+
+
+def resolve_ocr_engine(engine: Optional[str] = None) -> Optional[str]:
+    """'auto' -> tesserocr (bo'lsa) yoki pytesseract; mavjud engine bo'lmasa None"""
+    engine = (engine or settings.OCR_ENGINE).lower()
+    if engine in ('auto', 'tesserocr') and TESSEROCR_AVAILABLE:
+        return 'tesserocr'
+    if engine == 'tesserocr':
+        logger.warning("OCR_ENGINE=tesserocr but tesserocr is not installed - using pytesseract")
+    return 'pytesseract' if TESSERACT_AVAILABLE else None
+
+
+def sheet_fingerprint(image: np.ndarray) -> str:
+    """Varaq piksellarining hash'i (bir xil upload/retry -> bir xil fingerprint)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((image.shape, str(image.dtype))).encode('utf-8'))
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+class AnchorCache:
+    """
+    (exam id, sheet fingerprint, mode) -> OCR anchor'lar - thread-safe LRU
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+
+        self._entries: 'OrderedDict[Tuple, List[Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[List[Dict]]:
+        with self._lock:
+            anchors = self._entries.get(key)
+            if anchors is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(anchor) for anchor in anchors]
+
+    def put(self, key: Tuple, anchors: List[Dict]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = [dict(anchor) for anchor in anchors]
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+anchor_cache = AnchorCache(settings.OCR_ANCHOR_CACHE_SIZE)
+
 class OCRAnchorDetector:
     """
     OCR yordamida savol raqamlarini topib, bubble'larni aniqlash
@@ -36,12 +158,20 @@ class OCRAnchorDetector:
         self.first_bubble_offset_mm = 8  # Raqamdan birinchi bubble'gacha
         
         # OCR konfiguratsiya
-        self.ocr_config = '--psm 6 --oem 3 -c tessedit_char_whitelist=0123456789.'
+        self.ocr_config = f'--psm 6 --oem 3 -c tessedit_char_whitelist={OCR_WHITELIST}'
+        self.mode = settings.OCR_ANCHOR_MODE  # 'strips' or 'full'
+        self.engine = resolve_ocr_engine()
+        
+        # Strip geometriyasi (mm)
+        self.strip_margin_mm = settings.OCR_STRIP_MARGIN_MM
+        self.band_height_mm = settings.OCR_STRIP_BAND_MM
+        self.band_overlap_mm = 12  # ~2 qator - band chegarasidagi raqam ikkalasida ham to'liq
         
     def detect_question_numbers(
         self,
         image: np.ndarray,
-        expected_count: int
+        expected_count: int,
+        exam_structure: Optional[Dict] = None
     ) -> List[Dict]:
         """
         Savol raqamlarini OCR bilan topish
@@ -49,46 +179,193 @@ class OCRAnchorDetector:
         Args:
             image: Grayscale image
             expected_count: Kutilayotgan savollar soni
+            exam_structure: Berilsa (va mode='strips') faqat layout'dagi raqam
+                ustunlari OCR qilinadi, aks holda butun sahifa
             
         Returns:
             list: [{'number': 1, 'x': px, 'y': px, 'confidence': 0-100}, ...]
         """
         # Check if Tesseract is available
-        if not TESSERACT_AVAILABLE:
+        if self.engine is None:
             logger.warning("Tesseract not available - skipping OCR detection")
             return []
         
-        logger.info(f"Detecting {expected_count} question numbers using OCR...")
+        logger.info(f"Detecting {expected_count} question numbers using OCR ({self.mode}, {self.engine})...")
         
-        # Image preprocessing for better OCR
-        # 1. Binarization
-        _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # Image preprocessing for better OCR (so'rov plane grafidan)
+        # 1. Binarization (Otsu) + 2. Morphological close to clean up
+        cleaned = get_image_planes(image)['close_2@otsu']
         
-        # 2. Morphological operations to clean up
-        kernel = np.ones((2, 2), np.uint8)
-        cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        regions = None
+        if self.mode == 'strips' and exam_structure is not None:
+            try:
+                regions = self.strip_regions(cleaned.shape[1], cleaned.shape[0], exam_structure)
+            except Exception as e:
+                logger.warning(f"Strip layout failed ({e}) - OCR on the full page")
         
         # 3. OCR with Tesseract
         try:
-            # Get detailed OCR data
-            ocr_data = pytesseract.image_to_data(
-                cleaned,
-                config=self.ocr_config,
-                output_type=pytesseract.Output.DICT
-            )
+            if regions:
+                question_numbers = self._ocr_regions(cleaned, regions)
+            else:
+                question_numbers = self._parse_words(self._ocr_words(cleaned), 0, 0)
         except Exception as e:
             logger.error(f"OCR failed: {e}")
             return []
         
-        # Parse OCR results
+        # Sort by number
+        question_numbers.sort(key=lambda q: q['number'])
+        
+        logger.info(f"OCR detected {len(question_numbers)}/{expected_count} question numbers")
+        
+        return question_numbers
+    
+    def strip_regions(
+        self,
+        image_width: int,
+        image_height: int,
+        exam_structure: Dict
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Savol raqamlari joylashishi mumkin bo'lgan band'lar (x1, y1, x2, y2) px
+        
+        Har bir savol ustuni uchun: x - raqam joyidan (birinchi bubble - offset)
+        margin bilan birinchi bubble chetigacha; y - sarlavha offset'li va offset'siz
+        layout'lar qamrovi. Ustun balandligi band_height_mm bo'laklarga bo'linadi.
+        """
+        from utils.coordinate_mapper import CoordinateMapper
+        from utils.layout_cache import get_grid_layout, grid_layout_params
+        
+        mapper = CoordinateMapper(image_width, image_height, exam_structure)
+        params = grid_layout_params(mapper)
+        px_per_mm_x = image_width / 210
+        px_per_mm_y = image_height / 297
+        
+        # Ustun -> (bubble A x, min y, max y) mm, ikkala sarlavha varianti bo'yicha
+        columns: Dict[float, List[float]] = {}
+        for header_offsets in (False, True):
+            layout = get_grid_layout(exam_structure, params, header_offsets)
+            first_points = layout.points[layout.offsets[:-1]]
+            for x_mm, y_mm, _ in first_points.tolist():
+                key = round(x_mm, 1)
+                span = columns.setdefault(key, [y_mm, y_mm])
+                span[0] = min(span[0], y_mm)
+                span[1] = max(span[1], y_mm)
+        
+        margin = self.strip_margin_mm
+        band_step = max(self.band_height_mm - self.band_overlap_mm, 1.0)
+        regions = []
+        
+        for bubble_x_mm, (y_min_mm, y_max_mm) in sorted(columns.items()):
+            x1 = (bubble_x_mm - params['first_bubble_offset_mm'] - margin) * px_per_mm_x
+            x2 = (bubble_x_mm - params['bubble_radius_mm']) * px_per_mm_x
+            x1 = max(0, int(x1))
+            x2 = min(image_width, int(np.ceil(x2)))
+            
+            top_mm = max(0.0, y_min_mm - margin)
+            bottom_mm = min(297.0, y_max_mm + margin)
+            band_top_mm = top_mm
+            while True:
+                band_bottom_mm = min(band_top_mm + self.band_height_mm, bottom_mm)
+                y1 = max(0, int(band_top_mm * px_per_mm_y))
+                y2 = min(image_height, int(np.ceil(band_bottom_mm * px_per_mm_y)))
+                if x2 > x1 and y2 > y1:
+                    regions.append((x1, y1, x2, y2))
+                if band_bottom_mm >= bottom_mm:
+                    break
+                band_top_mm += band_step
+        
+        strip_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        logger.info(
+            f"OCR strips: {len(columns)} columns, {len(regions)} bands, "
+            f"{100.0 * strip_area / (image_width * image_height):.1f}% of page"
+        )
+        return regions
+    
+    def _ocr_regions(self, cleaned: np.ndarray, regions: List[Tuple[int, int, int, int]]) -> List[Dict]:
+        """
+        Band'larni parallel OCR qilish; overlap'da takrorlangan raqamlardan
+        eng ishonchlisi qoladi
+        """
+        def ocr_band(region):
+            x1, y1, x2, y2 = region
+            band = cv2.copyMakeBorder(
+                cleaned[y1:y2, x1:x2],
+                STRIP_PADDING_PX, STRIP_PADDING_PX, STRIP_PADDING_PX, STRIP_PADDING_PX,
+                cv2.BORDER_CONSTANT, value=255
+            )
+            return self._parse_words(
+                self._ocr_words(band),
+                x1 - STRIP_PADDING_PX,
+                y1 - STRIP_PADDING_PX
+            )
+        
+        best: Dict[int, Dict] = {}
+        for anchors in _get_strip_executor().map(ocr_band, regions):
+            for anchor in anchors:
+                current = best.get(anchor['number'])
+                if current is None or anchor['confidence'] > current['confidence']:
+                    best[anchor['number']] = anchor
+        
+        return list(best.values())
+    
+    def _ocr_words(self, image: np.ndarray) -> List[Word]:
+        """Rasmdagi so'zlar (text, conf, left, top, width, height) - tanlangan engine bilan"""
+        if self.engine == 'tesserocr':
+            try:
+                return self._tesserocr_words(image)
+            except Exception as e:
+                if not TESSERACT_AVAILABLE:
+                    raise
+                logger.warning(f"tesserocr failed ({e}) - using pytesseract")
+        
+        # Get detailed OCR data
+        ocr_data = pytesseract.image_to_data(
+            image,
+            config=self.ocr_config,
+            output_type=pytesseract.Output.DICT
+        )
+        return [
+            (
+                ocr_data['text'][i],
+                float(ocr_data['conf'][i]),
+                ocr_data['left'][i],
+                ocr_data['top'][i],
+                ocr_data['width'][i],
+                ocr_data['height'][i]
+            )
+            for i in range(len(ocr_data['text']))
+        ]
+    
+    def _tesserocr_words(self, image: np.ndarray) -> List[Word]:
+        api = _get_tesserocr_api()
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape[:2]
+        api.SetImageBytes(image.tobytes(), width, height, 1, width)
+        api.Recognize()
+        
+        level = tesserocr.RIL.WORD
+        words = []
+        iterator = api.GetIterator()
+        for word in tesserocr.iterate_level(iterator, level):
+            text = word.GetUTF8Text(level)
+            box = word.BoundingBox(level)
+            if not text or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            words.append((text, word.Confidence(level), x1, y1, x2 - x1, y2 - y1))
+        return words
+    
+    def _parse_words(self, words: List[Word], offset_x: int, offset_y: int) -> List[Dict]:
+        """OCR so'zlaridan savol raqamlari (koordinatalar sahifa piksellarida)"""
         question_numbers = []
         
-        for i in range(len(ocr_data['text'])):
-            text = ocr_data['text'][i].strip()
-            conf = int(ocr_data['conf'][i])
+        for text, conf, x, y, w, h in words:
+            text = text.strip()
+            conf = int(conf)
             
             # Skip low confidence or empty
-            if conf < 50 or not text:
+            if conf < MIN_WORD_CONFIDENCE or not text:
                 continue
             
             # Check if it's a question number (e.g., "1.", "2.", "10.")
@@ -97,10 +374,8 @@ class OCRAnchorDetector:
                 number = int(match.group(1))
                 
                 # Get bounding box
-                x = ocr_data['left'][i]
-                y = ocr_data['top'][i]
-                w = ocr_data['width'][i]
-                h = ocr_data['height'][i]
+                x += offset_x
+                y += offset_y
                 
                 # Center of number
                 center_x = x + w // 2
@@ -116,11 +391,6 @@ class OCRAnchorDetector:
                 
                 logger.debug(f"Found Q{number} at ({center_x}, {center_y}), conf={conf}%")
         
-        # Sort by number
-        question_numbers.sort(key=lambda q: q['number'])
-        
-        logger.info(f"OCR detected {len(question_numbers)}/{expected_count} question numbers")
-        
         return question_numbers
     
     def calculate_bubble_positions(
@@ -193,8 +463,19 @@ class OCRAnchorDetector:
         
         logger.info(f"Starting OCR-based anchor detection for {total_questions} questions")
         
-        # Detect question numbers
-        anchors = self.detect_question_numbers(image, total_questions)
+        # Detect question numbers ((exam id, fingerprint) bo'yicha cache)
+        exam_id = exam_structure.get('id') or hashlib.sha1(
+            repr(exam_structure.get('subjects')).encode('utf-8')
+        ).hexdigest()
+        cache_key = (str(exam_id), sheet_fingerprint(image), self.mode)
+        anchors = anchor_cache.get(cache_key)
+        
+        if anchors is None:
+            anchors = self.detect_question_numbers(image, total_questions, exam_structure)
+            if anchors:
+                anchor_cache.put(cache_key, anchors)
+        else:
+            logger.info(f"OCR anchors reused from cache: {len(anchors)} question numbers")
         
         if len(anchors) < total_questions * 0.8:  # At least 80% detected
             logger.warning(f"Only {len(anchors)}/{total_questions} anchors detected!")
@@ -2,11 +2,13 @@
 Professional OMR Bubble Detection - FIXED VERSION
 Multi-parameter analysis with comparative algorithm
 """
-import cv2
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import logging
 
+from services.bubble_scorer import BatchBubbleScorer
+from services.mask_bank import mask_bank
+
 logger = logging.getLogger(__name__)
 
 class OMRDetector:
@@ -25,6 +27,7 @@ class OMRDetector:
         self.min_darkness = min_darkness
         self.min_difference = min_difference
         self.multiple_marks_threshold = multiple_marks_threshold
+        self.batch_scorer = BatchBubbleScorer()
         
     def detect_all_answers(
         self,
@@ -37,6 +40,9 @@ class OMRDetector:
         """
         logger.info("Starting Professional OMR detection...")
         
+        # Barcha bubble'larni bir marta vektorlashtirilgan tahlil qilish
+        precomputed = self._analyze_all_bubbles(image, coordinates)
+        
         results = {}
         stats = {
             'total': 0,
@@ -63,7 +69,9 @@ class OMRDetector:
                     stats['total'] += 1
                     
                     # PROFESSIONAL DETECTION
-                    result = self.detect_single_question(image, coords)
+                    result = self.detect_single_question(
+                        image, coords, precomputed.get(q_num)
+                    )
                     
                     # Update statistics
                     if result['answer']:
@@ -91,24 +99,75 @@ class OMRDetector:
             'statistics': stats
         }
     
+    def _analyze_all_bubbles(self, image: np.ndarray, coordinates: Dict) -> Dict:
+        """
+        Varaqdagi barcha bubble'lar tahlili: {q_num: [analysis, ...]}
+        """
+        keys = []
+        bubbles = []
+        for q_num, coords in coordinates.items():
+            for bubble in coords.get('bubbles', []):
+                keys.append(q_num)
+                bubbles.append(bubble)
+        
+        precomputed = {}
+        for q_num, analysis in zip(keys, self.analyze_bubbles(image, bubbles)):
+            precomputed.setdefault(q_num, []).append(analysis)
+        
+        return precomputed
+    
+    def analyze_bubbles(
+        self,
+        image: np.ndarray,
+        bubbles: List[Dict]
+    ) -> List[Dict]:
+        """
+        Ko'p bubble'ni bir vaqtda tahlil qilish - analyze_bubble bilan bir xil natija
+        
+        Rasm chetidagi bubble'lar uchun analyze_bubble ishlatiladi.
+        """
+        stats = self.batch_scorer.disk_stats(
+            image, bubbles,
+            roi_scale=1.1,
+            radius_ratios=(1.0, 0.8),
+            threshold='fixed',
+            fixed_threshold=127
+        )
+        full = stats[1.0]
+        inner = stats[0.8]
+        
+        analyses = []
+        for i, bubble in enumerate(bubbles):
+            if stats['valid'][i]:
+                analysis = self._build_analysis(
+                    float(full['darkness'][i]),
+                    float(full['dark_percent'][i]),
+                    float(inner['dark_percent'][i])
+                )
+            else:
+                analysis = self.analyze_bubble(image, bubble)
+            
+            analyses.append({
+                'variant': bubble['variant'],
+                **analysis
+            })
+        
+        return analyses
+    
     def detect_single_question(
         self,
         image: np.ndarray,
-        coords: Dict
+        coords: Dict,
+        analyses: Optional[List[Dict]] = None
     ) -> Dict:
         """
         Bitta savolni aniqlash - Multi-parameter comparative analysis
         """
         bubbles = coords['bubbles']
-        analyses = []
         
         # Har bir variantni tahlil qilish
-        for bubble in bubbles:
-            analysis = self.analyze_bubble(image, bubble)
-            analyses.append({
-                'variant': bubble['variant'],
-                **analysis
-            })
+        if analyses is None:
+            analyses = self.analyze_bubbles(image, bubbles)
         
         # COMPARATIVE DECISION MAKING
         decision = self.make_decision(analyses)
@@ -150,43 +209,39 @@ class OMRDetector:
         if roi.size == 0:
             return {'darkness': 0, 'coverage': 0, 'fill_ratio': 0, 'inner_fill': 0, 'score': 0}
         
-        # Create TWO masks: FULL circle and INNER circle (80% radius)
+        # TWO masks: FULL circle and INNER circle (80% radius) - umumiy mask_bank'dan
         center = (center_x, center_y)
-        
-        # Full circle mask
-        full_mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(full_mask, center, radius, 255, -1)
+        full_pixels, full_count = mask_bank.disk(roi.shape[:2], center, radius)
         
         # Inner circle mask (80% radius) - to exclude edge marks
         inner_radius = int(radius * 0.8)
-        inner_mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(inner_mask, center, inner_radius, 255, -1)
+        inner_pixels, inner_count = mask_bank.disk(roi.shape[:2], center, inner_radius)
         
-        # Extract pixels
-        full_masked = cv2.bitwise_and(roi, roi, mask=full_mask)
-        inner_masked = cv2.bitwise_and(roi, roi, mask=inner_mask)
-        
-        full_pixels = full_mask > 0
-        inner_pixels = inner_mask > 0
-        
-        if np.sum(full_pixels) == 0:
+        if full_count == 0:
             return {'darkness': 0, 'coverage': 0, 'fill_ratio': 0, 'inner_fill': 0, 'score': 0}
         
+        # Extract pixels
+        full_values = roi[full_pixels]
+        
         # 1. DARKNESS (qoralik) - Average darkness in FULL circle
-        inverted = 255 - full_masked
-        darkness = float(np.mean(inverted[full_pixels]) / 255 * 100)
+        darkness = float(np.mean(255 - full_values) / 255 * 100)
         
         # 2. COVERAGE (qoplash) - Percentage of dark pixels in FULL circle
-        _, binary = cv2.threshold(full_masked, 127, 255, cv2.THRESH_BINARY_INV)
-        coverage = float(np.sum(binary[full_pixels] > 0) / np.sum(full_pixels) * 100)
+        # (THRESH_BINARY_INV 127: piksel <= 127 -> qora)
+        coverage = float(np.count_nonzero(full_values <= 127) / full_count * 100)
         
         # 3. FILL RATIO - Percentage of dark pixels in INNER circle (CRITICAL!)
-        if np.sum(inner_pixels) > 0:
-            _, inner_binary = cv2.threshold(inner_masked, 127, 255, cv2.THRESH_BINARY_INV)
-            fill_ratio = float(np.sum(inner_binary[inner_pixels] > 0) / np.sum(inner_pixels) * 100)
+        if inner_count > 0:
+            fill_ratio = float(np.count_nonzero(roi[inner_pixels] <= 127) / inner_count * 100)
         else:
             fill_ratio = 0
         
+        return self._build_analysis(darkness, coverage, fill_ratio)
+    
+    def _build_analysis(self, darkness: float, coverage: float, fill_ratio: float) -> Dict:
+        """
+        Metrikalardan yakuniy score (per-bubble va batch yo'l uchun umumiy)
+        """
         # 4. INNER FILL - How much of the INNER circle is filled
         inner_fill = fill_ratio
         
@@ -7,6 +7,8 @@ import numpy as np
 from typing import List, Optional, Tuple
 import logging
 
+from services.corner_engine import get_corner_engine, use_corner_engine
+
 logger = logging.getLogger(__name__)
 
 class PhotoCornerDetector:
@@ -39,6 +41,13 @@ class PhotoCornerDetector:
         """
         logger.info("Starting photo corner detection...")
         
+        if use_corner_engine():
+            markers = get_corner_engine('photo').detect(image)
+            if len(markers) == 4:
+                return [(marker['x'], marker['y']) for marker in markers]
+            logger.warning("All corner detection methods failed")
+            return None
+        
         # Convert to grayscale if needed
         if len(image.shape) == 3:
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -4,9 +4,12 @@ More lenient detection for photos (not PDF-generated exams)
 """
 import cv2
 import numpy as np
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 
+from services.bubble_scorer import BatchBubbleScorer
+from services.mask_bank import mask_bank
+
 logger = logging.getLogger(__name__)
 
 class PhotoOMRDetector:
@@ -30,6 +33,7 @@ class PhotoOMRDetector:
         self.min_darkness = min_darkness
         self.min_difference = min_difference
         self.multiple_marks_threshold = multiple_marks_threshold
+        self.batch_scorer = BatchBubbleScorer()
         
     def detect_all_answers(
         self,
@@ -42,6 +46,9 @@ class PhotoOMRDetector:
         """
         logger.info("Starting Photo OMR detection (lenient mode)...")
         
+        # Barcha bubble'larni bir marta vektorlashtirilgan tahlil qilish
+        precomputed = self._analyze_all_bubbles(image, coordinates)
+        
         results = {}
         stats = {
             'total': 0,
@@ -68,7 +75,9 @@ class PhotoOMRDetector:
                     stats['total'] += 1
                     
                     # PHOTO DETECTION (lenient)
-                    result = self.detect_single_question(image, coords)
+                    result = self.detect_single_question(
+                        image, coords, precomputed.get(q_num)
+                    )
                     
                     # Update statistics
                     if result['answer']:
@@ -96,24 +105,70 @@ class PhotoOMRDetector:
             'statistics': stats
         }
     
+    def _analyze_all_bubbles(self, image: np.ndarray, coordinates: Dict) -> Dict:
+        """
+        Varaqdagi barcha bubble'lar tahlili: {q_num: [analysis, ...]}
+        """
+        keys = []
+        bubbles = []
+        for q_num, coords in coordinates.items():
+            for bubble in coords.get('bubbles', []):
+                keys.append(q_num)
+                bubbles.append(bubble)
+        
+        precomputed = {}
+        for q_num, analysis in zip(keys, self.analyze_bubbles(image, bubbles)):
+            precomputed.setdefault(q_num, []).append(analysis)
+        
+        return precomputed
+    
+    def analyze_bubbles(
+        self,
+        image: np.ndarray,
+        bubbles: List[Dict]
+    ) -> List[Dict]:
+        """
+        Ko'p bubble'ni bir vaqtda tahlil qilish - analyze_bubble bilan bir xil natija
+        """
+        stats = self.batch_scorer.disk_stats(
+            image, bubbles,
+            roi_scale=1.2,
+            radius_ratios=(1.0,),
+            threshold='otsu'
+        )
+        circle = stats[1.0]
+        
+        analyses = []
+        for i, bubble in enumerate(bubbles):
+            if stats['valid'][i]:
+                analysis = self._build_analysis(
+                    float(circle['darkness'][i]),
+                    float(circle['dark_percent'][i])
+                )
+            else:
+                analysis = self.analyze_bubble(image, bubble)
+            
+            analyses.append({
+                'variant': bubble['variant'],
+                **analysis
+            })
+        
+        return analyses
+    
     def detect_single_question(
         self,
         image: np.ndarray,
-        coords: Dict
+        coords: Dict,
+        analyses: Optional[List[Dict]] = None
     ) -> Dict:
         """
         Bitta savolni aniqlash - LENIENT for photos
         """
         bubbles = coords['bubbles']
-        analyses = []
         
         # Har bir variantni tahlil qilish
-        for bubble in bubbles:
-            analysis = self.analyze_bubble(image, bubble)
-            analyses.append({
-                'variant': bubble['variant'],
-                **analysis
-            })
+        if analyses is None:
+            analyses = self.analyze_bubbles(image, bubbles)
         
         # LENIENT DECISION MAKING
         decision = self.make_decision(analyses)
@@ -160,18 +215,16 @@ class PhotoOMRDetector:
         if roi.size == 0:
             return {'darkness': 0, 'coverage': 0, 'score': 0}
         
-        # Create circle mask
+        # Circle mask (umumiy mask_bank'dan)
         center = (center_x, center_y)
-        mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(mask, center, radius, 255, -1)
+        pixels, pixel_count = mask_bank.disk(roi.shape[:2], center, radius)
         
-        # Extract pixels
-        masked = cv2.bitwise_and(roi, roi, mask=mask)
-        pixels = mask > 0
-        
-        if np.sum(pixels) == 0:
+        if pixel_count == 0:
             return {'darkness': 0, 'coverage': 0, 'score': 0}
         
+        # Extract pixels (Otsu doira tashqarisidagi 0'larni ham hisobga oladi - shuning uchun to'liq ROI)
+        masked = cv2.bitwise_and(roi, roi, mask=pixels.view(np.uint8))
+        
         # 1. DARKNESS - Average darkness
         inverted = 255 - masked
         darkness = float(np.mean(inverted[pixels]) / 255 * 100)
@@ -179,8 +232,14 @@ class PhotoOMRDetector:
         # 2. COVERAGE - Percentage of dark pixels
         # Use ADAPTIVE threshold for photos (better than fixed threshold)
         _, binary = cv2.threshold(masked, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        coverage = float(np.sum(binary[pixels] > 0) / np.sum(pixels) * 100)
+        coverage = float(np.sum(binary[pixels] > 0) / pixel_count * 100)
         
+        return self._build_analysis(darkness, coverage)
+    
+    def _build_analysis(self, darkness: float, coverage: float) -> Dict:
+        """
+        Metrikalardan yakuniy score (per-bubble va batch yo'l uchun umumiy)
+        """
         # 3. SIMPLE SCORE - Just average of darkness and coverage
         # NO strict inner_fill requirement for photos!
         score = (darkness * 0.5 + coverage * 0.5)
@@ -4,9 +4,14 @@ Uses template matching and adaptive detection
 """
 import cv2
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import logging
 
+from services.image_loader import load_image, describe_source
+from services.bubble_finder import exam_cache_key, find_bubble_candidates
+from services.mask_bank import mask_bank
+from utils.spatial_index import as_points, cluster_rows
+
 logger = logging.getLogger(__name__)
 
 class PhotoOMRService:
@@ -32,7 +37,9 @@ class PhotoOMRService:
     def detect_bubbles_automatically(
         self,
         image: np.ndarray,
-        expected_count: int = 200
+        expected_count: int = 200,
+        corners: Optional[List] = None,
+        cache_key: Optional[str] = None
     ) -> List[Dict]:
         """
         Automatically detect all bubbles in image using Hough Circle Transform
@@ -40,58 +47,42 @@ class PhotoOMRService:
         Args:
             image: Grayscale image
             expected_count: Expected number of bubbles (40 questions x 5 variants = 200)
+            corners: Corner markers (if detected) - search is limited to the area between them
+            cache_key: Exam key - winning parameter set is tried first next time
             
         Returns:
             list: [{'x': px, 'y': px, 'radius': px}, ...]
         """
         logger.info(f"Detecting bubbles automatically (expected: {expected_count})...")
         
-        # Enhanced preprocessing for photos
-        # 1. Contrast enhancement (CLAHE)
+        # Enhanced preprocessing for photos (answer grid ROI'da)
         clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(image)
         
-        # 2. Gaussian blur
-        blurred = cv2.GaussianBlur(enhanced, (3, 3), 0)  # Smaller kernel
+        def preprocess(region: np.ndarray) -> np.ndarray:
+            # 1. Contrast enhancement (CLAHE), 2. Gaussian blur
+            return cv2.GaussianBlur(clahe.apply(region), (3, 3), 0)  # Smaller kernel
         
-        # Try multiple parameter sets to find bubbles
+        # Try multiple parameter sets to find bubbles (early exit when count is close)
         param_sets = [
-            {'minRadius': 8, 'maxRadius': 25, 'param2': 25},  # Original parameters
-            {'minRadius': 10, 'maxRadius': 30, 'param2': 20},
-            {'minRadius': 6, 'maxRadius': 20, 'param2': 30},
-            {'minRadius': 12, 'maxRadius': 35, 'param2': 15},
+            {'minRadius': 8, 'maxRadius': 25, 'param2': 25, 'minDist': 25},  # Original parameters
+            {'minRadius': 10, 'maxRadius': 30, 'param2': 20, 'minDist': 25},
+            {'minRadius': 6, 'maxRadius': 20, 'param2': 30, 'minDist': 25},
+            {'minRadius': 12, 'maxRadius': 35, 'param2': 15, 'minDist': 25},
         ]
         
-        best_circles = None
-        best_count_diff = float('inf')
-        
-        for params in param_sets:
-            circles = cv2.HoughCircles(
-                blurred,
-                cv2.HOUGH_GRADIENT,
-                dp=1,
-                minDist=25,
-                param1=50,
-                param2=params['param2'],
-                minRadius=params['minRadius'],
-                maxRadius=params['maxRadius']
-            )
-            
-            if circles is not None:
-                count = len(circles[0])
-                count_diff = abs(count - expected_count)
-                
-                logger.info(f"  Params {params}: Found {count} circles (diff: {count_diff})")
-                
-                if count_diff < best_count_diff:
-                    best_count_diff = count_diff
-                    best_circles = circles
+        circles, _ = find_bubble_candidates(
+            image,
+            param_sets,
+            expected_count=expected_count,
+            preprocess=preprocess,
+            corners=corners,
+            cache_key=('photo_omr', cache_key) if cache_key else None
+        )
         
-        if best_circles is None:
+        if circles is None:
             logger.warning("No circles found with any parameter set!")
             return []
         
-        circles = np.round(best_circles[0, :]).astype("int")
         logger.info(f"✅ Found {len(circles)} bubbles")
         
         # Convert to dict format
@@ -130,24 +121,11 @@ class PhotoOMRService:
         logger.info(f"Mapping {len(bubbles)} bubbles to {total_questions} questions...")
         
         # Sort bubbles by Y (top to bottom), then X (left to right)
-        bubbles_sorted = sorted(bubbles, key=lambda b: (b['y'], b['x']))
-        
-        # Group into rows
-        rows = []
-        current_row = []
-        last_y = -100
-        
-        for bubble in bubbles_sorted:
-            if abs(bubble['y'] - last_y) < 30:  # Same row (30px tolerance)
-                current_row.append(bubble)
-            else:
-                if current_row:
-                    rows.append(current_row)
-                current_row = [bubble]
-            last_y = bubble['y']
-        
-        if current_row:
-            rows.append(current_row)
+        # and group into rows (30px tolerance) - vektorlashtirilgan
+        rows = [
+            [bubbles[i] for i in row]
+            for row in cluster_rows(as_points(bubbles), tolerance=30)
+        ]
         
         logger.info(f"Grouped into {len(rows)} rows")
         
@@ -351,17 +329,15 @@ class PhotoOMRService:
         center_x = x - x1
         center_y = y - y1
         
-        # Full circle mask
-        full_mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(full_mask, (center_x, center_y), radius, 255, -1)
+        # Full circle mask (umumiy mask_bank'dan)
+        full_mask, _ = mask_bank.disk(roi.shape[:2], (center_x, center_y), radius)
         
         # Inner circle mask (70% radius for photos - more lenient)
         inner_radius = int(radius * 0.7)  # Reduced from 0.8 to 0.7
-        inner_mask = np.zeros(roi.shape, dtype=np.uint8)
-        cv2.circle(inner_mask, (center_x, center_y), inner_radius, 255, -1)
+        inner_mask, _ = mask_bank.disk(roi.shape[:2], (center_x, center_y), inner_radius)
         
-        full_pixels = roi[full_mask > 0]
-        inner_pixels = roi[inner_mask > 0] if inner_radius > 0 else full_pixels
+        full_pixels = roi[full_mask]
+        inner_pixels = roi[inner_mask] if inner_radius > 0 else full_pixels
         
         if len(full_pixels) == 0:
             return {'darkness': 0, 'coverage': 0, 'score': 0}
@@ -373,12 +349,12 @@ class PhotoOMRService:
         # Calculate coverage using multiple thresholding methods
         # Method 1: Otsu thresholding (adaptive)
         _, binary_otsu = cv2.threshold(roi, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        coverage_otsu = np.sum(binary_otsu[full_mask > 0] > 0) / len(full_pixels) * 100
+        coverage_otsu = np.sum(binary_otsu[full_mask] > 0) / len(full_pixels) * 100
         
         # Method 2: Fixed threshold (more sensitive for photos)
         threshold_fixed = max(100, mean_brightness - 30)  # Dynamic threshold
         _, binary_fixed = cv2.threshold(roi, threshold_fixed, 255, cv2.THRESH_BINARY_INV)
-        coverage_fixed = np.sum(binary_fixed[full_mask > 0] > 0) / len(full_pixels) * 100
+        coverage_fixed = np.sum(binary_fixed[full_mask] > 0) / len(full_pixels) * 100
         
         # Use the higher coverage (more sensitive)
         coverage = max(coverage_otsu, coverage_fixed)
@@ -388,9 +364,8 @@ class PhotoOMRService:
             inner_brightness = np.mean(inner_pixels)
             inner_darkness = (255 - inner_brightness) / 255 * 100
             
-            # Inner coverage
-            _, inner_binary = cv2.threshold(roi, threshold_fixed, 255, cv2.THRESH_BINARY_INV)
-            inner_coverage = np.sum(inner_binary[inner_mask > 0] > 0) / len(inner_pixels) * 100 if len(inner_pixels) > 0 else 0
+            # Inner coverage (xuddi shu fixed threshold - binary_fixed qayta ishlatiladi)
+            inner_coverage = np.sum(binary_fixed[inner_mask] > 0) / len(inner_pixels) * 100 if len(inner_pixels) > 0 else 0
         else:
             inner_darkness = darkness
             inner_coverage = coverage
@@ -510,7 +485,7 @@ class PhotoOMRService:
     
     def process_photo(
         self,
-        image_path: str,
+        image_path: Union[str, np.ndarray],
         exam_structure: Dict,
         answer_key: Dict
     ) -> Dict:
@@ -518,19 +493,17 @@ class PhotoOMRService:
         Complete photo processing pipeline with improved corner detection
         
         Args:
-            image_path: Path to photo
+            image_path: Path to photo or decoded BGR ndarray
             exam_structure: Exam structure
             answer_key: Answer key
             
         Returns:
             dict: Complete results with grading
         """
-        logger.info(f"Processing photo: {image_path}")
+        logger.info(f"Processing photo: {describe_source(image_path)}")
         
         # Load image
-        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        if image is None:
-            raise ValueError(f"Cannot load image: {image_path}")
+        image = load_image(image_path, cv2.IMREAD_GRAYSCALE)
         
         logger.info(f"Image loaded: {image.shape[1]}x{image.shape[0]}")
         
@@ -542,13 +515,14 @@ class PhotoOMRService:
         )
         
         coordinates = None
+        corners = None
         
         # Try improved corner detection first
         try:
             from services.photo_corner_detector import PhotoCornerDetector
             
             # Load color image for corner detection
-            color_image = cv2.imread(image_path)
+            color_image = load_image(image_path, cv2.IMREAD_COLOR)
             corner_detector = PhotoCornerDetector()
             corners = corner_detector.detect_corners(color_image)
             
@@ -594,7 +568,9 @@ class PhotoOMRService:
             # Step 1: Detect bubbles
             bubbles = self.detect_bubbles_automatically(
                 image,
-                expected_count=total_questions * 5
+                expected_count=total_questions * 5,
+                corners=corners if corners and len(corners) == 4 else None,
+                cache_key=exam_cache_key(exam_structure)
             )
             
             if len(bubbles) < total_questions * 3:  # At least 60% of expected
@@ -7,6 +7,8 @@ import numpy as np
 from typing import Dict, List, Tuple, Optional
 import logging
 
+from services.quality_metrics import get_quality_metrics
+
 logger = logging.getLogger(__name__)
 
 class PhotoQualityAssessor:
@@ -42,18 +44,15 @@ class PhotoQualityAssessor:
         """
         logger.info("Starting photo quality assessment...")
         
-        # Convert to grayscale if needed
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = image.copy()
+        # Shared single-pass metrics (cached per image)
+        metrics = get_quality_metrics(image)
         
         # Individual assessments
-        sharpness = self._assess_sharpness(gray)
-        contrast = self._assess_contrast(gray)
-        lighting = self._assess_lighting(gray)
-        perspective = self._assess_perspective(gray)
-        noise = self._assess_noise(gray)
+        sharpness = self._assess_sharpness(metrics)
+        contrast = self._assess_contrast(metrics)
+        lighting = self._assess_lighting(metrics)
+        perspective = self._assess_perspective(metrics)
+        noise = self._assess_noise(metrics)
         
         # Calculate overall quality
         overall_quality = self._calculate_overall_quality(
@@ -80,62 +79,58 @@ class PhotoQualityAssessor:
             },
             'recommendations': recommendations,
             'image_info': {
-                'width': gray.shape[1],
-                'height': gray.shape[0],
-                'aspect_ratio': round(gray.shape[1] / gray.shape[0], 2)
+                'width': metrics['width'],
+                'height': metrics['height'],
+                'aspect_ratio': round(metrics['width'] / metrics['height'], 2)
             }
         }
         
         logger.info(f"Quality assessment complete: {overall_quality:.1f}/100")
         return result
     
-    def _assess_sharpness(self, gray: np.ndarray) -> float:
+    def _assess_sharpness(self, metrics: Dict) -> float:
         """
         Assess image sharpness using Laplacian variance
         """
-        laplacian = cv2.Laplacian(gray, cv2.CV_64F)
-        variance = laplacian.var()
+        variance = metrics['laplacian_var']
         
         # Normalize to 0-100 scale
         sharpness = min(100, variance / 10)
         
         return sharpness
     
-    def _assess_contrast(self, gray: np.ndarray) -> float:
+    def _assess_contrast(self, metrics: Dict) -> float:
         """
         Assess image contrast using standard deviation
         """
-        std_dev = np.std(gray)
+        std_dev = metrics['std']
         
         # Normalize to 0-100 scale
         contrast = min(100, std_dev * 2)
         
         return contrast
     
-    def _assess_lighting(self, gray: np.ndarray) -> float:
+    def _assess_lighting(self, metrics: Dict) -> float:
         """
         Assess lighting quality
         """
-        mean_brightness = np.mean(gray)
+        mean_brightness = metrics['mean']
         
         # Ideal brightness is around 128 (middle gray)
         brightness_score = 100 - abs(mean_brightness - 128) * 2
         brightness_score = max(0, brightness_score)
         
-        # Check for overexposure/underexposure
-        overexposed = np.sum(gray > 240) / gray.size * 100
-        underexposed = np.sum(gray < 15) / gray.size * 100
-        
-        exposure_penalty = (overexposed + underexposed) * 2
+        # Check for overexposure/underexposure (% of pixels > 240 / < 15)
+        exposure_penalty = (metrics['overexposed'] + metrics['underexposed']) * 2
         lighting_score = max(0, brightness_score - exposure_penalty)
         
         return lighting_score
     
-    def _assess_perspective(self, gray: np.ndarray) -> float:
+    def _assess_perspective(self, metrics: Dict) -> float:
         """
         Assess perspective distortion
         """
-        height, width = gray.shape
+        height, width = metrics['height'], metrics['width']
         
         # Expected A4 aspect ratio
         expected_ratio = 297 / 210  # A4 height/width
@@ -149,16 +144,12 @@ class PhotoQualityAssessor:
         
         return perspective_score
     
-    def _assess_noise(self, gray: np.ndarray) -> float:
+    def _assess_noise(self, metrics: Dict) -> float:
         """
         Assess image noise level
         """
-        # Apply Gaussian blur and calculate difference
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        noise_map = cv2.absdiff(gray, blurred)
-        
-        # Calculate noise level
-        noise_level = np.mean(noise_map)
+        # Mean |gray - GaussianBlur(5x5)| on sampled tiles
+        noise_level = metrics['blur_residual']
         
         # Normalize to 0-100 scale (lower noise = higher score)
         noise_score = max(0, 100 - noise_level * 4)
@@ -6,10 +6,26 @@ import cv2
 import numpy as np
 import json
 import logging
-from typing import Dict, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.stage_metrics import stage
 
 logger = logging.getLogger(__name__)
 
+# Chop etilgan varaqdagi QR joylashuvi (pdfGenerator.ts: addImage(qr, 160, 10, 25, 25))
+QR_BOX_MM = (160.0, 10.0, 25.0)  # x, y, size
+PAPER_SIZE_MM = (210.0, 297.0)
+MARKER_CENTER_MM = 12.5  # ImageProcessor 'markers' kadri: marker markazlari rasm burchaklarida
+QR_ROI_MARGIN_MM = 8.0
+REMEMBERED_ROI_MARGIN = 0.3  # eslab qolingan hudud atrofidagi zaxira (QR tomoniga nisbatan)
+MIN_DECODE_SIDE = 21  # 21x21 - eng kichik QR (version 1)
+
+NormalizedBox = Tuple[float, float, float, float]  # x1, y1, x2, y2 (0-1)
+
 # Try multiple QR detection libraries
 PYZBAR_AVAILABLE = False
 OPENCV_QR_AVAILABLE = False
@@ -35,6 +51,72 @@ except Exception as e:
 if not PYZBAR_AVAILABLE and not OPENCV_QR_AVAILABLE:
     logger.warning("No QR code detection library available - using default layout")
 
+
+def _expected_qr_roi() -> NormalizedBox:
+    """
+    Layout konstantalaridan kutilgan QR hududi (normallashgan)
+
+    ImageProcessor ikki xil kadr qaytaradi: 'page' (butun A4) va 'markers'
+    (marker markazlari rasm burchaklarida) - hudud ikkalasini ham qamraydi.
+    """
+    x, y, size = QR_BOX_MM
+    paper_w, paper_h = PAPER_SIZE_MM
+    frames = (
+        (0.0, paper_w, paper_h),
+        (MARKER_CENTER_MM, paper_w - 2 * MARKER_CENTER_MM, paper_h - 2 * MARKER_CENTER_MM)
+    )
+    margin = QR_ROI_MARGIN_MM
+
+    x1 = min((x - margin - offset) / width for offset, width, _ in frames)
+    y1 = min((y - margin - offset) / height for offset, _, height in frames)
+    x2 = max((x + size + margin - offset) / width for offset, width, _ in frames)
+    y2 = max((y + size + margin - offset) / height for offset, _, height in frames)
+
+    return (max(0.0, x1), max(0.0, y1), min(1.0, x2), min(1.0, y2))
+
+
+EXPECTED_QR_ROI = _expected_qr_roi()
+
+# Oxirgi muvaffaqiyatli decode joyi: examId -> NormalizedBox (LRU, worker ichida)
+_LAST_LOCATION_KEY = '__last__'
+_qr_locations: 'OrderedDict[str, NormalizedBox]' = OrderedDict()
+_qr_locations_lock = threading.Lock()
+
+_opencv_local = threading.local()
+
+
+def _get_opencv_detector():
+    """Thread bo'yicha bitta cv2.QRCodeDetector (instance thread-safe emas)"""
+    detector = getattr(_opencv_local, 'detector', None)
+    if detector is None:
+        detector = _opencv_local.detector = cv2.QRCodeDetector()
+    return detector
+
+
+def remember_qr_location(exam_id: Optional[str], box: Optional[NormalizedBox]):
+    """QR topilgan hududni exam bo'yicha va 'oxirgi' sifatida saqlash"""
+    if box is None:
+        return
+
+    with _qr_locations_lock:
+        for key in (exam_id, _LAST_LOCATION_KEY):
+            if key is None:
+                continue
+            _qr_locations[key] = box
+            _qr_locations.move_to_end(key)
+        while len(_qr_locations) > max(1, settings.QR_LOCATION_CACHE_SIZE):
+            _qr_locations.popitem(last=False)
+
+
+def get_remembered_qr_location(exam_id: Optional[str]) -> Optional[NormalizedBox]:
+    with _qr_locations_lock:
+        return _qr_locations.get(exam_id) if exam_id is not None else None
+
+
+def clear_qr_locations():
+    with _qr_locations_lock:
+        _qr_locations.clear()
+
 class QRCodeReader:
     """
     QR Code'dan layout ma'lumotlarini o'qish
@@ -43,6 +125,11 @@ class QRCodeReader:
     def __init__(self):
         self.use_pyzbar = PYZBAR_AVAILABLE
         self.use_opencv = OPENCV_QR_AVAILABLE
+        self.decode_mode = settings.QR_DECODE_MODE
+        
+        # A/B: mode -> {'calls', 'misses', 'total_ms', 'hits': {attempt: count}}
+        self._stats: Dict[str, Dict] = {}
+        self._stats_lock = threading.Lock()
         
         if not self.use_pyzbar and not self.use_opencv:
             logger.warning("QRCodeReader initialized without any QR detection support")
@@ -51,30 +138,39 @@ class QRCodeReader:
         elif self.use_opencv:
             logger.info("QRCodeReader using OpenCV QRCodeDetector")
     
-    def read_qr_code(self, image: np.ndarray) -> Optional[Dict]:
+    def read_qr_code(
+        self,
+        image: np.ndarray,
+        exam_id: Optional[str] = None,
+        mode: Optional[str] = None
+    ) -> Optional[Dict]:
         """
         Image'dan QR code'ni topish va o'qish
         
         Args:
             image: Grayscale or BGR image
+            exam_id: Kutilayotgan imtihon (eslab qolingan QR joyi uchun)
+            mode: 'roi' yoki 'legacy' (default: settings.QR_DECODE_MODE)
             
         Returns:
             dict: Layout data from QR code, or None if not found
         """
+        mode = mode or self.decode_mode
+        
         # Try pyzbar first, then OpenCV
         if self.use_pyzbar:
-            result = self._read_with_pyzbar(image)
+            result = self._read_with_pyzbar(image, exam_id, mode)
             if result:
                 return result
         
         if self.use_opencv:
-            result = self._read_with_opencv(image)
+            result = self._read_with_opencv(image, exam_id, mode)
             if result:
                 return result
         
         return None
     
-    def _read_with_pyzbar(self, image: np.ndarray) -> Optional[Dict]:
+    def _read_with_pyzbar(self, image: np.ndarray, exam_id: Optional[str] = None, mode: str = 'roi') -> Optional[Dict]:
         """Read QR code using pyzbar"""
         try:
             logger.info("Searching for QR code...")
@@ -85,34 +181,12 @@ class QRCodeReader:
             else:
                 gray = image
             
-            # Try 1: Direct detection
-            qr_codes = pyzbar.decode(gray)
+            qr_data, box = self._locate_and_decode(gray, exam_id, mode, self._decode_pyzbar, 'pyzbar')
             
-            # Try 2: Enhanced detection if first attempt fails
-            if not qr_codes:
-                logger.info("First attempt failed, trying enhanced detection...")
-                enhanced = self.enhance_for_qr_detection(gray)
-                qr_codes = pyzbar.decode(enhanced)
-            
-            # Try 3: Try different regions (top-right corner where QR is located)
-            if not qr_codes:
-                logger.info("Trying top-right corner region...")
-                h, w = gray.shape
-                # QR is at 175mm, 10mm, 25mm x 25mm on A4 (210mm x 297mm)
-                # That's roughly 83% from left, 3% from top, 12% width, 8% height
-                x1 = int(w * 0.75)
-                y1 = 0
-                x2 = w
-                y2 = int(h * 0.15)
-                corner_region = gray[y1:y2, x1:x2]
-                qr_codes = pyzbar.decode(corner_region)
-            
-            if not qr_codes:
+            if not qr_data:
                 logger.warning("No QR code found in image after all attempts")
                 return None
             
-            # Read first QR code
-            qr_data = qr_codes[0].data.decode('utf-8')
             logger.info(f"QR code found! Data length: {len(qr_data)} bytes")
             
             # Parse JSON data
@@ -123,6 +197,8 @@ class QRCodeReader:
                 logger.error("Invalid QR code data structure")
                 return None
             
+            remember_qr_location(layout_data.get('examId'), box)
+            
             logger.info(f"✅ QR code successfully read: Exam '{layout_data.get('examName')}', Version {layout_data.get('version')}")
             logger.info(f"   Total questions: {layout_data.get('structure', {}).get('totalQuestions')}")
             
@@ -135,7 +211,7 @@ class QRCodeReader:
             logger.error(f"Error reading QR code with pyzbar: {e}")
             return None
     
-    def _read_with_opencv(self, image: np.ndarray) -> Optional[Dict]:
+    def _read_with_opencv(self, image: np.ndarray, exam_id: Optional[str] = None, mode: str = 'roi') -> Optional[Dict]:
         """Read QR code using OpenCV QRCodeDetector"""
         try:
             logger.info("Trying OpenCV QRCodeDetector...")
@@ -146,28 +222,7 @@ class QRCodeReader:
             else:
                 gray = image
             
-            # Create QR detector
-            qr_detector = cv2.QRCodeDetector()
-            
-            # Try 1: Direct detection
-            data, bbox, straight_qrcode = qr_detector.detectAndDecode(gray)
-            
-            # Try 2: Enhanced detection if first attempt fails
-            if not data:
-                logger.info("First attempt failed, trying enhanced detection...")
-                enhanced = self.enhance_for_qr_detection(gray)
-                data, bbox, straight_qrcode = qr_detector.detectAndDecode(enhanced)
-            
-            # Try 3: Try different regions (top-right corner)
-            if not data:
-                logger.info("Trying top-right corner region...")
-                h, w = gray.shape
-                x1 = int(w * 0.75)
-                y1 = 0
-                x2 = w
-                y2 = int(h * 0.15)
-                corner_region = gray[y1:y2, x1:x2]
-                data, bbox, straight_qrcode = qr_detector.detectAndDecode(corner_region)
+            data, box = self._locate_and_decode(gray, exam_id, mode, self._decode_opencv, 'opencv')
             
             if not data:
                 logger.warning("OpenCV QRCodeDetector: No QR code found")
@@ -183,6 +238,8 @@ class QRCodeReader:
                 logger.error("Invalid QR code data structure")
                 return None
             
+            remember_qr_location(layout_data.get('examId'), box)
+            
             logger.info(f"✅ QR code successfully read with OpenCV: Exam '{layout_data.get('examName')}', Version {layout_data.get('version')}")
             
             return layout_data
@@ -194,6 +251,187 @@ class QRCodeReader:
             logger.error(f"Error reading QR code with OpenCV: {e}")
             return None
     
+    def _decode_pyzbar(self, image: np.ndarray) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """pyzbar decode -> (data, corner points)"""
+        qr_codes = pyzbar.decode(image)
+        if not qr_codes:
+            return None, None
+        
+        code = qr_codes[0]
+        points = np.array([(point.x, point.y) for point in code.polygon], dtype=np.float32) if code.polygon else None
+        return code.data.decode('utf-8'), points
+    
+    def _decode_opencv(self, image: np.ndarray) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """OpenCV decode (memoized detector) -> (data, corner points)"""
+        data, bbox, _ = _get_opencv_detector().detectAndDecode(image)
+        if not data:
+            return None, None
+        
+        points = bbox.reshape(-1, 2) if bbox is not None else None
+        return data, points
+    
+    def _locate_and_decode(
+        self,
+        gray: np.ndarray,
+        exam_id: Optional[str],
+        mode: str,
+        decode: Callable,
+        library: str
+    ) -> Tuple[Optional[str], Optional[NormalizedBox]]:
+        """
+        'roi': eslab qolingan / kutilgan hudud, keyin butun sahifa (fallback)
+        'legacy': faqat butun sahifa urinishlari (A/B solishtirish uchun)
+        """
+        start = time.perf_counter()
+        data, box, attempt = None, None, None
+        
+        if mode == 'roi':
+            with stage('qr_roi'):
+                data, box, attempt = self._decode_roi_first(gray, exam_id, decode)
+        
+        if not data:
+            with stage('qr_full_page'):
+                data, box, attempt = self._decode_full_page(gray, decode)
+        
+        self._record_decode(mode, f'{library}:{attempt}' if data else None, time.perf_counter() - start)
+        return data, box
+    
+    def _candidate_rois(self, exam_id: Optional[str]) -> List[Tuple[str, NormalizedBox]]:
+        """Tekshiriladigan hududlar tartibi: exam bo'yicha eslab qolingan, oxirgi, kutilgan"""
+        candidates = []
+        for name, box in (
+            ('remembered', get_remembered_qr_location(exam_id)),
+            ('last', get_remembered_qr_location(_LAST_LOCATION_KEY)),
+            ('expected', EXPECTED_QR_ROI)
+        ):
+            if box is not None and all(box != seen for _, seen in candidates):
+                candidates.append((name, box))
+        return candidates
+    
+    def _decode_roi_first(
+        self,
+        gray: np.ndarray,
+        exam_id: Optional[str],
+        decode: Callable
+    ) -> Tuple[Optional[str], Optional[NormalizedBox], Optional[str]]:
+        """
+        Hudud bo'yicha pyramid: QR_PYRAMID_SCALES tartibida (kichraytirilgan
+        birinchi, kattalashtirish faqat miss bo'lsa), oxirida kutilgan hudud
+        enhance_for_qr_detection bilan
+        """
+        height, width = gray.shape[:2]
+        
+        for name, box in self._candidate_rois(exam_id):
+            x1, y1 = int(box[0] * width), int(box[1] * height)
+            x2, y2 = int(np.ceil(box[2] * width)), int(np.ceil(box[3] * height))
+            region = gray[y1:y2, x1:x2]
+            if min(region.shape[:2]) < MIN_DECODE_SIDE:
+                continue
+            
+            for scale in settings.QR_PYRAMID_SCALES:
+                if scale == 1.0:
+                    scaled = region
+                else:
+                    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+                    scaled = cv2.resize(region, None, fx=scale, fy=scale, interpolation=interpolation)
+                if min(scaled.shape[:2]) < MIN_DECODE_SIDE:
+                    continue
+                
+                data, points = decode(scaled)
+                if data:
+                    logger.debug(f"QR decoded from {name} region at scale {scale:g}")
+                    return data, self._normalize_box(points, scale, x1, y1, width, height), f'{name}@{scale:g}'
+            
+            if name == 'expected':
+                data, points = decode(self.enhance_for_qr_detection(region))
+                if data:
+                    return data, self._normalize_box(points, 1.0, x1, y1, width, height), 'expected_enhanced'
+        
+        logger.info("QR not found in expected region, falling back to full page...")
+        return None, None, None
+    
+    def _decode_full_page(
+        self,
+        gray: np.ndarray,
+        decode: Callable
+    ) -> Tuple[Optional[str], Optional[NormalizedBox], Optional[str]]:
+        """Eski ketma-ketlik: butun sahifa, enhanced butun sahifa, yuqori o'ng burchak"""
+        height, width = gray.shape[:2]
+        
+        # Try 1: Direct detection
+        data, points = decode(gray)
+        if data:
+            return data, self._normalize_box(points, 1.0, 0, 0, width, height), 'full_page'
+        
+        # Try 2: Enhanced detection if first attempt fails
+        logger.info("First attempt failed, trying enhanced detection...")
+        data, points = decode(self.enhance_for_qr_detection(gray))
+        if data:
+            return data, self._normalize_box(points, 1.0, 0, 0, width, height), 'full_page_enhanced'
+        
+        # Try 3: Try different regions (top-right corner where QR is located)
+        logger.info("Trying top-right corner region...")
+        # QR is at 160mm, 10mm, 25mm x 25mm on A4 (210mm x 297mm)
+        # That's roughly 76% from left, 3% from top, 12% width, 8% height
+        x1 = int(width * 0.75)
+        y2 = int(height * 0.15)
+        data, points = decode(gray[0:y2, x1:width])
+        if data:
+            return data, self._normalize_box(points, 1.0, x1, 0, width, height), 'top_right'
+        
+        return None, None, None
+    
+    def _normalize_box(
+        self,
+        points: Optional[np.ndarray],
+        scale: float,
+        offset_x: int,
+        offset_y: int,
+        width: int,
+        height: int
+    ) -> Optional[NormalizedBox]:
+        """Decode burchaklari -> butun rasmga nisbatan zaxirali hudud"""
+        if points is None or len(points) == 0:
+            return None
+        
+        points = np.asarray(points, dtype=np.float32) / scale + (offset_x, offset_y)
+        (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+        margin = REMEMBERED_ROI_MARGIN * max(x2 - x1, y2 - y1)
+        
+        return (
+            max(0.0, float(x1 - margin) / width),
+            max(0.0, float(y1 - margin) / height),
+            min(1.0, float(x2 + margin) / width),
+            min(1.0, float(y2 + margin) / height)
+        )
+    
+    def _record_decode(self, mode: str, attempt: Optional[str], elapsed: float):
+        with self._stats_lock:
+            entry = self._stats.setdefault(mode, {'calls': 0, 'misses': 0, 'total_ms': 0.0, 'hits': {}})
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed * 1000
+            if attempt is None:
+                entry['misses'] += 1
+            else:
+                entry['hits'][attempt] = entry['hits'].get(attempt, 0) + 1
+    
+    def get_stats(self) -> Dict:
+        """
+        Decode statistikasi mode bo'yicha (roi vs legacy A/B):
+        {mode: {'calls', 'misses', 'avg_ms', 'total_ms', 'hits': {library:attempt: count}}}
+        """
+        with self._stats_lock:
+            return {
+                mode: {
+                    'calls': entry['calls'],
+                    'misses': entry['misses'],
+                    'avg_ms': round(entry['total_ms'] / entry['calls'], 2) if entry['calls'] else 0.0,
+                    'total_ms': round(entry['total_ms'], 2),
+                    'hits': dict(entry['hits'])
+                }
+                for mode, entry in self._stats.items()
+            }
+    
     def _validate_layout_data(self, data: Dict) -> bool:
         """
         QR code data'ni validate qilish
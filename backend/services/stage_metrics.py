@@ -0,0 +1,406 @@
+"""
+Stage Metrics - pipeline bosqichlari uchun yengil instrumentation
+performance_benchmarks.PERFORMANCE_TARGETS'dagi bosqichlarni real so'rovlarda o'lchaydi
+
+Ikki qism:
+1. Worker ichida (process yoki thread): track_request + stage() har bir bosqich
+   uchun wall time, CPU time va peak RSS o'sishini yozadi. Natija pipeline
+   javobiga statistics['stages'] sifatida qo'shiladi (pickle orqali process
+   chegarasidan o'tadi).
+2. Asosiy process'da: MetricsRegistry javoblardagi bosqichlarni yig'adi -
+   p50/p95/p99 (oxirgi N ta namuna), Prometheus text format va
+   check_performance / generate_performance_report uchun jonli qiymatlar.
+   Koordinata strategiyalari natijalari (statistics['coordinate_detection']
+   ['strategy_timings']) va AI tekshiruv counter'lari (statistics['ai'])
+   ham shu yerda yig'iladi.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+from config import settings
+from performance_benchmarks import PERFORMANCE_TARGETS, check_performance, generate_performance_report
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+STATUS_CODES = {'good': 0, 'warning': 1, 'critical': 2, 'unknown': -1}
+
+# statistics['ai'] dagi yig'iladigan counter'lar (AsyncAIVerifier 'ai_verification' + verified/corrected)
+AI_COUNTERS = (
+    'verified', 'corrected', 'requested', 'cache_hits', 'unanswered', 'requests',
+    'tiled_requests', 'single_fallbacks', 'retries', 'failed', 'deadline_expired'
+)
+
+_current_recorder: ContextVar[Optional['StageRecorder']] = ContextVar('stage_recorder', default=None)
+
+
+def _peak_rss_mb() -> float:
+    """Process'ning peak RSS'i (MB) - Linux'da ru_maxrss KB'da"""
+    if not RESOURCE_AVAILABLE:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageRecorder:
+    """
+    Bitta so'rov bosqichlari: {stage: {'wall', 'cpu', 'rss_delta_mb', 'calls'}}
+
+    CPU time - joriy thread bo'yicha (thread pool'da boshqa so'rovlar aralashmaydi).
+    Peak RSS - process bo'yicha yuqori nuqta; bosqich davomida o'sish bo'lmasa 0.
+    Bir xil nomli bosqich qayta chaqirilsa qiymatlar qo'shiladi.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        rss_start = _peak_rss_mb()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(
+                name, {'wall': 0.0, 'cpu': 0.0, 'rss_delta_mb': 0.0, 'calls': 0}
+            )
+            entry['wall'] += time.perf_counter() - wall_start
+            entry['cpu'] += time.thread_time() - cpu_start
+            entry['rss_delta_mb'] += max(0.0, _peak_rss_mb() - rss_start)
+            entry['calls'] += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            name: {
+                'wall': round(entry['wall'], 4),
+                'cpu': round(entry['cpu'], 4),
+                'rss_delta_mb': round(entry['rss_delta_mb'], 1),
+                'calls': entry['calls']
+            }
+            for name, entry in self.stages.items()
+        }
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Bosqichni o'lchash: with stage('omr_detection'): ...
+
+    Faol so'rov (track_request) bo'lmasa hech narsa qilmaydi.
+    """
+    recorder = _current_recorder.get()
+    if recorder is None or not settings.METRICS_ENABLED:
+        yield
+        return
+
+    with recorder.stage(name):
+        yield
+
+
+def timed_stage(name: str) -> Callable:
+    """stage() ning decorator ko'rinishi"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def track_request(func: Callable) -> Callable:
+    """
+    Pipeline funksiyasi uchun decorator - so'rov davomida StageRecorder faol,
+    butun funksiya 'total' bosqichi sifatida yoziladi va natija
+    statistics['stages']'ga qo'shiladi
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not settings.METRICS_ENABLED:
+            return func(*args, **kwargs)
+
+        recorder = StageRecorder()
+        token = _current_recorder.set(recorder)
+        try:
+            with recorder.stage('total'):
+                result = func(*args, **kwargs)
+        finally:
+            _current_recorder.reset(token)
+
+        if isinstance(result, dict):
+            result.setdefault('statistics', {})['stages'] = recorder.to_dict()
+        return result
+    return wrapper
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank quantile (tartiblangan ro'yxat)"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class _StageSeries:
+    """Bitta bosqich uchun umumiy hisoblagichlar + oxirgi N namuna"""
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.wall_sum = 0.0
+        self.cpu_sum = 0.0
+        self.rss_sum = 0.0
+        self.wall = deque(maxlen=window)
+        self.cpu = deque(maxlen=window)
+        self.rss = deque(maxlen=window)
+
+    def observe(self, entry: Dict):
+        self.count += 1
+        self.wall_sum += entry['wall']
+        self.cpu_sum += entry['cpu']
+        self.rss_sum += entry['rss_delta_mb']
+        self.wall.append(entry['wall'])
+        self.cpu.append(entry['cpu'])
+        self.rss.append(entry['rss_delta_mb'])
+
+    def quantiles(self, samples: Iterable[float]) -> Dict[float, float]:
+        ordered = sorted(samples)
+        return {q: _quantile(ordered, q) for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """
+    Asosiy process'dagi agregator - pipeline javoblaridan statistics['stages']
+
+    Quantile'lar oxirgi `window` ta namuna bo'yicha (sliding window),
+    _sum/_count esa process ishga tushgandan beri.
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._series: Dict[str, _StageSeries] = {}
+        self._requests: Dict[str, int] = {}
+        self._strategies: Dict[str, Dict] = {}
+        self._ai: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, pipeline: str, result) -> None:
+        """Pipeline javobidagi bosqich o'lchovlarini qo'shish"""
+        if not isinstance(result, dict):
+            return
+        statistics = result.get('statistics') or {}
+        self._observe_strategies((statistics.get('coordinate_detection') or {}).get('strategy_timings'))
+        self._observe_ai(statistics.get('ai'))
+
+        stages = statistics.get('stages')
+        if not stages:
+            return
+
+        with self._lock:
+            self._requests[pipeline] = self._requests.get(pipeline, 0) + 1
+            for name, entry in stages.items():
+                series = self._series.get(name)
+                if series is None:
+                    series = self._series[name] = _StageSeries(self.window)
+                series.observe(entry)
+
+    def _observe_strategies(self, timings: Optional[Dict]):
+        """
+        Koordinata strategiyalari: {strategy: {'outcome', 'duration_ms'}}
+
+        'late' strategiyaning davomiyligi noma'lum (fonda tugaydi), 'cancelled' esa
+        ishlamagan - ikkalasi ham vaqt yig'indisiga kirmaydi.
+        """
+        if not timings:
+            return
+
+        with self._lock:
+            for name, timing in timings.items():
+                entry = self._strategies.setdefault(
+                    name, {'outcomes': {}, 'attempts': 0, 'total_ms': 0.0}
+                )
+                outcome = timing.get('outcome', 'unknown')
+                entry['outcomes'][outcome] = entry['outcomes'].get(outcome, 0) + 1
+                if outcome != 'cancelled' and timing.get('duration_ms') is not None:
+                    entry['attempts'] += 1
+                    entry['total_ms'] += timing['duration_ms']
+
+    def _observe_ai(self, ai_stats: Optional[Dict]):
+        """AI tekshiruv counter'lari (faqat tekshiruv bo'lgan so'rovlar)"""
+        if not ai_stats or not ai_stats.get('enabled'):
+            return
+
+        with self._lock:
+            for key in AI_COUNTERS:
+                value = ai_stats.get(key)
+                if isinstance(value, (int, float)):
+                    self._ai[key] = self._ai.get(key, 0) + value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._requests.clear()
+            self._strategies.clear()
+            self._ai.clear()
+
+    def ai_snapshot(self) -> Dict:
+        """AI tekshiruv counter'lari yig'indisi: {counter: total}"""
+        with self._lock:
+            return dict(self._ai)
+
+    def strategy_snapshot(self) -> Dict:
+        """
+        Per-strategy counter'lar (qaysi strategiyalar foydali ekanini ko'rish uchun)
+
+        Returns:
+            {strategy: {outcome: count, ..., 'attempts', 'total_ms', 'avg_ms', 'success_rate'}}
+        """
+        with self._lock:
+            report = {}
+            for name, entry in sorted(self._strategies.items()):
+                attempts = entry['attempts']
+                report[name] = dict(
+                    entry['outcomes'],
+                    attempts=attempts,
+                    total_ms=round(entry['total_ms'], 1),
+                    avg_ms=round(entry['total_ms'] / attempts, 1) if attempts else 0.0,
+                    success_rate=round(entry['outcomes'].get('success', 0) / attempts * 100, 1) if attempts else 0.0
+                )
+            return report
+
+    def snapshot(self) -> Dict:
+        """
+        Returns:
+            {stage: {'count', 'wall': {p50, p95, p99, avg}, 'cpu': {...}, 'rss_delta_mb': {...}}}
+        """
+        with self._lock:
+            report = {}
+            for name, series in self._series.items():
+                report[name] = {'count': series.count}
+                for metric, samples, total in (
+                    ('wall', series.wall, series.wall_sum),
+                    ('cpu', series.cpu, series.cpu_sum),
+                    ('rss_delta_mb', series.rss, series.rss_sum)
+                ):
+                    values = series.quantiles(samples)
+                    report[name][metric] = {
+                        'p50': round(values[0.5], 4),
+                        'p95': round(values[0.95], 4),
+                        'p99': round(values[0.99], 4),
+                        'avg': round(total / series.count, 4) if series.count else 0.0
+                    }
+            return report
+
+    def performance_report(self, quantile: str = 'p95') -> Dict:
+        """
+        PERFORMANCE_TARGETS bo'yicha jonli hisobot (generate_performance_report)
+
+        Har bir bosqich uchun wall time'ning berilgan quantile'i tekshiriladi.
+        """
+        snapshot = self.snapshot()
+        values = {
+            name: data['wall'][quantile]
+            for name, data in snapshot.items()
+            if name in PERFORMANCE_TARGETS
+        }
+        report = generate_performance_report(values)
+        report['quantile'] = quantile
+        report['samples'] = {name: snapshot[name]['count'] for name in values}
+        return report
+
+    def render_prometheus(
+        self,
+        extra_gauges: Optional[Dict[str, float]] = None,
+        extra_counters: Optional[Dict[str, float]] = None
+    ) -> str:
+        """
+        Prometheus text exposition format (0.0.4)
+
+        omr_stage_*_seconds / omr_stage_rss_delta_megabytes - summary (quantile, _sum, _count)
+        omr_stage_performance_status - check_performance natijasi p95 bo'yicha
+        (0 good, 1 warning, 2 critical)
+        """
+        with self._lock:
+            series_items = [
+                (name, series.count, list(series.wall), series.wall_sum,
+                 list(series.cpu), series.cpu_sum, list(series.rss), series.rss_sum)
+                for name, series in sorted(self._series.items())
+            ]
+            requests = dict(self._requests)
+            strategies = [
+                (name, dict(entry['outcomes']), entry['attempts'], entry['total_ms'])
+                for name, entry in sorted(self._strategies.items())
+            ]
+            ai_counters = dict(self._ai)
+
+        lines = []
+
+        lines.append('# HELP omr_requests_total Graded requests by pipeline')
+        lines.append('# TYPE omr_requests_total counter')
+        for pipeline, count in sorted(requests.items()):
+            lines.append(f'omr_requests_total{{pipeline="{pipeline}"}} {count}')
+
+        summaries = (
+            ('omr_stage_wall_seconds', 'Pipeline stage wall-clock time', 2, 3),
+            ('omr_stage_cpu_seconds', 'Pipeline stage CPU time (worker thread)', 4, 5),
+            ('omr_stage_rss_delta_megabytes', 'Pipeline stage peak RSS growth', 6, 7)
+        )
+        for metric, help_text, samples_index, sum_index in summaries:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} summary')
+            for item in series_items:
+                name, count = item[0], item[1]
+                ordered = sorted(item[samples_index])
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{stage="{name}",quantile="{q}"}} {_quantile(ordered, q):.6f}')
+                lines.append(f'{metric}_sum{{stage="{name}"}} {item[sum_index]:.6f}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+
+        lines.append('# HELP omr_stage_performance_status p95 wall time vs PERFORMANCE_TARGETS (0 good, 1 warning, 2 critical)')
+        lines.append('# TYPE omr_stage_performance_status gauge')
+        for item in series_items:
+            name = item[0]
+            if name not in PERFORMANCE_TARGETS:
+                continue
+            status = check_performance(name, _quantile(sorted(item[2]), 0.95))['status']
+            lines.append(f'omr_stage_performance_status{{stage="{name}"}} {STATUS_CODES[status]}')
+
+        lines.append('# HELP omr_coordinate_strategy_runs_total Coordinate detection strategy runs by outcome')
+        lines.append('# TYPE omr_coordinate_strategy_runs_total counter')
+        for name, outcomes, _, _ in strategies:
+            for outcome, count in sorted(outcomes.items()):
+                lines.append(f'omr_coordinate_strategy_runs_total{{strategy="{name}",outcome="{outcome}"}} {count}')
+
+        lines.append('# HELP omr_coordinate_strategy_seconds Coordinate detection strategy run time (completed runs)')
+        lines.append('# TYPE omr_coordinate_strategy_seconds summary')
+        for name, _, attempts, total_ms in strategies:
+            lines.append(f'omr_coordinate_strategy_seconds_sum{{strategy="{name}"}} {total_ms / 1000:.6f}')
+            lines.append(f'omr_coordinate_strategy_seconds_count{{strategy="{name}"}} {attempts}')
+
+        lines.append('# HELP omr_ai_verification_events_total AI verification counters (questions, API requests, retries, ...)')
+        lines.append('# TYPE omr_ai_verification_events_total counter')
+        for key in AI_COUNTERS:
+            if key in ai_counters:
+                lines.append(f'omr_ai_verification_events_total{{event="{key}"}} {ai_counters[key]}')
+
+        for metric_type, extra in (('gauge', extra_gauges), ('counter', extra_counters)):
+            for metric, value in (extra or {}).items():
+                lines.append(f'# TYPE {metric} {metric_type}')
+                lines.append(f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry(window=settings.METRICS_WINDOW)
@@ -7,6 +7,10 @@ import numpy as np
 from typing import List, Dict, Tuple, Optional
 import logging
 
+from config import settings
+from services.bubble_finder import find_bubble_candidates
+from services.integral_stats import IntegralImageEngine
+
 logger = logging.getLogger(__name__)
 
 class TemplateMatchingOMR:
@@ -24,6 +28,7 @@ class TemplateMatchingOMR:
         self.min_radius = 15  # Minimum bubble radius in pixels
         self.max_radius = 40  # Maximum bubble radius in pixels
         self.min_distance = 30  # Minimum distance between bubbles
+        self.fill_threshold = 180  # Pixels darker than this are considered "filled"
         
     def detect_bubbles(self, image: np.ndarray) -> List[Dict]:
         """
@@ -37,33 +42,46 @@ class TemplateMatchingOMR:
         else:
             gray = image.copy()
         
-        # Apply Gaussian blur
-        blurred = cv2.GaussianBlur(gray, (9, 9), 2)
-        
-        # Detect circles using HoughCircles
-        circles = cv2.HoughCircles(
-            blurred,
-            cv2.HOUGH_GRADIENT,
-            dp=1,
-            minDist=self.min_distance,
-            param1=50,
-            param2=30,
-            minRadius=self.min_radius,
-            maxRadius=self.max_radius
+        # Detect circles using HoughCircles (answer grid ROI, reduced scale)
+        circles, _ = find_bubble_candidates(
+            gray,
+            [{
+                'minRadius': self.min_radius,
+                'maxRadius': self.max_radius,
+                'param2': 30,
+                'minDist': self.min_distance
+            }],
+            preprocess=lambda region: cv2.GaussianBlur(region, (9, 9), 2)  # Apply Gaussian blur
         )
         
         bubbles = []
         if circles is not None:
-            circles = np.round(circles[0, :]).astype("int")
             
-            for (x, y, r) in circles:
-                bubbles.append({
-                    'x': int(x),
-                    'y': int(y),
-                    'radius': int(r),
-                    'darkness': self._calculate_darkness(gray, x, y, r),
-                    'fill_ratio': self._calculate_fill_ratio(gray, x, y, r)
-                })
+            if settings.USE_INTEGRAL_STATS:
+                # Barcha doiralar uchun bitta integral image - O(1) so'rovlar
+                engine = IntegralImageEngine(gray)
+                stats = engine.disk_stats(
+                    circles[:, 0], circles[:, 1], circles[:, 2],
+                    dark_threshold=self.fill_threshold
+                )
+                
+                for i, (x, y, r) in enumerate(circles):
+                    bubbles.append({
+                        'x': int(x),
+                        'y': int(y),
+                        'radius': int(r),
+                        'darkness': self._darkness_from_mean(stats['mean'][i]) if stats['valid'][i] else 0.0,
+                        'fill_ratio': stats['dark_count'][i] / stats['count'][i] * 100 if stats['valid'][i] else 0.0
+                    })
+            else:
+                for (x, y, r) in circles:
+                    bubbles.append({
+                        'x': int(x),
+                        'y': int(y),
+                        'radius': int(r),
+                        'darkness': self._calculate_darkness(gray, x, y, r),
+                        'fill_ratio': self._calculate_fill_ratio(gray, x, y, r)
+                    })
         
         logger.info(f"Found {len(bubbles)} bubble candidates")
         return bubbles
@@ -255,11 +273,12 @@ class TemplateMatchingOMR:
         if len(pixels) == 0:
             return 0.0
         
-        # Calculate darkness (inverted brightness)
-        avg_brightness = np.mean(pixels)
-        darkness = (255 - avg_brightness) / 255 * 100
-        
-        return darkness
+        return self._darkness_from_mean(np.mean(pixels))
+    
+    @staticmethod
+    def _darkness_from_mean(avg_brightness: float) -> float:
+        """Darkness (inverted brightness) foizda"""
+        return (255 - avg_brightness) / 255 * 100
     
     def _calculate_fill_ratio(self, gray: np.ndarray, x: int, y: int, radius: int) -> float:
         """
@@ -276,8 +295,7 @@ class TemplateMatchingOMR:
             return 0.0
         
         # Threshold for "dark" pixels
-        threshold = 180  # Pixels darker than this are considered "filled"
-        dark_pixels = np.sum(pixels < threshold)
+        dark_pixels = np.sum(pixels < self.fill_threshold)
         total_pixels = len(pixels)
         
         fill_ratio = (dark_pixels / total_pixels) * 100
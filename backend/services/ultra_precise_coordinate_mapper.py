@@ -6,11 +6,37 @@ import cv2
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 import logging
+import contextvars
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from config import settings
+from services.bubble_finder import find_bubble_candidates
+from services.lazy_planes import get_image_planes
+
 logger = logging.getLogger(__name__)
 
+# Strategy chain - priority order: (name, accuracy_estimate, start log, success log)
+DETECTION_STRATEGIES = [
+    ('template_matching', 100, "📐 Trying template matching...", "✅ Template matching: 100% accuracy"),
+    ('ocr_anchors', 95, "🔍 Trying OCR anchor detection...", "✅ OCR anchors: 95% accuracy"),
+    ('advanced_corners', 90, "📍 Trying advanced corner detection...", "✅ Advanced corners: 90% accuracy"),
+    ('pattern_recognition', 85, "🔎 Trying pattern recognition...", "✅ Pattern recognition: 85% accuracy")
+]
+
+# QR fast path - PDF'dagi corner marker markazlari (mm), 15mm marker + 5mm margin
+MARKER_CENTER_MM = 12.5
+PAPER_SIZE_MM = (210.0, 297.0)
+
+# Racing mode: g'olib aniqlangach o'rnatiladi, strategiyalar bosqichlar orasida tekshiradi
+_cancel_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    'strategy_cancel_event', default=None
+)
+CANCELLED_RESULT = {'success': False, 'cancelled': True, 'error': 'Cancelled - higher priority strategy won'}
+
 class UltraPreciseCoordinateMapper:
     """
     100% aniq koordinatalashtirish tizimi
@@ -23,11 +49,17 @@ class UltraPreciseCoordinateMapper:
     - Real-time calibration
     """
     
-    def __init__(self):
+    def __init__(self, strategy_mode: Optional[str] = None, race_workers: Optional[int] = None):
         self.precision_level = "ULTRA_HIGH"  # ULTRA_HIGH, HIGH, MEDIUM
         self.pixel_tolerance = 1.0  # 1 pixel tolerance
         self.calibration_points = []
         
+        # 'sequential' - birin-ketin, 'race' - parallel, eng yuqori prioritetli muvaffaqiyat
+        self.strategy_mode = strategy_mode or settings.COORDINATE_STRATEGY_MODE
+        self.race_workers = race_workers or settings.COORDINATE_RACE_WORKERS
+        self._race_executor = None
+        self._race_executor_lock = threading.Lock()
+        
     def detect_layout_with_precision(
         self, 
         image: np.ndarray,
@@ -54,47 +86,21 @@ class UltraPreciseCoordinateMapper:
             'quality_metrics': {}
         }
         
-        # Strategy 1: Template Matching (BEST)
-        if coordinate_template:
-            logger.info("📐 Trying template matching...")
-            template_result = self._detect_with_template_matching(
-                image, coordinate_template, exam_structure
-            )
-            if template_result['success']:
-                results.update(template_result)
-                results['method'] = 'template_matching'
-                results['accuracy_estimate'] = 100
-                logger.info("✅ Template matching: 100% accuracy")
-                return results
-        
-        # Strategy 2: OCR Anchor Detection
-        logger.info("🔍 Trying OCR anchor detection...")
-        ocr_result = self._detect_with_ocr_anchors(image, exam_structure)
-        if ocr_result['success']:
-            results.update(ocr_result)
-            results['method'] = 'ocr_anchors'
-            results['accuracy_estimate'] = 95
-            logger.info("✅ OCR anchors: 95% accuracy")
-            return results
+        # Strategies 1-4: template matching, OCR anchors, advanced corners, pattern recognition
+        strategies = self._build_strategy_chain(image, exam_structure, coordinate_template)
         
-        # Strategy 3: Advanced Corner Detection
-        logger.info("📍 Trying advanced corner detection...")
-        corner_result = self._detect_with_advanced_corners(image, exam_structure)
-        if corner_result['success']:
-            results.update(corner_result)
-            results['method'] = 'advanced_corners'
-            results['accuracy_estimate'] = 90
-            logger.info("✅ Advanced corners: 90% accuracy")
-            return results
+        if self.strategy_mode == 'race' and len(strategies) > 1:
+            winner, timings = self._race_strategies(strategies)
+        else:
+            winner, timings = self._run_strategies_sequential(strategies)
+        
+        results['strategy_timings'] = timings
         
-        # Strategy 4: Pattern Recognition
-        logger.info("🔎 Trying pattern recognition...")
-        pattern_result = self._detect_with_pattern_recognition(image, exam_structure)
-        if pattern_result['success']:
-            results.update(pattern_result)
-            results['method'] = 'pattern_recognition'
-            results['accuracy_estimate'] = 85
-            logger.info("✅ Pattern recognition: 85% accuracy")
+        if winner is not None:
+            name, accuracy, result = winner
+            results.update(result)
+            results['method'] = name
+            results['accuracy_estimate'] = accuracy
             return results
         
         # Strategy 5: Simple Grid Fallback (NEW!)
@@ -116,6 +122,284 @@ class UltraPreciseCoordinateMapper:
         
         return results
     
+    def detect_layout_from_qr(
+        self,
+        image: np.ndarray,
+        qr_data: Dict,
+        qr_layout: Dict,
+        exam_structure: Dict,
+        frame: str = 'page'
+    ) -> Dict:
+        """
+        QR fast path - OCR/corner/pattern cascade'siz deterministik layout
+        
+        QR code examId/version va layout parametrlarini beradi, shuning uchun
+        layout bir marta kompilyatsiya qilinadi (LayoutCache) va har bir varaq
+        uchun bitta affine bilan pixel'ga o'giriladi.
+        
+        Args:
+            image: Perspective-corrected grayscale (ImageProcessor natijasi)
+            qr_data: read_qr_code natijasi
+            qr_layout: get_layout_from_qr natijasi (GRID_LAYOUT_FIELDS)
+            exam_structure: So'rovdagi imtihon tuzilmasi
+            frame: 'page' - rasm = butun sahifa, 'markers' - rasm = marker markazlari orasi
+        
+        Returns:
+            detect_layout_with_precision bilan bir xil format; 'success': False bo'lsa
+            chaqiruvchi to'liq cascade'ga qaytadi
+        """
+        start = time.perf_counter()
+        result = self._map_qr_layout(image, qr_data, qr_layout, exam_structure, frame)
+        duration_ms = (time.perf_counter() - start) * 1000
+        
+        outcome = 'success' if result.get('success') else 'failure'
+        result['strategy_timings'] = {'qr_layout': {'outcome': outcome, 'duration_ms': round(duration_ms, 1)}}
+        
+        if result.get('success'):
+            logger.info(f"⚡ QR layout fast path: {len(result['coordinates'])} questions in {duration_ms:.1f}ms")
+        else:
+            logger.warning(f"QR layout fast path rejected: {result.get('error')}")
+        
+        return result
+    
+    def _map_qr_layout(
+        self,
+        image: np.ndarray,
+        qr_data: Dict,
+        qr_layout: Dict,
+        exam_structure: Dict,
+        frame: str
+    ) -> Dict:
+        from utils.layout_cache import get_qr_layout
+        
+        structure = qr_data.get('structure', {})
+        expected_total = sum(
+            section['questionCount']
+            for subject in exam_structure['subjects']
+            for section in subject['sections']
+        )
+        if structure.get('totalQuestions') not in (None, expected_total):
+            return {
+                'success': False,
+                'error': f"QR totalQuestions {structure['totalQuestions']} != exam {expected_total}"
+            }
+        
+        layout = get_qr_layout(qr_data, qr_layout, exam_structure)
+        
+        height, width = image.shape[:2]
+        paper_width, paper_height = PAPER_SIZE_MM
+        if frame == 'markers':
+            # Rasm burchaklari = marker markazlari (12.5mm .. 197.5mm / 284.5mm)
+            scale_x = width / (paper_width - 2 * MARKER_CENTER_MM)
+            scale_y = height / (paper_height - 2 * MARKER_CENTER_MM)
+            offset_mm = MARKER_CENTER_MM
+        else:
+            scale_x = width / paper_width
+            scale_y = height / paper_height
+            offset_mm = 0.0
+        
+        matrix = [
+            [scale_x, 0.0, -offset_mm * scale_x],
+            [0.0, scale_y, -offset_mm * scale_y]
+        ]
+        mapped = layout.map(matrix, min(scale_x, scale_y))
+        
+        inside = (
+            (mapped.xy[:, 0] >= 0) & (mapped.xy[:, 0] < width) &
+            (mapped.xy[:, 1] >= 0) & (mapped.xy[:, 1] < height)
+        )
+        valid = int(inside.sum())
+        validation = {
+            'total_questions': len(layout.question_numbers),
+            'valid_coordinates': valid,
+            'invalid_coordinates': len(inside) - valid,
+            'out_of_bounds': len(inside) - valid,
+            'quality_score': valid / len(inside) if len(inside) else 0
+        }
+        if validation['quality_score'] < 1.0:
+            return {
+                'success': False,
+                'error': f"{validation['out_of_bounds']} bubbles outside the image",
+                'validation': validation
+            }
+        
+        return {
+            'success': True,
+            'method': 'qr_layout',
+            'accuracy_estimate': 100,
+            'coordinates': mapped.to_dict(),
+            'calibration_data': {'frame': frame, 'px_per_mm': [scale_x, scale_y]},
+            'quality_metrics': {},
+            'validation': validation,
+            'qr_exam_id': qr_data.get('examId'),
+            'qr_version': qr_data.get('version')
+        }
+    
+    def _build_strategy_chain(
+        self,
+        image: np.ndarray,
+        exam_structure: Dict,
+        coordinate_template: Optional[Dict]
+    ) -> List[Tuple]:
+        """
+        Mustaqil strategiyalar ro'yxati (prioritet tartibida)
+        
+        Returns:
+            [(name, accuracy, start_log, success_log, fn), ...]
+        """
+        runners = {
+            'template_matching': lambda: self._detect_with_template_matching(
+                image, coordinate_template, exam_structure
+            ),
+            'ocr_anchors': lambda: self._detect_with_ocr_anchors(image, exam_structure),
+            'advanced_corners': lambda: self._detect_with_advanced_corners(image, exam_structure),
+            'pattern_recognition': lambda: self._detect_with_pattern_recognition(image, exam_structure)
+        }
+        
+        return [
+            (name, accuracy, start_log, success_log, runners[name])
+            for name, accuracy, start_log, success_log in DETECTION_STRATEGIES
+            if name != 'template_matching' or coordinate_template
+        ]
+    
+    def _run_strategy(self, name: str, fn, cancel_event: Optional[threading.Event] = None) -> Tuple[Optional[Dict], Dict]:
+        """
+        Bitta strategiyani bajarish va o'lchash
+        
+        Outcome'lar javobdagi strategy_timings orqali MetricsRegistry'ga (/metrics) boradi.
+        
+        Returns:
+            (result yoki None (cancelled), {'outcome', 'duration_ms'})
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            return None, {'outcome': 'cancelled', 'duration_ms': 0.0}
+        
+        token = _cancel_event.set(cancel_event)
+        start = time.perf_counter()
+        try:
+            result = fn()
+            if result.get('cancelled'):
+                outcome = 'cancelled'
+            else:
+                outcome = 'success' if result.get('success') else 'failure'
+        except Exception as e:
+            logger.error(f"Strategy {name} crashed: {e}")
+            result = {'success': False, 'error': str(e)}
+            outcome = 'error'
+        finally:
+            _cancel_event.reset(token)
+        duration_ms = (time.perf_counter() - start) * 1000
+        
+        # Yuqoriroq prioritetli strategiya allaqachon yutgan - natija tashlanadi
+        if outcome != 'cancelled' and cancel_event is not None and cancel_event.is_set():
+            outcome = 'late'
+        
+        return result, {'outcome': outcome, 'duration_ms': round(duration_ms, 1)}
+    
+    @staticmethod
+    def _cancelled() -> bool:
+        """Racing mode'da g'olib allaqachon topilganmi (strategiya bosqichlari orasida tekshiriladi)"""
+        cancel_event = _cancel_event.get()
+        return cancel_event is not None and cancel_event.is_set()
+    
+    def _run_strategies_sequential(self, strategies: List[Tuple]) -> Tuple[Optional[Tuple], Dict]:
+        """
+        Strategiyalarni birin-ketin sinash - birinchi muvaffaqiyatda to'xtaydi
+        """
+        timings = {}
+        
+        for name, accuracy, start_log, success_log, fn in strategies:
+            logger.info(start_log)
+            result, timings[name] = self._run_strategy(name, fn)
+            
+            if result.get('success'):
+                logger.info(success_log)
+                return (name, accuracy, result), timings
+        
+        return None, timings
+    
+    @staticmethod
+    def _stop_lower_priority(future, index: int, futures: List, cancel_event: threading.Event):
+        """
+        Done-callback (g'olib thread'ida, u navbatdagi vazifani olishidan oldin):
+        yuqoriroq prioritetlilar muvaffaqiyatsiz tugagan bo'lsa, bu muvaffaqiyat
+        yakuniy - past prioritetlilar darhol bekor qilinadi / to'xtatiladi
+        """
+        if future.cancelled() or cancel_event.is_set():
+            return
+        result = future.result()[0]
+        if not (result and result.get('success')):
+            return
+        for earlier in futures[:index]:
+            if not earlier.done() or earlier.cancelled():
+                return
+            earlier_result = earlier.result()[0]
+            if earlier_result and earlier_result.get('success'):
+                return
+        
+        cancel_event.set()
+        for later in futures[index + 1:]:
+            later.cancel()
+    
+    def _get_race_executor(self) -> ThreadPoolExecutor:
+        with self._race_executor_lock:
+            if self._race_executor is None:
+                self._race_executor = ThreadPoolExecutor(
+                    max_workers=self.race_workers,
+                    thread_name_prefix='coord-race'
+                )
+            return self._race_executor
+    
+    def _race_strategies(self, strategies: List[Tuple]) -> Tuple[Optional[Tuple], Dict]:
+        """
+        Racing mode - barcha strategiyalar parallel ishga tushadi
+        
+        Natijalar prioritet tartibida kutiladi: eng yuqori prioritetli muvaffaqiyatli
+        strategiya qaytariladi. G'olib aniqlangach, hali boshlanmagan past prioritetli
+        strategiyalar bekor qilinadi, ishlayotganlari keyingi bosqich chegarasida
+        to'xtaydi (_cancelled), joriy bosqichni tugatganlari esa 'late'.
+        OpenCV va Tesseract GIL'ni bo'shatadi, shuning uchun thread'lar yetarli.
+        """
+        executor = self._get_race_executor()
+        cancel_event = threading.Event()
+        
+        logger.info(f"🏁 Racing {len(strategies)} strategies: {', '.join(s[0] for s in strategies)}")
+        # copy_context: so'rov plane_scope'i (umumiy plane'lar) thread'larga uzatiladi
+        futures = [
+            (name, accuracy, success_log, executor.submit(
+                contextvars.copy_context().run, self._run_strategy, name, fn, cancel_event
+            ))
+            for name, accuracy, _, success_log, fn in strategies
+        ]
+        pending = [future for _, _, _, future in futures]
+        for index, future in enumerate(pending):
+            future.add_done_callback(
+                lambda done, index=index: self._stop_lower_priority(done, index, pending, cancel_event)
+            )
+        
+        timings = {}
+        winner = None
+        
+        for name, accuracy, success_log, future in futures:
+            if winner is not None:
+                # Boshlanmagan bo'lsa - bekor qilinadi, aks holda fonda tugaydi
+                if future.cancel():
+                    timings[name] = {'outcome': 'cancelled', 'duration_ms': 0.0}
+                elif future.done():
+                    timings[name] = future.result()[1]
+                else:
+                    timings[name] = {'outcome': 'late', 'duration_ms': None}
+                continue
+            
+            result, timings[name] = future.result()
+            
+            if result is not None and result.get('success'):
+                logger.info(success_log)
+                winner = (name, accuracy, result)
+                cancel_event.set()
+        
+        return winner, timings
+    
     def _detect_with_template_matching(
         self, 
         image: np.ndarray, 
@@ -130,15 +414,14 @@ class UltraPreciseCoordinateMapper:
             from utils.template_coordinate_mapper import TemplateCoordinateMapper
             from services.improved_corner_detector import ImprovedCornerDetector
             
-            # Ensure image is in correct format
-            if len(image.shape) == 3:
-                image_for_detection = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                image_for_detection = image.copy()
+            # Ensure image is in correct format (umumiy plane grafidan, nusxasiz)
+            image_for_detection = get_image_planes(image)['gray']
             
             # Detect corners first
             corner_detector = ImprovedCornerDetector()
             corners = corner_detector.detect_corners(image_for_detection)
+            if self._cancelled():
+                return dict(CANCELLED_RESULT)
             
             if not corners or len(corners) != 4:
                 logger.warning("Template matching: Corner detection failed")
@@ -184,14 +467,13 @@ class UltraPreciseCoordinateMapper:
         try:
             from services.ocr_anchor_detector import OCRAnchorDetector
             
-            # Ensure image is grayscale
-            if len(image.shape) == 3:
-                gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                gray_image = image.copy()
+            # Ensure image is grayscale (umumiy plane grafidan, nusxasiz)
+            gray_image = get_image_planes(image)['gray']
             
             detector = OCRAnchorDetector()
             coordinates = detector.detect_all_with_anchors(gray_image, exam_structure)
+            if self._cancelled():
+                return dict(CANCELLED_RESULT)
             
             if not coordinates:
                 logger.warning("OCR anchor detection: No coordinates found")
@@ -223,15 +505,14 @@ class UltraPreciseCoordinateMapper:
             from services.improved_corner_detector import ImprovedCornerDetector
             from utils.relative_coordinate_mapper import RelativeCoordinateMapper
             
-            # Ensure image is in correct format
-            if len(image.shape) == 3:
-                image_for_detection = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                image_for_detection = image.copy()
+            # Ensure image is in correct format (umumiy plane grafidan, nusxasiz)
+            image_for_detection = get_image_planes(image)['gray']
             
             # Multi-strategy corner detection
             detector = ImprovedCornerDetector()
             corners = detector.detect_corners(image_for_detection)
+            if self._cancelled():
+                return dict(CANCELLED_RESULT)
             
             if not corners or len(corners) != 4:
                 logger.warning("Advanced corner detection: Corner detection failed")
@@ -240,6 +521,8 @@ class UltraPreciseCoordinateMapper:
             # Validate corner quality
             height, width = image_for_detection.shape[:2]
             corner_quality = self._assess_corner_quality(image_for_detection, corners)
+            if self._cancelled():
+                return dict(CANCELLED_RESULT)
             
             if corner_quality < 0.5:  # Lowered threshold for better compatibility
                 logger.warning(f"Advanced corner detection: Poor corner quality {corner_quality:.2f}")
@@ -284,12 +567,16 @@ class UltraPreciseCoordinateMapper:
         try:
             # Find bubble patterns in image
             bubble_candidates = self._find_bubble_patterns(image)
+            if self._cancelled():
+                return dict(CANCELLED_RESULT)
             
             if len(bubble_candidates) < 20:  # Minimum bubbles needed
                 return {'success': False, 'error': 'Insufficient bubble patterns found'}
             
             # Analyze patterns to determine layout
             layout_analysis = self._analyze_bubble_layout(bubble_candidates, exam_structure)
+            if self._cancelled():
+                return dict(CANCELLED_RESULT)
             
             if not layout_analysis['success']:
                 return {'success': False, 'error': 'Layout analysis failed'}
@@ -318,25 +605,19 @@ class UltraPreciseCoordinateMapper:
         """
         Rasmdan bubble pattern'larni topish
         """
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+        planes = get_image_planes(image)
+        gray = planes['gray']
         
         # Multiple detection methods
         bubbles = []
         
-        # Method 1: HoughCircles
-        circles = cv2.HoughCircles(
+        # Method 1: HoughCircles (answer grid ROI, reduced scale)
+        circles, _ = find_bubble_candidates(
             gray,
-            cv2.HOUGH_GRADIENT,
-            dp=1,
-            minDist=20,
-            param1=50,
-            param2=30,
-            minRadius=5,
-            maxRadius=15
+            [{'minRadius': 5, 'maxRadius': 15, 'param2': 30, 'minDist': 20}]
         )
         
         if circles is not None:
-            circles = np.round(circles[0, :]).astype("int")
             for (x, y, r) in circles:
                 bubbles.append({
                     'x': int(x),
@@ -346,7 +627,7 @@ class UltraPreciseCoordinateMapper:
                 })
         
         # Method 2: Contour detection
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        binary = planes['otsu_inv']
         contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
         for contour in contours:
@@ -0,0 +1,208 @@
+"""
+Worker Pool - CPU-bound grading pipelines uchun boshqariladigan executor
+Event loop'ni bloklamaslik uchun OpenCV ishini alohida process/thread'larda bajaradi
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPoolSaturated(Exception):
+    """Navbat to'lgan - yangi ish qabul qilinmaydi (HTTP 429)"""
+    pass
+
+
+class WorkerJobTimeout(Exception):
+    """Ish belgilangan vaqt ichida tugamadi (HTTP 504)"""
+    pass
+
+
+def _warm_up_worker():
+    """
+    Worker initializer - og'ir import'lar va servislarni oldindan yuklash
+
+    Birinchi so'rov cv2/numpy import va servis konstruktorlarini kutmasligi uchun
+    har bir worker ishga tushganda chaqiriladi.
+    """
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    from services import grading_pipeline
+    grading_pipeline.get_services()
+
+
+def _ping() -> int:
+    """Worker tayyorligini tekshirish (warm-up uchun)"""
+    return os.getpid()
+
+
+class WorkerPool:
+    """
+    Grading pipeline'lar uchun chegaralangan worker pool
+
+    - mode='process': ProcessPoolExecutor (GIL'siz, haqiqiy parallellik)
+    - mode='thread': ThreadPoolExecutor (fork/spawn qilib bo'lmaydigan muhitlar uchun)
+
+    Bir vaqtda bajarilayotgan + navbatdagi ishlar soni max_workers + queue_size
+    bilan chegaralangan. Limitdan oshsa WorkerPoolSaturated ko'tariladi.
+    """
+
+    def __init__(
+        self,
+        mode: str = 'process',
+        max_workers: Optional[int] = None,
+        queue_size: int = 10,
+        job_timeout: float = 60.0,
+        start_method: str = 'spawn'
+    ):
+        if mode not in ('process', 'thread'):
+            raise ValueError(f"Unknown worker pool mode: {mode}")
+
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.queue_size = max(0, queue_size)
+        self.job_timeout = job_timeout
+        self.start_method = start_method
+
+        self._executor = None
+        self._in_flight = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timed_out': 0
+        }
+
+        logger.info(
+            f"WorkerPool configured: mode={mode}, workers={self.max_workers}, "
+            f"queue={self.queue_size}, timeout={job_timeout}s"
+        )
+
+    @property
+    def capacity(self) -> int:
+        """Bir vaqtda qabul qilinadigan maksimal ishlar soni"""
+        return self.max_workers + self.queue_size
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self, warm_up: bool = True):
+        """
+        Executor'ni yaratish va (ixtiyoriy) barcha worker'larni isitish
+        """
+        if self._executor is not None:
+            return
+
+        if self.mode == 'process':
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_warm_up_worker
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix='omr-worker',
+                initializer=_warm_up_worker
+            )
+
+        if warm_up:
+            start = time.perf_counter()
+            # Har bir worker'ni ishga tushirish (executor'lar lazy spawn qiladi)
+            futures = [self._executor.submit(_ping) for _ in range(self.max_workers)]
+            for future in futures:
+                future.result()
+            logger.info(
+                f"WorkerPool warm-up complete: {self.max_workers} {self.mode} workers "
+                f"in {time.perf_counter() - start:.2f}s"
+            )
+
+    def shutdown(self, wait: bool = True):
+        """Executor'ni to'xtatish"""
+        if self._executor is None:
+            return
+
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        logger.info("WorkerPool shut down")
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Funksiyani worker'da bajarish
+
+        Args:
+            func: Module darajasidagi (pickle qilinadigan) funksiya
+            *args, **kwargs: Funksiya argumentlari
+            timeout: Ish uchun vaqt limiti (default: job_timeout)
+
+        Raises:
+            WorkerPoolSaturated: Navbat to'lgan
+            WorkerJobTimeout: Ish vaqt limitidan oshdi
+        """
+        if self._executor is None:
+            raise RuntimeError("WorkerPool is not started")
+
+        if self._in_flight >= self.capacity:
+            self._stats['rejected'] += 1
+            raise WorkerPoolSaturated(
+                f"Worker pool saturated ({self._in_flight}/{self.capacity} jobs in flight)"
+            )
+
+        loop = asyncio.get_running_loop()
+
+        self._in_flight += 1
+        self._stats['submitted'] += 1
+
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._in_flight -= 1
+            raise
+
+        # Slot ish haqiqatan tugaganda bo'shatiladi (timeout'da emas),
+        # shunda backpressure real yuklamani aks ettiradi
+        future.add_done_callback(
+            lambda f: loop.call_soon_threadsafe(self._release, f)
+        )
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future),
+                timeout=timeout if timeout is not None else self.job_timeout
+            )
+        except asyncio.TimeoutError:
+            self._stats['timed_out'] += 1
+            raise WorkerJobTimeout(
+                f"Job {getattr(func, '__name__', func)} exceeded "
+                f"{timeout if timeout is not None else self.job_timeout}s"
+            )
+
+    def _release(self, future):
+        self._in_flight = max(0, self._in_flight - 1)
+
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self._stats['failed'] += 1
+        else:
+            self._stats['completed'] += 1
+
+    def get_stats(self) -> Dict:
+        """Pool holati (health/metrics uchun)"""
+        return {
+            'mode': self.mode,
+            'started': self.started,
+            'max_workers': self.max_workers,
+            'queue_size': self.queue_size,
+            'capacity': self.capacity,
+            'in_flight': self._in_flight,
+            'job_timeout': self.job_timeout,
+            **self._stats
+        }
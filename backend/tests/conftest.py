@@ -0,0 +1,9 @@
+"""
+Pytest sozlamalari - backend/ ildizini import yo'liga qo'shish (main, services, utils)
+"""
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
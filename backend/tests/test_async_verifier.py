@@ -0,0 +1,254 @@
+"""
+AsyncAIVerifier - mock_ai_server.py'ga qarshi (jarayon ichida uvicorn thread'ida)
+
+Retry (5xx), Retry-After (429), varaq deadline'i, verdict cache va tiled mode
+(AI_VERIFY_BATCH_SIZE > 1).
+"""
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+import uvicorn
+
+import mock_ai_server
+from config import settings
+from services import grading_pipeline
+from services.async_verifier import AsyncAIVerifier
+from services.stage_metrics import MetricsRegistry
+
+VARIANTS = ['A', 'B', 'C', 'D']
+MOCK_DEFAULTS = dict(mock_ai_server.options)
+
+
+@pytest.fixture(scope='module')
+def mock_url():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(mock_ai_server.app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if server.started:
+            break
+        time.sleep(0.05)
+    assert server.started
+
+    yield f'http://127.0.0.1:{port}/v1'
+
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def mock_options():
+    """Har bir test toza mock holatidan boshlanadi"""
+    mock_ai_server.options.update(MOCK_DEFAULTS, latency=0.02, jitter=0.0)
+    with mock_ai_server.state_lock:
+        for key in mock_ai_server.state:
+            mock_ai_server.state[key] = 0
+    yield mock_ai_server.options
+    mock_ai_server.options.update(MOCK_DEFAULTS)
+
+
+def make_sheet(marks):
+    """
+    Grayscale varaq: har bir savol - 4 ta bubble qatori, marks[i] indeksli bubble to'ldirilgan
+
+    Returns:
+        (image, coordinates, omr_results) - barcha savollar past ishonchli
+    """
+    image = np.full((120 + 100 * len(marks), 420), 235, dtype=np.uint8)
+    coordinates = {}
+    answers = []
+    for index, mark in enumerate(marks):
+        number = index + 1
+        y = 100 + index * 100
+        bubbles = []
+        for column, variant in enumerate(VARIANTS):
+            x = 100 + column * 60
+            cv2.circle(image, (x, y), 15, 40, -1 if column == mark else 2)
+            bubbles.append({'variant': variant, 'x': x, 'y': y})
+        coordinates[number] = {'bubbles': bubbles}
+        answers.append({'questionNumber': number, 'answer': None, 'confidence': 30, 'warning': 'NO_MARK'})
+
+    omr_results = {'answers': {'topic': {'section': answers}}, 'statistics': {'uncertain': len(answers)}}
+    return image, coordinates, omr_results
+
+
+def fresh_results(omr_results):
+    """verify_uncertain_answers javob dict'larini joyida o'zgartiradi - har chaqiruvga nusxa"""
+    return {
+        'answers': {
+            topic: {section: [dict(answer) for answer in items] for section, items in sections.items()}
+            for topic, sections in omr_results['answers'].items()
+        },
+        'statistics': dict(omr_results['statistics'])
+    }
+
+
+def make_verifier(url, **overrides):
+    options = dict(concurrency=4, max_retries=2, deadline=10.0, request_timeout=5.0, cache_size=0, batch_size=1)
+    options.update(overrides)
+    return AsyncAIVerifier(provider='openai', api_key='test-key', model='mock', base_url=url, **options)
+
+
+def verified_answers(results):
+    return {
+        answer['questionNumber']: answer['answer']
+        for answer in results['answers']['topic']['section']
+        if answer.get('ai_verified')
+    }
+
+
+def test_answers_come_from_mock(mock_url, mock_options):
+    image, coordinates, omr_results = make_sheet([0, 2, 1, 3])
+
+    results = make_verifier(mock_url).verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+
+    assert verified_answers(results) == {1: 'A', 2: 'C', 3: 'B', 4: 'D'}
+    assert results['ai_verification']['requests'] == 4
+    assert results['ai_verification']['unanswered'] == 0
+
+
+def test_server_errors_are_retried_then_given_up(mock_url, mock_options, monkeypatch):
+    monkeypatch.setattr(settings, 'AI_VERIFY_BACKOFF_BASE', 0.01)
+    mock_options['error_rate'] = 1.0
+    image, coordinates, omr_results = make_sheet([0, 1])
+
+    results = make_verifier(mock_url, max_retries=2).verify_uncertain_answers(
+        image, fresh_results(omr_results), coordinates
+    )
+
+    stats = results['ai_verification']
+    assert verified_answers(results) == {}
+    assert stats['requests'] == 2 * 3
+    assert stats['retries'] == 2 * 2
+    assert stats['failed'] == 2
+    assert stats['unanswered'] == 2
+
+
+def test_rate_limit_honours_retry_after(mock_url, mock_options, monkeypatch):
+    # Backoff juda katta - Retry-After e'tiborsiz qolsa test sekinlashadi
+    monkeypatch.setattr(settings, 'AI_VERIFY_BACKOFF_BASE', 5.0)
+    mock_options.update(rate_limit_every=2, retry_after=0.2)
+    image, coordinates, omr_results = make_sheet([0, 1, 2, 3])
+
+    start = time.perf_counter()
+    results = make_verifier(mock_url).verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+    elapsed = time.perf_counter() - start
+
+    stats = results['ai_verification']
+    assert verified_answers(results) == {1: 'A', 2: 'B', 3: 'C', 4: 'D'}
+    assert stats['retries'] >= 1
+    assert mock_ai_server.state['rate_limited'] == stats['retries']
+    assert 0.2 <= elapsed < 2.0
+
+
+def test_deadline_keeps_omr_answers(mock_url, mock_options):
+    mock_options['latency'] = 2.0
+    image, coordinates, omr_results = make_sheet([0, 1, 2])
+
+    start = time.perf_counter()
+    results = make_verifier(mock_url, deadline=0.3).verify_uncertain_answers(
+        image, fresh_results(omr_results), coordinates
+    )
+    elapsed = time.perf_counter() - start
+
+    stats = results['ai_verification']
+    assert verified_answers(results) == {}
+    assert all(answer['answer'] is None for answer in results['answers']['topic']['section'])
+    assert stats['unanswered'] == 3
+    assert stats['deadline_expired'] == 3
+    assert elapsed < 1.5
+
+
+def test_cache_skips_repeat_requests(mock_url, mock_options):
+    image, coordinates, omr_results = make_sheet([3, 0, 2])
+    verifier = make_verifier(mock_url, cache_size=16)
+
+    first = verifier.verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+    second = verifier.verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+
+    assert verified_answers(second) == verified_answers(first) == {1: 'D', 2: 'A', 3: 'C'}
+    assert first['ai_verification']['requests'] == 3
+    assert second['ai_verification']['requests'] == 0
+    assert second['ai_verification']['cache_hits'] == 3
+    assert mock_ai_server.state['requests'] == 3
+
+
+def verdicts(results):
+    """Savol bo'yicha qaror: (javob, ishonch, warning)"""
+    return {
+        answer['questionNumber']: (answer['answer'], answer['confidence'], answer['warning'])
+        for answer in results['answers']['topic']['section']
+    }
+
+
+def tiled_verifier(url, batch_size):
+    verifier = make_verifier(url, batch_size=batch_size)
+    # Tile = crop o'lchami (200 px balandlik) - mock bir xil piksellarni ko'radi
+    verifier.tile_height = 200
+    return verifier
+
+
+def test_tiled_mode_matches_single_requests(mock_url, mock_options):
+    marks = [0, 2, 1, 3, 2, 0]
+    image, coordinates, omr_results = make_sheet(marks)
+
+    single = tiled_verifier(mock_url, 1).verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+    tiled = tiled_verifier(mock_url, 4).verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+
+    assert verdicts(tiled) == verdicts(single)
+    assert verified_answers(tiled) == {number + 1: 'ABCD'[mark] for number, mark in enumerate(marks)}
+    assert single['ai_verification']['requests'] == 6
+    assert tiled['ai_verification']['requests'] == 2
+    assert tiled['ai_verification']['tiled_requests'] == 2
+    assert tiled['ai_verification']['single_fallbacks'] == 0
+
+
+def test_malformed_tiled_reply_falls_back_to_single_requests(mock_url, mock_options):
+    mock_options['malformed_tiled'] = True
+    image, coordinates, omr_results = make_sheet([3, 1, 0])
+
+    results = tiled_verifier(mock_url, 3).verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+
+    stats = results['ai_verification']
+    assert verified_answers(results) == {1: 'D', 2: 'B', 3: 'A'}
+    assert stats['tiled_requests'] == 1
+    assert stats['single_fallbacks'] == 3
+    assert stats['requests'] == 1 + 3
+    assert mock_ai_server.state['tiled_requests'] == 1
+
+
+def test_call_counters_reach_metrics(mock_url, mock_options):
+    image, coordinates, omr_results = make_sheet([1, 2])
+    results = make_verifier(mock_url).verify_uncertain_answers(image, fresh_results(omr_results), coordinates)
+
+    registry = MetricsRegistry(window=16)
+    registry.observe('run_grade_sheet', {
+        'statistics': {'ai': dict(results['ai_verification'], enabled=True, verified=2, corrected=2)}
+    })
+
+    assert registry.ai_snapshot()['requests'] == 2
+    assert 'omr_ai_verification_events_total{event="retries"} 0' in registry.render_prometheus()
+
+
+def test_async_init_failure_falls_back_to_sync_verifier(monkeypatch):
+    from services import async_verifier
+    from services.openai_verifier import OpenAIVerifier
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('async client unavailable')
+
+    monkeypatch.setattr(settings, 'ENABLE_AI_VERIFICATION', True)
+    monkeypatch.setattr(settings, 'AI_VERIFY_ASYNC', True)
+    monkeypatch.setattr(settings, 'AI_PROVIDER', 'openai')
+    monkeypatch.setattr(settings, 'OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(async_verifier, 'AsyncAIVerifier', broken)
+
+    assert isinstance(grading_pipeline.create_ai_verifier(), OpenAIVerifier)
@@ -0,0 +1,79 @@
+"""
+BatchExpander ZIP limitlari - katta/ko'p entry'lar o'qilmasdan skipped'ga tushadi
+"""
+import io
+import zipfile
+
+import cv2
+import numpy as np
+
+from services.batch_loader import BatchExpander
+
+
+def _png() -> bytes:
+    ok, buffer = cv2.imencode('.png', np.full((40, 30), 200, dtype=np.uint8))
+    assert ok
+    return buffer.tobytes()
+
+
+def _zip(entries) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _expander(tmp_path, **limits) -> BatchExpander:
+    return BatchExpander(tmp_path, max_sheets=100, **limits)
+
+
+def test_zip_images_are_expanded(tmp_path):
+    expander = _expander(tmp_path)
+    expander.add_upload('batch.zip', None, _zip([('b.png', _png()), ('a.png', _png()), ('notes.txt', b'x')]))
+
+    assert [sheet['filename'] for sheet in expander.sheets] == ['a.png', 'b.png']
+    assert [entry['filename'] for entry in expander.skipped] == ['notes.txt']
+
+
+def test_oversized_entry_is_skipped_without_reading(tmp_path, monkeypatch):
+    # 20MB nol - siqilgan holda bir necha KB (ZIP bomb)
+    data = _zip([('bomb.png', b'\0' * (20 * 1024 * 1024)), ('ok.png', _png())])
+    assert len(data) < 100 * 1024
+
+    read_calls = []
+    original_read = zipfile.ZipFile.read
+    monkeypatch.setattr(
+        zipfile.ZipFile, 'read',
+        lambda self, name, pwd=None: read_calls.append(getattr(name, 'filename', name)) or original_read(self, name, pwd)
+    )
+
+    expander = _expander(tmp_path, max_entry_size=10 * 1024 * 1024)
+    expander.add_upload('batch.zip', None, data)
+
+    assert read_calls == ['ok.png']
+    assert [sheet['filename'] for sheet in expander.sheets] == ['ok.png']
+    assert expander.skipped[0]['filename'] == 'bomb.png'
+    assert 'too large' in expander.skipped[0]['reason']
+
+
+def test_total_uncompressed_size_is_capped(tmp_path):
+    png = _png()
+    data = _zip([(f'{i}.png', png) for i in range(5)])
+
+    expander = _expander(tmp_path, max_zip_total_size=len(png) * 3)
+    expander.add_upload('batch.zip', None, data)
+
+    assert len(expander.sheets) == 3
+    assert [entry['filename'] for entry in expander.skipped] == ['3.png', '4.png']
+
+
+def test_entry_count_is_capped(tmp_path):
+    data = _zip([(f'{i}.png', _png()) for i in range(5)])
+
+    expander = _expander(tmp_path, max_zip_entries=4)
+    expander.add_upload('batch.zip', None, data)
+
+    assert expander.sheets == []
+    assert expander.skipped[0]['filename'] == 'batch.zip'
+    assert 'entries' in expander.skipped[0]['reason']
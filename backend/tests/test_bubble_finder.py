@@ -0,0 +1,44 @@
+"""
+find_bubble_candidates - kutilgan son bo'yicha early exit va parametr cache
+"""
+import cv2
+import numpy as np
+
+from services.bubble_finder import find_bubble_candidates, hough_param_cache
+
+PARAM_SETS = [
+    {'minRadius': 40, 'maxRadius': 60, 'param2': 30, 'minDist': 80},  # bubble'lardan katta
+    {'minRadius': 14, 'maxRadius': 22, 'param2': 20, 'minDist': 30}
+]
+
+
+def _sheet(rows: int = 3, cols: int = 4) -> np.ndarray:
+    gray = np.full((400, 400), 255, dtype=np.uint8)
+    for row in range(rows):
+        for col in range(cols):
+            cv2.circle(gray, (80 + col * 70, 100 + row * 80), 18, 0, 2)
+    return gray
+
+
+def test_expected_count_zero_does_not_raise():
+    circles, params = find_bubble_candidates(_sheet(), PARAM_SETS, expected_count=0)
+
+    # Nolga eng yaqin son tanlanadi, TypeError yo'q
+    assert circles is not None
+    assert params in PARAM_SETS
+
+
+def test_early_exit_and_cache_within_tolerance():
+    hough_param_cache.clear()
+    key = ('test_detector', 'exam-1')
+
+    circles, params = find_bubble_candidates(_sheet(), PARAM_SETS, expected_count=12, cache_key=key)
+
+    assert params == PARAM_SETS[1]
+    assert abs(len(circles) - 12) <= 1
+    assert hough_param_cache.get_stats()['size'] == 1
+
+    # Keyingi varaqda cache'dagi to'plam birinchi sinaladi
+    _, params = find_bubble_candidates(_sheet(), PARAM_SETS, expected_count=12, cache_key=key)
+    assert params == PARAM_SETS[1]
+    assert hough_param_cache.hits == 1
@@ -0,0 +1,80 @@
+"""
+Koordinata strategiyalari - racing mode bekor qilish va /metrics counter'lari
+"""
+import threading
+import time
+
+from services.stage_metrics import MetricsRegistry
+from services.ultra_precise_coordinate_mapper import CANCELLED_RESULT, UltraPreciseCoordinateMapper
+
+
+def test_race_stops_running_and_cancels_pending_strategies():
+    mapper = UltraPreciseCoordinateMapper(strategy_mode='race', race_workers=2)
+    stopped = threading.Event()
+    started = threading.Event()
+
+    def winner():
+        started.wait(1.0)
+        return {'success': True, 'coordinates': {}}
+
+    def slow():
+        # Bosqichlar orasida _cancelled() tekshiriladi
+        started.set()
+        for _ in range(500):
+            if mapper._cancelled():
+                stopped.set()
+                return dict(CANCELLED_RESULT)
+            time.sleep(0.01)
+        return {'success': True}
+
+    def never():
+        raise AssertionError('pending strategy should be cancelled before it starts')
+
+    strategies = [
+        ('template_matching', 100, '', '', winner),
+        ('ocr_anchors', 95, '', '', slow),
+        ('advanced_corners', 90, '', '', never)
+    ]
+    result, timings = mapper._race_strategies(strategies)
+
+    assert result[0] == 'template_matching'
+    assert timings['advanced_corners']['outcome'] == 'cancelled'
+    assert timings['ocr_anchors']['outcome'] in ('late', 'cancelled')
+    assert stopped.wait(2.0)
+
+
+def test_sequential_mode_ignores_cancel_checks():
+    mapper = UltraPreciseCoordinateMapper(strategy_mode='sequential')
+    strategies = [
+        ('ocr_anchors', 95, '', '', lambda: {'success': not mapper._cancelled()})
+    ]
+
+    result, timings = mapper._run_strategies_sequential(strategies)
+
+    assert result[0] == 'ocr_anchors'
+    assert timings['ocr_anchors']['outcome'] == 'success'
+
+
+def test_registry_publishes_strategy_counters():
+    registry = MetricsRegistry(window=16)
+    for timings in (
+        {'template_matching': {'outcome': 'failure', 'duration_ms': 40.0},
+         'ocr_anchors': {'outcome': 'success', 'duration_ms': 60.0},
+         'pattern_recognition': {'outcome': 'late', 'duration_ms': None}},
+        {'ocr_anchors': {'outcome': 'success', 'duration_ms': 20.0},
+         'pattern_recognition': {'outcome': 'cancelled', 'duration_ms': 0.0}}
+    ):
+        registry.observe('run_grade_sheet', {
+            'statistics': {'coordinate_detection': {'strategy_timings': timings}}
+        })
+
+    snapshot = registry.strategy_snapshot()
+    assert snapshot['ocr_anchors']['success'] == 2
+    assert snapshot['ocr_anchors']['avg_ms'] == 40.0
+    assert snapshot['ocr_anchors']['success_rate'] == 100.0
+    assert snapshot['pattern_recognition']['attempts'] == 0
+
+    text = registry.render_prometheus()
+    assert 'omr_coordinate_strategy_runs_total{strategy="ocr_anchors",outcome="success"} 2' in text
+    assert 'omr_coordinate_strategy_runs_total{strategy="pattern_recognition",outcome="late"} 1' in text
+    assert 'omr_coordinate_strategy_seconds_sum{strategy="template_matching"} 0.040000' in text
@@ -0,0 +1,84 @@
+"""
+Corner engine template strategiyasi - coarse-to-fine match_marker_template
+va ImprovedCornerDetector'ning legacy template yo'li
+"""
+import cv2
+import numpy as np
+
+from services.corner_engine import CornerEngine, marker_template, match_marker_template
+from services.improved_corner_detector import ImprovedCornerDetector
+
+
+def _page(width=1240, height=1754):
+    """A4 150 dpi, 15 mm markerlar 5 mm chetda, biroz shovqin bilan"""
+    rng = np.random.default_rng(0)
+    page = np.clip(rng.normal(235, 6, (height, width)), 0, 255).astype(np.uint8)
+    px_per_mm = min(width / 210, height / 297)
+    size = int(round(15 * px_per_mm))
+    margin = int(round(5 * px_per_mm))
+    for x, y in ((margin, margin), (width - margin - size, margin),
+                 (margin, height - margin - size), (width - margin - size, height - margin - size)):
+        page[y:y + size, x:x + size] = 30
+    return page, size, margin
+
+
+def test_coarse_to_fine_matches_full_resolution_search():
+    page, size, margin = _page()
+    tile = page[:300, :300]
+    pad = size // 4
+
+    full = cv2.matchTemplate(tile, marker_template(size, pad), cv2.TM_CCOEFF_NORMED)
+    _, full_peak, _, full_location = cv2.minMaxLoc(full)
+
+    peak, location = match_marker_template(tile, size, pad, threshold=0.6, coarse_threshold=0.5)
+
+    assert location == full_location
+    assert abs(peak - full_peak) < 1e-6
+    assert location == (margin - pad, margin - pad)
+
+
+def test_no_marker_returns_none():
+    blank = np.full((300, 300), 235, dtype=np.uint8)
+    cv2.putText(blank, 'Q12', (40, 150), cv2.FONT_HERSHEY_SIMPLEX, 2, 0, 4)
+
+    assert match_marker_template(blank, 89, 22, threshold=0.6, coarse_threshold=0.5) is None
+
+
+def test_engine_template_strategy_finds_markers(monkeypatch):
+    page, size, margin = _page()
+    engine = CornerEngine('scan')
+    monkeypatch.setitem(engine.params, 'strategies', ('template',))
+
+    markers = engine.detect(page)
+
+    assert [marker['method'] for marker in markers] == ['template'] * 4
+    expected = margin + size / 2
+    assert abs(markers[0]['x'] - expected) <= 1.5
+    assert abs(markers[0]['y'] - expected) <= 1.5
+
+
+def test_uniform_template_cannot_locate_markers():
+    # Hoshiyasiz (bir xil rangli) template - TM_CCOEFF_NORMED har joyda 1.0
+    page, size, _ = _page()
+    result = cv2.matchTemplate(page[:300, :300], np.zeros((size, size), dtype=np.uint8), cv2.TM_CCOEFF_NORMED)
+    assert result.min() == result.max()
+
+    template = marker_template(size, size // 4)
+    assert template[0, 0] == 255 and template[template.shape[0] // 2, template.shape[1] // 2] == 0
+
+
+def test_legacy_template_matching_finds_all_corners():
+    page, size, margin = _page()
+    height, width = page.shape
+
+    corners = ImprovedCornerDetector()._detect_by_template_matching(page)
+
+    near = margin + size / 2
+    expected = {
+        'top-left': (near, near), 'top-right': (width - near, near),
+        'bottom-left': (near, height - near), 'bottom-right': (width - near, height - near)
+    }
+    assert [corner['name'] for corner in corners] == list(expected)
+    for corner in corners:
+        x, y = expected[corner['name']]
+        assert abs(corner['x'] - x) <= 2 and abs(corner['y'] - y) <= 2
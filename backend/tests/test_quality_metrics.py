@@ -0,0 +1,50 @@
+"""
+compute_quality_metrics - tile'lar bo'yicha sharpness butun sahifa shkalasida
+"""
+import cv2
+import numpy as np
+
+from services.quality_metrics import compute_quality_metrics
+
+
+def _page(width=2480, height=3508):
+    """A4 300 dpi: bubble qatorlari, matn chiziqlari va qog'oz shovqini"""
+    rng = np.random.default_rng(0)
+    page = np.clip(rng.normal(232, 4, (height, width)), 0, 255).astype(np.uint8)
+    for y in range(300, height - 300, 90):
+        for x in range(300, width - 300, 110):
+            cv2.circle(page, (x, y), 28, 40, 3 if (x + y) % 7 else -1)
+        cv2.line(page, (120, y + 40), (width - 120, y + 40), 90, 2)
+    return page
+
+
+def _full_page_variance(gray):
+    return cv2.Laplacian(gray, cv2.CV_64F).var()
+
+
+def test_global_statistics_are_exact():
+    page = _page()
+    metrics = compute_quality_metrics(page)
+
+    assert abs(metrics['mean'] - page.mean()) < 1e-6
+    assert abs(metrics['std'] - page.std()) < 1e-6
+    assert abs(metrics['overexposed'] - (page > 240).mean() * 100) < 1e-9
+    assert abs(metrics['underexposed'] - (page < 15).mean() * 100) < 1e-9
+
+
+def test_tile_sharpness_tracks_full_page_variance():
+    page = _page()
+    for kernel in (0, 3, 7, 15):
+        blurred = page if kernel == 0 else cv2.GaussianBlur(page, (kernel, kernel), 0)
+        ratio = compute_quality_metrics(blurred)['laplacian_var'] / _full_page_variance(blurred)
+        # test_images + sintetik varaqlar bo'yicha nisbat 0.67-1.23 oralig'ida
+        assert 0.65 < ratio < 1.35, (kernel, ratio)
+
+
+def test_blur_lowers_sharpness_monotonically():
+    page = _page()
+    values = [
+        compute_quality_metrics(page if kernel == 0 else cv2.GaussianBlur(page, (kernel, kernel), 0))['laplacian_var']
+        for kernel in (0, 3, 7, 15)
+    ]
+    assert values == sorted(values, reverse=True)
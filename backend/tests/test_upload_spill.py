@@ -0,0 +1,59 @@
+"""
+read_upload: kichik upload xotirada, UPLOAD_SPILL_THRESHOLD'dan kattasi TEMP_DIR orqali
+"""
+import asyncio
+import io
+
+import cv2
+import numpy as np
+from starlette.datastructures import UploadFile
+
+import main
+from config import settings
+from services.image_loader import load_image
+
+
+def _encoded_sheet() -> bytes:
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(400, 300), dtype=np.uint8)
+    ok, buffer = cv2.imencode('.png', image)
+    assert ok
+    return buffer.tobytes()
+
+
+def _read(data: bytes, filename: str = 'sheet.png'):
+    upload = UploadFile(file=io.BytesIO(data), filename=filename, size=len(data))
+    return asyncio.run(main.read_upload(upload, prefix='test_'))
+
+
+def test_default_threshold_is_reachable():
+    assert 0 < settings.UPLOAD_SPILL_THRESHOLD <= settings.MAX_FILE_SIZE
+
+
+def test_small_upload_stays_in_memory(monkeypatch, tmp_path):
+    data = _encoded_sheet()
+    monkeypatch.setattr(settings, 'TEMP_DIR', tmp_path)
+    monkeypatch.setattr(settings, 'UPLOAD_SPILL_THRESHOLD', len(data))
+
+    source, temp_path = _read(data)
+
+    assert temp_path is None
+    assert source == data
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_large_upload_spills_to_temp_dir(monkeypatch, tmp_path):
+    data = _encoded_sheet()
+    monkeypatch.setattr(settings, 'TEMP_DIR', tmp_path)
+    monkeypatch.setattr(settings, 'UPLOAD_SPILL_THRESHOLD', len(data) - 1)
+
+    source, temp_path = _read(data)
+
+    assert temp_path is not None and temp_path.parent == tmp_path
+    assert source == str(temp_path)
+    assert temp_path.read_bytes() == data
+    # Diskdan yuklangan rasm xotiradagi bilan bir xil decode bo'ladi
+    assert np.array_equal(load_image(source, cv2.IMREAD_GRAYSCALE), load_image(data, cv2.IMREAD_GRAYSCALE))
+
+    main.remove_temp_file(temp_path)
+    assert not temp_path.exists()
@@ -10,6 +10,7 @@ import os
 # Add parent directory to path for config import
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import settings
+from utils.layout_cache import CompiledLayout, MappedLayout, get_grid_layout, grid_layout_params
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +87,32 @@ class CoordinateMapper:
         
         logger.info(f"Calculating coordinates: {self.px_per_mm_x:.2f} px/mm")
     
+    def compile_layout(self) -> CompiledLayout:
+        """
+        Varaqdan mustaqil layout (mm) - exam_structure + layout bo'yicha cache'lanadi
+        """
+        # CRITICAL FIX: Simulated/generated images (QR code yoki aniq target o'lcham)
+        # topic/section sarlavhalarisiz - real PDF'da sarlavha offset'lari qo'shiladi
+        simulated = bool(self.qr_layout) or (self.image_width == 2480 and self.image_height == 3508)
+        if simulated:
+            logger.info("Detected simulated/generated image - skipping topic/section headers")
+        else:
+            logger.info("Real PDF detected - adding topic/section header offsets")
+
+        return get_grid_layout(self.exam_structure, grid_layout_params(self), header_offsets=not simulated)
+
+    def map_layout(self) -> MappedLayout:
+        """
+        Layout'ni pixel'larga o'girish (mm -> px, bitta vektorlashtirilgan amal)
+        """
+        layout = self.compile_layout()
+        matrix = [
+            [self.px_per_mm_x, 0.0, 0.0],
+            [0.0, self.px_per_mm_y, 0.0]
+        ]
+        radius_scale = min(self.px_per_mm_x, self.px_per_mm_y)
+        return layout.map(matrix, radius_scale)
+
     def calculate_all(self) -> Dict[int, Dict]:
         """
         Barcha savollar uchun koordinatalarni hisoblash
@@ -101,96 +128,9 @@ class CoordinateMapper:
                 }
             }
         """
-        coordinates = {}
-        question_number = 1
-        
-        # In PDF: currentY = startY (this is where grid starts)
-        # This matches grid_start_y_mm (113mm by default)
-        current_y_mm = self.grid_start_y_mm
-        
-        for topic_idx, topic in enumerate(self.exam_structure['subjects']):
-            logger.info(f"Topic {topic_idx + 1}: {topic['name']}")
-            
-            # CRITICAL FIX: Check if this is a simulated/test image
-            # Simulated images don't have topic/section headers!
-            # If QR code is present, use its layout (no headers)
-            # If no QR code but image is exactly target size, assume no headers
-            
-            if self.qr_layout or (self.image_width == 2480 and self.image_height == 3508):
-                # This is likely a simulated/generated image without headers
-                logger.info("Detected simulated/generated image - skipping topic header")
-                # Don't add header offset for simulated images
-            else:
-                # Real PDF with printed headers
-                logger.info("Real PDF detected - adding topic header offset")
-                current_y_mm += 8  # Skip topic header (6mm) + spacing (2mm)
-            
-            for section_idx, section in enumerate(topic['sections']):
-                logger.info(f"  Section {section_idx + 1}: {section['name']} ({section['questionCount']} questions)")
-                
-                # CRITICAL FIX: Check if this is a simulated/test image
-                # Simulated images don't have section headers!
-                
-                if self.qr_layout or (self.image_width == 2480 and self.image_height == 3508):
-                    # This is likely a simulated/generated image without headers
-                    logger.info("Detected simulated/generated image - skipping section header")
-                    # Don't add header offset for simulated images
-                else:
-                    # Real PDF with printed headers
-                    logger.info("Real PDF detected - adding section header offset")
-                    current_y_mm += 5  # Skip section header
-                
-                # Calculate questions in this section
-                for i in range(section['questionCount']):
-                    # Determine row and column
-                    row = i // self.questions_per_row
-                    col = i % self.questions_per_row
-                    
-                    # Calculate Y position
-                    # In PDF: currentY + 2 for bubble center
-                    # currentY + 4 for question number text
-                    question_y_mm = current_y_mm + (row * self.row_height_mm)
-                    
-                    # Calculate X position
-                    question_x_mm = self.grid_start_x_mm + (col * self.question_spacing_mm)
-                    
-                    # Calculate bubble positions
-                    bubbles = []
-                    variants = ['A', 'B', 'C', 'D', 'E']
-                    
-                    for v_idx, variant in enumerate(variants):
-                        # In PDF: bubbleX = xPos + 8 + (vIndex * bubbleSpacing)
-                        # bubbleY = currentY + 2
-                        bubble_x_mm = question_x_mm + self.first_bubble_offset_mm + (v_idx * self.bubble_spacing_mm)
-                        bubble_y_mm = question_y_mm + 2  # +2mm offset in PDF
-                        
-                        # Convert to pixels
-                        bubble_x_px = bubble_x_mm * self.px_per_mm_x
-                        bubble_y_px = bubble_y_mm * self.px_per_mm_y
-                        bubble_radius_px = self.bubble_radius_mm * min(self.px_per_mm_x, self.px_per_mm_y)
-                        
-                        bubbles.append({
-                            'variant': variant,
-                            'x': bubble_x_px,
-                            'y': bubble_y_px,
-                            'radius': bubble_radius_px
-                        })
-                    
-                    coordinates[question_number] = {
-                        'questionNumber': question_number,
-                        'bubbles': bubbles
-                    }
-                    
-                    question_number += 1
-                
-                # Update Y for next section
-                rows_in_section = (section['questionCount'] + self.questions_per_row - 1) // self.questions_per_row
-                current_y_mm += (rows_in_section * self.row_height_mm) + 2  # +2mm spacing (reduced from 3mm)
-            
-            # Space between topics
-            current_y_mm += 3  # Reduced from 5mm to 3mm
+        coordinates = self.map_layout().to_dict()
         
-        logger.info(f"Calculated coordinates for {question_number - 1} questions")
+        logger.info(f"Calculated coordinates for {len(coordinates)} questions")
         return coordinates
     
     def get_corner_markers(self) -> List[Dict]:
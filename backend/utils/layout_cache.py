@@ -0,0 +1,409 @@
+"""
+Layout Cache - imtihon/template uchun kompilyatsiya qilingan bubble layout'lari
+Har bir varaq uchun exam_structure'dan dict'larni qaytadan qurish o'rniga
+
+Varaqdan varaqqa faqat corner'lar o'zgaradi, shuning uchun:
+1. Bubble markazlari va radiuslari bir marta contiguous float32 massivga yig'iladi
+2. Natija hash (exam_structure + coordinate_template + QR layout) bo'yicha LRU'da saqlanadi
+3. Har bir varaq uchun bitta vektorlashtirilgan affine/homography bilan pixel'ga o'giriladi
+4. Eski {q_num: {'bubbles': [...]}} dict faqat kerak bo'lganda (to_dict) quriladi
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = ('A', 'B', 'C', 'D', 'E')
+
+# PDF generator layout parametrlari (QR code yoki default)
+GRID_LAYOUT_FIELDS = (
+    'questions_per_row',
+    'question_spacing_mm',
+    'bubble_radius_mm',
+    'bubble_spacing_mm',
+    'row_height_mm',
+    'grid_start_x_mm',
+    'grid_start_y_mm',
+    'first_bubble_offset_mm'
+)
+
+
+def layout_key(kind: str, *parts) -> str:
+    """Layout ta'rifining barqaror hash'i (LayoutCache kaliti)"""
+    payload = json.dumps(
+        [kind, *parts],
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+# Template'ni serialize qilish uni compile qilishdan qimmatroq - bir xil dict
+# obyekti (masalan, batch'da ExamContext.coord_template) uchun kalit eslab qolinadi.
+# Obyekt memo'da saqlanadi, shuning uchun id() qayta ishlatilmaydi.
+_template_keys: 'OrderedDict[int, Tuple[Dict, str]]' = OrderedDict()
+_template_keys_lock = threading.Lock()
+_TEMPLATE_KEY_LIMIT = 16
+
+
+def template_key(coordinate_template: Dict) -> str:
+    """
+    Coordinate template kaliti (obyekt identity bo'yicha memo)
+
+    Template so'rov JSON'idan olinadi va keyin o'zgartirilmaydi deb hisoblanadi.
+    """
+    memo_key = id(coordinate_template)
+
+    with _template_keys_lock:
+        entry = _template_keys.get(memo_key)
+        if entry is not None and entry[0] is coordinate_template:
+            _template_keys.move_to_end(memo_key)
+            return entry[1]
+
+    key = layout_key('template', coordinate_template)
+
+    with _template_keys_lock:
+        _template_keys[memo_key] = (coordinate_template, key)
+        while len(_template_keys) > _TEMPLATE_KEY_LIMIT:
+            _template_keys.popitem(last=False)
+
+    return key
+
+
+class MappedLayout:
+    """
+    Bitta varaq uchun pixel koordinatalari
+
+    xy: (N, 2) float64, radii: (N,) float64 - CompiledLayout bilan bir xil tartibda.
+    """
+
+    def __init__(
+        self,
+        layout: 'CompiledLayout',
+        xy: np.ndarray,
+        radii: np.ndarray,
+        relative: Optional[np.ndarray] = None
+    ):
+        self.layout = layout
+        self.xy = xy
+        self.radii = radii
+        self.relative = relative
+        self._coordinates = None
+
+    def to_dict(self) -> Dict[int, Dict]:
+        """
+        Eski format (birinchi chaqiruvda quriladi)
+
+        Returns:
+            dict: {questionNumber: {'questionNumber': int, 'bubbles': [...]}}
+        """
+        if self._coordinates is not None:
+            return self._coordinates
+
+        xs = self.xy[:, 0].tolist()
+        ys = self.xy[:, 1].tolist()
+        radii = self.radii.tolist()
+        if self.relative is not None:
+            rel_xs = self.relative[:, 0].tolist()
+            rel_ys = self.relative[:, 1].tolist()
+
+        variants = self.layout.variants
+        offsets = self.layout.offsets
+        coordinates = {}
+
+        for q_idx, q_num in enumerate(self.layout.question_numbers):
+            bubbles = []
+            for i in range(offsets[q_idx], offsets[q_idx + 1]):
+                bubble = {
+                    'variant': variants[i],
+                    'x': xs[i],
+                    'y': ys[i],
+                    'radius': radii[i]
+                }
+                if self.relative is not None:
+                    bubble['relative_x'] = rel_xs[i]  # For debugging
+                    bubble['relative_y'] = rel_ys[i]  # For debugging
+                bubbles.append(bubble)
+
+            coordinates[q_num] = {
+                'questionNumber': q_num,
+                'bubbles': bubbles
+            }
+
+        self._coordinates = coordinates
+        return coordinates
+
+
+class CompiledLayout:
+    """
+    Varaqdan mustaqil bubble layout
+
+    points: (N, 3) float32 [x, y, radius] layout birliklarida
+            (generator layout'i uchun mm, template uchun corner'lar orasidagi 0-1)
+    frame: (width, height) - points'ni 0-1 ga normallashtirish uchun
+    """
+
+    def __init__(
+        self,
+        question_numbers: Sequence[int],
+        offsets: Sequence[int],
+        variants: Sequence,
+        points: np.ndarray,
+        frame: Tuple[float, float] = (1.0, 1.0)
+    ):
+        self.question_numbers = list(question_numbers)
+        self.offsets = list(offsets)
+        self.variants = tuple(variants)
+        self.points = np.ascontiguousarray(points, dtype=np.float32)
+        self.points.setflags(write=False)
+        self.frame = frame
+
+    @property
+    def question_count(self) -> int:
+        return len(self.question_numbers)
+
+    @property
+    def bubble_count(self) -> int:
+        return len(self.points)
+
+    def normalized(self) -> np.ndarray:
+        """(N, 2) float64 markazlar 0-1 oralig'ida (frame bo'yicha)"""
+        return self.points[:, :2].astype(np.float64) / np.asarray(self.frame, dtype=np.float64)
+
+    def map(
+        self,
+        matrix: np.ndarray,
+        radius_scale: float,
+        normalized: bool = False,
+        include_relative: bool = False
+    ) -> MappedLayout:
+        """
+        Layout'ni varaq pixel'lariga o'girish
+
+        Args:
+            matrix: 2x3 affine yoki 3x3 homography (layout/normallashgan -> pixel)
+            radius_scale: pixel/mm (radius uchun)
+            normalized: True bo'lsa matrix 0-1 koordinatalarga qo'llanadi
+            include_relative: Bubble'larga relative_x/relative_y qo'shish
+        """
+        m = np.asarray(matrix, dtype=np.float64)
+        uv = self.normalized() if normalized else self.points[:, :2].astype(np.float64)
+        u = uv[:, 0]
+        v = uv[:, 1]
+
+        # Element-wise (BLAS/FMA'siz) - skalyar formulalar bilan bir xil natija
+        x = m[0, 0] * u + m[0, 1] * v + m[0, 2]
+        y = m[1, 0] * u + m[1, 1] * v + m[1, 2]
+
+        if m.shape[0] == 3 and (m[2, 0] != 0 or m[2, 1] != 0 or m[2, 2] != 1):
+            w = m[2, 0] * u + m[2, 1] * v + m[2, 2]
+            x = x / w
+            y = y / w
+
+        radii = self.points[:, 2].astype(np.float64) * radius_scale
+        relative = self.normalized() if include_relative else None
+
+        return MappedLayout(self, np.stack([x, y], axis=1), radii, relative)
+
+
+def compile_grid_layout(exam_structure: Dict, params: Dict, header_offsets: bool) -> CompiledLayout:
+    """
+    PDF generator grid'idan layout (mm) - CoordinateMapper/RelativeCoordinateMapper uchun
+
+    Args:
+        exam_structure: {'subjects': [{'name', 'sections': [{'name', 'questionCount'}]}]}
+        params: GRID_LAYOUT_FIELDS qiymatlari
+        header_offsets: Topic (+8mm) va section (+5mm) sarlavhalarini hisobga olish
+    """
+    questions_per_row = params['questions_per_row']
+    row_height_mm = params['row_height_mm']
+
+    question_numbers = []
+    offsets = [0]
+    variants = []
+    points = []
+
+    question_number = 1
+    current_y_mm = params['grid_start_y_mm']
+
+    for topic_idx, topic in enumerate(exam_structure['subjects']):
+        logger.info(f"Topic {topic_idx + 1}: {topic['name']}")
+
+        if header_offsets:
+            current_y_mm += 8  # Skip topic header (6mm) + spacing (2mm)
+
+        for section_idx, section in enumerate(topic['sections']):
+            logger.info(f"  Section {section_idx + 1}: {section['name']} ({section['questionCount']} questions)")
+
+            if header_offsets:
+                current_y_mm += 5  # Skip section header
+
+            for i in range(section['questionCount']):
+                row = i // questions_per_row
+                col = i % questions_per_row
+
+                question_y_mm = current_y_mm + (row * row_height_mm)
+                question_x_mm = params['grid_start_x_mm'] + (col * params['question_spacing_mm'])
+
+                for v_idx, variant in enumerate(VARIANTS):
+                    # In PDF: bubbleX = xPos + 8 + (vIndex * bubbleSpacing), bubbleY = currentY + 2
+                    bubble_x_mm = question_x_mm + params['first_bubble_offset_mm'] + (v_idx * params['bubble_spacing_mm'])
+                    bubble_y_mm = question_y_mm + 2
+
+                    variants.append(variant)
+                    points.append((bubble_x_mm, bubble_y_mm, params['bubble_radius_mm']))
+
+                question_numbers.append(question_number)
+                offsets.append(len(points))
+                question_number += 1
+
+            rows_in_section = (section['questionCount'] + questions_per_row - 1) // questions_per_row
+            current_y_mm += (rows_in_section * row_height_mm) + 2
+
+        current_y_mm += 3
+
+    return CompiledLayout(
+        question_numbers,
+        offsets,
+        variants,
+        np.array(points, dtype=np.float32).reshape(-1, 3),
+        frame=(210.0, 297.0)  # A4 in mm
+    )
+
+
+def compile_template_layout(coordinate_template: Dict) -> CompiledLayout:
+    """
+    Saqlangan coordinate template'dan layout (corner'lar orasidagi 0-1 koordinatalar)
+    """
+    bubble_radius_mm = coordinate_template.get('layout', {}).get('bubbleRadius', 2.5)
+
+    question_numbers = []
+    offsets = [0]
+    variants = []
+    points = []
+
+    for q_num_str, q_data in coordinate_template.get('questions', {}).items():
+        for bubble_template in q_data.get('bubbles', []):
+            variants.append(bubble_template.get('variant'))
+            points.append((
+                bubble_template.get('relativeX', 0),
+                bubble_template.get('relativeY', 0),
+                bubble_radius_mm
+            ))
+
+        question_numbers.append(int(q_num_str))
+        offsets.append(len(points))
+
+    return CompiledLayout(
+        question_numbers,
+        offsets,
+        variants,
+        np.array(points, dtype=np.float32).reshape(-1, 3)
+    )
+
+
+class LayoutCache:
+    """
+    CompiledLayout'lar uchun thread-safe LRU (hajm va TTL bo'yicha eviction)
+    """
+
+    def __init__(self, max_size: int = 64, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl  # seconds, 0 = muddatsiz
+
+        self._entries: 'OrderedDict[str, Tuple[float, CompiledLayout]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compile(self, key: str, compile_fn: Callable[[], CompiledLayout]) -> CompiledLayout:
+        """Cache'dan olish yoki compile_fn bilan qurib saqlash"""
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, layout = entry
+                if not self.ttl or now - created_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return layout
+                del self._entries[key]
+
+            self.misses += 1
+            layout = compile_fn()
+            self._entries[key] = (now, layout)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        logger.info(
+            f"Compiled layout {key[:12]}: {layout.question_count} questions, "
+            f"{layout.bubble_count} bubbles"
+        )
+        return layout
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+layout_cache = LayoutCache(settings.LAYOUT_CACHE_SIZE, settings.LAYOUT_CACHE_TTL)
+
+
+def grid_layout_params(mapper) -> Dict:
+    """Mapper atributlaridan GRID_LAYOUT_FIELDS dict"""
+    return {field: getattr(mapper, field) for field in GRID_LAYOUT_FIELDS}
+
+
+def get_grid_layout(exam_structure: Dict, params: Dict, header_offsets: bool) -> CompiledLayout:
+    key = layout_key('grid', exam_structure, params, header_offsets)
+    return layout_cache.get_or_compile(
+        key,
+        lambda: compile_grid_layout(exam_structure, params, header_offsets)
+    )
+
+
+def get_template_layout(coordinate_template: Dict) -> CompiledLayout:
+    key = template_key(coordinate_template)
+    return layout_cache.get_or_compile(
+        key,
+        lambda: compile_template_layout(coordinate_template)
+    )
+
+
+def get_qr_layout(qr_data: Dict, params: Dict, exam_structure: Dict) -> CompiledLayout:
+    """
+    QR bilan aniqlangan varaq layout'i - examId/version bo'yicha kalit
+
+    Chop etilgan PDF sarlavhalarni o'z ichiga oladi (header_offsets=True).
+    Kalitga savollar soni ham kiradi - imtihon tahrirlansa eski layout ishlatilmaydi.
+    """
+    question_counts = [
+        [section['questionCount'] for section in subject['sections']]
+        for subject in exam_structure['subjects']
+    ]
+    key = layout_key('qr', qr_data.get('examId'), qr_data.get('version'), params, question_counts)
+    return layout_cache.get_or_compile(
+        key,
+        lambda: compile_grid_layout(exam_structure, params, header_offsets=True)
+    )
@@ -6,6 +6,8 @@ import logging
 from typing import Dict, List, Optional
 import numpy as np
 
+from utils.layout_cache import MappedLayout, get_grid_layout, grid_layout_params
+
 logger = logging.getLogger(__name__)
 
 class RelativeCoordinateMapper:
@@ -147,6 +149,27 @@ class RelativeCoordinateMapper:
         
         return (pixel_x, pixel_y)
     
+    def map_layout(self) -> MappedLayout:
+        """
+        Cache'langan layout'ni pixel'larga o'girish
+        mm -> nisbiy (0-1) -> pixel, bitta vektorlashtirilgan amal
+        """
+        # Real PDF: topic/section sarlavhalari har doim hisobga olinadi
+        layout = get_grid_layout(self.exam_structure, grid_layout_params(self), header_offsets=True)
+        
+        # relative_to_pixels() bilan bir xil: top-left + relative * (width, height)
+        matrix = [
+            [self.width_px, 0.0, self.corners['top-left']['x']],
+            [0.0, self.height_px, self.corners['top-left']['y']]
+        ]
+        
+        # Bubble radius in pixels - average scale factor
+        scale_x = self.width_px / self.width_mm
+        scale_y = self.height_px / self.height_mm
+        scale_avg = (scale_x + scale_y) / 2
+        
+        return layout.map(matrix, scale_avg, normalized=True, include_relative=True)
+    
     def calculate_all(self) -> Dict[int, Dict]:
         """
         Barcha savollar uchun koordinatalarni hisoblash
@@ -155,80 +178,7 @@ class RelativeCoordinateMapper:
         Returns:
             dict: {questionNumber: {'questionNumber': int, 'bubbles': [...]}}
         """
-        coordinates = {}
-        question_number = 1
-        
-        # Start from grid position
-        current_y_mm = self.grid_start_y_mm
-        
-        for topic_idx, topic in enumerate(self.exam_structure['subjects']):
-            logger.info(f"Topic {topic_idx + 1}: {topic['name']}")
-            
-            # Topic header
-            current_y_mm += 8
-            
-            for section_idx, section in enumerate(topic['sections']):
-                logger.info(f"  Section {section_idx + 1}: {section['name']} ({section['questionCount']} questions)")
-                
-                # Section header
-                current_y_mm += 5
-                
-                # Calculate questions in this section
-                for i in range(section['questionCount']):
-                    # Determine row and column
-                    row = i // self.questions_per_row
-                    col = i % self.questions_per_row
-                    
-                    # Calculate Y position (in mm)
-                    question_y_mm = current_y_mm + (row * self.row_height_mm)
-                    
-                    # Calculate X position (in mm)
-                    question_x_mm = self.grid_start_x_mm + (col * self.question_spacing_mm)
-                    
-                    # Calculate bubble positions
-                    bubbles = []
-                    variants = ['A', 'B', 'C', 'D', 'E']
-                    
-                    for v_idx, variant in enumerate(variants):
-                        # Bubble position in mm (absolute in PDF)
-                        bubble_x_mm = question_x_mm + self.first_bubble_offset_mm + (v_idx * self.bubble_spacing_mm)
-                        bubble_y_mm = question_y_mm + 2  # +2mm offset in PDF
-                        
-                        # Convert to relative coordinates (0-1)
-                        relative_x, relative_y = self.mm_to_relative(bubble_x_mm, bubble_y_mm)
-                        
-                        # Convert to pixel coordinates
-                        pixel_x, pixel_y = self.relative_to_pixels(relative_x, relative_y)
-                        
-                        # Bubble radius in pixels
-                        # Use average scale factor
-                        scale_x = self.width_px / self.width_mm
-                        scale_y = self.height_px / self.height_mm
-                        scale_avg = (scale_x + scale_y) / 2
-                        bubble_radius_px = self.bubble_radius_mm * scale_avg
-                        
-                        bubbles.append({
-                            'variant': variant,
-                            'x': pixel_x,
-                            'y': pixel_y,
-                            'radius': bubble_radius_px,
-                            'relative_x': relative_x,  # For debugging
-                            'relative_y': relative_y   # For debugging
-                        })
-                    
-                    coordinates[question_number] = {
-                        'questionNumber': question_number,
-                        'bubbles': bubbles
-                    }
-                    
-                    question_number += 1
-                
-                # Update Y for next section
-                rows_in_section = (section['questionCount'] + self.questions_per_row - 1) // self.questions_per_row
-                current_y_mm += (rows_in_section * self.row_height_mm) + 2
-            
-            # Space between topics
-            current_y_mm += 3
+        coordinates = self.map_layout().to_dict()
         
-        logger.info(f"✅ Calculated coordinates for {question_number - 1} questions using corner-based system")
+        logger.info(f"✅ Calculated coordinates for {len(coordinates)} questions using corner-based system")
         return coordinates
@@ -0,0 +1,194 @@
+"""
+Spatial Index - topilgan doirachalar uchun vektorlashtirilgan qo'shnilik amallari
+
+Bubble detector'lar minglab nomzod aylana qaytarishi mumkin (ayniqsa template
+matching), eski kod esa har juftlik uchun Python'da np.sqrt hisoblar edi (O(n*m)).
+Bu yerda barcha juftliklar bitta so'rov bilan olinadi:
+1. scipy.spatial.cKDTree (sparse_distance_matrix) - asosiy yo'l
+2. uniform grid hash (numpy searchsorted) - scipy bo'lmasa
+
+Ustiga qurilgan amallar:
+- match_nearest:   har bir kutilgan nuqta uchun eng yaqin topilgan nuqta (max masofa ichida)
+- suppress_radius: ustuvorlik tartibida radius ichidagi dublikatlarni olib tashlash
+- cluster_rows:    Y bo'yicha qatorlarga ajratish (qo'shni Y farqi tolerance'dan kichik)
+"""
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from scipy.spatial import cKDTree
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+    logger.warning("scipy not available - spatial index falls back to grid hash")
+
+
+def as_points(items: Sequence, x_key='x', y_key='y') -> np.ndarray:
+    """
+    Dict'lar ro'yxatidan (N, 2) float64 massiv
+
+    x_key tuple/list qiymatli kalit bo'lsa (masalan 'center'), y_key=None bering.
+    """
+    if not items:
+        return np.empty((0, 2), dtype=np.float64)
+    if y_key is None:
+        return np.array([item[x_key][:2] for item in items], dtype=np.float64).reshape(-1, 2)
+    return np.array([(item[x_key], item[y_key]) for item in items], dtype=np.float64)
+
+
+def pairs_within(
+    queries: np.ndarray,
+    points: np.ndarray,
+    radius: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Masofasi radius'dan oshmagan barcha (query, point) juftliklari
+
+    Returns:
+        (query_idx, point_idx, distance) - query_idx, keyin point_idx bo'yicha tartiblangan
+    """
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(queries) == 0 or len(points) == 0 or radius <= 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64)
+
+    if SCIPY_AVAILABLE:
+        records = cKDTree(queries).sparse_distance_matrix(
+            cKDTree(points), radius, output_type='ndarray'
+        )
+        q_idx = records['i'].astype(np.int64)
+        p_idx = records['j'].astype(np.int64)
+        dist = records['v'].astype(np.float64)
+    else:
+        q_idx, p_idx, dist = _grid_pairs(queries, points, radius)
+
+    order = np.lexsort((p_idx, q_idx))
+    return q_idx[order], p_idx[order], dist[order]
+
+
+def _grid_pairs(
+    queries: np.ndarray,
+    points: np.ndarray,
+    radius: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Uniform grid hash (katak = radius): har bir query uchun 3x3 qo'shni katak"""
+    origin = np.minimum(queries.min(axis=0), points.min(axis=0))
+    p_cells = np.floor((points - origin) / radius).astype(np.int64)
+    q_cells = np.floor((queries - origin) / radius).astype(np.int64)
+    stride = int(max(p_cells[:, 0].max(), q_cells[:, 0].max())) + 3
+
+    p_keys = (p_cells[:, 1] + 1) * stride + (p_cells[:, 0] + 1)
+    p_order = np.argsort(p_keys, kind='stable')
+    p_keys = p_keys[p_order]
+
+    q_all, p_all = [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            keys = (q_cells[:, 1] + 1 + dy) * stride + (q_cells[:, 0] + 1 + dx)
+            start = np.searchsorted(p_keys, keys, side='left')
+            counts = np.searchsorted(p_keys, keys, side='right') - start
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            q_rep = np.repeat(np.arange(len(queries)), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            q_all.append(q_rep)
+            p_all.append(p_order[np.repeat(start, counts) + offsets])
+
+    if not q_all:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float64)
+
+    q_idx = np.concatenate(q_all)
+    p_idx = np.concatenate(p_all)
+    dist = np.hypot(*(queries[q_idx] - points[p_idx]).T)
+    keep = dist <= radius
+    return q_idx[keep], p_idx[keep], dist[keep]
+
+
+def match_nearest(
+    queries: np.ndarray,
+    points: np.ndarray,
+    max_distance: float,
+    query_sizes: Optional[np.ndarray] = None,
+    point_sizes: Optional[np.ndarray] = None,
+    size_weight: float = 0.0
+) -> np.ndarray:
+    """
+    Har bir query uchun eng yaxshi point indeksi (-1 - max_distance ichida yo'q)
+
+    Metrika: distance + size_weight * |point_size - query_size|, faqat distance < max_distance
+    bo'lganlar orasida; teng metrikada kichik indeksli point tanlanadi.
+    """
+    matches = np.full(len(queries), -1, dtype=np.int64)
+    q_idx, p_idx, dist = pairs_within(queries, points, max_distance)
+
+    strict = dist < max_distance
+    q_idx, p_idx, dist = q_idx[strict], p_idx[strict], dist[strict]
+    if len(q_idx) == 0:
+        return matches
+
+    cost = dist
+    if size_weight and query_sizes is not None and point_sizes is not None:
+        cost = dist + size_weight * np.abs(
+            np.asarray(point_sizes, dtype=np.float64)[p_idx] - np.asarray(query_sizes, dtype=np.float64)[q_idx]
+        )
+
+    order = np.lexsort((p_idx, cost, q_idx))
+    q_sorted = q_idx[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = q_sorted[1:] != q_sorted[:-1]
+    matches[q_sorted[first]] = p_idx[order][first]
+    return matches
+
+
+def suppress_radius(points: np.ndarray, min_distance: float, order: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Ustuvorlik tartibida (order, default - berilgan tartib) greedy dublikat olib tashlash
+
+    Nuqta saqlanadi, agar oldin saqlangan birorta nuqtadan masofasi min_distance'dan
+    kichik bo'lmasa. Saqlangan indekslar ustuvorlik tartibida qaytadi.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if order is None:
+        order = np.arange(len(points))
+    if len(points) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    q_idx, p_idx, dist = pairs_within(points, points, min_distance)
+    close = (dist < min_distance) & (q_idx != p_idx)
+    q_idx, p_idx = q_idx[close], p_idx[close]
+    bounds = np.searchsorted(q_idx, np.arange(len(points) + 1))
+
+    suppressed = np.zeros(len(points), dtype=bool)
+    kept = []
+    for index in order:
+        if suppressed[index]:
+            continue
+        kept.append(index)
+        suppressed[p_idx[bounds[index]:bounds[index + 1]]] = True
+
+    return np.asarray(kept, dtype=np.int64)
+
+
+def cluster_rows(points: np.ndarray, tolerance: float) -> List[np.ndarray]:
+    """
+    Nuqtalarni (y, x) bo'yicha tartiblab qatorlarga ajratish
+
+    Ketma-ket ikki nuqtaning Y farqi tolerance'dan kichik bo'lsa - bitta qator.
+
+    Returns:
+        qatorlar ro'yxati, har biri indekslar massivi ((y, x) tartibida)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return []
+
+    order = np.lexsort((points[:, 0], points[:, 1]))
+    breaks = np.flatnonzero(np.diff(points[order, 1]) >= tolerance) + 1
+    return np.split(order, breaks)
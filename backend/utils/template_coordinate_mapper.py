@@ -6,6 +6,8 @@ EvalBee kabi professional tizim
 import logging
 from typing import Dict, List
 
+from utils.layout_cache import MappedLayout, get_template_layout
+
 logger = logging.getLogger(__name__)
 
 class TemplateCoordinateMapper:
@@ -76,67 +78,46 @@ class TemplateCoordinateMapper:
         
         return (pixel_x, pixel_y)
     
-    def calculate_all(self) -> Dict[int, Dict]:
+    def _scale_factor(self) -> float:
         """
-        Template'dan barcha koordinatalarni hisoblash
-        
-        Returns:
-            dict: {questionNumber: {'questionNumber': int, 'bubbles': [...]}}
+        Pixel/mm nisbati - template'dagi corner'lar orasidagi masofa (mm) bo'yicha
         """
-        coordinates = {}
-        
-        # Get questions from template
-        template_questions = self.template.get('questions', {})
-        
-        if not template_questions:
-            logger.error("❌ No questions found in coordinate template!")
-            return coordinates
-        
-        # Get layout for bubble radius calculation
-        layout = self.template.get('layout', {})
-        bubble_radius_mm = layout.get('bubbleRadius', 2.5)
-        
-        # Calculate scale factor (pixels per mm)
-        # Template has distance between corners in mm
         template_corners = self.template.get('cornerMarkers', {})
         if template_corners:
             template_width_mm = (
                 template_corners.get('topRight', {}).get('x', 197.5) - 
                 template_corners.get('topLeft', {}).get('x', 12.5)
             )
-            scale_factor = self.width_px / template_width_mm
-        else:
-            # Fallback: assume 185mm between corners
-            scale_factor = self.width_px / 185.0
+            return self.width_px / template_width_mm
+        
+        # Fallback: assume 185mm between corners
+        return self.width_px / 185.0
+    
+    def map_layout(self) -> MappedLayout:
+        """
+        Cache'langan template layout'ini pixel'larga o'girish (bitta vektorlashtirilgan amal)
+        """
+        layout = get_template_layout(self.template)
         
-        bubble_radius_px = bubble_radius_mm * scale_factor
+        # relative_to_pixels() bilan bir xil: top-left + relative * (width, height)
+        matrix = [
+            [self.width_px, 0.0, self.corners['top-left']['x']],
+            [0.0, self.height_px, self.corners['top-left']['y']]
+        ]
+        return layout.map(matrix, self._scale_factor(), normalized=True, include_relative=True)
+    
+    def calculate_all(self) -> Dict[int, Dict]:
+        """
+        Template'dan barcha koordinatalarni hisoblash
         
-        # Convert each question from template
-        for q_num_str, q_data in template_questions.items():
-            q_num = int(q_num_str)
-            
-            bubbles = []
-            for bubble_template in q_data.get('bubbles', []):
-                # Get relative coordinates from template
-                relative_x = bubble_template.get('relativeX', 0)
-                relative_y = bubble_template.get('relativeY', 0)
-                
-                # Convert to pixels
-                pixel_x, pixel_y = self.relative_to_pixels(relative_x, relative_y)
-                
-                bubbles.append({
-                    'variant': bubble_template.get('variant'),
-                    'x': pixel_x,
-                    'y': pixel_y,
-                    'radius': bubble_radius_px,
-                    'relative_x': relative_x,  # For debugging
-                    'relative_y': relative_y   # For debugging
-                })
-            
-            coordinates[q_num] = {
-                'questionNumber': q_num,
-                'bubbles': bubbles
-            }
+        Returns:
+            dict: {questionNumber: {'questionNumber': int, 'bubbles': [...]}}
+        """
+        if not self.template.get('questions', {}):
+            logger.error("❌ No questions found in coordinate template!")
+            return {}
+        
+        coordinates = self.map_layout().to_dict()
         
         logger.info(f"✅ Calculated coordinates for {len(coordinates)} questions from template")
         